@@ -0,0 +1,144 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - cache build time with and without running the I/O stage of the pipeline in threads (SamplesCacher io_threads argument).
+A network storage is simulated by a read op with a fixed latency per sample, followed by a CPU bound op.
+
+Usage:
+    python fuse/data/datasets/caching/benchmarks/benchmark_io_threads.py --num_samples 64 --latency_ms 50 --compute_ms 10
+"""
+import argparse
+import tempfile
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from fuse.data import OpBase, PipelineDefault, get_sample_id
+from fuse.data.datasets.caching.samples_cacher import SamplesCacher
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.ndict import NDict
+
+
+class OpSimulatedRead(OpBase):
+    """
+    Simulates reading a volume from a network storage - waits latency_ms and creates the volume
+    """
+
+    def __init__(self, latency_ms: float):
+        super().__init__()
+        self._latency_ms = latency_ms
+
+    def __call__(self, sample_dict: NDict) -> NDict:
+        time.sleep(self._latency_ms / 1000.0)
+        sample_dict["data.input.img"] = np.full(
+            (32, 64, 64), get_sample_id(sample_dict), dtype=np.float32
+        )
+        return sample_dict
+
+    def get_execution_hint(self) -> str:
+        return "io"
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
+
+class OpBusyCompute(OpBase):
+    """
+    CPU bound op - keeps the cpu busy for compute_ms
+    """
+
+    def __init__(self, compute_ms: float):
+        super().__init__()
+        self._compute_ms = compute_ms
+
+    def __call__(self, sample_dict: NDict) -> NDict:
+        end = time.perf_counter() + self._compute_ms / 1000.0
+        img = sample_dict["data.input.img"]
+        while time.perf_counter() < end:
+            img = np.sqrt(img * img)
+        sample_dict["data.input.img"] = img
+        return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
+
+def run_benchmark(
+    num_samples: int,
+    latency_ms: float,
+    compute_ms: float,
+    workers: int,
+    io_threads_options: Sequence[int],
+    cache_dir: Optional[str] = None,
+) -> pd.DataFrame:
+    pipeline = PipelineDefault(
+        "static",
+        [
+            (OpSimulatedRead(latency_ms), dict()),
+            (OpBusyCompute(compute_ms), dict()),
+        ],
+    )
+    results = []
+    for io_threads in io_threads_options:
+        cacher = SamplesCacher(
+            f"benchmark_io_threads_{io_threads}",
+            pipeline,
+            cache_dir if cache_dir is not None else tempfile.mkdtemp(),
+            restart_cache=True,
+            workers=workers,
+            verbose=0,
+            progress_report_interval=None,
+            io_threads=io_threads,
+        )
+        start = time.perf_counter()
+        cacher.cache_samples(list(range(num_samples)))
+        elapsed = time.perf_counter() - start
+        results.append(
+            dict(
+                io_threads=io_threads,
+                build_sec=elapsed,
+                samples_per_sec=num_samples / elapsed,
+            )
+        )
+
+    df = pd.DataFrame(results)
+    df["speedup"] = df.build_sec.iloc[0] / df.build_sec
+    return df.round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_samples", type=int, default=64)
+    parser.add_argument("--latency_ms", type=float, default=50.0)
+    parser.add_argument("--compute_ms", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--io_threads", type=int, nargs="+", default=[0, 4, 16])
+    parser.add_argument("--cache_dir", type=str, default=None)
+    args = parser.parse_args()
+
+    df = run_benchmark(
+        args.num_samples,
+        args.latency_ms,
+        args.compute_ms,
+        args.workers,
+        args.io_threads,
+        args.cache_dir,
+    )
+    print(get_pretty_dataframe(df))
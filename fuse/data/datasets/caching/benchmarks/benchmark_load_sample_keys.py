@@ -0,0 +1,130 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - loading entire cached samples vs. loading only the required keys (SamplesCacher.load_sample(..., keys=...))
+Reports the loading time and the number of bytes read from the files per sample, for each cache storage.
+Note - bytes read through memory mapped files ("shards_mmap") are page faults, and are not counted by the io counters.
+
+Usage:
+    python fuse/data/datasets/caching/benchmarks/benchmark_load_sample_keys.py --num_samples 20 --volume_shape 64 256 256
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import psutil
+
+from fuse.data import OpBase, PipelineDefault, get_sample_id
+from fuse.data.datasets.caching.samples_cacher import SamplesCacher
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.ndict import NDict
+
+
+class OpGenerateVolume(OpBase):
+    """
+    Generates a synthetic CT-like sample: a volume, a segmentation map and a few labels
+    """
+
+    def __init__(self, volume_shape: Sequence[int]):
+        super().__init__()
+        self._volume_shape = tuple(volume_shape)
+
+    def __call__(self, sample_dict: NDict) -> NDict:
+        rng = np.random.default_rng(get_sample_id(sample_dict))
+        sample_dict["data.input.img"] = rng.random(self._volume_shape, dtype=np.float32)
+        sample_dict["data.gt.seg"] = rng.integers(
+            0, 3, size=self._volume_shape, dtype=np.uint8
+        )
+        sample_dict["data.gt.label"] = int(rng.integers(0, 2))
+        sample_dict["data.metadata.spacing"] = [0.8, 0.8, 2.5]
+        return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
+
+def _measure(
+    cacher: SamplesCacher, sample_ids: List[int], keys: Optional[Sequence[str]]
+) -> dict:
+    process = psutil.Process()
+    read_chars_before = process.io_counters().read_chars
+    start = time.perf_counter()
+    for sid in sample_ids:
+        sample = cacher.load_sample(sid, keys=keys)
+        # touch the values, so lazily loaded (memory mapped) data is actually read
+        for v in sample.values():
+            if isinstance(v, np.ndarray):
+                v.sum()
+    elapsed = time.perf_counter() - start
+    read_bytes = process.io_counters().read_chars - read_chars_before
+    return dict(
+        ms_per_sample=1000.0 * elapsed / len(sample_ids),
+        MB_read_per_sample=read_bytes / len(sample_ids) / 1024**2,
+    )
+
+
+def run_benchmark(
+    num_samples: int,
+    volume_shape: Sequence[int],
+    storages: Sequence[str],
+    cache_dir: Optional[str] = None,
+) -> pd.DataFrame:
+    if cache_dir is None:
+        cache_dir = tempfile.mkdtemp()
+    sample_ids = list(range(num_samples))
+    pipeline = PipelineDefault("static", [(OpGenerateVolume(volume_shape), dict())])
+
+    results = []
+    for storage in storages:
+        cacher = SamplesCacher(
+            f"benchmark_load_sample_keys_{storage}",
+            pipeline,
+            cache_dirs=os.path.join(cache_dir, storage),
+            restart_cache=True,
+            storage=storage,
+            audit_first_sample=False,
+            audit_rate=None,
+        )
+        cacher.cache_samples(sample_ids)
+        for desc, keys in [
+            ("full", None),
+            ("data.gt.label", ["data.gt.label"]),
+            ("data.gt", ["data.gt"]),
+        ]:
+            results.append(
+                dict(storage=storage, keys=desc, **_measure(cacher, sample_ids, keys))
+            )
+
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_samples", type=int, default=20)
+    parser.add_argument("--volume_shape", type=int, nargs=3, default=[64, 256, 256])
+    parser.add_argument(
+        "--storages", nargs="+", default=["files", "shards", "shards_mmap"]
+    )
+    parser.add_argument("--cache_dir", type=str, default=None)
+    args = parser.parse_args()
+
+    df = run_benchmark(
+        args.num_samples, args.volume_shape, args.storages, args.cache_dir
+    )
+    print(get_pretty_dataframe(df))
@@ -0,0 +1,140 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - reading a random patch of a cached CT-like volume (as a random crop in the dynamic pipeline would),
+for each cache storage. With "files_lazy" only the HDF5 chunks touched by the patch are read and decompressed.
+Reports the time per sample and the number of bytes read from the files per sample.
+Note - bytes read through memory mapped files ("shards_mmap") are page faults, and are not counted by the io counters.
+
+Usage:
+    python fuse/data/datasets/caching/benchmarks/benchmark_region_reads.py --num_samples 20 --volume_shape 128 512 512 --patch_shape 64 64 64
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import psutil
+
+from fuse.data import OpBase, PipelineDefault, get_sample_id
+from fuse.data.datasets.caching.samples_cacher import SamplesCacher
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.ndict import NDict
+
+
+class OpGenerateVolume(OpBase):
+    """
+    Generates a synthetic CT-like int16 volume - smooth intensities with noise, so it compresses like a real scan
+    """
+
+    def __init__(self, volume_shape: Sequence[int]):
+        super().__init__()
+        self._volume_shape = tuple(volume_shape)
+
+    def __call__(self, sample_dict: NDict) -> NDict:
+        rng = np.random.default_rng(get_sample_id(sample_dict))
+        grid = np.ogrid[tuple(slice(0, size) for size in self._volume_shape)]
+        smooth = sum(
+            np.sin(g * (0.05 + 0.05 * axis)).astype(np.float32)
+            for axis, g in enumerate(grid)
+        )
+        noise = rng.integers(-8, 8, size=self._volume_shape, dtype=np.int16)
+        sample_dict["data.input.img"] = (smooth * 300).astype(np.int16) + noise
+        return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
+
+def run_benchmark(
+    num_samples: int,
+    volume_shape: Sequence[int],
+    patch_shape: Sequence[int],
+    storages: Sequence[str],
+    cache_dir: Optional[str] = None,
+) -> pd.DataFrame:
+    if cache_dir is None:
+        cache_dir = tempfile.mkdtemp()
+    sample_ids = list(range(num_samples))
+    pipeline = PipelineDefault("static", [(OpGenerateVolume(volume_shape), dict())])
+    rng = np.random.default_rng(0)
+    patches = [
+        tuple(
+            slice(start, start + size)
+            for start, size in zip(
+                [
+                    rng.integers(0, vol - size + 1)
+                    for vol, size in zip(volume_shape, patch_shape)
+                ],
+                patch_shape,
+            )
+        )
+        for _ in sample_ids
+    ]
+
+    results = []
+    for storage in storages:
+        cacher = SamplesCacher(
+            f"benchmark_region_reads_{storage}",
+            pipeline,
+            cache_dirs=os.path.join(cache_dir, storage),
+            restart_cache=True,
+            storage=storage,
+            audit_first_sample=False,
+            audit_rate=None,
+        )
+        cacher.cache_samples(sample_ids)
+
+        process = psutil.Process()
+        read_chars_before = process.io_counters().read_chars
+        start = time.perf_counter()
+        for sid, patch in zip(sample_ids, patches):
+            sample = cacher.load_sample(sid)
+            np.asarray(sample["data.input.img"][patch]).sum()
+        elapsed = time.perf_counter() - start
+        read_bytes = process.io_counters().read_chars - read_chars_before
+        results.append(
+            dict(
+                storage=storage,
+                ms_per_sample=1000.0 * elapsed / num_samples,
+                MB_read_per_sample=read_bytes / num_samples / 1024**2,
+            )
+        )
+
+    return pd.DataFrame(results).round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_samples", type=int, default=20)
+    parser.add_argument("--volume_shape", type=int, nargs=3, default=[128, 512, 512])
+    parser.add_argument("--patch_shape", type=int, nargs=3, default=[64, 64, 64])
+    parser.add_argument(
+        "--storages", nargs="+", default=["files", "files_lazy", "shards_mmap"]
+    )
+    parser.add_argument("--cache_dir", type=str, default=None)
+    args = parser.parse_args()
+
+    df = run_benchmark(
+        args.num_samples,
+        args.volume_shape,
+        args.patch_shape,
+        args.storages,
+        args.cache_dir,
+    )
+    print(get_pretty_dataframe(df))
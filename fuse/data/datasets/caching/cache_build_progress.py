@@ -0,0 +1,167 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+import base64
+import binascii
+import os
+import pickle
+import time
+import zlib
+
+import pandas as pd
+
+from fuse.utils.misc.misc import get_pretty_dataframe
+
+
+class CacheBuildJournal:
+    """
+    An append-only journal of the original sample ids that were already cached (and their output sample ids).
+    Written by the main process of SamplesCacher.cache_samples() in batches.
+    When an interrupted cache build restarts, the journal is loaded with a single file read per cache dir,
+    and only the missing original sample ids are processed.
+
+    Layout: [pipeline hash dir]/[journal name].journal - a record per line, each record is a batch:
+    "<crc32 of the payload, 8 hex digits> <base64 encoded payload>", where the payload is a pickled list of (original sample id hash, output sample ids) tuples.
+    A record starts with a newline as well, so a record that was interrupted while being written (e.g. the process was killed)
+    ends at the beginning of the next record. Such corrupted records are detected by the checksum and skipped.
+    """
+
+    def __init__(self, name: str = "cache_build_journal"):
+        """
+        :param name: journal file name (without extension)
+        """
+        self._filename = name + ".journal"
+
+    def append(self, write_dir: str, batch: List[Tuple[str, Any]]) -> None:
+        """
+        Appends a batch of (original sample id hash, output sample ids)
+        :param write_dir: the directory (pipeline hash dir) in which the journal is written
+        """
+        if len(batch) == 0:
+            return
+        os.makedirs(write_dir, exist_ok=True)
+        payload = pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL)
+        record = b"\n%08x %s\n" % (zlib.crc32(payload), base64.b64encode(payload))
+        # a single write call in append mode, so concurrent builds will not interleave records
+        fd = os.open(
+            os.path.join(write_dir, self._filename),
+            os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+            0o644,
+        )
+        try:
+            os.write(fd, record)
+        finally:
+            os.close(fd)
+
+    def load(self, read_dirs: List[str]) -> Dict[str, Any]:
+        """
+        :return: original sample id hash -> output sample ids, for all the journaled samples found in read dirs.
+            read dirs are searched in order, the first found wins.
+        """
+        ans = {}
+        for curr_read_dir in reversed(read_dirs):
+            filename = os.path.join(curr_read_dir, self._filename)
+            if not os.path.isfile(filename):
+                continue
+            with open(filename, "rb") as f:
+                for line in f:
+                    batch = _decode_journal_record(line)
+                    if batch is not None:
+                        ans.update(batch)
+        return ans
+
+
+def _decode_journal_record(line: bytes) -> Any:
+    """
+    :return: the batch stored in a journal record, or None if the line is empty or corrupted
+    """
+    parts = line.split()
+    if len(parts) != 2:
+        return None
+    try:
+        crc = int(parts[0], 16)
+        payload = base64.b64decode(parts[1], validate=True)
+    except (ValueError, binascii.Error):
+        return None
+    if zlib.crc32(payload) != crc:
+        return None
+    return pickle.loads(payload)
+
+
+class CacheBuildThroughput:
+    """
+    Collects per worker statistics while building the cache, and periodically reports throughput (samples/s, MB/s written).
+    """
+
+    def __init__(self, report_interval: float = 60.0, verbose: int = 1):
+        """
+        :param report_interval: report every report_interval seconds. None to report only at the end.
+        :param verbose: set to 0 to disable the reports
+        """
+        self._report_interval = report_interval
+        self._verbose = verbose
+        self._start_time = time.time()
+        self._last_report_time = self._start_time
+        self._workers: Dict[Any, dict] = OrderedDict()
+
+    def update(self, stats: dict) -> None:
+        """
+        :param stats: statistics about a single cached original sample id - a dict with the keys:
+            "worker" - worker identifier (pid), "bytes" - number of bytes written, "seconds" - processing time
+        """
+        worker = self._workers.setdefault(
+            stats["worker"], dict(samples=0, bytes=0, busy_seconds=0.0)
+        )
+        worker["samples"] += 1
+        worker["bytes"] += stats["bytes"]
+        worker["busy_seconds"] += stats["seconds"]
+
+        if self._report_interval is not None:
+            if time.time() - self._last_report_time >= self._report_interval:
+                self.report()
+
+    def get_summary(self) -> pd.DataFrame:
+        elapsed = max(time.time() - self._start_time, 1e-9)
+        rows = []
+        for worker_id, worker in self._workers.items():
+            rows.append(
+                {
+                    "worker": worker_id,
+                    "samples": worker["samples"],
+                    "samples/s": worker["samples"] / elapsed,
+                    "MB/s written": worker["bytes"] / 1024**2 / elapsed,
+                    "busy %": 100.0 * worker["busy_seconds"] / elapsed,
+                }
+            )
+        df = pd.DataFrame(
+            rows, columns=["worker", "samples", "samples/s", "MB/s written", "busy %"]
+        )
+        if len(df) > 0:
+            total = {
+                "worker": "total",
+                "samples": df["samples"].sum(),
+                "samples/s": df["samples/s"].sum(),
+                "MB/s written": df["MB/s written"].sum(),
+                "busy %": df["busy %"].mean(),
+            }
+            df = pd.concat([df, pd.DataFrame([total])], ignore_index=True)
+        return df.round(2)
+
+    def report(self) -> None:
+        self._last_report_time = time.time()
+        if self._verbose > 0 and len(self._workers) > 0:
+            print(
+                f"cache build throughput after {self._last_report_time - self._start_time:.1f} seconds:"
+            )
+            print(get_pretty_dataframe(self.get_summary(), col_width=16))
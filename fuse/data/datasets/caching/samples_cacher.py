@@ -12,19 +12,29 @@ limitations under the License.
 Created on June 30, 2021
 """
 from functools import partial
-from typing import Hashable, List, Optional, Sequence, Union, Callable, Any, Tuple, Dict
+from typing import Dict, Hashable, List, Optional, Sequence, Union, Callable, Any, Tuple
 
 from fuse.data.pipelines.pipeline_default import PipelineDefault
 from collections import OrderedDict
-from fuse.data.datasets.caching.object_caching_handlers import (
-    _object_requires_hdf5_recurse,
+from fuse.data.datasets.caching.cache_build_progress import (
+    CacheBuildJournal,
+    CacheBuildThroughput,
 )
+from fuse.data.datasets.caching.samples_memory_cache import SamplesMemoryCacheBase
+from fuse.data.datasets.caching.samples_storage import (
+    SamplesStorageBase,
+    SamplesStorageFiles,
+    SamplesStorageShards,
+    get_samples_storage,
+    is_key_requested,
+)
+from fuse.data.utils.lazy_array import LazyArray
 from fuse.utils.ndict import NDict
+import copy
 import os
 import psutil
+import time
 from fuse.utils.file_io.file_io import (
-    load_hdf5,
-    save_hdf5_safe,
     load_pickle,
     save_pickle_safe,
 )
@@ -38,15 +48,23 @@ from fuse.utils.file_io import delete_directory_tree
 from glob import glob
 from fuse.utils.multiprocessing.run_multiprocessed import (
     run_multiprocessed,
+    run_thread_prefetched,
     get_from_global_storage,
 )
 from fuse.data.datasets.sample_caching_audit import SampleCachingAudit
-from fuse.data.utils.sample import get_initial_sample_id, set_initial_sample_id
+from fuse.data.utils.sample import (
+    get_initial_sample_id,
+    get_initial_sample_id_key,
+    get_sample_id_key,
+    set_initial_sample_id,
+)
 from warnings import warn
-import numpy as np
 
 
 class SamplesCacher:
+    # intermediate results of the pipeline (see OpCheckpoint) are stored in [cache dir]/[unique name]/checkpoints
+    CHECKPOINTS_DIR = "checkpoints"
+
     def __init__(
         self,
         unique_name: str,
@@ -58,6 +76,11 @@ class SamplesCacher:
         workers: int = 0,
         verbose: int = 1,
         use_pipeline_hash: Optional[bool] = True,
+        storage: Union[str, SamplesStorageBase] = "files",
+        journal_batch_size: int = 100,
+        progress_report_interval: Optional[float] = 300.0,
+        memory_cache: Optional[SamplesMemoryCacheBase] = None,
+        io_threads: int = 0,
         **audit_kwargs: dict,
     ) -> None:
         """
@@ -76,6 +99,25 @@ class SamplesCacher:
         (for example, code change)
         :param workers: number of multiprocessing workers used when building the cache. Default value is 0 (no multiprocessing)
         :param use_pipeline_hash [Optional]: indicates whether to use a hash of given pipeline for naming its cache dir. Default=True
+        :param storage: how samples are stored on disk. Either a SamplesStorageBase instance or one of:
+            "files" (default) - a file per output sample (and a marker file per original sample id)
+            "files_lazy" - like "files", but large numpy arrays are returned as LazyArray instances,
+                so only the regions of an array that are actually accessed (e.g. a crop) are read from disk. See SamplesStorageFiles.
+            "shards" - samples are appended into a few large shard files with a persistent offset index.
+                Recommended for large datasets, especially on network storage. See SamplesStorageShards.
+            "shards_mmap" - like "shards", but large numpy arrays are returned as read-only memory mapped views,
+                so only the parts of an array that are actually accessed are read from disk.
+        :param journal_batch_size: while building the cache, the processed original sample ids are recorded in a journal every journal_batch_size samples.
+            An interrupted build resumes from the journal instead of checking every sample.
+        :param progress_report_interval: while building the cache, report throughput (samples/s, MB/s written) per worker every progress_report_interval seconds.
+            Set to None to report only once, when the build is done.
+        :param memory_cache: optional memory tier, loaded samples are kept in memory and are not read again from disk in the next epochs.
+            Either SamplesMemoryCache (per process, with LRU or LFU eviction)
+            or SamplesSharedMemoryCache (shared by the DataLoader workers, avoids duplicate copies of the same sample).
+        :param io_threads: while building the cache, the I/O stage of the pipeline (the ops that read the data, see OpBase.get_execution_hint())
+            runs in io_threads threads per worker, ahead of the rest of the pipeline, to overlap many outstanding reads.
+            Useful to saturate a network storage. Each worker gets the samples in chunks of 4 * io_threads samples.
+            Default value is 0 (the entire pipeline runs sample by sample)
         :param **audit_kwargs: optional custom kwargs to pass to SampleCachingAudit instance.
             auditing cached samples (usually periodically) is very important, in order to avoid "stale" cached samples.
             To disable pass audit_first_sample=False, audit_rate=None,
@@ -101,17 +143,29 @@ class SamplesCacher:
         else:
             self._read_dirs_logic = custom_read_dirs_callable
 
+        self._storage = get_samples_storage(storage)
+        self._journal_batch_size = journal_batch_size
+        self._progress_report_interval = progress_report_interval
+        self._memory_cache = memory_cache
+        self._io_threads = io_threads
+        self._checkpoint_storages: Dict[str, SamplesStorageBase] = {}
+
         self._pipeline = pipeline
         self._use_pipeline_hash = use_pipeline_hash
 
         self._pipeline_desc_text = str(pipeline)
+        # per op hashes of the pipeline prefixes - the last one describes the entire pipeline
+        self._pipeline_prefix_hashes = pipeline.get_prefix_hashes()
         if use_pipeline_hash:
-            self._pipeline_desc_hash = (
-                "hash_"
-                + hashlib.md5(self._pipeline_desc_text.encode("utf-8")).hexdigest()
+            self._pipeline_desc_hash = "hash_" + (
+                self._pipeline_prefix_hashes[-1]
+                if len(self._pipeline_prefix_hashes) > 0
+                else hashlib.md5(b"").hexdigest()
             )
         else:
             self._pipeline_desc_hash = "hash_fixed"
+        # computed only if a cache dir of a different pipeline hash is found, see _migrate_legacy_hash_dir()
+        self._pipeline_legacy_desc_hash = None
 
         self._verbose = verbose
 
@@ -135,6 +189,46 @@ class SamplesCacher:
 
         self._verify_no_other_pipelines_cache()
 
+    def derive(self, name_suffix: str, pipeline: PipelineDefault) -> "SamplesCacher":
+        """
+        Creates a cacher, with the same settings, for a pipeline that further processes the samples cached by this cacher.
+        Its cache dir will be [cache dir]/[unique_name][name_suffix], next to the cache of this cacher.
+        The memory tier (see memory_cache argument) is moved to the derived cacher, since the samples are expected to be loaded from it.
+        See DatasetDefault hoist_deterministic_ops argument.
+        :param name_suffix: added to the unique name of this cacher
+        :param pipeline: the pipeline of the derived cacher. The original sample ids of the derived cacher are the output sample ids of this cacher.
+        """
+        unique_name = self._unique_name + name_suffix
+        memory_cache = self._memory_cache
+        self._memory_cache = None
+        return SamplesCacher(
+            unique_name,
+            pipeline,
+            [os.path.dirname(cache_dir) for cache_dir in self._cache_dirs],
+            custom_write_dir_callable=self._write_dir_logic,
+            custom_read_dirs_callable=partial(
+                _derived_read_dirs_logic,
+                read_dirs_logic=self._read_dirs_logic,
+                unique_name=unique_name,
+            ),
+            restart_cache=self._restart_cache,
+            workers=self._workers,
+            verbose=self._verbose,
+            use_pipeline_hash=self._use_pipeline_hash,
+            storage=copy.deepcopy(self._storage),
+            journal_batch_size=self._journal_batch_size,
+            progress_report_interval=self._progress_report_interval,
+            memory_cache=memory_cache,
+            io_threads=self._io_threads,
+            **self._audit_kwargs,
+        )
+
+    def get_pipeline_desc_hash(self) -> str:
+        """
+        :return: the hash of the pipeline, which is also the name of the cache sub directory
+        """
+        return self._pipeline_desc_hash
+
     def _verify_no_other_pipelines_cache(self) -> None:
         dirs_to_check = self._get_read_dirs() + [self._get_write_dir()]
         for d in dirs_to_check:
@@ -144,6 +238,8 @@ class SamplesCacher:
                 if not os.path.isdir(found_dir):
                     continue
                 if os.path.basename(found_dir) != self._pipeline_desc_hash:
+                    if self._migrate_legacy_hash_dir(found_dir):
+                        continue
                     new_desc = self._pipeline_desc_text
                     new_file = os.path.join(
                         found_dir, f"pipeline_{self._pipeline_desc_hash}_desc.txt"
@@ -160,6 +256,7 @@ class SamplesCacher:
                             "*** New pipeline description (does not match old pipeline):",
                             new_file,
                         )
+                    self._print_first_changed_op(found_dir)
 
                     raise Exception(
                         f"Found samples cache for pipeline hash {os.path.basename(found_dir)} which is different from the current loaded pipeline hash {self._pipeline_desc_hash} !!\n"
@@ -168,6 +265,82 @@ class SamplesCacher:
                         f"Cache full path {os.path.abspath(d)}"
                     )
 
+    def _migrate_legacy_hash_dir(self, found_dir: str) -> bool:
+        """
+        Older versions named the cache dir by a hash of a pipeline description that included only the code found directly in the ops __call__().
+        If found_dir was created by an older version for the current pipeline, it's renamed to the current pipeline hash.
+        :return: True if found_dir was migrated
+        """
+        if not self._use_pipeline_hash:
+            return False
+        if self._pipeline_legacy_desc_hash is None:
+            self._pipeline_legacy_desc_hash = (
+                "hash_" + self._pipeline.get_legacy_desc_hash()
+            )
+        if os.path.basename(found_dir) != self._pipeline_legacy_desc_hash:
+            return False
+        new_dir = os.path.join(os.path.dirname(found_dir), self._pipeline_desc_hash)
+        if os.path.exists(new_dir):
+            return False
+        warn(
+            f"Found samples cache created by an older version for the current pipeline, renaming {found_dir} to {new_dir}"
+        )
+        os.rename(found_dir, new_dir)
+        self._write_pipeline_desc_files(new_dir)
+        return True
+
+    def _write_pipeline_desc_files(self, hash_dir: str) -> None:
+        pipeline_desc_file = os.path.join(
+            hash_dir, f"pipeline_{self._pipeline_desc_hash}_desc.txt"
+        )
+        if not os.path.exists(pipeline_desc_file):
+            with open(pipeline_desc_file, "wt") as f:
+                f.write(self._pipeline_desc_text)
+            print("======== wrote", pipeline_desc_file)
+        pipeline_ops_file = self._get_pipeline_ops_file(hash_dir)
+        if not os.path.exists(pipeline_ops_file):
+            save_pickle_safe(
+                dict(
+                    op_ids=self._pipeline.get_op_ids(),
+                    prefix_hashes=self._pipeline_prefix_hashes,
+                ),
+                pipeline_ops_file,
+            )
+
+    def _get_pipeline_ops_file(self, hash_dir: str) -> str:
+        return os.path.join(hash_dir, f"pipeline_{os.path.basename(hash_dir)}_ops.pkl")
+
+    def _print_first_changed_op(self, other_hash_dir: str) -> None:
+        """
+        Compares the per op prefix hashes of the current pipeline and the pipeline that created other_hash_dir
+        """
+        ops_file = self._get_pipeline_ops_file(other_hash_dir)
+        if not os.path.exists(ops_file):
+            return
+        other_prefix_hashes = load_pickle(ops_file)["prefix_hashes"]
+        op_ids = self._pipeline.get_op_ids()
+        for index, prefix_hash in enumerate(self._pipeline_prefix_hashes):
+            if (
+                index >= len(other_prefix_hashes)
+                or other_prefix_hashes[index] != prefix_hash
+            ):
+                print(
+                    f"*** The first changed (or added) op is op_id={op_ids[index]} ({type(self._pipeline.ops[index]).__name__}), the ops before it are unchanged"
+                )
+                valid_checkpoints = [
+                    name
+                    for op_id, name, _ in self._pipeline.get_checkpoints()
+                    if op_ids.index(op_id) < index
+                ]
+                if len(valid_checkpoints) > 0:
+                    print(
+                        f"*** Checkpoint {valid_checkpoints[-1]} is still valid - when rebuilding the cache, only the ops after it will run"
+                    )
+                return
+        print(
+            f"*** The ops are unchanged, but {len(other_prefix_hashes) - len(op_ids)} ops were removed from the end of the pipeline"
+        )
+
     def delete_cache(self) -> None:
         """
         Will delete this specific named cache from all read and write dirs
@@ -177,15 +350,34 @@ class SamplesCacher:
         dirs_to_delete = [
             os.path.realpath(os.path.join(x, "..")) for x in dirs_to_delete
         ]  # one dir above the pipeline hash dir
+        # checkpoints which are still valid for the current pipeline are kept, so only the ops after them will rerun
+        keep_checkpoints = set(self._get_checkpoint_dir_names().values())
+        if len(keep_checkpoints) > 0:
+            dirs_to_delete = [
+                path
+                for del_dir in dirs_to_delete
+                for path in glob(os.path.join(del_dir, "*"))
+                if os.path.basename(path) != self.CHECKPOINTS_DIR
+            ] + [
+                path
+                for del_dir in dirs_to_delete
+                for path in glob(os.path.join(del_dir, self.CHECKPOINTS_DIR, "*"))
+                if os.path.basename(path) not in keep_checkpoints
+            ]
         print('Due to "delete_cache" call, about to delete the following dirs:')
 
         for del_dir in dirs_to_delete:
             print(del_dir)
         print("---- list end ----")
+        if len(keep_checkpoints) > 0:
+            print(f"keeping the valid checkpoints: {sorted(keep_checkpoints)}")
         print("deleting ... ")
         for del_dir in dirs_to_delete:
             print(f"deleting {os.path.abspath(del_dir)} ...")
-            delete_directory_tree(del_dir)
+            if os.path.isfile(del_dir):
+                os.remove(del_dir)
+            else:
+                delete_directory_tree(del_dir)
 
     def _get_write_dir(self) -> str:
         ans = self._write_dir_logic(self._cache_dirs)
@@ -219,7 +411,9 @@ class SamplesCacher:
         read_dirs = self._get_read_dirs()
         for curr_read_dir in read_dirs:
             fullpath_filename = os.path.join(
-                curr_read_dir, "full_sets_info", hash_filename
+                curr_read_dir,
+                self._get_storage_specific_name("full_sets_info"),
+                hash_filename,
             )
             if os.path.isfile(fullpath_filename):
                 print(
@@ -227,38 +421,103 @@ class SamplesCacher:
                 )
                 return load_pickle(fullpath_filename)
 
-        orig_sid_to_final = OrderedDict()
+        write_dir = self._get_write_dir()
+        journal = CacheBuildJournal(
+            self._get_storage_specific_name("cache_build_journal")
+        )
+
+        # resume an interrupted build - original sample ids found in the journal are already cached
+        journaled = journal.load(read_dirs)
+        orig_sid_to_hash = {
+            sid: SamplesCacher.get_orig_sample_id_hash(sid) for sid in orig_sample_ids
+        }
+        cached_output_info = {
+            sid: journaled[h] for sid, h in orig_sid_to_hash.items() if h in journaled
+        }
+        missing_orig_sample_ids = [
+            sid for sid in orig_sample_ids if sid not in cached_output_info
+        ]
+        if self._verbose > 0 and len(cached_output_info) > 0:
+            print(
+                f"found {len(cached_output_info)} out of {len(orig_sample_ids)} samples in the cache build journal, caching the remaining {len(missing_orig_sample_ids)} samples"
+            )
+
         for_global_storage = {"samples_cacher_instance": self}
-        all_ans = run_multiprocessed(
-            SamplesCacher._cache_worker,
-            orig_sample_ids,
+        throughput = CacheBuildThroughput(
+            report_interval=self._progress_report_interval, verbose=self._verbose
+        )
+        journal_batch = []
+        io_prefetch = (
+            self._io_threads > 0 and self._pipeline.get_io_stage_op_id() is not None
+        )
+        if io_prefetch:
+            chunk_size = 4 * self._io_threads
+            worker_func = SamplesCacher._cache_chunk_worker
+            args_list = [
+                missing_orig_sample_ids[index : index + chunk_size]
+                for index in range(0, len(missing_orig_sample_ids), chunk_size)
+            ]
+        else:
+            worker_func = SamplesCacher._cache_worker
+            args_list = missing_orig_sample_ids
+        for results in run_multiprocessed(
+            worker_func,
+            args_list,
             workers=self._workers,
             copy_to_global_storage=for_global_storage,
             verbose=1,
             desc="caching",
-        )
-
-        for initial_sample_id, output_sample_ids in zip(orig_sample_ids, all_ans):
-            orig_sid_to_final[initial_sample_id] = output_sample_ids
+            keep_results_order=False,
+            as_iterator=True,
+        ):
+            if not io_prefetch:
+                results = [results]
+            for orig_sample_id, output_sample_ids, stats in results:
+                cached_output_info[orig_sample_id] = output_sample_ids
+                throughput.update(stats)
+                journal_batch.append(
+                    (orig_sid_to_hash[orig_sample_id], output_sample_ids)
+                )
+            if len(journal_batch) >= self._journal_batch_size:
+                journal.append(write_dir, journal_batch)
+                journal_batch = []
+        journal.append(write_dir, journal_batch)
+        if len(missing_orig_sample_ids) > 0:
+            throughput.report()
+        self._storage.close()
+        for storage in self._checkpoint_storages.values():
+            storage.close()
 
-        write_dir = self._get_write_dir()
+        orig_sid_to_final = OrderedDict()
+        for initial_sample_id in orig_sample_ids:
+            orig_sid_to_final[initial_sample_id] = cached_output_info[initial_sample_id]
 
-        set_info_dir = os.path.join(write_dir, "full_sets_info")
+        set_info_dir = os.path.join(
+            write_dir, self._get_storage_specific_name("full_sets_info")
+        )
         os.makedirs(set_info_dir, exist_ok=True)
 
-        pipeline_desc_file = os.path.join(
-            write_dir, f"pipeline_{self._pipeline_desc_hash}_desc.txt"
-        )
-        if not os.path.exists(pipeline_desc_file):
-            with open(pipeline_desc_file, "wt") as f:
-                f.write(self._pipeline_desc_text)
-            print("======== wrote", pipeline_desc_file)
+        self._write_pipeline_desc_files(write_dir)
 
         fullpath_filename = os.path.join(set_info_dir, hash_filename)
         save_pickle_safe(orig_sid_to_final, fullpath_filename, compress=True)
 
         return orig_sid_to_final
 
+    def get_memory_cache_stats(self) -> Optional[dict]:
+        """
+        :return: statistics of the memory tier (hits, misses, evictions, ...) in the current process, or None if not used
+        """
+        if self._memory_cache is None:
+            return None
+        return self._memory_cache.get_stats()
+
+    def _get_storage_specific_name(self, name: str) -> str:
+        # summaries of what was already cached are valid only for the storage that created them
+        if self._storage.name == "files":
+            return name
+        return f"{name}@{self._storage.name}"
+
     @staticmethod
     def get_final_sample_id_hash(sample_id: Any) -> str:
         """
@@ -294,71 +553,150 @@ class SamplesCacher:
         """
         :param sample_id: the sample_id of the sample to load
         :param keys: optionally, provide a subset of the keys to load in this sample.
-        This is useful for speeding up loading.
+        Each key can be a full keypath or a prefix of a sub-dict (e.g. "data.gt").
+        Only the data of the requested keys is read from the cache, which is useful for speeding up loading.
+        The sample id keys are always loaded.
         """
+        if keys is not None:
+            keys = list(keys) + [get_sample_id_key(), get_initial_sample_id_key()]
 
         sample_from_cache = self._load_sample_from_cache(sample_id, keys)
         audit_required = self._audit.update()
 
         if audit_required:
             initial_sample_id = get_initial_sample_id(sample_from_cache)
-            fresh_sample = self._load_sample_using_pipeline(initial_sample_id, keys)
+            fresh_sample = self._load_sample_using_pipeline(initial_sample_id)
             fresh_sample = get_specific_sample_from_potentially_morphed(
                 fresh_sample, sample_id
             )
+            fresh_sample = _project_sample(fresh_sample, keys)
 
-            self._audit.audit(sample_from_cache, fresh_sample)
+            self._audit.audit(_read_lazy_arrays(sample_from_cache), fresh_sample)
 
         return sample_from_cache
 
     def _load_sample_using_pipeline(
         self,
         sample_id: Hashable,
-        keys: Optional[Sequence[str]] = None,  # FIXME: noticed that keys is ignored !
-    ) -> NDict:
+        use_checkpoints: bool = False,
+        io_stage_samples: Optional[List[dict]] = None,
+    ) -> Union[None, dict, List[dict]]:
+        """
+        Runs the entire pipeline. Note - the result might be a list of samples or None, see OpBase
+        :param use_checkpoints: resume from the last persisted checkpoint (see OpCheckpoint) if found, and persist the checkpoints computed along the way.
+            Audit does not use it, so stale checkpoints are detected as well.
+        :param io_stage_samples: optional, the output of the I/O stage of the pipeline (see io_threads argument) - only the rest of the pipeline will run.
+            Ignored if a persisted checkpoint is found.
+        """
+        checkpoints = self._pipeline.get_checkpoints() if use_checkpoints else []
+        if len(checkpoints) == 0:
+            if io_stage_samples is not None:
+                return self._pipeline.resume_after_io_stage(io_stage_samples)
+            sample_dict = create_initial_sample(sample_id)
+            result_sample = self._pipeline(sample_dict)
+            return result_sample
+
+        orig_hash = SamplesCacher.get_orig_sample_id_hash(sample_id)
+        checkpoint_callback = partial(self._write_checkpoint, orig_hash)
+        for op_id, _, _ in reversed(checkpoints):
+            samples = self._read_checkpoint(op_id, orig_hash)
+            if samples is not None:
+                return self._pipeline.resume(
+                    samples, op_id, checkpoint_callback=checkpoint_callback
+                )
+
+        if io_stage_samples is not None:
+            return self._pipeline.resume_after_io_stage(
+                io_stage_samples, checkpoint_callback=checkpoint_callback
+            )
         sample_dict = create_initial_sample(sample_id)
-        result_sample = self._pipeline(sample_dict)
-        return result_sample
+        return self._pipeline(sample_dict, checkpoint_callback=checkpoint_callback)
+
+    def _get_checkpoint_dir_names(self) -> Dict[str, str]:
+        """
+        :return: op id -> checkpoint dir name, for each OpCheckpoint in the pipeline.
+            The name includes the hash of the pipeline prefix, so it is valid as long as the ops up to the checkpoint are unchanged.
+        """
+        return {
+            op_id: f"{name}@{prefix_hash}"
+            for op_id, name, prefix_hash in self._pipeline.get_checkpoints()
+        }
+
+    def _get_checkpoint_storage(self, op_id: str) -> SamplesStorageBase:
+        # a storage instance per checkpoint, so each one writes into its own shards
+        if op_id not in self._checkpoint_storages:
+            if isinstance(self._storage, SamplesStorageShards):
+                # the tail of the pipeline might modify the arrays inplace, so not using mmap
+                storage = SamplesStorageShards(
+                    max_shard_bytes=self._storage._max_shard_bytes,
+                    minimal_array_size=self._storage._minimal_array_size,
+                )
+            elif isinstance(self._storage, SamplesStorageFiles):
+                # the tail of the pipeline might modify the arrays inplace, so not using lazy arrays
+                storage = SamplesStorageFiles()
+            else:
+                storage = copy.deepcopy(self._storage)
+            self._checkpoint_storages[op_id] = storage
+        return self._checkpoint_storages[op_id]
+
+    def _write_checkpoint(
+        self, orig_hash: str, op_id: str, samples: List[NDict]
+    ) -> None:
+        dir_name = self._get_checkpoint_dir_names()[op_id]
+        write_dir = os.path.join(
+            os.path.dirname(self._get_write_dir()), self.CHECKPOINTS_DIR, dir_name
+        )
+        storage = self._get_checkpoint_storage(op_id)
+        found, _ = storage.read_orig_info([write_dir], orig_hash)
+        if found:
+            return
+        os.makedirs(write_dir, exist_ok=True)
+        for index, sample in enumerate(samples):
+            storage.write_sample(write_dir, f"{orig_hash}@{index}", sample)
+        storage.write_orig_info(write_dir, orig_hash, len(samples))
+
+    def _read_checkpoint(self, op_id: str, orig_hash: str) -> Optional[List[NDict]]:
+        dir_name = self._get_checkpoint_dir_names()[op_id]
+        read_dirs = [
+            os.path.join(os.path.dirname(d), self.CHECKPOINTS_DIR, dir_name)
+            for d in self._get_read_dirs()
+        ]
+        storage = self._get_checkpoint_storage(op_id)
+        found, num_samples = storage.read_orig_info(read_dirs, orig_hash)
+        if not found:
+            return None
+        samples = [
+            storage.read_sample(read_dirs, f"{orig_hash}@{index}")
+            for index in range(num_samples)
+        ]
+        if any(sample is None for sample in samples):
+            return None
+        return samples
 
     def _load_sample_from_cache(
         self,
         sample_id: Hashable,
-        keys: Optional[Sequence[str]] = None,  # FIXME: noticed that keys is ignored !
+        keys: Optional[Sequence[str]] = None,
     ) -> NDict:
         """
-        TODO: add comments
+        Loads a sample from the first read dir that contains it
+        :param keys: optional, load only the specified keys. See load_sample()
         """
         read_dirs = self._get_read_dirs()
         sample_hash = SamplesCacher.get_final_sample_id_hash(sample_id)
 
-        for curr_read_dir in read_dirs:
-            extension_less = os.path.join(curr_read_dir, sample_hash)
-            if os.path.isfile(extension_less + ".pkl.gz"):
-                loaded_sample = NDict(load_pickle(extension_less + ".pkl.gz"))
-                if os.path.isfile(extension_less + ".hdf5"):
-                    loaded_sample_hdf5_part = load_hdf5(extension_less + ".hdf5")
-                    stored_ndarrays_list = [
-                        k
-                        for k in loaded_sample_hdf5_part.keys()
-                        if ("@RESERVED_LIST@" in k) or ("@RESERVED_TUPLE@" in k)
-                    ]  # in these cases the ndarrays were originally stored as a list or tuple of ndarrays
-                    for seq_key in stored_ndarrays_list:
-                        seq_key_clean = seq_key.replace("@RESERVED_LIST@", "").replace(
-                            "@RESERVED_TUPLE@", ""
-                        )
-                        curr_sequence_length = loaded_sample_hdf5_part.pop(seq_key)[0]
-                        curr_seq = []
-                        for i in range(curr_sequence_length):
-                            curr_seq.append(
-                                loaded_sample_hdf5_part.pop(
-                                    seq_key_clean + f"@RESERVED_ELEM@{i}"
-                                )
-                            )
-                        if "@RESERVED_TUPLE@" in seq_key:
-                            curr_seq = tuple(curr_seq)
-                        loaded_sample_hdf5_part[seq_key_clean] = curr_seq
-
-                    loaded_sample.merge(loaded_sample_hdf5_part)
+        if self._memory_cache is not None:
+            # the memory tier keeps entire samples, the requested keys are selected after loading
+            loaded_sample = self._memory_cache.get(sample_hash)
+            if loaded_sample is None:
+                loaded_sample = self._storage.read_sample(read_dirs, sample_hash)
+                if loaded_sample is not None:
+                    self._memory_cache.put(sample_hash, loaded_sample)
+            if loaded_sample is not None:
+                return _project_sample(loaded_sample, keys)
+        else:
+            loaded_sample = self._storage.read_sample(read_dirs, sample_hash, keys)
+            if loaded_sample is not None:
                 return loaded_sample
 
         raise Exception(
@@ -366,14 +704,57 @@ class SamplesCacher:
         )
 
     @staticmethod
-    def _cache_worker(orig_sample_id: Any) -> Any:
+    def _cache_worker(orig_sample_id: Any) -> Tuple[Any, Any, dict]:
+        """
+        :return: the original sample id, the output sample ids and statistics used for throughput reports
+        """
+        cacher = get_from_global_storage("samples_cacher_instance")
+        start = time.time()
+        ans, bytes_written = cacher._cache_and_count_bytes(orig_sample_id)
+        stats = dict(
+            worker=os.getpid(), bytes=bytes_written, seconds=time.time() - start
+        )
+        return orig_sample_id, ans, stats
+
+    @staticmethod
+    def _cache_chunk_worker(orig_sample_ids: List[Any]) -> List[Tuple[Any, Any, dict]]:
+        """
+        Caches a chunk of samples, while the I/O stage of the pipeline of the next samples runs in threads (see io_threads argument)
+        :return: a list of tuples, see _cache_worker()
+        """
         cacher = get_from_global_storage("samples_cacher_instance")
-        ans = cacher._cache(orig_sample_id)
+        ans = []
+        start = time.time()
+        for orig_sample_id, io_stage_samples in run_thread_prefetched(
+            cacher._run_io_stage, orig_sample_ids, cacher._io_threads
+        ):
+            output_sample_ids, bytes_written = cacher._cache_and_count_bytes(
+                orig_sample_id, io_stage_samples
+            )
+            end = time.time()
+            stats = dict(worker=os.getpid(), bytes=bytes_written, seconds=end - start)
+            start = end
+            ans.append((orig_sample_id, output_sample_ids, stats))
         return ans
 
+    def _run_io_stage(self, orig_sample_id: Any) -> List[dict]:
+        """
+        See PipelineDefault.run_io_stage()
+        """
+        return self._pipeline.run_io_stage(create_initial_sample(orig_sample_id))
+
     def _cache(self, orig_sample_id: Any) -> Any:
+        """
+        See _cache_and_count_bytes()
+        """
+        return self._cache_and_count_bytes(orig_sample_id)[0]
+
+    def _cache_and_count_bytes(
+        self, orig_sample_id: Any, io_stage_samples: Optional[List[dict]] = None
+    ) -> Tuple[Any, int]:
         """
         :param orig_sample_id: the original sample id, which was provided as the input to the pipeline
+        :param io_stage_samples: optional, the output of the I/O stage of the pipeline, see _load_sample_using_pipeline()
         :param sample: the result of the pipeline - can be None if it was dropped, a dictionary in the typical standard case,
          and a list of dictionaries in case the sample was split into multiple samples (ops are allowed to do that during the static part of the processing)
         """
@@ -383,16 +764,15 @@ class SamplesCacher:
         read_dirs = self._get_read_dirs()
 
         was_processed_hash = SamplesCacher.get_orig_sample_id_hash(orig_sample_id)
-        was_processed_fn = was_processed_hash + ".pkl"
 
         # checking in all read directories if information related to this sample(s) was already cached
-        for curr_read_dir in read_dirs:
-            fn = os.path.join(curr_read_dir, was_processed_fn)
-            if os.path.isfile(fn):
-                ans = load_pickle(fn)
-                return ans
+        found, ans = self._storage.read_orig_info(read_dirs, was_processed_hash)
+        if found:
+            return ans, 0
 
-        result_sample = self._load_sample_using_pipeline(orig_sample_id)
+        result_sample = self._load_sample_using_pipeline(
+            orig_sample_id, use_checkpoints=True, io_stage_samples=io_stage_samples
+        )
 
         if isinstance(result_sample, dict):
             result_sample = [result_sample]
@@ -408,6 +788,7 @@ class SamplesCacher:
                 f"Unsupported sample type, got {type(result_sample)}. Supported types are dict, list-of-dicts and None."
             )
 
+        bytes_written = 0
         if result_sample is not None:
             output_info = []
             for curr_sample in result_sample:
@@ -417,60 +798,42 @@ class SamplesCacher:
                     curr_sample_id
                 )
 
-                requiring_hdf5_keys = _object_requires_hdf5_recurse(curr_sample)
-                if len(requiring_hdf5_keys) > 0:
-                    requiring_hdf5_dict = curr_sample.get_multi(requiring_hdf5_keys)
-                    requiring_hdf5_dict = requiring_hdf5_dict.flatten()
-
-                    hdf5_filename = os.path.join(
-                        write_dir, output_sample_hash + ".hdf5"
-                    )
-
-                    requiring_hdf5_dict_final = NDict()
-                    for k, obj in requiring_hdf5_dict.items():
-                        requiring_hdf5_dict_final.update(
-                            _convert_to_sequence_for_hdf5_if_needed(k, obj)
-                        )
-
-                    save_hdf5_safe(hdf5_filename, **requiring_hdf5_dict_final)
-
-                    # remove all hdf5 entries from the sample_dict that will be pickled
-                    for k in requiring_hdf5_dict.keys():
-                        _ = curr_sample.pop(k)
-
-                save_pickle_safe(
-                    curr_sample,
-                    os.path.join(write_dir, output_sample_hash + ".pkl.gz"),
-                    compress=True,
+                bytes_written += self._storage.write_sample(
+                    write_dir, output_sample_hash, curr_sample
                 )
         else:
             output_info = None
             # requiring_hdf5_keys = None
 
-        save_pickle_safe(output_info, os.path.join(write_dir, was_processed_fn))
-        return output_info
-
-
-def _convert_to_sequence_for_hdf5_if_needed(key: str, data: Any) -> Dict:
-    ans = {}
-    if isinstance(data, (list, tuple)):
-        if isinstance(data, list):
-            ans[key + "@RESERVED_LIST@"] = np.array(
-                [len(data)]
-            )  # to mark that this case is a list, and its length
-        elif isinstance(data, tuple):
-            ans[key + "@RESERVED_TUPLE@"] = np.array(
-                [len(data)]
-            )  # to mark that this case is a tuple, and its length
-        else:
-            assert False  # should not get here
+        self._storage.write_orig_info(write_dir, was_processed_hash, output_info)
+        return output_info, bytes_written
+
+
+def _project_sample(sample: NDict, keys: Optional[Sequence[str]]) -> NDict:
+    """
+    Keeps only the requested keys (or sub-dicts) - the same selection storages apply when loading with keys
+    """
+    if keys is None:
+        return sample
+    return NDict(
+        {k: v for k, v in sample.items() if is_key_requested(k, keys)},
+        already_flat=True,
+    )
+
 
-        for i, elem in enumerate(data):
-            ans[key + f"@RESERVED_ELEM@{i}"] = elem
-    else:
-        ans = {key: data}
+def _read_lazy_arrays(sample: NDict) -> NDict:
+    """
+    Used by the audit - LazyArray values (see SamplesStorageFiles lazy_arrays) are compared as numpy arrays
+    """
 
-    return ans
+    def _read(value: Any) -> Any:
+        if isinstance(value, LazyArray):
+            return value.numpy()
+        if isinstance(value, (list, tuple)):
+            return type(value)(_read(elem) for elem in value)
+        return value
+
+    return NDict({k: _read(v) for k, v in sample.items()}, already_flat=True)
 
 
 def _get_available_write_location(
@@ -501,3 +864,10 @@ def _get_available_write_location(
 
 def default_read_dirs_logic(cache_dirs: List[str]) -> List[str]:
     return cache_dirs
+
+
+def _derived_read_dirs_logic(read_dirs_logic: Callable, unique_name: str) -> List[str]:
+    """
+    The read dirs of a derived cacher (see SamplesCacher.derive()) - next to the read dirs of the original cacher
+    """
+    return [os.path.join(os.path.dirname(d), unique_name) for d in read_dirs_logic()]
@@ -0,0 +1,241 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Set
+import atexit
+import heapq
+import os
+import pickle
+import tempfile
+import threading
+import uuid
+
+from fuse.data.datasets.caching.samples_storage import SamplesStorageShards
+from fuse.utils.file_io.file_io import delete_directory_tree
+from fuse.utils.ndict import NDict
+
+
+class SamplesMemoryCacheBase:
+    """
+    A memory tier on top of the samples cache (see SamplesCacher memory_cache argument).
+    Samples are loaded from disk only once and then served from memory, as long as they fit in max_bytes.
+    Note that statistics are counted per process.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        :param max_bytes: maximum number of bytes used to store samples
+        """
+        self._max_bytes = max_bytes
+        self.reset_stats()
+
+    def get(self, sample_hash: str) -> Optional[NDict]:
+        """
+        :return: a copy of the sample, safe to modify, or None if not found
+        """
+        raise NotImplementedError
+
+    def put(self, sample_hash: str, sample: NDict) -> None:
+        """
+        Store a sample (if possible)
+        """
+        raise NotImplementedError
+
+    def get_used_bytes(self) -> int:
+        raise NotImplementedError
+
+    def reset_stats(self) -> None:
+        self._stats = Counter(hits=0, misses=0, evictions=0, rejected=0)
+
+    def get_stats(self) -> dict:
+        """
+        :return: a dictionary with the number of hits, misses, evicted samples, samples rejected since they could not fit, and the used bytes
+        """
+        ans = dict(self._stats)
+        ans["used_bytes"] = self.get_used_bytes()
+        return ans
+
+
+class SamplesMemoryCache(SamplesMemoryCacheBase):
+    """
+    In-process memory tier. Samples are kept serialized (pickled), so every get returns an independent copy
+    that the dynamic pipeline can safely modify, and the memory usage is known exactly.
+    Note that each DataLoader worker keeps its own copy, see SamplesSharedMemoryCache to avoid it.
+
+    Usage example:
+        cacher = SamplesCacher("my_cache", static_pipeline, cache_dirs=cache_dir, memory_cache=SamplesMemoryCache(max_bytes=8 * 1024**3))
+    """
+
+    POLICIES = ("lru", "lfu")
+
+    def __init__(self, max_bytes: int, policy: str = "lru"):
+        """
+        :param max_bytes: maximum number of bytes used to store samples
+        :param policy: eviction policy once max_bytes is reached - "lru" (least recently used) or "lfu" (least frequently used)
+        """
+        if policy not in self.POLICIES:
+            raise Exception(
+                f"Unsupported eviction policy {policy}, supported policies are {self.POLICIES}"
+            )
+        super().__init__(max_bytes)
+        self._policy = policy
+        self._samples: OrderedDict[str, bytes] = OrderedDict()
+        # lfu - the samples grouped by their number of accesses, each group is ordered from least to most recently used.
+        # The frequencies of the groups are kept in a heap (with lazy removal of the frequencies of empty groups), so eviction is O(log N)
+        self._frequency: Dict[str, int] = {}
+        self._frequency_groups: Dict[int, OrderedDict] = {}
+        self._frequency_heap: List[int] = []
+        self._frequency_heap_members: Set[int] = set()
+        self._used_bytes = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # a copy sent to another process starts empty
+        return {"_max_bytes": self._max_bytes, "_policy": self._policy}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["_max_bytes"], state["_policy"])
+
+    def get(self, sample_hash: str) -> Optional[NDict]:
+        with self._lock:
+            data = self._samples.get(sample_hash, None)
+            if data is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._samples.move_to_end(sample_hash)
+            if self._policy == "lfu":
+                frequency = self._frequency[sample_hash]
+                self._remove_from_frequency_group(sample_hash, frequency)
+                self._add_to_frequency_group(sample_hash, frequency + 1)
+        return pickle.loads(data)
+
+    def put(self, sample_hash: str, sample: NDict) -> None:
+        data = pickle.dumps(sample, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if sample_hash in self._samples:
+                return
+            if len(data) > self._max_bytes:
+                self._stats["rejected"] += 1
+                return
+            while self._used_bytes + len(data) > self._max_bytes:
+                self._evict()
+            self._samples[sample_hash] = data
+            if self._policy == "lfu":
+                self._add_to_frequency_group(sample_hash, 1)
+            self._used_bytes += len(data)
+
+    def _evict(self) -> None:
+        if self._policy == "lru":
+            victim = next(iter(self._samples))
+        else:
+            # the least frequently used, ties are broken by recency
+            while self._frequency_heap[0] not in self._frequency_groups:
+                self._frequency_heap_members.remove(heapq.heappop(self._frequency_heap))
+            frequency = self._frequency_heap[0]
+            victim = next(iter(self._frequency_groups[frequency]))
+            self._remove_from_frequency_group(victim, frequency)
+        self._used_bytes -= len(self._samples.pop(victim))
+        self._stats["evictions"] += 1
+
+    def _add_to_frequency_group(self, sample_hash: str, frequency: int) -> None:
+        self._frequency[sample_hash] = frequency
+        group = self._frequency_groups.get(frequency, None)
+        if group is None:
+            group = self._frequency_groups[frequency] = OrderedDict()
+            if frequency not in self._frequency_heap_members:
+                heapq.heappush(self._frequency_heap, frequency)
+                self._frequency_heap_members.add(frequency)
+        group[sample_hash] = None
+
+    def _remove_from_frequency_group(self, sample_hash: str, frequency: int) -> None:
+        del self._frequency[sample_hash]
+        group = self._frequency_groups[frequency]
+        del group[sample_hash]
+        if len(group) == 0:
+            del self._frequency_groups[frequency]
+
+    def get_used_bytes(self) -> int:
+        return self._used_bytes
+
+
+class SamplesSharedMemoryCache(SamplesMemoryCacheBase):
+    """
+    Memory tier shared by all the processes using the cacher (typically DataLoader workers),
+    so N workers do not each keep their own duplicate copy of the hot samples.
+    Samples are stored in shard files (see SamplesStorageShards) in a RAM backed file system (/dev/shm by default),
+    each process appends to its own shard and reads the shards of all the others.
+
+    The shards are append-only, so there is no eviction: samples are added until max_bytes is reached and rejected afterwards.
+    Note that max_bytes is a soft limit - the processes check the used bytes without coordinating with each other,
+    so N processes that store samples at the same time might exceed it by up to N samples.
+    It is useful when the working set (or most of it) fits in memory.
+    The directory is deleted when the process that created this object exits.
+
+    Usage example:
+        cacher = SamplesCacher("my_cache", static_pipeline, cache_dirs=cache_dir, memory_cache=SamplesSharedMemoryCache(max_bytes=8 * 1024**3))
+    """
+
+    def __init__(self, max_bytes: int, shared_memory_dir: Optional[str] = None):
+        """
+        :param max_bytes: maximum number of bytes used to store samples (by all processes)
+        :param shared_memory_dir: a RAM backed directory in which a unique sub directory is created. Default is /dev/shm if available.
+        """
+        super().__init__(max_bytes)
+        if shared_memory_dir is None:
+            shared_memory_dir = (
+                "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            )
+        self._dir = os.path.join(
+            shared_memory_dir, f"fuse_samples_memory_cache_{uuid.uuid4().hex}"
+        )
+        os.makedirs(self._dir)
+        self._storage = SamplesStorageShards(max_shard_bytes=max_bytes)
+        self._owner_pid = os.getpid()
+        atexit.register(self._cleanup)
+
+    def _cleanup(self) -> None:
+        if os.getpid() == self._owner_pid and os.path.isdir(self._dir):
+            self._storage.close()
+            delete_directory_tree(self._dir)
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state["_stats"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.reset_stats()
+
+    def get(self, sample_hash: str) -> Optional[NDict]:
+        sample = self._storage.read_sample([self._dir], sample_hash)
+        self._stats["hits" if sample is not None else "misses"] += 1
+        return sample
+
+    def put(self, sample_hash: str, sample: NDict) -> None:
+        # a soft limit, see the class doc
+        if self.get_used_bytes() >= self._max_bytes:
+            self._stats["rejected"] += 1
+            return
+        self._storage.write_sample(self._dir, sample_hash, sample)
+
+    def get_used_bytes(self) -> int:
+        shards_dir = os.path.join(self._dir, SamplesStorageShards.SHARDS_DIR)
+        if not os.path.isdir(shards_dir):
+            return 0
+        return sum(
+            entry.stat().st_size
+            for entry in os.scandir(shards_dir)
+            if entry.name.endswith(".bin")
+        )
@@ -0,0 +1,658 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from abc import abstractmethod
+from glob import glob
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import mmap
+import os
+import pickle
+import socket
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from fuse.data.datasets.caching.object_caching_handlers import (
+    _object_requires_hdf5_recurse,
+    _valid_ndarray,
+)
+from fuse.data.utils.lazy_array import LazyArray
+from fuse.utils.file_io.file_io import (
+    load_hdf5,
+    load_hdf5_lazy,
+    save_hdf5_safe,
+    load_pickle,
+    save_pickle_safe,
+)
+from fuse.utils.ndict import NDict
+
+
+class SamplesStorageBase:
+    """
+    Defines how SamplesCacher persists samples on disk.
+    Two kinds of records are stored:
+    1. output samples - the result of the static pipeline, keyed by SamplesCacher.get_final_sample_id_hash()
+    2. "was processed" information - the output sample ids generated from an original sample id,
+        keyed by SamplesCacher.get_orig_sample_id_hash()
+    """
+
+    # short name of the storage, used to separate information that depends on the storage layout
+    name: str = None
+
+    @abstractmethod
+    def write_sample(self, write_dir: str, sample_hash: str, sample: NDict) -> int:
+        """
+        Store a single output sample
+        :param write_dir: the directory to write into
+        :param sample_hash: the output sample hash
+        :param sample: the sample to store. Might be modified inplace.
+        :return: number of bytes written
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_sample(
+        self,
+        read_dirs: List[str],
+        sample_hash: str,
+        keys: Optional[Sequence[str]] = None,
+    ) -> Optional[NDict]:
+        """
+        Load a single output sample. Read dirs are searched in the provided order.
+        :param keys: optional, load only the specified keypaths (or sub-dicts, e.g. "data.gt"). None to load everything.
+            Storages are expected to avoid reading (and decoding) the data of keys that were not requested.
+        :return: the sample or None if not found
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def write_orig_info(self, write_dir: str, orig_hash: str, output_info: Any) -> None:
+        """
+        Store the output sample ids generated from an original sample id (None if the sample was dropped)
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_orig_info(self, read_dirs: List[str], orig_hash: str) -> Tuple[bool, Any]:
+        """
+        :return: a tuple (found, output_info)
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """
+        Release any resources (open files etc.) held by the storage in the current process
+        """
+        pass
+
+
+class SamplesStorageFiles(SamplesStorageBase):
+    """
+    The default storage - a file per output sample ([hash].pkl.gz and, for large numpy arrays, [hash].hdf5)
+    and a "was processed" marker file per original sample id.
+
+    When lazy_arrays=True, the large arrays are returned as LazyArray instances, read on demand from the HDF5 file.
+    Only the chunks touched by the selected region (for example a crop in the dynamic pipeline, see OpCrop3D) are read and decompressed.
+    The HDF5 files are kept open in a per process pool (see fuse.utils.file_io.file_io.load_hdf5_lazy()).
+    """
+
+    name = "files"
+
+    def __init__(self, lazy_arrays: bool = False):
+        """
+        :param lazy_arrays: return the large arrays as LazyArray instances instead of reading them to memory
+        """
+        self._lazy_arrays = lazy_arrays
+
+    def write_sample(self, write_dir: str, sample_hash: str, sample: NDict) -> int:
+        total_bytes = 0
+        requiring_hdf5_keys = _object_requires_hdf5_recurse(sample)
+        if len(requiring_hdf5_keys) > 0:
+            requiring_hdf5_dict = sample.get_multi(requiring_hdf5_keys)
+            requiring_hdf5_dict = requiring_hdf5_dict.flatten()
+
+            hdf5_filename = os.path.join(write_dir, sample_hash + ".hdf5")
+
+            requiring_hdf5_dict_final = NDict()
+            for k, obj in requiring_hdf5_dict.items():
+                requiring_hdf5_dict_final.update(
+                    _convert_to_sequence_for_hdf5_if_needed(k, obj)
+                )
+
+            save_hdf5_safe(hdf5_filename, **requiring_hdf5_dict_final)
+            total_bytes += os.path.getsize(hdf5_filename)
+
+            # remove all hdf5 entries from the sample_dict that will be pickled (without modifying the given sample)
+            hdf5_keys = set(requiring_hdf5_dict.keys())
+            sample = NDict(
+                {k: v for k, v in sample.items() if k not in hdf5_keys},
+                already_flat=True,
+            )
+
+        pickle_filename = save_pickle_safe(
+            sample,
+            os.path.join(write_dir, sample_hash + ".pkl.gz"),
+            compress=True,
+        )
+        total_bytes += os.path.getsize(pickle_filename)
+        return total_bytes
+
+    def read_sample(
+        self,
+        read_dirs: List[str],
+        sample_hash: str,
+        keys: Optional[Sequence[str]] = None,
+    ) -> Optional[NDict]:
+        for curr_read_dir in read_dirs:
+            extension_less = os.path.join(curr_read_dir, sample_hash)
+            if os.path.isfile(extension_less + ".pkl.gz"):
+                loaded_sample = NDict(load_pickle(extension_less + ".pkl.gz"))
+                if keys is not None:
+                    loaded_sample = NDict(
+                        {
+                            k: v
+                            for k, v in loaded_sample.items()
+                            if is_key_requested(k, keys)
+                        },
+                        already_flat=True,
+                    )
+                if os.path.isfile(extension_less + ".hdf5"):
+                    custom_extract = None
+                    if keys is not None:
+                        # extract only the requested datasets
+                        custom_extract = {
+                            k: None
+                            for k in _get_hdf5_keys(extension_less + ".hdf5")
+                            if is_key_requested(k.split("@RESERVED_")[0], keys)
+                        }
+                    if custom_extract is None or len(custom_extract) > 0:
+                        if self._lazy_arrays:
+                            loaded_sample_hdf5_part = _load_hdf5_as_lazy_arrays(
+                                extension_less + ".hdf5", keys=custom_extract
+                            )
+                        else:
+                            loaded_sample_hdf5_part = load_hdf5(
+                                extension_less + ".hdf5", custom_extract=custom_extract
+                            )
+                        _restore_sequences_from_hdf5(loaded_sample_hdf5_part)
+                        loaded_sample.merge(loaded_sample_hdf5_part)
+                return loaded_sample
+
+        return None
+
+    def write_orig_info(self, write_dir: str, orig_hash: str, output_info: Any) -> None:
+        save_pickle_safe(output_info, os.path.join(write_dir, orig_hash + ".pkl"))
+
+    def read_orig_info(self, read_dirs: List[str], orig_hash: str) -> Tuple[bool, Any]:
+        # checking in all read directories if information related to this sample(s) was already cached
+        for curr_read_dir in read_dirs:
+            fn = os.path.join(curr_read_dir, orig_hash + ".pkl")
+            if os.path.isfile(fn):
+                return True, load_pickle(fn)
+        return False, None
+
+
+class SamplesStorageShards(SamplesStorageBase):
+    """
+    Packs samples into a small number of large append-only shard files.
+    Intended for big datasets, in which a file per sample overloads the file system (typically network storage) metadata servers.
+
+    Layout (inside the pipeline hash dir):
+        shards/shard@[host]_[pid]_[rand].bin - concatenated sample records
+        shards/shard@[host]_[pid]_[rand].idx - a persistent index: a stream of pickled records, one per stored sample / original sample id
+
+    A sample record is a pickled header (all the small values + a description of the large arrays)
+    followed by the large numpy arrays, each stored as a raw, C-contiguous, aligned blob.
+
+    Every writing process appends to its own shard, so no locking is needed between multiprocessing workers.
+    A record is added to the index only after the sample data was written, so an interrupted build never points to partial data.
+    Loading a sample costs a single positioned read (os.pread) from an already open shard file.
+    The index records written by a process are added to its in-memory index directly. Records written by other processes are loaded
+    when a lookup misses, at most once per min_refresh_interval seconds per read dir (and on the first miss after close()).
+
+    When mmap_arrays=True, only the header is read, and the large arrays are returned as read-only views of the memory mapped shard.
+    Nothing is copied, and only the pages that are actually accessed (for example by a crop in the dynamic pipeline) are read from disk.
+    Note that ops that modify such arrays inplace will fail - copy the array first (or use a different mode).
+
+    Usage example:
+        cacher = SamplesCacher("my_cache", static_pipeline, cache_dirs=cache_dir, storage="shards")
+        # or, for zero-copy loading of large arrays:
+        cacher = SamplesCacher("my_cache", static_pipeline, cache_dirs=cache_dir, storage="shards_mmap")
+    """
+
+    name = "shards"
+
+    SHARDS_DIR = "shards"
+    # alignment (in bytes) of records and of arrays within a record
+    ALIGNMENT = 64
+
+    def __init__(
+        self,
+        max_shard_bytes: int = 2 * 1024**3,
+        mmap_arrays: bool = False,
+        minimal_array_size: int = 100,
+        min_refresh_interval: float = 1.0,
+    ):
+        """
+        :param max_shard_bytes: once a shard grows beyond this size, the writing process starts a new one
+        :param mmap_arrays: return the large arrays as read-only views of the memory mapped shard instead of reading them to memory
+        :param minimal_array_size: numpy arrays with more elements than this value are stored as raw blobs
+        :param min_refresh_interval: minimal time (seconds) between two reloads of the index of a read dir, triggered by lookups that miss.
+            Reloading lists all the shards, so without a limit, caching many new samples costs O(samples x shards) file system calls.
+        """
+        self._max_shard_bytes = max_shard_bytes
+        self._mmap_arrays = mmap_arrays
+        self._minimal_array_size = minimal_array_size
+        self._min_refresh_interval = min_refresh_interval
+        self._reset_process_state()
+
+    def _reset_process_state(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+        # writer state
+        self._writer_dir = None
+        self._writer_name = None
+        self._writer_bin = None
+        self._writer_idx = None
+        # reader state - per read dir: {"sample": {hash: (shard name, offset, length, header length)}, "orig": {hash: output_info}, "consumed": {idx path: bytes}}
+        self._indices: Dict[str, Dict[str, dict]] = {}
+        # per read dir: the last time (time.monotonic()) the index was reloaded
+        self._last_refresh: Dict[str, float] = {}
+        self._read_fds: Dict[str, int] = {}
+        self._read_mmaps: Dict[str, mmap.mmap] = {}
+
+    def _verify_process(self) -> None:
+        # open files and loaded indices must not be shared with a forked worker process
+        if self._pid != os.getpid():
+            self._reset_process_state()
+
+    def __getstate__(self) -> dict:
+        return {
+            "_max_shard_bytes": self._max_shard_bytes,
+            "_mmap_arrays": self._mmap_arrays,
+            "_minimal_array_size": self._minimal_array_size,
+            "_min_refresh_interval": self._min_refresh_interval,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._reset_process_state()
+
+    ### writing
+
+    def _get_writer(self, write_dir: str) -> Tuple[Any, Any, str]:
+        if self._writer_bin is not None:
+            if (
+                self._writer_dir != write_dir
+                or self._writer_bin.tell() >= self._max_shard_bytes
+            ):
+                self._close_writer()
+
+        if self._writer_bin is None:
+            shards_dir = os.path.join(write_dir, self.SHARDS_DIR)
+            os.makedirs(shards_dir, exist_ok=True)
+            self._writer_name = (
+                f"shard@{socket.gethostname()}_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+            )
+            self._writer_dir = write_dir
+            self._writer_bin = open(
+                os.path.join(shards_dir, self._writer_name + ".bin"), "ab"
+            )
+            self._writer_idx = open(
+                os.path.join(shards_dir, self._writer_name + ".idx"), "ab"
+            )
+
+        return self._writer_bin, self._writer_idx, self._writer_name
+
+    def _close_writer(self) -> None:
+        if self._writer_bin is not None:
+            self._writer_bin.close()
+            self._writer_idx.close()
+        self._writer_dir = None
+        self._writer_name = None
+        self._writer_bin = None
+        self._writer_idx = None
+
+    def _append_index_record(self, idx_file: Any, record: tuple) -> None:
+        start = idx_file.tell()
+        pickle.dump(record, idx_file, protocol=pickle.HIGHEST_PROTOCOL)
+        idx_file.flush()
+        # add the record to the loaded index, so it's found without reloading the index
+        index = self._indices.get(self._writer_dir, None)
+        if index is not None:
+            _add_index_record(index, record, idx_file.name)
+            if index["consumed"].get(idx_file.name, 0) == start:
+                index["consumed"][idx_file.name] = idx_file.tell()
+
+    def _serialize_sample(self, sample: NDict) -> Tuple[bytes, List[np.ndarray]]:
+        """
+        :return: the record header and the list of arrays to store as raw blobs after it
+        """
+        values = {}
+        arrays_desc = {}
+        arrays = []
+        arrays_bytes = 0
+        for k, v in NDict(sample).to_dict().items():
+            if _valid_ndarray(v, self._minimal_array_size) and not v.dtype.hasobject:
+                v = np.ascontiguousarray(v)
+                # offset is relative to the start of the arrays area
+                arrays_desc[k] = (v.dtype.str, v.shape, arrays_bytes)
+                arrays_bytes += _align(v.nbytes, self.ALIGNMENT)
+                arrays.append(v)
+            else:
+                values[k] = v
+        header = pickle.dumps((values, arrays_desc), protocol=pickle.HIGHEST_PROTOCOL)
+        return header, arrays
+
+    def write_sample(self, write_dir: str, sample_hash: str, sample: NDict) -> int:
+        header, arrays = self._serialize_sample(sample)
+        with self._lock:
+            self._verify_process()
+            bin_file, idx_file, shard_name = self._get_writer(write_dir)
+            offset = bin_file.tell()
+            # align the record start, so the arrays will be aligned in the file (and in memory when mapped)
+            _write_padding(bin_file, _align(offset, self.ALIGNMENT) - offset)
+            offset = _align(offset, self.ALIGNMENT)
+            bin_file.write(header)
+            _write_padding(bin_file, _align(len(header), self.ALIGNMENT) - len(header))
+            for arr in arrays:
+                bin_file.write(memoryview(arr).cast("B"))
+                _write_padding(
+                    bin_file, _align(arr.nbytes, self.ALIGNMENT) - arr.nbytes
+                )
+            length = bin_file.tell() - offset
+            bin_file.flush()
+            self._append_index_record(
+                idx_file,
+                ("sample", sample_hash, shard_name, offset, length, len(header)),
+            )
+        return length
+
+    def write_orig_info(self, write_dir: str, orig_hash: str, output_info: Any) -> None:
+        with self._lock:
+            self._verify_process()
+            _, idx_file, _ = self._get_writer(write_dir)
+            self._append_index_record(idx_file, ("orig", orig_hash, output_info))
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_writer()
+            for fd in self._read_fds.values():
+                os.close(fd)
+            self._read_fds = {}
+            # records written by other processes (e.g. the workers that built the cache) are loaded on the next miss
+            self._last_refresh = {}
+            # arrays returned to the user might still reference the mapped memory, so the mmaps are released by the garbage collector
+            self._read_mmaps = {}
+
+    ### reading
+
+    def _refresh_index(self, read_dir: str) -> None:
+        """
+        Loads new index records. Index files are append-only, so only the unread tail of each file is parsed.
+        """
+        index = self._indices.setdefault(
+            read_dir, {"sample": {}, "orig": {}, "consumed": {}}
+        )
+        for idx_path in sorted(
+            glob(os.path.join(read_dir, self.SHARDS_DIR, "shard@*.idx"))
+        ):
+            consumed = index["consumed"].get(idx_path, 0)
+            if os.path.getsize(idx_path) <= consumed:
+                continue
+            with open(idx_path, "rb") as f:
+                f.seek(consumed)
+                while True:
+                    try:
+                        record = pickle.load(f)
+                    except (EOFError, pickle.UnpicklingError):
+                        # end of file, or a record which is still being written by another process
+                        break
+                    consumed = f.tell()
+                    _add_index_record(index, record, idx_path)
+            index["consumed"][idx_path] = consumed
+        self._last_refresh[read_dir] = time.monotonic()
+
+    def _find(
+        self, read_dirs: List[str], kind: str, key: str
+    ) -> Tuple[Optional[str], Any]:
+        """
+        Searches the read dirs, in order, for an index record.
+        The index is reloaded only on a miss, and at most once per min_refresh_interval seconds.
+        :return: a tuple (read_dir, record) or (None, None) if not found
+        """
+        with self._lock:
+            self._verify_process()
+            for refresh in (False, True):
+                for curr_read_dir in read_dirs:
+                    if curr_read_dir not in self._indices or (
+                        refresh and self._is_refresh_allowed(curr_read_dir)
+                    ):
+                        self._refresh_index(curr_read_dir)
+                    records = self._indices[curr_read_dir][kind]
+                    if key in records:
+                        return curr_read_dir, records[key]
+        return None, None
+
+    def _is_refresh_allowed(self, read_dir: str) -> bool:
+        last_refresh = self._last_refresh.get(read_dir, None)
+        return (
+            last_refresh is None
+            or time.monotonic() - last_refresh >= self._min_refresh_interval
+        )
+
+    def _get_read_fd(self, shard_path: str) -> int:
+        fd = self._read_fds.get(shard_path, None)
+        if fd is None:
+            fd = os.open(shard_path, os.O_RDONLY)
+            self._read_fds[shard_path] = fd
+        return fd
+
+    def _get_read_mmap(self, shard_path: str, required_size: int) -> mmap.mmap:
+        mm = self._read_mmaps.get(shard_path, None)
+        if mm is None or len(mm) < required_size:
+            # (re)map - the shard might have grown since it was mapped
+            mm = mmap.mmap(self._get_read_fd(shard_path), 0, access=mmap.ACCESS_READ)
+            self._read_mmaps[shard_path] = mm
+        return mm
+
+    def read_sample(
+        self,
+        read_dirs: List[str],
+        sample_hash: str,
+        keys: Optional[Sequence[str]] = None,
+    ) -> Optional[NDict]:
+        read_dir, record = self._find(read_dirs, "sample", sample_hash)
+        if record is None:
+            return None
+        shard_name, offset, length, header_length = record
+        shard_path = os.path.join(read_dir, self.SHARDS_DIR, shard_name + ".bin")
+        with self._lock:
+            fd = self._get_read_fd(shard_path)
+            if self._mmap_arrays:
+                buffer = self._get_read_mmap(shard_path, offset + length)
+                buffer_offset = offset
+        if not self._mmap_arrays:
+            buffer_offset = 0
+            if keys is None:
+                # read the entire record with a single call into a writable buffer
+                buffer = bytearray(length)
+            else:
+                # read only the header, the requested arrays are read separately below
+                buffer = bytearray(header_length)
+            _pread_into(fd, buffer, offset)
+
+        values, arrays_desc = pickle.loads(
+            buffer[buffer_offset : buffer_offset + header_length]
+        )
+        if keys is not None:
+            values = {k: v for k, v in values.items() if is_key_requested(k, keys)}
+            arrays_desc = {
+                k: desc for k, desc in arrays_desc.items() if is_key_requested(k, keys)
+            }
+
+        arrays_offset = _align(header_length, self.ALIGNMENT)
+        for k, (dtype, shape, arr_offset) in arrays_desc.items():
+            if self._mmap_arrays or keys is None:
+                values[k] = np.ndarray(
+                    shape,
+                    dtype=dtype,
+                    buffer=buffer,
+                    offset=buffer_offset + arrays_offset + arr_offset,
+                )
+            else:
+                arr = np.empty(shape, dtype=dtype)
+                _pread_into(fd, arr, offset + arrays_offset + arr_offset)
+                values[k] = arr
+
+        return NDict(values, already_flat=True)
+
+    def read_orig_info(self, read_dirs: List[str], orig_hash: str) -> Tuple[bool, Any]:
+        read_dir, output_info = self._find(read_dirs, "orig", orig_hash)
+        return read_dir is not None, output_info
+
+
+def _add_index_record(index: Dict[str, dict], record: tuple, idx_path: str) -> None:
+    if record[0] == "sample":
+        index["sample"][record[1]] = record[2:]
+    elif record[0] == "orig":
+        _, orig_hash, output_info = record
+        index["orig"][orig_hash] = output_info
+    else:
+        raise Exception(
+            f"Unexpected record type {record[0]} in shards index {idx_path}"
+        )
+
+
+def is_key_requested(key: str, keys: Optional[Sequence[str]]) -> bool:
+    """
+    :param key: a keypath of a stored value
+    :param keys: requested keypaths, each might also be a prefix of a sub-dict (for example "data.gt"). None means everything.
+    :return: True if the value should be loaded
+    """
+    if keys is None:
+        return True
+    for k in keys:
+        if key == k or key.startswith(k + "."):
+            return True
+    return False
+
+
+def _get_hdf5_keys(filename: str) -> List[str]:
+    return load_hdf5_lazy(filename).keys()
+
+
+def _load_hdf5_as_lazy_arrays(
+    filename: str, keys: Optional[Sequence[str]] = None
+) -> Dict[str, Any]:
+    """
+    :param keys: the datasets to load, None for all of them
+    :return: a LazyArray per dataset. The small markers of stored sequences (see _convert_to_sequence_for_hdf5_if_needed()) are read.
+    """
+    h5f = load_hdf5_lazy(filename)
+    ans = {}
+    for key in h5f.keys() if keys is None else keys:
+        dset = h5f[key]
+        if "@RESERVED_LIST@" in key or "@RESERVED_TUPLE@" in key:
+            ans[key] = dset[...]
+        else:
+            ans[key] = LazyArray(dset.__getitem__, dset.shape, dset.dtype)
+    return ans
+
+
+def _pread_into(fd: int, buffer: Any, offset: int) -> None:
+    """
+    Fills a writable buffer (bytearray, numpy array etc.) from the file, starting at the given offset
+    """
+    view = memoryview(buffer).cast("B")
+    while len(view) > 0:
+        num_read = os.preadv(fd, [view], offset)
+        if num_read == 0:
+            raise Exception("Unexpected end of file while reading a cached sample")
+        view = view[num_read:]
+        offset += num_read
+
+
+def _align(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+def _write_padding(f: Any, num_bytes: int) -> None:
+    if num_bytes > 0:
+        f.write(b"\0" * num_bytes)
+
+
+def get_samples_storage(storage: Any) -> SamplesStorageBase:
+    """
+    :param storage: either a SamplesStorageBase instance or one of the names "files", "files_lazy", "shards", "shards_mmap"
+    """
+    if isinstance(storage, SamplesStorageBase):
+        return storage
+    if storage == SamplesStorageFiles.name:
+        return SamplesStorageFiles()
+    if storage == SamplesStorageShards.name:
+        return SamplesStorageShards()
+    if storage == "files_lazy":
+        return SamplesStorageFiles(lazy_arrays=True)
+    if storage == "shards_mmap":
+        return SamplesStorageShards(mmap_arrays=True)
+    raise Exception(
+        f"Unsupported storage {storage}. Supported options are a SamplesStorageBase instance or one of ['files', 'files_lazy', 'shards', 'shards_mmap']"
+    )
+
+
+def _convert_to_sequence_for_hdf5_if_needed(key: str, data: Any) -> Dict:
+    ans = {}
+    if isinstance(data, (list, tuple)):
+        if isinstance(data, list):
+            ans[key + "@RESERVED_LIST@"] = np.array(
+                [len(data)]
+            )  # to mark that this case is a list, and its length
+        elif isinstance(data, tuple):
+            ans[key + "@RESERVED_TUPLE@"] = np.array(
+                [len(data)]
+            )  # to mark that this case is a tuple, and its length
+        else:
+            assert False  # should not get here
+
+        for i, elem in enumerate(data):
+            ans[key + f"@RESERVED_ELEM@{i}"] = elem
+    else:
+        ans = {key: data}
+
+    return ans
+
+
+def _restore_sequences_from_hdf5(loaded_sample_hdf5_part: dict) -> None:
+    """
+    Inplace - the opposite of _convert_to_sequence_for_hdf5_if_needed()
+    """
+    stored_ndarrays_list = [
+        k
+        for k in loaded_sample_hdf5_part.keys()
+        if ("@RESERVED_LIST@" in k) or ("@RESERVED_TUPLE@" in k)
+    ]  # in these cases the ndarrays were originally stored as a list or tuple of ndarrays
+    for seq_key in stored_ndarrays_list:
+        seq_key_clean = seq_key.replace("@RESERVED_LIST@", "").replace(
+            "@RESERVED_TUPLE@", ""
+        )
+        curr_sequence_length = loaded_sample_hdf5_part.pop(seq_key)[0]
+        curr_seq = []
+        for i in range(curr_sequence_length):
+            curr_seq.append(
+                loaded_sample_hdf5_part.pop(seq_key_clean + f"@RESERVED_ELEM@{i}")
+            )
+        if "@RESERVED_TUPLE@" in seq_key:
+            curr_seq = tuple(curr_seq)
+        loaded_sample_hdf5_part[seq_key_clean] = curr_seq
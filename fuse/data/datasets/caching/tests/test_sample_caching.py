@@ -23,9 +23,23 @@ from fuse.data import get_sample_id, create_initial_sample
 import numpy as np
 import tempfile
 import os
+import shutil
+import pickle
+from glob import glob
+from functools import partial
+from unittest.mock import patch
 from fuse.data.ops.op_base import OpBase
+from fuse.data.ops.ops_common import OpCheckpoint, OpLambda
+from fuse.data.utils.lazy_array import LazyArray
 from typing import List, Union
 from fuse.data.datasets.caching.samples_cacher import SamplesCacher
+from fuse.data.datasets.caching.cache_build_progress import CacheBuildJournal
+from fuse.data.datasets.caching import samples_storage
+from fuse.data.datasets.caching.samples_storage import SamplesStorageShards
+from fuse.data.datasets.caching.samples_memory_cache import (
+    SamplesMemoryCache,
+    SamplesSharedMemoryCache,
+)
 
 from fuse.utils.ndict import NDict
 
@@ -91,6 +105,413 @@ class TestSampleCaching(unittest.TestCase):
 
         banana = 123
 
+    def test_cache_samples_shards(self) -> None:
+        orig_sample_ids = ["case_1", "case_2", "case_3", "case_4"]
+        tmpdir = tempfile.mkdtemp()
+        cache_dirs = [
+            os.path.join(tmpdir, "cache_e"),
+        ]
+
+        pipeline_desc = [
+            (OpFakeLoad(), {}),
+        ]
+        pl = PipelineDefault("example_pipeline", pipeline_desc)
+
+        cacher = SamplesCacher(
+            "unittests_cache", pl, cache_dirs, restart_cache=True, storage="shards"
+        )
+        orig_sid_to_final = cacher.cache_samples(orig_sample_ids)
+        self.assertIsNone(orig_sid_to_final["case_3"])
+        self.assertEqual(
+            orig_sid_to_final["case_4"], ["case_4_subcase_1", "case_4_subcase_2"]
+        )
+
+        # a few shard files instead of a file per sample
+        shard_files = glob(
+            os.path.join(cache_dirs[0], "unittests_cache", "hash_*", "shards", "*")
+        )
+        self.assertEqual(len(shard_files), 2)
+
+        sample = cacher.load_sample("case_4_subcase_2")
+        expected = _generate_sample_2(42)
+        for k in expected.keypaths():
+            np.testing.assert_array_equal(sample[k], expected[k])
+
+        # a new cacher instance (e.g. a new session) should reuse the persistent index
+        cacher = SamplesCacher("unittests_cache", pl, cache_dirs, storage="shards")
+        self.assertEqual(cacher._cache("case_1"), ["case_1"])
+        sample = cacher.load_sample("case_1")
+        self.assertAlmostEqual(
+            sample["data.cc.img"].sum(), _generate_sample_1()["data.cc.img"].sum()
+        )
+
+    def test_cache_samples_resume(self) -> None:
+        orig_sample_ids = ["case_1", "case_2", "case_3", "case_4"]
+        tmpdir = tempfile.mkdtemp()
+        cache_dirs = [
+            os.path.join(tmpdir, "cache_r"),
+        ]
+
+        pipeline_desc = [
+            (OpFakeLoad(), {}),
+        ]
+        pl = PipelineDefault("example_pipeline", pipeline_desc)
+
+        cacher = SamplesCacher(
+            "unittests_cache",
+            pl,
+            cache_dirs,
+            restart_cache=True,
+            storage="shards",
+            journal_batch_size=1,
+        )
+        expected = cacher.cache_samples(orig_sample_ids[:3])
+        journal_files = glob(
+            os.path.join(
+                cache_dirs[0], "unittests_cache", "hash_*", "cache_build_journal*"
+            )
+        )
+        self.assertEqual(len(journal_files), 1)
+
+        # simulate an interrupted build - the full set summary was not written yet
+        for set_info_dir in glob(
+            os.path.join(cache_dirs[0], "unittests_cache", "hash_*", "full_sets_info*")
+        ):
+            shutil.rmtree(set_info_dir)
+
+        cacher = SamplesCacher(
+            "unittests_cache", pl, cache_dirs, storage="shards", journal_batch_size=1
+        )
+        with patch.object(
+            SamplesCacher,
+            "_load_sample_using_pipeline",
+            autospec=True,
+            side_effect=SamplesCacher._load_sample_using_pipeline,
+        ) as load_using_pipeline:
+            orig_sid_to_final = cacher.cache_samples(orig_sample_ids)
+        # only the new sample was processed
+        self.assertEqual(load_using_pipeline.call_count, 1)
+        for orig_sample_id in orig_sample_ids[:3]:
+            self.assertEqual(
+                orig_sid_to_final[orig_sample_id], expected[orig_sample_id]
+            )
+        self.assertEqual(list(orig_sid_to_final.keys()), orig_sample_ids)
+
+    def test_shards_index_refresh(self) -> None:
+        cache_dir = tempfile.mkdtemp()
+        writer = SamplesStorageShards(min_refresh_interval=1000.0)
+        reader = SamplesStorageShards(min_refresh_interval=1000.0)
+        self.assertEqual(reader.read_orig_info([cache_dir], "a"), (False, None))
+        self.assertEqual(writer.read_orig_info([cache_dir], "b"), (False, None))
+        writer.write_orig_info(cache_dir, "a", ["case_a"])
+
+        with patch.object(samples_storage, "glob", wraps=glob) as glob_mock:
+            # the records written by this process are found without reloading the index
+            writer.write_orig_info(cache_dir, "b", ["case_b"])
+            self.assertEqual(
+                writer.read_orig_info([cache_dir], "b"), (True, ["case_b"])
+            )
+            # misses reload the index at most once per min_refresh_interval seconds
+            for _ in range(10):
+                self.assertEqual(reader.read_orig_info([cache_dir], "c"), (False, None))
+            self.assertEqual(glob_mock.call_count, 0)
+
+        # records written by other processes are loaded on the next miss after close()
+        reader.close()
+        self.assertEqual(reader.read_orig_info([cache_dir], "a"), (True, ["case_a"]))
+        self.assertEqual(reader.read_orig_info([cache_dir], "b"), (True, ["case_b"]))
+        writer.close()
+
+    def test_cache_build_journal_corrupted_record(self) -> None:
+        write_dir = tempfile.mkdtemp()
+        journal = CacheBuildJournal()
+        journal.append(write_dir, [("hash_1", ["case_1"]), ("hash_2", ["case_2"])])
+        journal.append(write_dir, [("hash_3", ["case_3"])])
+        (journal_file,) = glob(os.path.join(write_dir, "*"))
+
+        # simulate a build that was killed while writing the second record, then resumed
+        with open(journal_file, "rb+") as f:
+            f.truncate(os.path.getsize(journal_file) - 5)
+        journal.append(write_dir, [("hash_4", ["case_4"])])
+        self.assertEqual(
+            journal.load([write_dir]),
+            {"hash_1": ["case_1"], "hash_2": ["case_2"], "hash_4": ["case_4"]},
+        )
+
+        # a corrupted byte in the first record
+        with open(journal_file, "rb+") as f:
+            f.seek(20)
+            value = f.read(1)
+            f.seek(20)
+            f.write(b"A" if value != b"A" else b"B")
+        self.assertEqual(journal.load([write_dir]), {"hash_4": ["case_4"]})
+
+    def test_cache_samples_shards_mmap(self) -> None:
+        orig_sample_ids = ["case_1", "case_2", "case_3", "case_4"]
+        tmpdir = tempfile.mkdtemp()
+        cache_dirs = [
+            os.path.join(tmpdir, "cache_f"),
+        ]
+
+        pipeline_desc = [
+            (OpFakeLoad(), {}),
+        ]
+        pl = PipelineDefault("example_pipeline", pipeline_desc)
+
+        cacher = SamplesCacher(
+            "unittests_cache",
+            pl,
+            cache_dirs,
+            restart_cache=True,
+            storage="shards_mmap",
+        )
+        cacher.cache_samples(orig_sample_ids)
+
+        sample = cacher.load_sample("case_1")
+        expected = _generate_sample_1()
+        for k in expected.keypaths():
+            np.testing.assert_array_equal(sample[k], expected[k])
+
+        # large arrays are read-only views of the memory mapped shard, small values are regular python objects
+        img = sample["data.cc.img"]
+        self.assertFalse(img.flags.writeable)
+        self.assertEqual(img.ctypes.data % 64, 0)
+        self.assertIsInstance(sample["data.cc.dicom_tags"], list)
+        with self.assertRaises(ValueError):
+            img[0, 0, 0] = 1.0
+
+    def test_cache_samples_files_lazy(self) -> None:
+        orig_sample_ids = ["case_1", "case_2", "case_3", "case_4"]
+        tmpdir = tempfile.mkdtemp()
+        cache_dirs = [
+            os.path.join(tmpdir, "cache_l"),
+        ]
+
+        pipeline_desc = [
+            (OpFakeLoad(), {}),
+        ]
+        pl = PipelineDefault("example_pipeline", pipeline_desc)
+
+        cacher = SamplesCacher(
+            "unittests_cache",
+            pl,
+            cache_dirs,
+            restart_cache=True,
+            storage="files_lazy",
+        )
+        cacher.cache_samples(orig_sample_ids)
+
+        sample = cacher.load_sample("case_1")
+        expected = _generate_sample_1()
+        for k in expected.keypaths():
+            np.testing.assert_array_equal(sample[k], expected[k])
+
+        # large arrays are read on demand, only the selected region
+        img = sample["data.cc.img"]
+        self.assertIsInstance(img, LazyArray)
+        np.testing.assert_array_equal(
+            img[2:5, 10:50:3, -20:].numpy(), expected["data.cc.img"][2:5, 10:50:3, -20:]
+        )
+        self.assertIsInstance(sample["data.cc.dicom_tags"], list)
+        self.assertIsInstance(pickle.loads(pickle.dumps(img)), np.ndarray)
+
+    def test_load_sample_keys(self) -> None:
+        orig_sample_ids = ["case_1", "case_2", "case_3", "case_4"]
+        pipeline_desc = [
+            (OpFakeLoad(), {}),
+        ]
+        pl = PipelineDefault("example_pipeline", pipeline_desc)
+        for storage in ["files", "files_lazy", "shards", "shards_mmap"]:
+            tmpdir = tempfile.mkdtemp()
+            cacher = SamplesCacher(
+                "unittests_cache",
+                pl,
+                os.path.join(tmpdir, "cache_g"),
+                restart_cache=True,
+                storage=storage,
+                audit_rate=1,
+                audit_units="samples",
+            )
+            cacher.cache_samples(orig_sample_ids)
+
+            sample = cacher.load_sample(
+                "case_4_subcase_1", keys=["data.cc", "data.gt_labels_style_1"]
+            )
+            self.assertEqual(
+                sorted(sample.keypaths()),
+                [
+                    "data.cc.dicom_tags",
+                    "data.cc.img",
+                    "data.cc.seg",
+                    "data.gt_labels_style_1",
+                    "data.initial_sample_id",
+                    "data.sample_id",
+                ],
+            )
+            expected = _generate_sample_1(41)
+            np.testing.assert_array_equal(
+                sample["data.cc.img"], expected["data.cc.img"]
+            )
+            self.assertEqual(sample["data.gt_labels_style_1"], [1, 3, 100, 12])
+
+    def test_memory_cache(self) -> None:
+        orig_sample_ids = ["case_1", "case_2", "case_4"]
+        tmpdir = tempfile.mkdtemp()
+        cache_dirs = [
+            os.path.join(tmpdir, "cache_m"),
+        ]
+
+        pipeline_desc = [
+            (OpFakeLoad(), {}),
+        ]
+        pl = PipelineDefault("example_pipeline", pipeline_desc)
+
+        for memory_cache in [
+            SamplesMemoryCache(max_bytes=1024**3),
+            SamplesSharedMemoryCache(max_bytes=1024**3, shared_memory_dir=tmpdir),
+        ]:
+            cacher = SamplesCacher(
+                "unittests_cache",
+                pl,
+                cache_dirs,
+                restart_cache=True,
+                memory_cache=memory_cache,
+            )
+            cacher.cache_samples(orig_sample_ids)
+            for _ in range(2):
+                sample = cacher.load_sample("case_2")
+                # modifying the loaded sample should not affect the cached one
+                sample["data.cc.img"][:] = 0
+                sample = cacher.load_sample("case_2", keys=["data.cc.img"])
+                self.assertGreater(sample["data.cc.img"].sum(), 0)
+                self.assertEqual(
+                    set(sample.keypaths()),
+                    {"data.cc.img", "data.sample_id", "data.initial_sample_id"},
+                )
+            stats = cacher.get_memory_cache_stats()
+            self.assertEqual(stats["misses"], 1)
+            self.assertEqual(stats["hits"], 3)
+
+            # a copy sent to another process (e.g. a DataLoader worker)
+            worker_memory_cache = pickle.loads(pickle.dumps(memory_cache))
+            expected_hit = isinstance(memory_cache, SamplesSharedMemoryCache)
+            self.assertEqual(
+                worker_memory_cache.get(
+                    SamplesCacher.get_final_sample_id_hash("case_2")
+                )
+                is not None,
+                expected_hit,
+            )
+
+        # eviction
+        sample_1 = _generate_sample_1()
+        sample_size = len(pickle.dumps(sample_1, protocol=pickle.HIGHEST_PROTOCOL))
+        for policy, expected_evicted in [("lru", "a"), ("lfu", "b")]:
+            memory_cache = SamplesMemoryCache(max_bytes=sample_size * 2, policy=policy)
+            memory_cache.put("a", sample_1)
+            memory_cache.put("b", sample_1)
+            memory_cache.get("a")
+            memory_cache.get("a")
+            memory_cache.get("b")
+            memory_cache.put("c", sample_1)
+            self.assertIsNone(memory_cache.get(expected_evicted))
+            self.assertEqual(memory_cache.get_stats()["evictions"], 1)
+            self.assertLessEqual(memory_cache.get_used_bytes(), sample_size * 2)
+
+        # lfu eviction order - compared to a reference implementation
+        rng = np.random.default_rng(0)
+        sample = NDict({"data.img": np.zeros(100)})
+        sample_size = len(pickle.dumps(sample, protocol=pickle.HIGHEST_PROTOCOL))
+        memory_cache = SamplesMemoryCache(max_bytes=sample_size * 5, policy="lfu")
+        expected_frequency = {}  # ordered from least to most recently used
+        for _ in range(2000):
+            sample_hash = str(rng.integers(0, 12))
+            if rng.random() < 0.5:
+                found = memory_cache.get(sample_hash) is not None
+                self.assertEqual(found, sample_hash in expected_frequency)
+                if found:
+                    expected_frequency[sample_hash] = (
+                        expected_frequency.pop(sample_hash) + 1
+                    )
+            elif sample_hash not in expected_frequency:
+                memory_cache.put(sample_hash, sample)
+                if len(expected_frequency) == 5:
+                    del expected_frequency[
+                        min(expected_frequency, key=expected_frequency.__getitem__)
+                    ]
+                expected_frequency[sample_hash] = 1
+        self.assertEqual(
+            set(memory_cache._samples.keys()), set(expected_frequency.keys())
+        )
+
+    def test_checkpoints(self) -> None:
+        orig_sample_ids = ["case_1", "case_2", "case_4"]
+        for storage in ["files", "shards"]:
+            tmpdir = tempfile.mkdtemp()
+            cache_dirs = [
+                os.path.join(tmpdir, "cache_ckpt"),
+            ]
+
+            def create_pipeline(factor: float) -> PipelineDefault:
+                return PipelineDefault(
+                    "example_pipeline",
+                    [
+                        (OpFakeLoad(), {}),
+                        (OpCheckpoint("loaded"), {}),
+                        (
+                            OpLambda(partial(np.multiply, factor)),
+                            dict(key="data.cc.img"),
+                        ),
+                    ],
+                )
+
+            cacher = SamplesCacher(
+                "unittests_cache",
+                create_pipeline(2.0),
+                cache_dirs,
+                restart_cache=True,
+                storage=storage,
+            )
+            cacher.cache_samples(orig_sample_ids)
+            self.assertEqual(
+                len(
+                    glob(
+                        os.path.join(
+                            cache_dirs[0], "unittests_cache", "checkpoints", "loaded@*"
+                        )
+                    )
+                ),
+                1,
+            )
+
+            # modify an op after the checkpoint - only the tail of the pipeline reruns
+            with patch(
+                f"{__name__}._generate_sample_1", wraps=_generate_sample_1
+            ) as generate_sample_1:
+                cacher = SamplesCacher(
+                    "unittests_cache",
+                    create_pipeline(3.0),
+                    cache_dirs,
+                    restart_cache=True,
+                    storage=storage,
+                    audit_first_sample=False,
+                    audit_rate=None,
+                )
+                orig_sid_to_final = cacher.cache_samples(orig_sample_ids)
+                self.assertEqual(generate_sample_1.call_count, 0)
+
+            self.assertEqual(
+                orig_sid_to_final["case_4"], ["case_4_subcase_1", "case_4_subcase_2"]
+            )
+            for sample_id, expected in [
+                ("case_1", _generate_sample_1()),
+                ("case_4_subcase_2", _generate_sample_2(42)),
+            ]:
+                sample = cacher.load_sample(sample_id)
+                np.testing.assert_array_almost_equal(
+                    sample["data.cc.img"], expected["data.cc.img"] * 3.0
+                )
+
     def test_same_uniquely_named_cache_and_multiple_pipeline_hashes(self) -> None:
         orig_sample_ids = ["case_1", "case_2", "case_3", "case_4"]
         tmpdir = tempfile.mkdtemp()
@@ -122,6 +543,47 @@ class TestSampleCaching(unittest.TestCase):
             restart_cache=False,
         )
 
+    def test_legacy_pipeline_hash(self) -> None:
+        orig_sample_ids = ["case_1", "case_2", "case_3", "case_4"]
+        tmpdir = tempfile.mkdtemp()
+        cache_dirs = [os.path.join(tmpdir, "cache_e")]
+
+        pl = PipelineDefault("example_pipeline", [(OpFakeLoad(), {})])
+        cacher = SamplesCacher("unittests_cache", pl, cache_dirs, restart_cache=True)
+        cacher.cache_samples(orig_sample_ids)
+
+        # simulate a cache created by an older version - named by the legacy hash, without the pipeline description files
+        hash_dir = os.path.join(
+            cache_dirs[0], "unittests_cache", cacher.get_pipeline_desc_hash()
+        )
+        for desc_file in glob(os.path.join(hash_dir, "pipeline_*")):
+            os.remove(desc_file)
+        legacy_hash_dir = os.path.join(
+            cache_dirs[0], "unittests_cache", "hash_" + pl.get_legacy_desc_hash()
+        )
+        self.assertNotEqual(hash_dir, legacy_hash_dir)
+        os.rename(hash_dir, legacy_hash_dir)
+
+        # the cache is migrated to the current hash instead of raising an exception
+        with self.assertWarns(UserWarning):
+            cacher = SamplesCacher(
+                "unittests_cache", pl, cache_dirs, restart_cache=False
+            )
+        self.assertFalse(os.path.exists(legacy_hash_dir))
+        self.assertTrue(os.path.isdir(hash_dir))
+        self.assertEqual(len(glob(os.path.join(hash_dir, "pipeline_*"))), 2)
+        cacher.cache_samples(orig_sample_ids)
+        sample = cacher.load_sample("case_1")
+        np.testing.assert_array_equal(
+            sample["data.cc.img"], _generate_sample_1()["data.cc.img"]
+        )
+
+        # a legacy hash of a different pipeline still raises an exception
+        os.rename(hash_dir, legacy_hash_dir)
+        pl = PipelineDefault("example_pipeline", [(OpFakeLoad(), {})] * 2)
+        with self.assertRaises(Exception):
+            SamplesCacher("unittests_cache", pl, cache_dirs, restart_cache=False)
+
     def tearDown(self) -> None:
         pass
 
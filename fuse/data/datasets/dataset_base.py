@@ -18,7 +18,7 @@ Created on June 30, 2021
 """
 
 from abc import abstractmethod
-from typing import Dict, Hashable, List, Optional, Sequence, Union
+from typing import Dict, Hashable, Iterator, List, Optional, Sequence, Union
 
 from torch.utils.data.dataset import Dataset
 
@@ -51,6 +51,19 @@ class DatasetBase(Dataset):
         """
         raise NotImplementedError
 
+    def iter_multi(
+        self,
+        items: Optional[Sequence[Union[int, Hashable]]] = None,
+        *args: list,
+        **kwargs: dict
+    ) -> Iterator[Dict]:
+        """
+        Iterate over multiple items, optionally just some of the keys.
+        The default implementation reads all the items using get_multi(). Override to stream the items with a bounded memory.
+        :param items: specify the list of sequence to read or None for all
+        """
+        yield from self.get_multi(items, *args, **kwargs)
+
     @abstractmethod
     def subset(self, indices: Sequence[int]) -> None:
         """
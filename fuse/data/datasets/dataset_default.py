@@ -16,16 +16,24 @@ Created on June 30, 2021
 
 """
 
-from typing import Dict, Hashable, List, Optional, Sequence, Union, Any
+from typing import Dict, Hashable, Iterator, List, Optional, Sequence, Union, Any
 
 from warnings import warn
 from fuse.data.datasets.dataset_base import DatasetBase
+from fuse.data.ops.op_base import OpBase
 from fuse.data.ops.ops_common import OpCollectMarker
 from fuse.data.pipelines.pipeline_default import PipelineDefault
+from fuse.data.pipelines.pipeline_profiler import PipelineProfiler
 from fuse.data.datasets.caching.samples_cacher import SamplesCacher
+from fuse.data.utils.shared_memory_transport import (
+    is_dataloader_worker,
+    to_shared_memory,
+)
 from fuse.utils.ndict import NDict
 from fuse.utils.multiprocessing.run_multiprocessed import (
     run_multiprocessed,
+    _run_multiprocessed_as_iterator_impl,
+    run_thread_prefetched,
     get_from_global_storage,
 )
 from fuse.data import (
@@ -33,6 +41,7 @@ from fuse.data import (
     create_initial_sample,
     get_specific_sample_from_potentially_morphed,
 )
+from fuse.data.utils.sample import set_initial_sample_id
 import copy
 from collections import OrderedDict
 import numpy as np
@@ -40,6 +49,9 @@ from operator import itemgetter
 
 
 class DatasetDefault(DatasetBase):
+    # the op id of the op that loads the samples of the static pipeline in the hoisted pipeline (see hoist_deterministic_ops argument)
+    HOISTED_LOAD_OP_ID = "load_static_cache"
+
     def __init__(
         self,
         sample_ids: Union[int, Sequence[Hashable], None],
@@ -47,6 +59,9 @@ class DatasetDefault(DatasetBase):
         dynamic_pipeline: Optional[PipelineDefault] = None,
         cacher: Optional[SamplesCacher] = None,
         allow_uncached_sample_morphing: bool = False,
+        profiler: Optional[PipelineProfiler] = None,
+        shared_memory_transport: bool = False,
+        hoist_deterministic_ops: bool = False,
     ):
         """
         :param sample_ids: list of sample_ids included in dataset. Or:
@@ -62,6 +77,19 @@ class DatasetDefault(DatasetBase):
                                 changing it will NOT trigger recaching of the static_pipeline part.
         :param cacher: optional SamplesCacher instance which will be used for caching samples to speed up samples loading
         :param allow_uncached_sample_morphing:  when enabled, allows an Op, to return None, or to return multiple samples (in a list)
+        :param profiler: optional PipelineProfiler - will be set to both the static and the dynamic pipelines to collect per op statistics
+                        across all the processes (including DataLoader workers). The statistics are reported by summary().
+        :param shared_memory_transport: when running in a DataLoader worker process, move the large numpy arrays of each sample to shared memory,
+                        so they will be sent to the main process without pickling and copying them (see SharedMemoryArray).
+                        Useful when the arrays reach the main process as is, e.g. with a custom collate function that keeps the samples.
+                        When using CollateDefault, prefer its shared_memory_transport argument.
+        :param hoist_deterministic_ops: requires a cacher. Moves the deterministic prefix of the dynamic pipeline - the ops before the first random op or random argument
+                        (see PipelineDefault.get_deterministic_prefix_op_id()), e.g. resizing and casting - out of the per epoch processing.
+                        The hoisted ops run once per sample on the output of the static pipeline, and their output is cached next to the static pipeline cache,
+                        in [cache dir]/[cacher unique name]@hoisted. create() reports the cpu time per epoch that is saved (see get_hoisting_report()).
+                        Like static pipeline changes, changing the hoisted ops requires rebuilding (restart_cache=True) or deleting the hoisted cache.
+                        Note that only ops that declare themselves deterministic (see OpBase.is_random()) are hoisted - custom ops are considered random unless they override is_random(),
+                        OpLambda / OpFunc unless created with deterministic=True, and callables which are not instances of OpBase are always considered random.
 
         """
         super().__init__()
@@ -119,8 +147,21 @@ class DatasetDefault(DatasetBase):
 
         self._static_pipeline = static_pipeline
         self._dynamic_pipeline = dynamic_pipeline
+        self._profiler = profiler
+        self._shared_memory_transport = shared_memory_transport
+        if profiler is not None:
+            self._static_pipeline.set_profiler(profiler)
+            self._dynamic_pipeline.set_profiler(profiler)
         self._orig_sample_ids = copy.deepcopy(sample_ids)
 
+        self._hoisted_pipeline = None
+        self._hoisted_cacher = None
+        self._hoisting_report = None
+        if hoist_deterministic_ops:
+            if cacher is None:
+                raise Exception("hoist_deterministic_ops requires a cacher")
+            self._hoist_deterministic_ops()
+
         self._created = False
 
     @property
@@ -131,13 +172,21 @@ class DatasetDefault(DatasetBase):
     def dynamic_pipeline(self) -> Union[PipelineDefault, None]:
         return self._dynamic_pipeline
 
-    def create(self, num_workers: int = 0, mp_context: Optional[str] = None) -> None:
+    def create(
+        self,
+        num_workers: int = 0,
+        mp_context: Optional[str] = None,
+        io_threads: int = 0,
+    ) -> None:
         """
         Create the data set, including caching
         :param num_workers: number of workers. used only when caching is disabled and allow_uncached_sample_morphing is enabled
             set num_workers=0 to disable multiprocessing (more convenient for debugging)
             Setting num_workers for caching is done in cacher constructor.
         :param mp_context: "fork", "spawn", "thread" or None for multiprocessing default
+        :param io_threads: used only when caching is disabled and allow_uncached_sample_morphing is enabled.
+            The I/O stage of the static pipeline (see OpBase.get_execution_hint()) runs in io_threads threads per worker, ahead of the rest of the pipeline.
+            Setting io_threads for caching is done in cacher constructor.
         :return: None
         """
 
@@ -146,14 +195,42 @@ class DatasetDefault(DatasetBase):
             self._output_sample_ids_info = self._cacher.cache_samples(
                 self._orig_sample_ids
             )
+            if self._hoisted_cacher is not None:
+                self._cache_hoisted_samples()
         elif self._allow_uncached_sample_morphing:
-            _output_sample_ids_info_list = run_multiprocessed(
-                DatasetDefault._process_orig_sample_id,
-                [(sid, self._static_pipeline, False) for sid in self._orig_sample_ids],
-                workers=num_workers,
-                mp_context=mp_context,
-                desc="dataset_default.sample_morphing",
-            )
+            if (
+                io_threads > 0
+                and self._static_pipeline.get_io_stage_op_id() is not None
+            ):
+                chunk_size = 4 * io_threads
+                _output_sample_ids_info_list = run_multiprocessed(
+                    DatasetDefault._process_orig_sample_ids_chunk,
+                    [
+                        (
+                            self._orig_sample_ids[index : index + chunk_size],
+                            self._static_pipeline,
+                            io_threads,
+                        )
+                        for index in range(0, len(self._orig_sample_ids), chunk_size)
+                    ],
+                    workers=num_workers,
+                    mp_context=mp_context,
+                    desc="dataset_default.sample_morphing",
+                )
+                _output_sample_ids_info_list = [
+                    info for chunk in _output_sample_ids_info_list for info in chunk
+                ]
+            else:
+                _output_sample_ids_info_list = run_multiprocessed(
+                    DatasetDefault._process_orig_sample_id,
+                    [
+                        (sid, self._static_pipeline, False)
+                        for sid in self._orig_sample_ids
+                    ],
+                    workers=num_workers,
+                    mp_context=mp_context,
+                    desc="dataset_default.sample_morphing",
+                )
 
             self._output_sample_ids_info = OrderedDict()
             self._final_sid_to_orig_sid = {}
@@ -206,7 +283,10 @@ class DatasetDefault(DatasetBase):
         :param item: either int representing sample index or sample_id
         :return: sample_dict
         """
-        return self.getitem(item)
+        sample = self.getitem(item)
+        if self._shared_memory_transport and is_dataloader_worker():
+            sample = to_shared_memory(sample)
+        return sample
 
     def getitem(
         self,
@@ -241,11 +321,27 @@ class DatasetDefault(DatasetBase):
         # get collect marker info
         collect_marker_info = self._get_collect_marker_info(collect_marker_name)
 
+        # the hoisted ops are already applied to the cached samples
+        dynamic_pipeline = (
+            self._dynamic_pipeline
+            if self._hoisted_cacher is None
+            else self._remaining_dynamic_pipeline
+        )
+
         # read sample
         if self._cacher is not None:
-            sample = self._cacher.load_sample(
-                sample_id, collect_marker_info["static_keys_deps"]
-            )
+            static_keys = collect_marker_info["static_keys_deps"]
+            if self._hoisted_cacher is not None:
+                # the static keys dependencies refer to the output of the static pipeline, before the hoisted ops
+                static_keys = None
+            if static_keys is None and keys is not None and len(dynamic_pipeline) == 0:
+                # the output is the cached sample itself, so only the required keys need to be loaded
+                static_keys = keys
+            if self._hoisted_cacher is None:
+                sample = self._cacher.load_sample(sample_id, static_keys)
+            else:
+                sample = self._hoisted_cacher.load_sample(sample_id, static_keys)
+                set_initial_sample_id(sample, self._final_sid_to_orig_sid[sample_id])
 
         if self._cacher is None:
             if not self._allow_uncached_sample_morphing:
@@ -263,9 +359,7 @@ class DatasetDefault(DatasetBase):
                 assert sample is not None
                 sample = get_specific_sample_from_potentially_morphed(sample, sample_id)
 
-        sample = self._dynamic_pipeline(
-            sample, until_op_id=collect_marker_info["op_id"]
-        )
+        sample = dynamic_pipeline(sample, until_op_id=collect_marker_info["op_id"])
 
         if not isinstance(sample, dict):
             raise Exception(
@@ -326,6 +420,51 @@ class DatasetDefault(DatasetBase):
         )
         return list_sample_dict
 
+    def iter_multi(
+        self,
+        items: Optional[Sequence[Union[int, Hashable]]] = None,
+        workers: int = 10,
+        verbose: int = 1,
+        mp_context: Optional[str] = None,
+        desc: str = "dataset_default.iter_multi",
+        prefetch: Optional[int] = None,
+        keep_order: bool = True,
+        **kwargs: Any,
+    ) -> Iterator[Dict]:
+        """
+        A streaming version of get_multi() - yields the samples one by one while the workers read the next ones.
+        The memory is bounded by the number of samples read ahead, so it can be used to scan or export datasets that do not fit in memory.
+        :param workers: number of processes to read the data. set to 0 to not use multi processing (useful when debugging).
+        :param mp_context: "fork", "spawn", "thread" or None for multiprocessing default
+        :param prefetch: the maximal number of samples read ahead of the consumer. Default is 2 * workers.
+        :param keep_order: if False, the samples will be yielded by their readiness and not by the order of items
+        :param kwargs: additional parameters to getitem(), e.g. keys
+        """
+        if items is None:
+            sample_ids = list(range(len(self)))
+        else:
+            sample_ids = items
+
+        if prefetch is None:
+            prefetch = max(2 * workers, 1)
+
+        for_global_storage = {
+            "dataset_default_get_multi_dataset": self,
+            "dataset_default_get_multi_kwargs": kwargs,
+        }
+
+        yield from _run_multiprocessed_as_iterator_impl(
+            worker_func=self._getitem_multiprocess,
+            copy_to_global_storage=for_global_storage,
+            args_list=sample_ids,
+            workers=workers,
+            verbose=verbose,
+            keep_results_order=keep_order,
+            mp_context=mp_context,
+            desc=desc,
+            prefetch=prefetch,
+        )
+
     def __len__(self) -> int:
         if not self._created:
             raise Exception("you must first call create()")
@@ -351,6 +490,36 @@ class DatasetDefault(DatasetBase):
 
         sample = pipeline(sample)
 
+        return DatasetDefault._get_output_info(
+            orig_sample_id, sample, return_sample_dict
+        )
+
+    @staticmethod
+    def _process_orig_sample_ids_chunk(args: Any) -> List[Any]:
+        """
+        Process, without caching, a chunk of samples, while the I/O stage of the pipeline of the next samples runs in threads
+        """
+        orig_sample_ids, pipeline, io_threads = args
+        return [
+            DatasetDefault._get_output_info(
+                orig_sample_id, pipeline.resume_after_io_stage(io_stage_samples), False
+            )
+            for orig_sample_id, io_stage_samples in run_thread_prefetched(
+                lambda sid: pipeline.run_io_stage(create_initial_sample(sid)),
+                orig_sample_ids,
+                io_threads,
+            )
+        ]
+
+    @staticmethod
+    def _get_output_info(
+        orig_sample_id: Any,
+        sample: Union[None, dict, List[dict]],
+        return_sample_dict: bool,
+    ) -> Any:
+        """
+        See _process_orig_sample_id()
+        """
         output_sample_ids = None
 
         if sample is not None:
@@ -380,7 +549,12 @@ class DatasetDefault(DatasetBase):
         # find the required collect markers and extract the info
         collect_marker_info = None
         for (op, _), op_id in reversed(
-            zip(self._dynamic_pipeline.ops_and_kwargs, self._dynamic_pipeline._op_ids)
+            list(
+                zip(
+                    self._dynamic_pipeline.ops_and_kwargs,
+                    self._dynamic_pipeline.get_op_ids(),
+                )
+            )
         ):
             if isinstance(op, OpCollectMarker):
                 collect_marker_info_cur = op.get_info()
@@ -401,10 +575,112 @@ class DatasetDefault(DatasetBase):
 
         return collect_marker_info
 
+    def _hoist_deterministic_ops(self) -> None:
+        """
+        Splits the dynamic pipeline into the hoisted pipeline - loads the cached output of the static pipeline and applies the deterministic prefix of the dynamic pipeline,
+        and the rest of the dynamic pipeline. See hoist_deterministic_ops argument.
+        """
+        last_op_id = self._dynamic_pipeline.get_deterministic_prefix_op_id()
+        if last_op_id is None:
+            warn(
+                "hoist_deterministic_ops is enabled, but the dynamic pipeline starts with a random op - there is nothing to hoist"
+            )
+            return
+
+        name = self._dynamic_pipeline.get_name()
+        ops_and_kwargs = self._dynamic_pipeline.ops_and_kwargs
+        op_ids = self._dynamic_pipeline.get_op_ids()
+        num_ops = op_ids.index(last_op_id) + 1
+        # same pipeline name and op ids, so the hoisted ops will behave exactly as in the dynamic pipeline
+        self._hoisted_pipeline = PipelineDefault(
+            name,
+            [(_OpLoadCachedSample(self._cacher), dict())] + ops_and_kwargs[:num_ops],
+            op_ids=[self.HOISTED_LOAD_OP_ID] + op_ids[:num_ops],
+        )
+        self._remaining_dynamic_pipeline = PipelineDefault(
+            name, ops_and_kwargs[num_ops:], op_ids=op_ids[num_ops:]
+        )
+        self._remaining_dynamic_pipeline.set_profiler(self._profiler)
+        self._hoisted_cacher = self._cacher.derive("@hoisted", self._hoisted_pipeline)
+
+    def _cache_hoisted_samples(self) -> None:
+        """
+        Caches the output of the hoisted pipeline, and reports the cpu time per epoch saved by hoisting.
+        """
+        self._final_sid_to_orig_sid = {}
+        for orig_sid, out_sids in self._output_sample_ids_info.items():
+            if out_sids is not None:
+                for final_sid in out_sids:
+                    self._final_sid_to_orig_sid[final_sid] = orig_sid
+        sample_ids = list(self._final_sid_to_orig_sid.keys())
+
+        # flush_interval=0 - the statistics of the caching worker processes must be saved before they are terminated
+        profiler = PipelineProfiler(flush_interval=0.0)
+        self._hoisted_pipeline.set_profiler(profiler)
+        try:
+            hoisted_output_info = self._hoisted_cacher.cache_samples(sample_ids)
+            for sample_id, out_sids in hoisted_output_info.items():
+                if out_sids != [sample_id]:
+                    raise Exception(
+                        f"The hoisted ops of the dynamic pipeline are expected to return the sample as is, got {out_sids} for sample_id={sample_id}"
+                    )
+
+            estimated = False
+            cpu_per_sample = self._get_hoisted_cpu_per_sample(profiler.get_stats())
+            if cpu_per_sample is None and len(sample_ids) > 0:
+                # the hoisted samples were already cached - estimate using a single sample
+                estimated = True
+                self._hoisted_pipeline(create_initial_sample(sample_ids[0]))
+                cpu_per_sample = self._get_hoisted_cpu_per_sample(profiler.get_stats())
+        finally:
+            self._hoisted_pipeline.set_profiler(None)
+
+        self._hoisting_report = dict(
+            hoisted_op_ids=self._hoisted_pipeline.get_op_ids()[1:],
+            num_samples=len(sample_ids),
+            cpu_sec_per_sample=cpu_per_sample or 0.0,
+            cpu_sec_per_epoch=(cpu_per_sample or 0.0) * len(sample_ids),
+            estimated=estimated,
+        )
+        print(
+            f"hoisted ops {self._hoisting_report['hoisted_op_ids']} of dynamic pipeline {self._dynamic_pipeline.get_name()} are cached - "
+            f"saves {'about ' if estimated else ''}{self._hoisting_report['cpu_sec_per_epoch']:.2f} cpu seconds per epoch "
+            f"({1000.0 * self._hoisting_report['cpu_sec_per_sample']:.1f} ms per sample)"
+        )
+
+    def _get_hoisted_cpu_per_sample(self, stats: dict) -> Optional[float]:
+        """
+        :param stats: statistics collected by the profiler of the hoisted pipeline
+        :return: the cpu time of the hoisted ops per sample, or None if they did not run
+        """
+        name = self._hoisted_pipeline.get_name()
+        ans = None
+        for op_id in self._hoisted_pipeline.get_op_ids()[1:]:
+            values = stats["ops"].get((name, op_id), None)
+            if values is None or values[0] <= 0:
+                return None
+            ans = (ans or 0.0) + values[2] / values[0]
+        return ans
+
+    def get_hoisting_report(self) -> Optional[dict]:
+        """
+        :return: None if hoist_deterministic_ops is disabled or nothing was hoisted. Otherwise, available after create(), a dictionary with:
+                 hoisted_op_ids, num_samples, cpu_sec_per_sample and cpu_sec_per_epoch - the cpu time of the hoisted ops that is saved per sample and per epoch,
+                 and estimated - True if the hoisted samples were already cached and the cpu time was measured using a single sample
+        """
+        return self._hoisting_report
+
+    def get_profiler(self) -> Optional[PipelineProfiler]:
+        return self._profiler
+
     def summary(self) -> str:
         sum = ""
         sum += f"Type: {type(self).__name__}\n"
         sum += f"Num samples: {len(self._final_sample_ids)}\n"
+        if self._hoisting_report is not None:
+            sum += f"Hoisted ops: {self._hoisting_report['hoisted_op_ids']}, saved cpu seconds per epoch: {self._hoisting_report['cpu_sec_per_epoch']:.2f}\n"
+        if self._profiler is not None:
+            sum += f"Pipelines profile:\n{self._profiler.summary()}"
         # TODO
         # sum += f"Cacher: {self._cacher.summary()}"
         # sum += f"Pipeline static: {self._static_pipeline.summary()}"
@@ -430,3 +706,29 @@ class DatasetDefault(DatasetBase):
 
         # grab the specified data
         self._final_sample_ids = itemgetter(*indices)(self._final_sample_ids)
+
+
+class _OpLoadCachedSample(OpBase):
+    """
+    Loads the output of the static pipeline from the cache - the first op of the hoisted pipeline, see DatasetDefault hoist_deterministic_ops argument
+    """
+
+    def __init__(self, cacher: SamplesCacher):
+        super().__init__()
+        self._cacher = cacher
+
+    def __call__(self, sample_dict: NDict) -> NDict:
+        return self._cacher.load_sample(get_sample_id(sample_dict))
+
+    def get_execution_hint(self) -> str:
+        return "io"
+
+    def get_hashable_string_representation(self) -> str:
+        # the cached samples are described by the static pipeline hash
+        return f"{type(self).__name__}@{self._cacher.get_pipeline_desc_hash()}"
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
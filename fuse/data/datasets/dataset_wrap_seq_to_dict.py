@@ -65,6 +65,12 @@ class OpReadDataset(OpBase):
             sample_dict[key] = elem
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class DatasetWrapSeqToDict(DatasetDefault):
     """
@@ -24,8 +24,12 @@ from fuse.data.pipelines.pipeline_default import PipelineDefault
 from fuse.data import get_sample_id, create_initial_sample
 import numpy as np
 import tempfile
+import threading
 import os
 from fuse.data.ops.op_base import OpBase
+from fuse.data.ops.ops_aug_common import OpSample
+from fuse.data.ops.ops_common import OpLambda
+from fuse.utils.rand.param_sampler import Uniform
 from typing import List, Union, Optional
 from fuse.data.datasets.caching.samples_cacher import SamplesCacher
 from fuse.data.datasets.dataset_default import DatasetDefault
@@ -79,6 +83,69 @@ class OpPrintContents(OpBase):
         return sample_dict
 
 
+class OpFakeLoadIO(OpBase):
+    """
+    A fake I/O bound op - records the thread it runs in. Drops sample 3 and splits sample 4
+    """
+
+    def __call__(self, sample_dict: NDict) -> Union[None, dict, List[dict]]:
+        sid = get_sample_id(sample_dict)
+        if sid == 3:
+            return None
+        if sid == 4:
+            samples = [create_initial_sample(4, f"4_{index}") for index in range(2)]
+        else:
+            samples = [sample_dict]
+        for sample in samples:
+            sample["data.value"] = sid * 10
+            sample["data.io_thread"] = threading.get_ident()
+        return samples
+
+    def get_execution_hint(self) -> str:
+        return "io"
+
+
+def _record_compute_thread(sample_dict: NDict) -> NDict:
+    sample_dict["data.compute_thread"] = threading.get_ident()
+    return sample_dict
+
+
+def _set_value_drop_3(sample_dict: NDict) -> Optional[NDict]:
+    sid = get_sample_id(sample_dict)
+    if sid == 3:
+        return None
+    sample_dict["data.value"] = sid * 10
+    return sample_dict
+
+
+class OpCountCalls(OpBase):
+    """
+    A deterministic op - counts its calls
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.num_calls = 0
+
+    def __call__(self, sample_dict: NDict) -> NDict:
+        self.num_calls += 1
+        sample_dict["data.doubled"] = sample_dict["data.value"] * 2
+        return sample_dict
+
+    def is_random(self) -> bool:
+        return False
+
+
+class OpAddNoise(OpBase):
+    """
+    An op that does not declare itself deterministic (and indeed it isn't)
+    """
+
+    def __call__(self, sample_dict: NDict, key: str) -> NDict:
+        sample_dict[key] = sample_dict[key] + np.random.rand()
+        return sample_dict
+
+
 class TestDatasetDefault(unittest.TestCase):
     """
     Test sample caching
@@ -227,6 +294,143 @@ class TestDatasetDefault(unittest.TestCase):
         )
         banana = 123
 
+    def test_iter_multi(self) -> None:
+        pipeline = PipelineDefault(
+            "dynamic", [(OpLambda(lambda x: x * 2), dict(key="data.sample_id"))]
+        )
+        dataset = DatasetDefault(list(range(20)), dynamic_pipeline=pipeline)
+        dataset.create()
+
+        expected = [sample["data.sample_id"] for sample in dataset.get_multi(workers=0)]
+        samples = dataset.iter_multi(workers=2, prefetch=2, mp_context="thread")
+        self.assertListEqual([sample["data.sample_id"] for sample in samples], expected)
+
+        samples = dataset.iter_multi(workers=2, keep_order=False, mp_context="thread")
+        self.assertSetEqual(
+            {sample["data.sample_id"] for sample in samples},
+            {index * 2 for index in range(20)},
+        )
+
+        # stop early
+        for sample in dataset.iter_multi(workers=2, prefetch=1, mp_context="thread"):
+            break
+        self.assertEqual(sample["data.sample_id"], 0)
+
+    def test_io_threads(self) -> None:
+        tmpdir = tempfile.mkdtemp()
+        static_pl = PipelineDefault(
+            "static_pipeline",
+            [
+                (OpFakeLoadIO(), {}),
+                (OpLambda(_record_compute_thread), dict(key=None)),
+            ],
+        )
+        self.assertEqual(static_pl.get_io_stage_op_id(), "0")
+
+        orig_sample_ids = list(range(10))
+        cacher = SamplesCacher(
+            "dataset_test_cache_io_threads",
+            static_pl,
+            [tmpdir],
+            restart_cache=True,
+            io_threads=2,
+            audit_first_sample=False,
+            audit_rate=None,
+        )
+        ds_cached = DatasetDefault(orig_sample_ids, static_pl, cacher=cacher)
+        ds_cached.create()
+
+        ds_not_cached = DatasetDefault(
+            orig_sample_ids,
+            static_pl,
+            allow_uncached_sample_morphing=True,
+        )
+        ds_not_cached.create(io_threads=2)
+
+        expected_sample_ids = [0, 1, 2, "4_0", "4_1", 5, 6, 7, 8, 9]
+        for ds in [ds_cached, ds_not_cached]:
+            self.assertListEqual(ds.get_all_sample_ids(), expected_sample_ids)
+
+        # the I/O stage ran in threads, ahead of the rest of the pipeline
+        for index, sample_id in enumerate(expected_sample_ids):
+            sample = ds_cached[index]
+            self.assertEqual(sample["data.sample_id"], sample_id)
+            self.assertEqual(sample["data.value"], ds_not_cached[index]["data.value"])
+            self.assertEqual(sample["data.compute_thread"], threading.get_ident())
+            self.assertNotEqual(sample["data.io_thread"], threading.get_ident())
+
+    def test_hoist_deterministic_ops(self) -> None:
+        tmpdir = tempfile.mkdtemp()
+        static_pl = PipelineDefault(
+            "static_pipeline", [(OpLambda(_set_value_drop_3), dict(key=None))]
+        )
+        op_count_calls = OpCountCalls()
+        dynamic_pl = PipelineDefault(
+            "dynamic_pipeline",
+            [
+                (op_count_calls, dict()),
+                (
+                    OpLambda(lambda x: x + 1, deterministic=True),
+                    dict(key="data.doubled"),
+                ),
+                (
+                    OpSample(OpLambda(lambda x, add: x + add)),
+                    dict(key="data.value", add=Uniform(0.0, 1.0)),
+                ),
+                (OpLambda(lambda x: x * 3), dict(key="data.doubled")),
+            ],
+        )
+        self.assertEqual(dynamic_pl.get_deterministic_prefix_op_id(), "1")
+
+        # ops are considered random unless they declare themselves deterministic
+        self.assertIsNone(
+            PipelineDefault(
+                "custom_op", [(OpAddNoise(), dict(key="data.value"))]
+            ).get_deterministic_prefix_op_id()
+        )
+        self.assertIsNone(
+            PipelineDefault(
+                "lambda", [(OpLambda(lambda x: x + 1), dict(key="data.value"))]
+            ).get_deterministic_prefix_op_id()
+        )
+
+        orig_sample_ids = list(range(10))
+        expected_sample_ids = [0, 1, 2, 4, 5, 6, 7, 8, 9]
+        for expected_estimated in [False, True]:
+            cacher = SamplesCacher(
+                "dataset_test_cache_hoist",
+                static_pl,
+                [tmpdir],
+                restart_cache=not expected_estimated,
+                audit_first_sample=False,
+                audit_rate=None,
+            )
+            ds = DatasetDefault(
+                orig_sample_ids,
+                static_pl,
+                dynamic_pl,
+                cacher=cacher,
+                hoist_deterministic_ops=True,
+            )
+            ds.create()
+            self.assertListEqual(ds.get_all_sample_ids(), expected_sample_ids)
+            report = ds.get_hoisting_report()
+            self.assertListEqual(report["hoisted_op_ids"], ["0", "1"])
+            self.assertEqual(report["num_samples"], len(expected_sample_ids))
+            self.assertEqual(report["estimated"], expected_estimated)
+
+            # the hoisted ops are not called anymore, the rest of the dynamic pipeline is
+            num_calls = op_count_calls.num_calls
+            for index, sample_id in enumerate(expected_sample_ids):
+                sample = ds[index]
+                value = sample_id * 10
+                self.assertEqual(sample["data.sample_id"], sample_id)
+                self.assertEqual(sample["data.initial_sample_id"], sample_id)
+                self.assertEqual(sample["data.doubled"], (value * 2 + 1) * 3)
+                self.assertGreaterEqual(sample["data.value"], value)
+                self.assertLess(sample["data.value"], value + 1)
+            self.assertEqual(op_count_calls.num_calls, num_calls)
+
     def tearDown(self) -> None:
         pass
 
@@ -1,6 +1,7 @@
 import inspect
-from typing import Callable, Any, Type, Optional, Sequence, List
-from inspect import stack
+from typing import Callable, Any, Type, Optional, Sequence, List, Set
+from types import CodeType, FunctionType, ModuleType
+import functools
 import warnings
 from fuse.utils.file_io.file_io import load_pickle, save_pickle_safe
 import os
@@ -13,13 +14,14 @@ def get_function_call_str(
     *_args: list,
     _ignore_kwargs_names: List = None,
     _include_code: bool = True,
+    _include_helpers_code: bool = True,
     **_kwargs: dict,
 ) -> str:
     """
     Converts a function and its kwargs into a hash value which can be used for caching.
     NOTE:
-    1. This is far from being bulletproof, the op might call another function which is not covered and is changed,
-    which will make the caching processing be unaware.
+    1. This is far from being bulletproof. The code of helper functions the function calls is included (see get_code_str),
+    but changes in code that is called in other ways (for example - via a variable or in a third party package) are not detected.
     2. This is a mechanism that helps to spot SOME of such issues, NOT ALL
     3. Only a specific subset of arg types contribute to the caching, mainly simple native python types.
     see 'value_to_string' for more details.
@@ -31,8 +33,13 @@ def get_function_call_str(
         that you don't want to have an effect on the hash, for example, verbose flag.
         example usage: ignore_kwargs_names=['verbose', 'cpu_cores_num']
 
-    _include_code: would code be included in the string representation. Note, it will only include code found *directly*
-        in the provided function. Set to False if you don't want it to influence the generated string.
+    _include_code: would code be included in the string representation. Note, it will include code found
+        in the provided function and in the helper functions it calls (see get_code_str).
+        Set to False if you don't want it to influence the generated string.
+        Default is True.
+
+    _include_helpers_code: when _include_code is True, would the code of the helper functions be included.
+        Set to False to include only the code found *directly* in the provided function (the description used by older versions).
         Default is True.
 
 
@@ -56,13 +63,103 @@ def get_function_call_str(
     args_flat_str += "@" + module_str
 
     if _include_code:
-        args_flat_str += "@" + inspect.getsource(
-            func
-        )  # considering the source code (first level of it...)
+        args_flat_str += "@" + get_code_str(
+            func, max_depth=3 if _include_helpers_code else 0
+        )
 
     return args_flat_str
 
 
+def get_code_str(func: Callable, max_depth: int = 3) -> str:
+    """
+    Source code of a function and of the helper functions it calls, up to max_depth levels of calls.
+    Helper functions are the ones which are defined in the same top level package as func (or in __main__), and are called
+    either directly by name, as an attribute of a module of that package, or as a method (self.foo()) of the same class.
+    Results are cached per code object, so the sources are read only once per process.
+    """
+    func = inspect.unwrap(getattr(func, "__func__", func))
+    if not isinstance(func, FunctionType):
+        return inspect.getsource(func)
+    return _get_code_str_cached(func, max_depth)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_code_str_cached(func: FunctionType, max_depth: int) -> str:
+    visited = set()
+    sources = []
+    _collect_code_recurse(func, max_depth, visited, sources)
+    return "@".join(sources)
+
+
+def _collect_code_recurse(
+    func: FunctionType, depth: int, visited: Set[CodeType], sources: List[str]
+) -> None:
+    if func.__code__ in visited:
+        return
+    visited.add(func.__code__)
+    sources.append(get_source_str(func.__code__))
+    if depth <= 0:
+        return
+    for helper in _get_called_helpers(func):
+        _collect_code_recurse(helper, depth - 1, visited, sources)
+
+
+def _get_called_helpers(func: FunctionType) -> List[FunctionType]:
+    """
+    The helper functions that func may call, see get_code_str()
+    """
+    package = _get_top_level_package(func.__module__)
+    names = _get_code_names(func.__code__)
+    owner = None
+    qualname_parts = func.__qualname__.split(".")
+    if len(qualname_parts) > 1:
+        owner = func.__globals__.get(qualname_parts[0], None)
+
+    helpers = []
+    for name in names:
+        candidates = []
+        value = func.__globals__.get(name, None)
+        if isinstance(value, ModuleType):
+            if _get_top_level_package(value.__name__) == package:
+                candidates.extend(getattr(value, n, None) for n in names)
+        else:
+            candidates.append(value)
+        if inspect.isclass(owner):
+            candidates.append(inspect.getattr_static(owner, name, None))
+        for candidate in candidates:
+            candidate = getattr(candidate, "__func__", candidate)
+            if (
+                isinstance(candidate, FunctionType)
+                and candidate is not func
+                and _get_top_level_package(candidate.__module__) == package
+            ):
+                helpers.append(candidate)
+    return helpers
+
+
+def _get_code_names(code: CodeType) -> List[str]:
+    # names used in the code object and in nested code objects (for example - lambdas and comprehensions)
+    names = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names.extend(_get_code_names(const))
+    return names
+
+
+def _get_top_level_package(module_name: Optional[str]) -> Optional[str]:
+    if module_name is None:
+        return None
+    return module_name.split(".")[0]
+
+
+@functools.lru_cache(maxsize=None)
+def get_source_str(code: CodeType) -> str:
+    """
+    inspect.getsource() cached per code object
+    """
+    return inspect.getsource(code)
+
+
 def value_to_string(val: Any, warn_on_types: Optional[Sequence] = None) -> str:
     """
     Used by default in several caching related hash builders.
@@ -144,15 +241,21 @@ def get_callers_string_description(
     """
 
     str_desc = ""
+    frame = inspect.currentframe()
     try:
-        curr_stack = stack()
-        curr_locals = None
         # note: frame 0 is this function, frame 1 is whoever called this (and wanted to know about its callers),
         # so both frames 0+1 are skipped.
-        for i in range(
-            ignore_first_frames, min(len(curr_stack), max_look_up + ignore_first_frames)
-        ):
-            curr_locals = curr_stack[i].frame.f_locals
+        # walking the frames directly is much faster than inspect.stack(), which reads the source lines of every frame
+        for _ in range(ignore_first_frames):
+            if frame is None:
+                break
+            frame = frame.f_back
+        for _ in range(max_look_up):
+            if frame is None:
+                break
+            curr_frame = frame
+            frame = frame.f_back
+            curr_locals = curr_frame.f_locals
             if expected_class is not None:
                 if "self" not in curr_locals:
                     continue
@@ -160,7 +263,7 @@ def get_callers_string_description(
                     continue
 
             if expected_function_name is not None:
-                if expected_function_name != str(curr_stack[i].function):
+                if expected_function_name != curr_frame.f_code.co_name:
                     continue
 
             curr_str = ".".join(
@@ -169,12 +272,12 @@ def get_callers_string_description(
                         curr_locals["self"].__module__
                     ),  # module is probably not needed as class already contains it
                     str(curr_locals["self"].__class__),
-                    str(curr_stack[i].function),
+                    curr_frame.f_code.co_name,
                 ]
             )
 
-            curr_str += inspect.getsource(curr_stack[i].frame)
-            for k, d in curr_stack[i].frame.f_locals.items():
+            curr_str += get_source_str(curr_frame.f_code)
+            for k, d in curr_locals.items():
                 if "self" == k:
                     continue
                 if k.startswith("__"):
@@ -184,8 +287,9 @@ def get_callers_string_description(
             str_desc += curr_str
 
     finally:
-        del curr_locals
-        del curr_stack
+        del frame
+        curr_frame = None
+        curr_locals = None
 
     return str_desc
 
@@ -56,8 +56,34 @@ class HashableClass:
 
         if not hasattr(self, "_stored_init_str_representation"):
             raise Exception(HashableClass._MISSING_SUPER_INIT_ERR_MSG)
+        # computed once per instance - both the init args and the code are fixed once the instance is created
+        cached = self.__dict__.get("_hashable_string_representation_cache", None)
+        if cached is not None:
+            return cached
         call_repr = get_function_call_str(
             self.__call__,
         )
 
+        ans = f"init_{self._stored_init_str_representation}@call_{call_repr}"
+        self._hashable_string_representation_cache = ans
+        return ans
+
+    def get_legacy_hashable_string_representation(self) -> str:
+        """
+        The string representation used by older versions - includes only the code found *directly* in __call__(), without the code of the helper functions it calls.
+        Used to recognize samples cache created by older versions (see SamplesCacher).
+        If get_hashable_string_representation() is overridden, returns the overridden representation.
+        """
+        if (
+            type(self).get_hashable_string_representation
+            is not HashableClass.get_hashable_string_representation
+        ):
+            return self.get_hashable_string_representation()
+        if not hasattr(self, "_stored_init_str_representation"):
+            raise Exception(HashableClass._MISSING_SUPER_INIT_ERR_MSG)
+        call_repr = get_function_call_str(
+            self.__call__,
+            _include_helpers_code=False,
+        )
+
         return f"init_{self._stored_init_str_representation}@call_{call_repr}"
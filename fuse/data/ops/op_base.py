@@ -49,6 +49,46 @@ class OpBase(HashableClass):
         """
         raise NotImplementedError
 
+    def get_execution_hint(self) -> str:
+        """
+        A hint for the executors of the static pipeline (see SamplesCacher and DatasetDefault.create io_threads argument).
+        The ops from the beginning of the pipeline up to the last "io" op, given that none of them is a "compute" op, are the I/O stage.
+        The I/O stage of the next samples runs in threads, overlapping many outstanding reads, ahead of the rest of the pipeline.
+        :return: one of:
+                 "compute" (default) - CPU heavy op
+                 "io" - an op that mostly waits for I/O, e.g. reads a file from a network storage
+                 "light" - negligible running time (e.g. an in-memory lookup), can be part of either stage
+        """
+        return "compute"
+
+    def is_random(self) -> bool:
+        """
+        Used to find the deterministic ops at the beginning of a dynamic pipeline, which can be cached (see DatasetDefault hoist_deterministic_ops argument).
+        To be on the safe side, an op is considered random unless it overrides this method and declares itself deterministic.
+        Random arguments (ParamSamplerBase) are detected separately, so an op that draws random values only through its arguments can return False.
+        Ops that wrap other ops should return True if any of the wrapped ops is random.
+        :return: True if the output of the op might be different when called twice with the same sample_dict and arguments
+        """
+        return True
+
+
+def get_execution_hint(op: OpBase) -> str:
+    """
+    See OpBase.get_execution_hint(). Supports also callables which are not instances of OpBase.
+    """
+    if isinstance(op, OpBase):
+        return op.get_execution_hint()
+    return "compute"
+
+
+def is_random_op(op: OpBase) -> bool:
+    """
+    See OpBase.is_random(). Callables which are not instances of OpBase are considered random.
+    """
+    if isinstance(op, OpBase):
+        return op.is_random()
+    return True
+
 
 class OpReversibleBase(OpBase):
     """
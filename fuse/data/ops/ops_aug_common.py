@@ -1,15 +1,22 @@
-from typing import List, Optional, Sequence, Union
+from typing import List, Optional, Sequence, Tuple, Union
 
 
 from fuse.utils.rand.param_sampler import RandBool, draw_samples_recursively
 
-from fuse.data.ops.op_base import OpBase, OpReversibleBase, op_call, op_reverse
+from fuse.data.ops.op_base import (
+    OpBase,
+    OpReversibleBase,
+    is_random_op,
+    op_call,
+    op_reverse,
+)
+from fuse.data.ops.ops_batch import OpBatchBase, op_call_batch
 from fuse.data.ops.ops_common import OpRepeat
 
 from fuse.utils.ndict import NDict
 
 
-class OpRandApply(OpReversibleBase):
+class OpRandApply(OpReversibleBase, OpBatchBase):
     def __init__(self, op: OpBase, probability: float):
         """
         Randomly apply the op (according to the given probability)
@@ -31,6 +38,52 @@ class OpRandApply(OpReversibleBase):
             sample_dict = op_call(self._op, sample_dict, f"{op_id}.apply", **kwargs)
         return sample_dict
 
+    def get_op(self) -> OpBase:
+        return self._op
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return True
+
+    def fusion_unwrap(
+        self, sample_dict: NDict, op_id: Optional[str], **kwargs: dict
+    ) -> Tuple[Optional[OpBase], Optional[str], dict]:
+        """
+        Used by OpFused: draws whether to apply the op, exactly as __call__() does, without calling it
+        :return: the op to call (None if it should not be applied), its op_id and its kwargs
+        """
+        apply = self._param_sampler.sample()
+        sample_dict[op_id] = apply
+        return (self._op if apply else None), f"{op_id}.apply", kwargs
+
+    def call_batch(
+        self,
+        batch_dict: NDict,
+        op_id: Optional[str],
+        kwargs_per_sample: List[Optional[dict]],
+    ) -> NDict:
+        """
+        See OpBatchBase - draws whether to apply the op per sample, stored as a list in batch_dict[op_id]
+        """
+        apply = [
+            self._param_sampler.sample() if kwargs is not None else False
+            for kwargs in kwargs_per_sample
+        ]
+        batch_dict[op_id] = apply
+        if any(apply):
+            batch_dict = op_call_batch(
+                self._op,
+                batch_dict,
+                f"{op_id}.apply",
+                [
+                    kwargs if sample_apply else None
+                    for kwargs, sample_apply in zip(kwargs_per_sample, apply)
+                ],
+            )
+        return batch_dict
+
     def reverse(
         self,
         sample_dict: NDict,
@@ -50,7 +103,7 @@ class OpRandApply(OpReversibleBase):
         return sample_dict
 
 
-class OpSample(OpReversibleBase):
+class OpSample(OpReversibleBase, OpBatchBase):
     """
     recursively searches for ParamSamplerBase instances in kwargs, and replaces the drawn values inplace before calling to op.__call__()
 
@@ -82,6 +135,43 @@ class OpSample(OpReversibleBase):
         sampled_kwargs = draw_samples_recursively(kwargs)
         return op_call(self._op, sample_dict, op_id, **sampled_kwargs)
 
+    def get_op(self) -> OpBase:
+        return self._op
+
+    def is_random(self) -> bool:
+        """
+        See OpBase - the random arguments are detected by the caller, the op itself might be random as well
+        """
+        return is_random_op(self._op)
+
+    def fusion_unwrap(
+        self, sample_dict: NDict, op_id: Optional[str], **kwargs: dict
+    ) -> Tuple[Optional[OpBase], Optional[str], dict]:
+        """
+        Used by OpFused: draws the arguments exactly as __call__() does, without calling the op
+        :return: the op to call, its op_id and the sampled kwargs
+        """
+        return self._op, op_id, draw_samples_recursively(kwargs)
+
+    def call_batch(
+        self,
+        batch_dict: NDict,
+        op_id: Optional[str],
+        kwargs_per_sample: List[Optional[dict]],
+    ) -> NDict:
+        """
+        See OpBatchBase - draws the arguments per sample
+        """
+        return op_call_batch(
+            self._op,
+            batch_dict,
+            op_id,
+            [
+                draw_samples_recursively(kwargs) if kwargs is not None else None
+                for kwargs in kwargs_per_sample
+            ],
+        )
+
     def reverse(
         self,
         sample_dict: NDict,
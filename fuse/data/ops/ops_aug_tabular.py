@@ -82,3 +82,9 @@ class OpAugOneHot(OpBase):
         sample_dict[key] = res_one_hot
 
         return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase - "ranking" mode draws the direction of the change
+        """
+        return True
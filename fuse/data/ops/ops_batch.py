@@ -0,0 +1,143 @@
+"""
+(C) Copyright 2021 IBM Corp.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Batch mode - running ops on a collated batch, see PipelineDefault batch_mode argument
+"""
+from typing import Any, List, Optional, Sequence
+
+import torch
+
+from fuse.data.ops.op_base import OpBase, op_call
+from fuse.utils.ndict import NDict
+
+
+class OpBatchBase(OpBase):
+    """
+    An op that can run on a collated batch with different arguments per sample (see PipelineDefault batch_mode argument).
+    Override call_batch() to process all the samples at once, typically using a single batched tensor op.
+    By default, the op is called once on the whole batch if all the samples share the same arguments, and per sample otherwise.
+    """
+
+    def call_batch(
+        self,
+        batch_dict: NDict,
+        op_id: Optional[str],
+        kwargs_per_sample: List[Optional[dict]],
+    ) -> NDict:
+        """
+        :param batch_dict: the collated batch
+        :param op_id: the op id
+        :param kwargs_per_sample: the op arguments per sample in the batch, None to leave the sample unchanged
+        :return: the modified batch_dict
+        """
+        return call_batch_per_sample(self, batch_dict, op_id, kwargs_per_sample)
+
+
+def op_call_batch(
+    op: OpBase,
+    batch_dict: NDict,
+    op_id: Optional[str],
+    kwargs_per_sample: List[Optional[dict]],
+) -> NDict:
+    """
+    Run an op on a collated batch - see OpBatchBase.call_batch()
+    """
+    if isinstance(op, OpBatchBase):
+        return op.call_batch(batch_dict, op_id, kwargs_per_sample)
+    return call_batch_per_sample(op, batch_dict, op_id, kwargs_per_sample)
+
+
+def call_batch_per_sample(
+    op: OpBase,
+    batch_dict: NDict,
+    op_id: Optional[str],
+    kwargs_per_sample: List[Optional[dict]],
+) -> NDict:
+    """
+    Fallback for ops without a batch implementation.
+    If all the samples share the same arguments, the op is called once on the whole batch.
+    Otherwise, the op is called per sample on batch_dict[key][index], where key is the op argument named "key".
+    """
+    if len(kwargs_per_sample) > 0 and all(
+        _is_same_kwargs(kwargs, kwargs_per_sample[0]) for kwargs in kwargs_per_sample
+    ):
+        ans = op_call(op, batch_dict, op_id, **kwargs_per_sample[0])
+        if not isinstance(ans, dict):
+            raise Exception(
+                f"Error: {type(op).__name__} is expected to return the batch_dict in batch mode, got {type(ans)}"
+            )
+        return ans
+
+    for index, kwargs in enumerate(kwargs_per_sample):
+        if kwargs is None:
+            continue
+        if "key" not in kwargs:
+            raise Exception(
+                f"Error: {type(op).__name__} does not support batch mode with different arguments per sample, expecting an argument named 'key'"
+            )
+        key = kwargs["key"]
+        sample_dict = NDict({key: batch_dict[key][index]})
+        sample_dict = op_call(op, sample_dict, op_id, **kwargs)
+        batch_dict[key][index] = sample_dict[key]
+    return batch_dict
+
+
+def get_common_kwarg(
+    kwargs_per_sample: Sequence[Optional[dict]], name: str, default: Any = None
+) -> Any:
+    """
+    Helper for batch implementations
+    :return: the value of the argument if it's the same for all the samples (ignoring skipped samples), or raise an exception otherwise
+    """
+    values = [
+        kwargs.get(name, default) for kwargs in kwargs_per_sample if kwargs is not None
+    ]
+    if any(not _is_same_value(value, values[0]) for value in values):
+        raise Exception(
+            f"Error: expecting the same value of {name} for all the samples in the batch"
+        )
+    return values[0] if values else default
+
+
+def get_batch_param(
+    kwargs_per_sample: Sequence[Optional[dict]],
+    name: str,
+    default: Any,
+    like: torch.Tensor,
+) -> torch.Tensor:
+    """
+    Helper for batch implementations - collect a numeric argument into a tensor broadcastable with like (shape [batch_size, 1, 1, ...])
+    :param default: the value used for samples that do not specify the argument
+    """
+    values = [kwargs.get(name, default) for kwargs in kwargs_per_sample]
+    dtype = like.dtype if torch.is_floating_point(like) else torch.float32
+    return torch.tensor(values, dtype=dtype, device=like.device).view(
+        [len(values)] + [1] * (like.dim() - 1)
+    )
+
+
+def _is_same_value(a: Any, b: Any) -> bool:
+    try:
+        return bool(a == b)
+    except Exception:  # e.g. comparing arrays
+        return a is b
+
+
+def _is_same_kwargs(a: Optional[dict], b: Optional[dict]) -> bool:
+    if a is b:
+        return a is not None
+    if a is None or b is None or a.keys() != b.keys():
+        return False
+    return all(_is_same_value(a[name], b[name]) for name in a)
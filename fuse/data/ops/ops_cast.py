@@ -22,6 +22,7 @@ from fuse.data.ops.op_base import OpReversibleBase
 import numpy as np
 
 from fuse.data import OpBase
+from fuse.data.utils.lazy_array import LazyArray
 import torch
 from torch import Tensor
 from fuse.utils.ndict import NDict
@@ -47,6 +48,9 @@ class Cast:
             value = value.to(dtype=dtype, device=device)
         elif isinstance(value, (np.ndarray, int, float, list)):
             value = torch.tensor(value, dtype=dtype, device=device)
+        elif isinstance(value, LazyArray):
+            # read just the selected region, converted from the stored dtype only once
+            value = torch.from_numpy(value.numpy()).to(dtype=dtype, device=device)
         else:
             raise Exception(
                 f"Unsupported type {type(value)} - add here support for this type"
@@ -65,6 +69,8 @@ class Cast:
             value = np.array(value, dtype=dtype)
         elif isinstance(value, bytes):
             value = np.array([e for e in value], dtype=dtype)
+        elif isinstance(value, LazyArray):
+            value = value.numpy(dtype)
         else:
             raise Exception(
                 f"Unsupported type {type(value)} - add here support for this type"
@@ -202,6 +208,12 @@ class OpCast(OpReversibleBase):
     def _cast(self) -> None:
         raise NotImplementedError
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpToTensor(OpCast):
     """
@@ -299,3 +311,9 @@ class OpOneHotToNumber(OpBase):
 
         ans = (max_value == 1) and (min_value == 0) and (sum_value == 1)
         return ans
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
@@ -15,14 +15,23 @@ from typing import (
 from fuse.data.key_types import TypeDetectorBase
 import copy
 from enum import Enum
-from .op_base import OpBase, OpReversibleBase, op_call, op_reverse  # DataType,
+from .op_base import (  # DataType,
+    OpBase,
+    OpReversibleBase,
+    get_execution_hint,
+    is_random_op,
+    op_call,
+    op_reverse,
+)
+from .ops_batch import OpBatchBase, op_call_batch
 from fuse.data.patterns import Patterns
 from fuse.utils.ndict import NDict
+from fuse.utils.rand.param_sampler import contains_param_sampler
 import numpy as np
 import torch
 
 
-class OpRepeat(OpReversibleBase):
+class OpRepeat(OpReversibleBase, OpBatchBase):
     """
     Repeat an op multiple times
 
@@ -84,6 +93,20 @@ class OpRepeat(OpReversibleBase):
 
         return sample_dict
 
+    def get_execution_hint(self) -> str:
+        """
+        See OpBase - same as the repeated op
+        """
+        return get_execution_hint(self._op)
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return is_random_op(self._op) or contains_param_sampler(
+            list(self._kwargs_per_step_to_add)
+        )
+
     def reverse(
         self,
         sample_dict: NDict,
@@ -105,21 +128,58 @@ class OpRepeat(OpReversibleBase):
 
         return sample_dict
 
+    def call_batch(
+        self,
+        batch_dict: NDict,
+        op_id: Optional[str],
+        kwargs_per_sample: List[Optional[dict]],
+    ) -> NDict:
+        """
+        See OpBatchBase
+        """
+        for step_index, step_kwargs_to_add in enumerate(self._kwargs_per_step_to_add):
+            step_kwargs_per_sample = []
+            for kwargs in kwargs_per_sample:
+                if kwargs is not None:
+                    kwargs = copy.copy(kwargs)
+                    kwargs.update(step_kwargs_to_add)
+                step_kwargs_per_sample.append(kwargs)
+            full_step_id = f"{op_id}_{step_index}"
+            batch_dict[
+                full_step_id + "_debug_info.op_name"
+            ] = self._op.__class__.__name__
+            batch_dict = op_call_batch(
+                self._op, batch_dict, full_step_id, step_kwargs_per_sample
+            )
+
+        return batch_dict
+
 
 class OpLambda(OpReversibleBase):
     """
     Apply simple lambda function / function to transform single value from sample_dict (or the all dictionary)
     Optionally add reverse method if required.
     Example:
-    OpLambda(func=lambda x: torch.tensor(x))
+    OpLambda(func=lambda x: torch.tensor(x), deterministic=True)
     """
 
     def __init__(
-        self, func: Callable, func_reverse: Optional[Callable] = None, **kwargs: Any
+        self,
+        func: Callable,
+        func_reverse: Optional[Callable] = None,
+        deterministic: bool = False,
+        **kwargs: Any,
     ):
+        """
+        :param func: the function to apply
+        :param func_reverse: optional, the function that reverses func
+        :param deterministic: set to True if func does not draw random values,
+                              allows to cache the op output (see DatasetDefault hoist_deterministic_ops argument)
+        """
         super().__init__(**kwargs)
         self._func = func
         self._func_reverse = func_reverse
+        self._deterministic = deterministic
 
     def __call__(
         self,
@@ -163,6 +223,12 @@ class OpLambda(OpReversibleBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase - considered random unless created with deterministic=True
+        """
+        return not self._deterministic
+
 
 class OpFunc(OpReversibleBase):
     """
@@ -189,12 +255,15 @@ class OpFunc(OpReversibleBase):
 
     """
 
-    def __init__(self, func: Callable, **kwargs: Any):
+    def __init__(self, func: Callable, deterministic: bool = False, **kwargs: Any):
         """
         :param func: a callable to call in  __call__()
+        :param deterministic: set to True if func does not draw random values,
+                              allows to cache the op output (see DatasetDefault hoist_deterministic_ops argument)
         """
         super().__init__(**kwargs)
         self._func = func
+        self._deterministic = deterministic
 
     def __call__(
         self,
@@ -240,6 +309,12 @@ class OpFunc(OpReversibleBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase - considered random unless created with deterministic=True
+        """
+        return not self._deterministic
+
 
 class OpApplyPatterns(OpReversibleBase):
     """
@@ -289,6 +364,15 @@ class OpApplyPatterns(OpReversibleBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return any(
+            is_random_op(op) or contains_param_sampler(op_kwargs)
+            for op, op_kwargs in self._patterns_dict.get_values()
+        )
+
     def reverse(
         self,
         sample_dict: NDict,
@@ -369,6 +453,15 @@ class OpApplyTypes(OpReversibleBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return any(
+            is_random_op(op) or contains_param_sampler(op_kwargs)
+            for op, op_kwargs in self._type_to_op_dict.values()
+        )
+
     def reverse(
         self,
         sample_dict: NDict,
@@ -440,6 +533,56 @@ class OpCollectMarker(OpReversibleBase):
     ) -> dict:
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
+
+class OpCheckpoint(OpReversibleBase):
+    """
+    Use this op within the static pipeline to mark an intermediate result that SamplesCacher should persist.
+    When an op after the checkpoint is modified (or added), the samples are loaded from the checkpoint and only the ops after it are rerun.
+    Typically placed right after an expensive op (for example, decoding a DICOM/NIfTI volume) that is followed by cheap ops that are often tuned.
+
+    Example:
+    static_pipeline = PipelineDefault("static", [
+        (OpLoadImage(data_dir), dict(key_in="data.input.img_path", key_out="data.input.img")),
+        (OpCheckpoint("decoded"), dict()),
+        (OpResizeTo(channels_first=False), dict(key="data.input.img", output_shape=(256, 256))),
+    ])
+
+    Note that changing an op before the checkpoint (or the checkpoint itself) invalidates it.
+    """
+
+    def __init__(self, name: str):
+        super().__init__()
+        self._name = name
+
+    def get_name(self) -> str:
+        return self._name
+
+    def __call__(
+        self, sample_dict: dict, op_id: Optional[str], **kwargs: Any
+    ) -> Union[None, dict, List[dict]]:
+        return sample_dict
+
+    def reverse(
+        self,
+        sample_dict: dict,
+        key_to_reverse: str,
+        key_to_follow: str,
+        op_id: Optional[str],
+    ) -> dict:
+        return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpKeepKeypaths(OpBase):
     """
@@ -461,6 +604,12 @@ class OpKeepKeypaths(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpDeleteKeypaths(OpBase):
     """
@@ -476,6 +625,12 @@ class OpDeleteKeypaths(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpLookup(OpBase):
     """
@@ -508,6 +663,12 @@ class OpLookup(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpToOneHot(OpBase):
     """
@@ -535,6 +696,12 @@ class OpToOneHot(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpConcat(OpBase):
     """
@@ -557,6 +724,12 @@ class OpConcat(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpOverrideNaN(OpBase):
     """
@@ -573,12 +746,24 @@ class OpOverrideNaN(OpBase):
             sample_dict[key] = value_to_fill
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpZScoreNorm(OpBase):
     def __call__(self, sample_dict: NDict, key: str, mean: float, std: float) -> NDict:
         sample_dict[key] = (sample_dict[key] - mean) / std
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpCond(OpBase):
     """Apply given op if the condition (either directly specified or read from the sample_dict) is True"""
@@ -603,6 +788,12 @@ class OpCond(OpBase):
         else:
             return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return is_random_op(self._op)
+
 
 class OpSet(OpBase):
     """Add/override key-value pair into sample_dict"""
@@ -617,6 +808,12 @@ class OpSet(OpBase):
         sample_dict[key] = value
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpSetRandomChoice(OpBase):
     """Choose random value from a list and add/override key-value pair into sample_dict"""
@@ -635,6 +832,12 @@ class OpSetRandomChoice(OpBase):
         sample_dict[key] = self._rng.choice(values)
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return True
+
 
 class OpSetIfNotExist(OpBase):
     """Add key-value pair into sample_dict only if the key doesn't already exist"""
@@ -650,6 +853,12 @@ class OpSetIfNotExist(OpBase):
             sample_dict[key] = value
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpReplaceElements(OpBase):
     """
@@ -703,6 +912,12 @@ class OpReplaceElements(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpReplaceAnyElements(OpBase):
     """
@@ -760,3 +975,9 @@ class OpReplaceAnyElements(OpBase):
             raise Exception(f"Unsupported object type {type(input_obj)}")
 
         return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
@@ -58,6 +58,12 @@ class OpDebugBase(OpBase):
         """The actual debug op implementation"""
         raise NotImplementedError
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpPrintKeys(OpDebugBase):
     """
@@ -0,0 +1,261 @@
+"""
+(C) Copyright 2021 IBM Corp.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Op fusion - see PipelineDefault.compile()
+"""
+from typing import Any, Callable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+
+from fuse.data.ops.op_base import (
+    OpBase,
+    OpReversibleBase,
+    is_random_op,
+    op_call,
+    op_reverse,
+)
+from fuse.utils.ndict import NDict
+from fuse.utils.rand.param_sampler import contains_param_sampler
+
+
+class FusionStepBase:
+    """
+    The fusible part of an op (see OpFusibleBase): a transformation of the value stored in a single key.
+    Consecutive steps are merged when possible (e.g., a single resample for consecutive geometric transformations).
+    """
+
+    def merge(self, other: "FusionStepBase") -> Optional["FusionStepBase"]:
+        """
+        :param other: the step that follows this step
+        :return: a single step equivalent to applying this step followed by other, or None if they cannot be merged
+        """
+        return None
+
+    def apply(self, value: Any, owned: bool) -> Tuple[Any, bool]:
+        """
+        :param value: the value to transform
+        :param owned: True if value is a buffer created by a previous fused step, so it can be modified in place
+        :return: the transformed value, and whether it is owned (see above)
+        """
+        raise NotImplementedError
+
+
+class FusionStepElementwise(FusionStepBase):
+    """
+    A sequence of elementwise functions, applied in place on a single buffer.
+    Consecutive elementwise steps are always merged.
+    """
+
+    def __init__(self, funcs: List[Callable]):
+        """
+        :param funcs: functions with the signature foo(value) -> value, each expected to modify the value in place and return it
+        """
+        self._funcs = funcs
+
+    def merge(self, other: FusionStepBase) -> Optional[FusionStepBase]:
+        if isinstance(other, FusionStepElementwise):
+            return FusionStepElementwise(self._funcs + other._funcs)
+        return None
+
+    def apply(self, value: Any, owned: bool) -> Tuple[Any, bool]:
+        if not owned:
+            # copy once, the value might be referenced elsewhere (e.g. by a cache)
+            if isinstance(value, torch.Tensor):
+                value = value.clone()
+            elif isinstance(value, np.ndarray):
+                value = value.copy()
+        for func in self._funcs:
+            value = func(value)
+        return value, True
+
+
+class OpFusibleBase(OpBase):
+    """
+    An op that PipelineDefault.compile() can fuse with its neighbour fusible ops working on the same key.
+    The op is expected to get the key as an argument named "key" and to modify only the value stored in this key.
+    """
+
+    def get_fusion_step(self, key: str, **kwargs: Any) -> Optional[FusionStepBase]:
+        """
+        :param key: the key the op works on
+        :param kwargs: the rest of the op arguments (after sampling)
+        :return: a step doing what __call__() does to the value, or None if the op cannot be fused given these arguments,
+                 in which case the op will be called as usual.
+        """
+        raise NotImplementedError
+
+
+def get_fusible_op(op: OpBase) -> Optional[OpFusibleBase]:
+    """
+    :return: the fusible op, possibly wrapped by ops that support fusion_unwrap() (e.g. OpSample and OpRandApply), or None
+    """
+    while hasattr(op, "fusion_unwrap"):
+        op = op.get_op()
+    return op if isinstance(op, OpFusibleBase) else None
+
+
+class OpFused(OpReversibleBase):
+    """
+    Runs a sequence of fusible ops working on the same key (see OpFusibleBase), created by PipelineDefault.compile().
+    The random arguments are drawn in the same order as when running the ops one by one,
+    and ops that cannot be fused given the arguments are called as usual.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        ops_and_kwargs: List[Tuple[OpBase, dict]],
+        op_ids: List[str],
+        fused_op_id: str,
+    ):
+        """
+        :param key: the key all the ops work on
+        :param ops_and_kwargs: the ops to fuse and their arguments
+        :param op_ids: the original op id of each op
+        :param fused_op_id: the op id of this op in the pipeline - used to recover the original op ids
+        """
+        super().__init__()
+        self._key = key
+        self._ops_and_kwargs = ops_and_kwargs
+        self._op_ids = op_ids
+        self._fused_op_id = fused_op_id
+
+    def _get_pipeline_op_id(self, op_id: str) -> str:
+        assert op_id.endswith(
+            "." + self._fused_op_id
+        ), f"Error: unexpected op_id {op_id} for fused op {self._fused_op_id}"
+        return op_id[: -len(self._fused_op_id) - 1]
+
+    def __call__(
+        self, sample_dict: NDict, op_id: Optional[str], **kwargs: dict
+    ) -> Union[None, dict, List[dict]]:
+        """
+        See super class
+        """
+        pipeline_op_id = self._get_pipeline_op_id(op_id)
+        pending = None
+        for sub_op_id, (op, op_kwargs) in zip(self._op_ids, self._ops_and_kwargs):
+            op_kwargs = dict(op_kwargs)
+            op_id = f"{pipeline_op_id}.{sub_op_id}"
+            # unwrap - draw random arguments, decide whether to apply, ...
+            while op is not None and hasattr(op, "fusion_unwrap"):
+                op, op_id, op_kwargs = op.fusion_unwrap(sample_dict, op_id, **op_kwargs)
+            if op is None:
+                continue
+
+            step = op.get_fusion_step(**op_kwargs)
+            if step is not None:
+                if pending is None:
+                    pending = [step]
+                else:
+                    merged = pending[-1].merge(step)
+                    if merged is not None:
+                        pending[-1] = merged
+                    else:
+                        pending.append(step)
+            else:
+                # fallback - apply the pending steps and call the op as usual
+                self._apply_steps(sample_dict, pending)
+                pending = None
+                sample_dict = op_call(op, sample_dict, op_id, **op_kwargs)
+                if not isinstance(sample_dict, dict):
+                    raise Exception(
+                        f"Error: fused op {type(op).__name__} is expected to return a single sample, got {type(sample_dict)}"
+                    )
+
+        self._apply_steps(sample_dict, pending)
+        return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return any(
+            is_random_op(op) or contains_param_sampler(op_kwargs)
+            for op, op_kwargs in self._ops_and_kwargs
+        )
+
+    def _apply_steps(
+        self, sample_dict: NDict, steps: Optional[Sequence[FusionStepBase]]
+    ) -> None:
+        if not steps:
+            return
+        value = sample_dict[self._key]
+        owned = False
+        for step in steps:
+            value, owned = step.apply(value, owned)
+        sample_dict[self._key] = value
+
+    def reverse(
+        self,
+        sample_dict: NDict,
+        key_to_reverse: str,
+        key_to_follow: str,
+        op_id: Optional[str],
+    ) -> dict:
+        """
+        See super class
+        """
+        pipeline_op_id = self._get_pipeline_op_id(op_id)
+        for sub_op_id, (op, _) in zip(
+            reversed(self._op_ids), reversed(self._ops_and_kwargs)
+        ):
+            sample_dict = op_reverse(
+                op,
+                sample_dict,
+                f"{pipeline_op_id}.{sub_op_id}",
+                key_to_reverse,
+                key_to_follow,
+            )
+        return sample_dict
+
+
+def fuse_ops(
+    ops_and_kwargs: List[Tuple[OpBase, dict]], op_ids: List[str]
+) -> Tuple[List[Tuple[OpBase, dict]], List[str]]:
+    """
+    Replace each sequence of two or more fusible ops (see OpFusibleBase) working on the same key with a single OpFused
+    :return: the new list of ops and kwargs and the new op ids. The op id of a fused op is the original op ids joined by "+".
+    """
+    groups = []  # list of (key, [indices])
+    for index, (op, kwargs) in enumerate(ops_and_kwargs):
+        key = kwargs.get("key", None)
+        if get_fusible_op(op) is None or not isinstance(key, str):
+            key = None
+        if key is not None and groups and groups[-1][0] == key:
+            groups[-1][1].append(index)
+        else:
+            groups.append((key, [index]))
+
+    new_ops_and_kwargs = []
+    new_op_ids = []
+    for key, indices in groups:
+        if key is None or len(indices) == 1:
+            for index in indices:
+                new_ops_and_kwargs.append(ops_and_kwargs[index])
+                new_op_ids.append(op_ids[index])
+            continue
+        fused_op_id = "+".join(op_ids[index] for index in indices)
+        fused_op = OpFused(
+            key,
+            [ops_and_kwargs[index] for index in indices],
+            [op_ids[index] for index in indices],
+            fused_op_id,
+        )
+        new_ops_and_kwargs.append((fused_op, dict()))
+        new_op_ids.append(fused_op_id)
+
+    return new_ops_and_kwargs, new_op_ids
@@ -109,12 +109,24 @@ class OpReadDataframe(OpBase):
 
         return sample_dict
 
+    def get_execution_hint(self) -> str:
+        """
+        See OpBase - the dataframe is read once in the constructor, so the op is an in-memory lookup
+        """
+        return "light"
+
     def get_all_keys(self) -> List[Hashable]:
         """
         :return: list of  dataframe index values
         """
         return list(self.data.keys())
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpReadHDF5(OpBase):
     """
@@ -161,3 +173,15 @@ class OpReadHDF5(OpBase):
             sample_dict[key_to_store] = self._h5[column][index]
 
         return sample_dict
+
+    def get_execution_hint(self) -> str:
+        """
+        See OpBase
+        """
+        return "io"
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
@@ -12,6 +12,16 @@ from fuse.data.key_types_for_testing import (
 )
 
 
+def _helper_for_test(value: int) -> int:
+    return value + 1
+
+
+class OpWithHelperForTest(OpBase):
+    def __call__(self, sample_dict: NDict, **kwargs: dict) -> NDict:
+        sample_dict["data.value"] = _helper_for_test(sample_dict["data.value"])
+        return sample_dict
+
+
 class TestOpBase(unittest.TestCase):
     def test_for_type_detector(self) -> None:
         td = type_detector_for_testing
@@ -70,6 +80,13 @@ class TestOpBase(unittest.TestCase):
             [DataTypeForTesting.IMAGE_FOR_TESTING],
         )
 
+    def test_op_hashable_string_includes_helpers(self) -> None:
+        op = OpWithHelperForTest()
+        desc = op.get_hashable_string_representation()
+        # the code of the helper function called by the op participates in the hash
+        self.assertIn("def _helper_for_test", desc)
+        self.assertIs(desc, op.get_hashable_string_representation())
+
 
 if __name__ == "__main__":
     unittest.main()
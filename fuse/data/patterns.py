@@ -1,5 +1,5 @@
 from collections import OrderedDict
-from typing import Any, Sequence
+from typing import Any, List, Sequence
 import re
 
 
@@ -45,6 +45,12 @@ class Patterns:
 
         return self._default_value
 
+    def get_values(self) -> List[Any]:
+        """
+        :return: the values of all the patterns
+        """
+        return list(self._patterns.values())
+
     def verify_value_in(self, key: str, values: Sequence[Any]) -> None:
         """
         Raise an exception of the matched value not in values
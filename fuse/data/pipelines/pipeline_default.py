@@ -16,13 +16,27 @@ limitations under the License.
 Created on June 30, 2021
 
 """
-from typing import List, Tuple, Union, Optional, Any
-from fuse.data.ops.op_base import OpBase, OpReversibleBase, op_call, op_reverse
+from typing import Callable, List, Tuple, Union, Optional, Any
+from fuse.data.ops.op_base import (
+    OpBase,
+    OpReversibleBase,
+    get_execution_hint,
+    is_random_op,
+    op_call,
+    op_reverse,
+)
+from fuse.data.ops.ops_batch import op_call_batch
+from fuse.data.ops.ops_common import OpCheckpoint, OpCollectMarker
+from fuse.data.ops.ops_fusion import fuse_ops
+from fuse.data.pipelines.pipeline_profiler import PipelineProfiler, get_samples_nbytes
 from fuse.utils.misc.context import DummyContext
+from fuse.data.utils.sample import get_sample_id_key
 from fuse.utils.ndict import NDict
+from fuse.utils.rand.param_sampler import contains_param_sampler
 from fuse.utils.cpu_profiling.timer import Timer
 import os
 import copy
+import hashlib
 import threading
 
 
@@ -39,12 +53,17 @@ class PipelineDefault(OpReversibleBase):
         ops_and_kwargs: List[Tuple[OpBase, dict]],
         op_ids: Optional[List[str]] = None,
         verbose: bool = False,
+        batch_mode: bool = False,
     ):
         """
         :param name: pipeline name
         :param ops_and_args: List of tuples. Each tuple include op and dictionary includes op specific arguments.
         :param op_ids: Optional, set op_id - unique name for every op. If not set, an index will be used
         :param verbose: set to True for debug messages such as the running time of each operation
+        :param batch_mode: set to True for a batch pipeline - a pipeline that runs on a collated batch_dict (see CollateDefault batch_pipeline argument).
+                           Random arguments are still drawn per sample (e.g. by OpSample and OpRandApply),
+                           and applied to all the samples at once by ops that implement OpBatchBase.call_batch().
+                           Other ops are called once on the whole batch if the arguments are the same for all the samples, and per sample otherwise.
         """
         super().__init__()
         self._name = name
@@ -60,11 +79,17 @@ class PipelineDefault(OpReversibleBase):
             ), "Expecting unique op id for every op."
             self._op_ids = op_ids
         self._verbose = verbose
+        self._batch_mode = batch_mode
+        self._profiler = None
 
     @property
     def ops(self) -> List[Any]:
         return [a[0] for a in self._ops_and_kwargs]
 
+    @property
+    def ops_and_kwargs(self) -> List[Tuple[Any, dict]]:
+        return list(self._ops_and_kwargs)
+
     def copy(self) -> "PipelineDefault":
         """
         This is a shallow copy of the pipeline: the two pipelines will point to the same operation instances.
@@ -99,54 +124,272 @@ class PipelineDefault(OpReversibleBase):
         self._ops_and_kwargs.extend(ops_and_kwargs)
         self._op_ids.extend(op_ids)
 
+    def compile(self) -> "PipelineDefault":
+        """
+        Creates an equivalent pipeline in which each sequence of fusible ops (see OpFusibleBase) working on the same key
+        is replaced by a single OpFused - e.g. consecutive geometric augmentations are applied with a single resample
+        and consecutive elementwise ops are applied in place on a single buffer. Ops that cannot be fused are left as is.
+        The random values are drawn in the same order, and the pipeline remains reversible.
+        Note that the op ids and therefore the hashes of the fused ops change (the fused op id is the original op ids joined by "+"),
+        so it's intended for dynamic pipelines. Use verbose=True to compare the running time of each op.
+        :return: the compiled pipeline
+        """
+        if self._batch_mode:
+            raise Exception(
+                "Error: compile() is not supported for a pipeline in batch mode"
+            )
+        ops_and_kwargs, op_ids = fuse_ops(self._ops_and_kwargs, self._op_ids)
+        ans = PipelineDefault(self._name, ops_and_kwargs, op_ids, self._verbose)
+        ans.set_profiler(self._profiler)
+        return ans
+
+    def set_profiler(self, profiler: Optional[PipelineProfiler]) -> None:
+        """
+        :param profiler: PipelineProfiler that will accumulate the running time and the sizes of the samples per op, or None to disable profiling
+        """
+        self._profiler = profiler
+
+    def get_profiler(self) -> Optional[PipelineProfiler]:
+        return self._profiler
+
+    def is_batch_mode(self) -> bool:
+        return self._batch_mode
+
     def get_name(self) -> str:
         return self._name
 
     def __str__(self) -> str:
-        text = []
-        for op_id, op_kwargs in zip(self._op_ids, self._ops_and_kwargs):
-            op, kwargs = op_kwargs
-            text.append(
-                str(op_id)
-                + "@"
-                + op.get_hashable_string_representation()
-                + "@"
-                + str(kwargs)
-                + "@"
-            )
-        return "".join(text)  # this is faster than accumulate_str+=new_str
+        return "".join(
+            self._get_op_str(index) for index in range(len(self._ops_and_kwargs))
+        )  # this is faster than accumulate_str+=new_str
+
+    def _get_op_str(self, index: int) -> str:
+        op, kwargs = self._ops_and_kwargs[index]
+        return (
+            str(self._op_ids[index])
+            + "@"
+            + op.get_hashable_string_representation()
+            + "@"
+            + str(kwargs)
+            + "@"
+        )
+
+    def get_ops_hashes(self) -> List[str]:
+        """
+        :return: a hash per op, based on the op id, the op string representation (see HashableClass) and the op kwargs
+        """
+        return [
+            hashlib.md5(self._get_op_str(index).encode("utf-8")).hexdigest()
+            for index in range(len(self._ops_and_kwargs))
+        ]
+
+    def get_prefix_hashes(self) -> List[str]:
+        """
+        :return: a hash per op, describing the pipeline up to and including this op.
+            The hashes of the ops before a changed op remain the same, so it can be used to find the first changed op
+            and to reuse results of the unchanged part of the pipeline.
+        """
+        ans = []
+        prefix_hash = ""
+        for op_hash in self.get_ops_hashes():
+            prefix_hash = hashlib.md5(
+                (prefix_hash + op_hash).encode("utf-8")
+            ).hexdigest()
+            ans.append(prefix_hash)
+        return ans
+
+    def get_legacy_desc_hash(self) -> str:
+        """
+        :return: the hash of the pipeline used by older versions - md5 of the string representation of the entire pipeline,
+            in which the ops include only the code found directly in their __call__() (see HashableClass.get_legacy_hashable_string_representation()).
+            Used to recognize samples cache created by older versions.
+        """
+        text = "".join(
+            str(op_id)
+            + "@"
+            + op.get_legacy_hashable_string_representation()
+            + "@"
+            + str(kwargs)
+            + "@"
+            for op_id, (op, kwargs) in zip(self._op_ids, self._ops_and_kwargs)
+        )
+        return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+    def get_op_ids(self) -> List[str]:
+        return list(self._op_ids)
 
     def __len__(self) -> int:
         return len(self._ops_and_kwargs)
 
+    def get_checkpoints(self) -> List[Tuple[str, str, str]]:
+        """
+        :return: a list of tuples (op id, checkpoint name, prefix hash) - one per OpCheckpoint in the pipeline
+        """
+        prefix_hashes = self.get_prefix_hashes()
+        return [
+            (op_id, op.get_name(), prefix_hash)
+            for op_id, (op, _), prefix_hash in zip(
+                self._op_ids, self._ops_and_kwargs, prefix_hashes
+            )
+            if isinstance(op, OpCheckpoint)
+        ]
+
+    def get_io_stage_op_id(self) -> Optional[str]:
+        """
+        The I/O stage of the pipeline is the ops from the beginning of the pipeline up to the last "io" op, given that none of them is a "compute" op.
+        See OpBase.get_execution_hint()
+        :return: the op id of the last op in the I/O stage, or None if the pipeline does not start with an I/O stage
+        """
+        ans = None
+        for op_id, op in zip(self._op_ids, self.ops):
+            hint = get_execution_hint(op)
+            if hint == "io":
+                ans = op_id
+            elif hint != "light":
+                break
+        return ans
+
+    def get_deterministic_prefix_op_id(self) -> Optional[str]:
+        """
+        The deterministic prefix of the pipeline is the longest sequence of ops, from the beginning of the pipeline, which are not random (see OpBase.is_random())
+        and whose arguments do not include random values (ParamSamplerBase). It stops at the first OpCollectMarker.
+        Typically the pre-processing ops of a dynamic pipeline, which can be cached (see DatasetDefault hoist_deterministic_ops argument).
+        :return: the op id of the last op in the deterministic prefix, or None if the first op is random
+        """
+        ans = None
+        for op_id, (op, op_kwargs) in zip(self._op_ids, self._ops_and_kwargs):
+            if (
+                isinstance(op, OpCollectMarker)
+                or is_random_op(op)
+                or contains_param_sampler(op_kwargs)
+            ):
+                break
+            ans = op_id
+        return ans
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return any(
+            is_random_op(op) or contains_param_sampler(op_kwargs)
+            for op, op_kwargs in self._ops_and_kwargs
+        )
+
     def __call__(
         self,
         sample_dict: NDict,
         op_id: Optional[str] = None,
         until_op_id: Optional[str] = None,
+        checkpoint_callback: Optional[Callable] = None,
     ) -> Union[None, dict, List[dict]]:
         """
         See super class
         plus
         :param until_op_id: optional - stop after the specified op_id - might be used for optimization
+        :param checkpoint_callback: optional callable with the signature foo(op_id: str, samples: List[dict]) -> None,
+            called after each OpCheckpoint with the samples processed so far. Used by SamplesCacher to persist intermediate results.
+        """
+        return self._run([sample_dict], 0, op_id, until_op_id, checkpoint_callback)
+
+    def resume(
+        self,
+        samples: List[dict],
+        after_op_id: str,
+        op_id: Optional[str] = None,
+        until_op_id: Optional[str] = None,
+        checkpoint_callback: Optional[Callable] = None,
+    ) -> Union[None, dict, List[dict]]:
+        """
+        Continue processing samples which were already processed up to and including after_op_id (typically loaded from a checkpoint)
+        :param samples: the samples processed so far
+        :param after_op_id: the op id of the last op that was already applied
+        See __call__() for the other arguments
+        """
+        start_index = self._op_ids.index(after_op_id) + 1
+        return self._run(
+            list(samples), start_index, op_id, until_op_id, checkpoint_callback
+        )
+
+    def run_io_stage(self, sample_dict: NDict) -> List[dict]:
+        """
+        Runs just the I/O stage of the pipeline (see get_io_stage_op_id()), typically in a thread, ahead of the rest of the pipeline.
+        Continue processing the returned samples using resume_after_io_stage()
+        :return: list of samples - empty if the sample was dropped
+        """
+        io_stage_op_id = self.get_io_stage_op_id()
+        if io_stage_op_id is None:
+            return [sample_dict]
+        ans = self._run([sample_dict], 0, None, io_stage_op_id, None, is_partial=True)
+        if ans is None:
+            return []
+        return ans if isinstance(ans, list) else [ans]
+
+    def resume_after_io_stage(
+        self,
+        samples: List[dict],
+        checkpoint_callback: Optional[Callable] = None,
+    ) -> Union[None, dict, List[dict]]:
+        """
+        Runs the rest of the pipeline on the output of run_io_stage()
+        See __call__() for checkpoint_callback argument
+        """
+        if len(samples) == 0:
+            return None
+        io_stage_op_id = self.get_io_stage_op_id()
+        start_index = (
+            0 if io_stage_op_id is None else self._op_ids.index(io_stage_op_id) + 1
+        )
+        return self._run(list(samples), start_index, None, None, checkpoint_callback)
+
+    def _run(
+        self,
+        samples_to_process: List[dict],
+        start_index: int,
+        op_id: Optional[str],
+        until_op_id: Optional[str],
+        checkpoint_callback: Optional[Callable],
+        is_partial: bool = False,
+    ) -> Union[None, dict, List[dict]]:
+        """
+        :param is_partial: the output samples will be processed further by the rest of this pipeline (see run_io_stage())
         """
         # set op_id if not specified
         if op_id is None:
             op_id = f"internal.{self._name}"
 
-        samples_to_process = [sample_dict]
-        for sub_op_id, (op, op_kwargs) in zip(self._op_ids, self._ops_and_kwargs):
+        profiler = self._profiler
+        if profiler is not None and profiler.track_bytes:
+            samples_nbytes = get_samples_nbytes(samples_to_process)
+        else:
+            samples_nbytes = 0
+
+        for sub_op_id, (op, op_kwargs) in zip(
+            self._op_ids[start_index:], self._ops_and_kwargs[start_index:]
+        ):
             if self._verbose:
                 context = Timer(
                     f"PID={os.getpid()} thread={threading.get_ident()} Pipeline {self._name}: op {type(op).__name__}, op_id {sub_op_id}",
                 )
             else:
                 context = DummyContext()
+            if profiler is not None:
+                profiler_start = profiler.start()
             with context:
                 samples_to_process_next = []
 
                 for sample in samples_to_process:
-                    sample = op_call(op, sample, f"{op_id}.{sub_op_id}", **op_kwargs)
+                    if self._batch_mode:
+                        sample = op_call_batch(
+                            op,
+                            sample,
+                            f"{op_id}.{sub_op_id}",
+                            [op_kwargs] * self._get_batch_size(sample),
+                        )
+                    else:
+                        sample = op_call(
+                            op, sample, f"{op_id}.{sub_op_id}", **op_kwargs
+                        )
 
                     # three options for return value:
                     # None - ignore the sample
@@ -164,18 +407,42 @@ class PipelineDefault(OpReversibleBase):
                         )
 
             # continue to process with next op
+            if profiler is not None:
+                samples_nbytes = profiler.record_op(
+                    self._name,
+                    sub_op_id,
+                    op,
+                    len(samples_to_process),
+                    profiler_start,
+                    samples_to_process_next,
+                    samples_nbytes,
+                )
             samples_to_process = samples_to_process_next
 
+            if checkpoint_callback is not None and isinstance(op, OpCheckpoint):
+                checkpoint_callback(sub_op_id, samples_to_process)
+
             # if required - stop after the specified op id
             if until_op_id is not None and sub_op_id == until_op_id:
                 break
 
+        if profiler is not None and not is_partial:
+            profiler.record_samples(self._name, samples_to_process)
+
         # if single sample - return it, otherwise return list of samples.
         if len(samples_to_process) == 1:
             return samples_to_process[0]
         else:
             return samples_to_process
 
+    @staticmethod
+    def _get_batch_size(batch_dict: NDict) -> int:
+        if get_sample_id_key() not in batch_dict:
+            raise Exception(
+                f"Error: a pipeline in batch mode expects a batch_dict with the list of sample ids in {get_sample_id_key()} (see CollateDefault)"
+            )
+        return len(batch_dict[get_sample_id_key()])
+
     def reverse(
         self,
         sample_dict: NDict,
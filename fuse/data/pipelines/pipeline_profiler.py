@@ -0,0 +1,395 @@
+"""
+(C) Copyright 2021 IBM Corp.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import atexit
+import copy
+import json
+import multiprocessing.util
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+
+from fuse.utils.file_io.file_io import delete_directory_tree
+from fuse.utils.misc.misc import get_pretty_dataframe
+
+
+class PipelineProfiler:
+    """
+    Low overhead per op profiler for PipelineDefault, aggregated across processes (e.g. DataLoader workers).
+    Set it using the profiler argument of DatasetDefault, or directly using PipelineDefault.set_profiler().
+
+    Per op, it accumulates the number of processed samples, the wall time, the cpu time (of the calling thread),
+    and optionally (see track_bytes) the change in the size of the samples (the bytes the op added to the sample_dict) and the size of the samples after the op.
+    Per key, it accumulates the size of the values in the output samples of each pipeline.
+
+    The statistics are accumulated in memory by each process. Worker processes periodically save their statistics
+    to a directory in a RAM backed file system (and when they exit), and get_stats() merges the statistics of all the processes.
+    All the statistics are sums, so the statistics of a period (e.g. an epoch) are the difference between two snapshots,
+    see PipelineProfiler.subtract_stats() and ModelEpochSummary.
+
+    Usage example:
+        profiler = PipelineProfiler()
+        dataset = DatasetDefault(sample_ids, static_pipeline, dynamic_pipeline, profiler=profiler)
+        # ... iterate over a DataLoader
+        print(dataset.summary())
+    """
+
+    # per op statistics
+    OP_STATS = ("samples", "wall_time", "cpu_time", "bytes_delta", "output_bytes")
+    # per key statistics
+    KEY_STATS = ("samples", "bytes")
+
+    def __init__(
+        self,
+        flush_interval: float = 1.0,
+        track_bytes: bool = False,
+        shared_memory_dir: Optional[str] = None,
+    ):
+        """
+        :param flush_interval: the minimal interval, in seconds, between two saves of the statistics of a worker process
+        :param track_bytes: set to True to collect the sizes statistics per op as well. It sums the size of all the values of the samples after every op,
+                            which costs O(ops x keys) per sample - significant for samples with many keys.
+                            The size per key is collected anyway, once per sample, on the output of each pipeline.
+        :param shared_memory_dir: a RAM backed directory in which a unique sub directory is created. Default is /dev/shm if available.
+        """
+        self._flush_interval = flush_interval
+        self._track_bytes = track_bytes
+        if shared_memory_dir is None:
+            shared_memory_dir = (
+                "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            )
+        self._dir = os.path.join(
+            shared_memory_dir, f"fuse_pipeline_profiler_{uuid.uuid4().hex}"
+        )
+        os.makedirs(self._dir)
+        self._owner_pid = os.getpid()
+        atexit.register(self._cleanup)
+        self._init_process_state()
+
+    def _init_process_state(self) -> None:
+        """
+        Statistics of the current process
+        """
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._ops: Dict[Tuple[str, str], List[float]] = {}
+        self._op_names: Dict[Tuple[str, str], str] = {}
+        self._keys: Dict[Tuple[str, str], List[float]] = {}
+        self._filename: Optional[str] = None
+        self._last_flush = time.monotonic()
+
+    def _cleanup(self) -> None:
+        if os.getpid() == self._owner_pid and os.path.isdir(self._dir):
+            delete_directory_tree(self._dir)
+
+    def __getstate__(self) -> dict:
+        # a copy sent to another process starts with empty statistics
+        return {
+            "_flush_interval": self._flush_interval,
+            "_track_bytes": self._track_bytes,
+            "_dir": self._dir,
+            "_owner_pid": self._owner_pid,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._init_process_state()
+
+    def _check_process(self) -> None:
+        if os.getpid() != self._pid:
+            # forked - the statistics of the parent process are not ours
+            self._init_process_state()
+        if self._pid != self._owner_pid and self._filename is None:
+            self._filename = os.path.join(
+                self._dir, f"{self._pid}_{uuid.uuid4().hex}.pkl"
+            )
+            # save the statistics when the worker process exits
+            multiprocessing.util.Finalize(self, self._flush, exitpriority=10)
+
+    @property
+    def track_bytes(self) -> bool:
+        return self._track_bytes
+
+    def start(self) -> Tuple[float, float]:
+        """
+        Called by the pipeline before running an op
+        :return: the current wall time and cpu time
+        """
+        return time.perf_counter(), time.thread_time()
+
+    def record_op(
+        self,
+        pipeline_name: str,
+        op_id: str,
+        op: Any,
+        num_samples: int,
+        start: Tuple[float, float],
+        output_samples: Sequence[dict],
+        input_bytes: int,
+    ) -> int:
+        """
+        Called by the pipeline after running an op
+        :param num_samples: the number of samples processed by the op
+        :param start: the value returned by start()
+        :param output_samples: the samples returned by the op
+        :param input_bytes: the size of the samples before the op (the value returned by the previous call)
+        :return: the size of the output samples
+        """
+        wall_time = time.perf_counter() - start[0]
+        cpu_time = time.thread_time() - start[1]
+        output_bytes = get_samples_nbytes(output_samples) if self._track_bytes else 0
+
+        self._check_process()
+        key = (pipeline_name, op_id)
+        with self._lock:
+            stats = self._ops.get(key, None)
+            if stats is None:
+                stats = self._ops[key] = [0, 0.0, 0.0, 0, 0]
+                self._op_names[key] = get_op_name(op)
+            stats[0] += num_samples
+            stats[1] += wall_time
+            stats[2] += cpu_time
+            stats[3] += output_bytes - input_bytes
+            stats[4] += output_bytes
+        self._maybe_flush()
+        return output_bytes
+
+    def record_samples(self, pipeline_name: str, samples: Sequence[dict]) -> None:
+        """
+        Called by the pipeline with its output samples - accumulates the size per key
+        """
+        self._check_process()
+        with self._lock:
+            for sample in samples:
+                for key, value in sample.items():
+                    stats = self._keys.get((pipeline_name, key), None)
+                    if stats is None:
+                        stats = self._keys[(pipeline_name, key)] = [0, 0]
+                    stats[0] += 1
+                    stats[1] += get_value_nbytes(value)
+
+    def _maybe_flush(self) -> None:
+        if (
+            self._filename is not None
+            and time.monotonic() - self._last_flush > self._flush_interval
+        ):
+            self._flush()
+
+    def _flush(self) -> None:
+        """
+        Save the statistics of a worker process
+        """
+        if self._filename is None or not os.path.isdir(self._dir):
+            return
+        with self._lock:
+            data = pickle.dumps(self._get_local_stats())
+        tmp_filename = self._filename + ".tmp"
+        with open(tmp_filename, "wb") as file:
+            file.write(data)
+        os.replace(tmp_filename, self._filename)
+        self._last_flush = time.monotonic()
+
+    def _get_local_stats(self) -> dict:
+        return {
+            "ops": copy.deepcopy(self._ops),
+            "op_names": dict(self._op_names),
+            "keys": copy.deepcopy(self._keys),
+        }
+
+    def get_stats(self) -> dict:
+        """
+        :return: the statistics of all the processes, including worker processes that already exited, in the format:
+                 {"ops": {(pipeline name, op_id): [sum per OP_STATS]}, "op_names": {(pipeline name, op_id): op name}, "keys": {(pipeline name, key): [sum per KEY_STATS]}}
+        """
+        self._check_process()
+        with self._lock:
+            stats = self._get_local_stats()
+        if not os.path.isdir(self._dir):
+            return stats
+        for entry in os.scandir(self._dir):
+            if not entry.name.endswith(".pkl") or entry.path == self._filename:
+                continue
+            try:
+                with open(entry.path, "rb") as file:
+                    worker_stats = pickle.load(file)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                # removed or being replaced
+                continue
+            self._add_stats(stats, worker_stats)
+        return stats
+
+    @staticmethod
+    def _add_stats(stats: dict, other: dict, sign: int = 1) -> None:
+        for name in ("ops", "keys"):
+            for key, values in other[name].items():
+                if key not in stats[name]:
+                    stats[name][key] = [0] * len(values)
+                stats[name][key] = [
+                    value + sign * other_value
+                    for value, other_value in zip(stats[name][key], values)
+                ]
+        stats["op_names"].update(other["op_names"])
+
+    @staticmethod
+    def subtract_stats(stats: dict, prev_stats: Optional[dict]) -> dict:
+        """
+        :return: the statistics collected between two calls to get_stats()
+        """
+        ans = copy.deepcopy(stats)
+        if prev_stats is not None:
+            PipelineProfiler._add_stats(ans, prev_stats, sign=-1)
+        return ans
+
+    def get_summary_dataframes(
+        self, stats: Optional[dict] = None
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        :param stats: statistics returned by get_stats() or subtract_stats(). If None, get_stats() will be used
+        :return: a dataframe with a row per op, sorted by the total wall time (hot spots first), and a dataframe with a row per key sorted by size
+        """
+        if stats is None:
+            stats = self.get_stats()
+
+        ops_rows = []
+        pipeline_wall_time: Dict[str, float] = {}
+        for (pipeline_name, op_id), values in stats["ops"].items():
+            pipeline_wall_time[pipeline_name] = (
+                pipeline_wall_time.get(pipeline_name, 0.0) + values[1]
+            )
+        for (pipeline_name, op_id), values in stats["ops"].items():
+            num_samples, wall_time, cpu_time, bytes_delta, output_bytes = values
+            if num_samples <= 0:
+                continue
+            ops_rows.append(
+                dict(
+                    pipeline=pipeline_name,
+                    op_id=op_id,
+                    op=stats["op_names"].get((pipeline_name, op_id), ""),
+                    samples=int(num_samples),
+                    total_wall_sec=wall_time,
+                    wall_percent=100.0
+                    * wall_time
+                    / max(pipeline_wall_time[pipeline_name], 1e-12),
+                    wall_ms_per_sample=1000.0 * wall_time / num_samples,
+                    cpu_ms_per_sample=1000.0 * cpu_time / num_samples,
+                    bytes_delta_per_sample=bytes_delta / num_samples,
+                    output_bytes_per_sample=output_bytes / num_samples,
+                )
+            )
+        ops_df = pd.DataFrame(
+            ops_rows,
+            columns=[
+                "pipeline",
+                "op_id",
+                "op",
+                "samples",
+                "total_wall_sec",
+                "wall_percent",
+                "wall_ms_per_sample",
+                "cpu_ms_per_sample",
+                "bytes_delta_per_sample",
+                "output_bytes_per_sample",
+            ],
+        )
+        ops_df = ops_df.sort_values("total_wall_sec", ascending=False).reset_index(
+            drop=True
+        )
+
+        keys_rows = [
+            dict(
+                pipeline=pipeline_name,
+                key=key,
+                samples=int(values[0]),
+                bytes_per_sample=values[1] / values[0],
+            )
+            for (pipeline_name, key), values in stats["keys"].items()
+            if values[0] > 0
+        ]
+        keys_df = pd.DataFrame(
+            keys_rows, columns=["pipeline", "key", "samples", "bytes_per_sample"]
+        )
+        keys_df = keys_df.sort_values("bytes_per_sample", ascending=False).reset_index(
+            drop=True
+        )
+        return ops_df, keys_df
+
+    def summary(self, stats: Optional[dict] = None) -> str:
+        """
+        :param stats: statistics returned by get_stats() or subtract_stats(). If None, get_stats() will be used
+        :return: summary tables - per op (hot spots first) and per key
+        """
+        ops_df, keys_df = self.get_summary_dataframes(stats)
+        if not self._track_bytes:
+            ops_df = ops_df.drop(
+                columns=["bytes_delta_per_sample", "output_bytes_per_sample"]
+            )
+        ans = "Pipeline ops (sorted by total wall time):\n"
+        ans += get_pretty_dataframe(ops_df.round(3))
+        ans += "Sample keys (sorted by size):\n"
+        ans += get_pretty_dataframe(keys_df.round(1))
+        return ans
+
+    def to_json(self, stats: Optional[dict] = None) -> str:
+        """
+        :param stats: statistics returned by get_stats() or subtract_stats(). If None, get_stats() will be used
+        :return: the summary tables in json format: {"ops": [row per op], "keys": [row per key]}
+        """
+        ops_df, keys_df = self.get_summary_dataframes(stats)
+        return json.dumps(
+            {"ops": ops_df.to_dict("records"), "keys": keys_df.to_dict("records")}
+        )
+
+
+def get_op_name(op: Any) -> str:
+    """
+    :return: the op class name, including the ops it wraps, e.g. OpRandApply(OpSample(OpAugColor))
+    """
+    name = type(op).__name__
+    if hasattr(op, "get_op"):
+        name += f"({get_op_name(op.get_op())})"
+    return name
+
+
+def get_value_nbytes(value: Any) -> int:
+    """
+    :return: the size in bytes of arrays, tensors, strings and bytes (and sequences of those). Other values are counted as 0.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(get_value_nbytes(element) for element in value)
+    return 0
+
+
+def get_samples_nbytes(samples: Sequence[dict]) -> int:
+    """
+    :return: the total size of the values in the samples, see get_value_nbytes()
+    """
+    return sum(
+        get_value_nbytes(value) for sample in samples for value in sample.values()
+    )
@@ -3,10 +3,18 @@ import unittest
 from fuse.utils.ndict import NDict
 from typing import Any, Union, List
 import copy
+import json
+import multiprocessing
+import random
+import numpy as np
 from unittest.case import expectedFailure
+from unittest.mock import patch
 
 from fuse.data.ops.op_base import OpBase, OpReversibleBase
 from fuse.data.pipelines.pipeline_default import PipelineDefault
+from fuse.data.pipelines.pipeline_profiler import PipelineProfiler
+from fuse.data.ops.ops_aug_common import OpRandApply, OpSample
+from fuse.utils.rand.param_sampler import RandInt
 
 
 class OpSetForTest(OpReversibleBase):
@@ -120,9 +128,118 @@ class TestPipelineDefault(unittest.TestCase):
         samples = [sample["data.sample_id"] for sample in sample_dict]
         self.assertListEqual(expected_samples, samples)
 
+    def test_batch_mode(self) -> None:
+        """
+        Test a pipeline in batch mode - random arguments are drawn per sample and ops without a batch implementation are called per sample
+        """
+        pipeline_seq = [
+            (OpSample(OpSetForTest()), dict(key="data.val", val=RandInt(1, 100))),
+            (OpRandApply(OpSetForTest(), 0.5), dict(key="data.val", val=0)),
+            (OpSetForTest(), dict(key="data.val_2", val=7)),
+        ]
+        pipe = PipelineDefault("test", pipeline_seq, batch_mode=True)
+        batch_size = 10
+        batch_dict = NDict(
+            {"data.sample_id": list(range(batch_size)), "data.val": [-1] * batch_size}
+        )
+
+        random.seed(1234)
+        batch_dict = pipe(batch_dict)
+
+        random.seed(1234)
+        expected_vals = [random.randint(1, 100) for _ in range(batch_size)]
+        apply = [random.uniform(0, 1) <= 0.5 for _ in range(batch_size)]
+        expected_vals = [0 if a else val for a, val in zip(apply, expected_vals)]
+        self.assertListEqual(batch_dict["data.val"], expected_vals)
+        self.assertListEqual(batch_dict["internal.test.1"], apply)
+        # same arguments for all the samples - a single call on the whole batch
+        self.assertEqual(batch_dict["data.val_2"], 7)
+
+        # the batch mode requires sample ids
+        with self.assertRaises(Exception):
+            pipe(NDict({"data.val": [-1] * batch_size}))
+
+    def test_profiler(self) -> None:
+        """
+        Test per op statistics, including statistics collected by another process
+        """
+        pipeline_seq = [
+            (OpSetForTest(), dict(key="data.small", val=np.zeros(10, dtype=np.uint8))),
+            (OpSetForTest(), dict(key="data.large", val=np.zeros(100, dtype=np.uint8))),
+        ]
+        pipe = PipelineDefault("test", pipeline_seq)
+        profiler = PipelineProfiler(flush_interval=0.0, track_bytes=True)
+        pipe.set_profiler(profiler)
+        for _ in range(3):
+            pipe(NDict({"data.sample_id": 0}))
+
+        ops_df, keys_df = profiler.get_summary_dataframes()
+        self.assertEqual(len(ops_df), 2)
+        self.assertListEqual(list(ops_df.samples), [3, 3])
+        # the op stores the array and the key name (10 bytes string)
+        self.assertListEqual(
+            sorted(ops_df.bytes_delta_per_sample.tolist()), [20.0, 110.0]
+        )
+        self.assertEqual(keys_df.key[0], "data.large")
+        key_bytes = dict(zip(keys_df.key, keys_df.bytes_per_sample))
+        self.assertEqual(key_bytes["data.small"], 10.0)
+        self.assertIn("OpSetForTest", profiler.summary())
+        self.assertEqual(len(json.loads(profiler.to_json())["ops"]), 2)
+
+        # statistics of other processes are merged
+        prev_stats = profiler.get_stats()
+        process = multiprocessing.get_context("fork").Process(
+            target=pipe, args=(NDict({"data.sample_id": 0}),)
+        )
+        process.start()
+        process.join()
+        stats = profiler.get_stats()
+        self.assertEqual(stats["ops"][("test", "0")][0], 4)
+        epoch_stats = PipelineProfiler.subtract_stats(stats, prev_stats)
+        self.assertEqual(epoch_stats["ops"][("test", "0")][0], 1)
+
+        # by default, the sizes are collected only on the output of the pipeline
+        profiler = PipelineProfiler(flush_interval=0.0)
+        pipe.set_profiler(profiler)
+        with patch(
+            "fuse.data.pipelines.pipeline_default.get_samples_nbytes"
+        ) as pipeline_nbytes, patch(
+            "fuse.data.pipelines.pipeline_profiler.get_samples_nbytes"
+        ) as profiler_nbytes:
+            pipe(NDict({"data.sample_id": 0}))
+        pipeline_nbytes.assert_not_called()
+        profiler_nbytes.assert_not_called()
+        ops_df, keys_df = profiler.get_summary_dataframes()
+        self.assertListEqual(ops_df.output_bytes_per_sample.tolist(), [0.0, 0.0])
+        key_bytes = dict(zip(keys_df.key, keys_df.bytes_per_sample))
+        self.assertEqual(key_bytes["data.large"], 100.0)
+        self.assertNotIn("bytes_delta_per_sample", profiler.summary())
+
     def tearDown(self) -> None:
         return super().tearDown()
 
+    def test_prefix_hashes(self) -> None:
+        pipeline_seq = [
+            (OpSetForTest(), dict(key="data.test_pipeline", val=5)),
+            (OpSetForTest(), dict(key="data.test_pipeline", val=6)),
+            (OpSetForTest(), dict(key="data.test_pipeline_2", val=7)),
+        ]
+        pipe = PipelineDefault("test", pipeline_seq)
+        changed_pipe = pipe.copy()
+        changed_pipe._ops_and_kwargs[1] = (
+            OpSetForTest(),
+            dict(key="data.test_pipeline", val=8),
+        )
+
+        prefix_hashes = pipe.get_prefix_hashes()
+        changed_prefix_hashes = changed_pipe.get_prefix_hashes()
+        self.assertEqual(len(prefix_hashes), 3)
+        self.assertEqual(prefix_hashes[0], changed_prefix_hashes[0])
+        self.assertNotEqual(prefix_hashes[1], changed_prefix_hashes[1])
+        self.assertNotEqual(prefix_hashes[2], changed_prefix_hashes[2])
+        # the op itself did not change, only the ops before it
+        self.assertEqual(pipe.get_ops_hashes()[2], changed_pipe.get_ops_hashes()[2])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,81 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - CollateDefault generic path vs. the schema locked path (see CollateDefault lock_schema argument)
+on EHR like samples with hundreds of keys (scalars, short sequences, small arrays and strings).
+
+Usage:
+    python fuse/data/utils/benchmarks/benchmark_collate_schema.py --num_keys 400 --batch_size 32
+"""
+import argparse
+import time
+from typing import List
+
+import numpy as np
+import pandas as pd
+import torch
+
+from fuse.data.utils.collates import CollateDefault
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.ndict import NDict
+
+
+def create_samples(num_keys: int, batch_size: int) -> List[NDict]:
+    rng = np.random.default_rng(0)
+    samples = []
+    for index in range(batch_size):
+        sample = NDict({"data.sample_id": index})
+        for key_index in range(num_keys):
+            kind = key_index % 5
+            key = f"data.input.group_{key_index % 10}.feature_{key_index}"
+            if kind == 0:
+                sample[key] = int(rng.integers(100))
+            elif kind == 1:
+                sample[key] = float(rng.random())
+            elif kind == 2:
+                sample[key] = torch.from_numpy(rng.integers(1000, size=64))
+            elif kind == 3:
+                sample[key] = rng.random(16, dtype=np.float32)
+            else:
+                sample[key] = f"code_{rng.integers(1000)}"
+        samples.append(sample)
+    return samples
+
+
+def run_benchmark(num_keys: int, batch_size: int, num_batches: int) -> pd.DataFrame:
+    samples = create_samples(num_keys, batch_size)
+    results = []
+    for name, collate in [
+        ("generic", CollateDefault()),
+        ("lock_schema", CollateDefault(lock_schema=True)),
+    ]:
+        collate(samples)  # warmup - infers the schema
+        start = time.perf_counter()
+        for _ in range(num_batches):
+            collate(samples)
+        elapsed = time.perf_counter() - start
+        results.append(dict(mode=name, ms_per_batch=1000.0 * elapsed / num_batches))
+
+    df = pd.DataFrame(results)
+    df["speedup"] = df.ms_per_batch.iloc[0] / df.ms_per_batch
+    return df.round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_keys", type=int, default=400)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--num_batches", type=int, default=20)
+    args = parser.parse_args()
+
+    df = run_benchmark(args.num_keys, args.batch_size, args.num_batches)
+    print(get_pretty_dataframe(df))
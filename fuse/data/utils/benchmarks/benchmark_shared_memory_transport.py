@@ -0,0 +1,98 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - main process cpu time and wall time of iterating a DataLoader whose batches include numpy volumes
+(KiTS21 like CT crops and PICAI like multi-parametric MRI volumes, collected to a list as variable size volumes are),
+with and without shared memory transport (see CollateDefault shared_memory_transport argument).
+
+Usage:
+    python fuse/data/utils/benchmarks/benchmark_shared_memory_transport.py --num_samples 64 --num_workers 2
+"""
+import argparse
+import time
+from functools import partial
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from torch.utils.data.dataloader import DataLoader
+
+from fuse.data.datasets.dataset_default import DatasetDefault
+from fuse.data.ops.ops_common import OpLambda
+from fuse.data.pipelines.pipeline_default import PipelineDefault
+from fuse.data.utils.collates import CollateDefault
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.ndict import NDict
+
+SHAPES = {
+    "kits21": (1, 96, 192, 192),
+    "picai": (3, 24, 256, 256),
+}
+
+
+def create_volume(sample_dict: NDict, shape: Tuple[int, ...]) -> NDict:
+    sample_dict["data.input.img"] = np.full(
+        shape, sample_dict["data.sample_id"], dtype=np.float32
+    )
+    sample_dict["data.gt.seg"] = np.zeros(shape[1:], dtype=np.uint8)
+    return sample_dict
+
+
+def run_benchmark(num_samples: int, batch_size: int, num_workers: int) -> pd.DataFrame:
+    results = []
+    for name, shape in SHAPES.items():
+        pipeline = PipelineDefault(
+            "dynamic",
+            [(OpLambda(partial(create_volume, shape=shape)), dict(key=None))],
+        )
+        dataset = DatasetDefault(list(range(num_samples)), dynamic_pipeline=pipeline)
+        dataset.create()
+        for transport in [False, True]:
+            collate = CollateDefault(
+                special_handlers_keys={
+                    "data.input.img": CollateDefault.just_collect_to_list,
+                    "data.gt.seg": CollateDefault.just_collect_to_list,
+                },
+                shared_memory_transport=transport,
+            )
+            dl = DataLoader(
+                dataset,
+                batch_size=batch_size,
+                num_workers=num_workers,
+                collate_fn=collate,
+            )
+            start_cpu = time.process_time()
+            start = time.perf_counter()
+            for batch in dl:
+                # touch the data as a training step would
+                for img in batch["data.input.img"]:
+                    img.sum()
+            results.append(
+                dict(
+                    dataset=name,
+                    shared_memory_transport=transport,
+                    main_cpu_sec=time.process_time() - start_cpu,
+                    wall_sec=time.perf_counter() - start,
+                )
+            )
+    return pd.DataFrame(results).round(3)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_samples", type=int, default=64)
+    parser.add_argument("--batch_size", type=int, default=4)
+    parser.add_argument("--num_workers", type=int, default=2)
+    args = parser.parse_args()
+
+    df = run_benchmark(args.num_samples, args.batch_size, args.num_workers)
+    print(get_pretty_dataframe(df))
@@ -16,6 +16,8 @@ limitations under the License.
 Created on June 30, 2021
 
 """
+from functools import partial
+from operator import itemgetter
 from typing import Any, Callable, Dict, List, Sequence, Optional, Tuple
 
 import numpy as np
@@ -26,6 +28,11 @@ import torch.nn.functional as F
 from fuse.utils import NDict
 from fuse.utils.data.collate import CollateToBatchList
 from fuse.data import get_sample_id_key
+from fuse.data.pipelines.pipeline_default import PipelineDefault
+from fuse.data.utils.shared_memory_transport import (
+    is_dataloader_worker,
+    to_shared_memory,
+)
 
 
 class CollateDefault(CollateToBatchList):
@@ -45,6 +52,10 @@ class CollateDefault(CollateToBatchList):
         special_handlers_keys: Optional[Dict[str, Callable]] = None,
         post_collate_special_handlers_keys: Optional[List[Callable]] = None,
         add_to_batch_dict: Optional[Dict[str, Any]] = None,
+        batch_pipeline: Optional[PipelineDefault] = None,
+        lock_schema: bool = False,
+        pin_memory: bool = False,
+        shared_memory_transport: bool = False,
     ):
         """
         :param skip_keys: do not collect the listed keys
@@ -55,6 +66,16 @@ class CollateDefault(CollateToBatchList):
         :param post_collate_special_handlers_keys: specify a callable which gets the batch_dict as an input and applies post processing to the batched tensors.
         :param raise_error_key_missing: if False, will not raise an error if there are keys that do not exist in some of the samples. Instead will set those values to None.
         :param add_to_batch_dict: optional, fixed items to add to batch_dict
+        :param batch_pipeline: optional, a pipeline in batch mode (see PipelineDefault batch_mode argument) to run on the collated batch_dict.
+                               Typically used to move the augmentations from the dynamic pipeline and apply them as batched tensor ops.
+        :param lock_schema: set to True to speed up the collation of samples with many keys. The schema - the keys, and per key the type, dtype and shape -
+                            is inferred from the first batch, and the next batches are collated with a precompiled stacking function per key,
+                            writing directly into a preallocated output tensor. A batch that does not match the schema is collated with the generic path,
+                            and the schema is inferred again. Requires NDict samples.
+        :param pin_memory: used with lock_schema, allocate the output tensors in pinned memory (ignored in DataLoader worker processes and when cuda is not available).
+        :param shared_memory_transport: when running in a DataLoader worker process, move the large numpy arrays left in the batch_dict
+                                        (e.g. collected to a list by a special handler) to shared memory,
+                                        so they will be sent to the main process without pickling and copying them (see SharedMemoryArray).
         """
         super().__init__(skip_keys, raise_error_key_missing)
         self._special_handlers_keys = {}
@@ -67,6 +88,18 @@ class CollateDefault(CollateToBatchList):
         self._add_to_batch_dict = add_to_batch_dict
 
         self._post_collate_special_handlers_keys = post_collate_special_handlers_keys
+        if batch_pipeline is not None and not batch_pipeline.is_batch_mode():
+            raise Exception(
+                f"Error: expecting a pipeline in batch mode, got {batch_pipeline.get_name()}"
+            )
+        self._batch_pipeline = batch_pipeline
+        self._lock_schema = lock_schema
+        self._shared_memory_transport = shared_memory_transport
+        self._pin_memory = pin_memory and torch.cuda.is_available()
+        # schema - set of keys and a stacking function per key (None for keys collated by _batch_dispatch())
+        self._schema_keys: Optional[set] = None
+        self._schema_stack_fns: Optional[Dict[str, Optional[Callable]]] = None
+        self._schema_getter: Optional[Callable] = None
 
     def __call__(self, samples: List[Dict]) -> Dict:
         """
@@ -74,6 +107,32 @@ class CollateDefault(CollateToBatchList):
         :param samples: list of samples
         :return: batch_dict
         """
+        batch_dict = None
+        if self._lock_schema and self._schema_stack_fns is not None:
+            batch_dict = self._collate_with_schema(samples)
+
+        if batch_dict is None:
+            batch_dict = self._collate_generic(samples)
+
+        if self._add_to_batch_dict is not None:
+            batch_dict.update(self._add_to_batch_dict)
+
+        if self._post_collate_special_handlers_keys is not None:
+            for callable in self._post_collate_special_handlers_keys:
+                callable(batch_dict)
+
+        if self._batch_pipeline is not None:
+            batch_dict = self._batch_pipeline(batch_dict)
+
+        if self._shared_memory_transport and is_dataloader_worker():
+            batch_dict = to_shared_memory(batch_dict)
+
+        return batch_dict
+
+    def _collate_generic(self, samples: List[Dict]) -> NDict:
+        """
+        collate the values of each key found in the samples - see __call__()
+        """
         batch_dict = NDict()
 
         # collect all keys
@@ -108,15 +167,196 @@ class CollateDefault(CollateToBatchList):
                 print(f"Error: Failed to collect key {key}")
                 raise
 
-        if self._add_to_batch_dict is not None:
-            batch_dict.update(self._add_to_batch_dict)
+        if self._lock_schema:
+            self._infer_schema(samples, keys)
 
-        if self._post_collate_special_handlers_keys is not None:
-            for callable in self._post_collate_special_handlers_keys:
-                callable(batch_dict)
+        return batch_dict
+
+    def _infer_schema(self, samples: List[Dict], keys: Sequence[str]) -> None:
+        """
+        infer the schema from a batch collated by the generic path - see lock_schema argument
+        """
+        self._schema_keys = None
+        self._schema_stack_fns = None
+        if len(samples) == 0 or not all(
+            isinstance(sample, NDict) for sample in samples
+        ):
+            return
+        sample_keys = set(samples[0].keys())
+        if not self._keep_keys and any(
+            sample.keys() != sample_keys for sample in samples
+        ):
+            return
+
+        samples_stored = [sample.to_dict() for sample in samples]
+        stack_fns = {}
+        for key in keys:
+            if key in self._skip_keys:
+                continue
+            # infer the type from the first sample that has the key (keep_keys might be missing in some of the samples)
+            value = next(
+                (stored[key] for stored in samples_stored if key in stored), _MISSING
+            )
+            if key in self._special_handlers_keys or value is _MISSING:
+                stack_fns[key] = None
+            elif isinstance(value, torch.Tensor) and value.device.type == "cpu":
+                stack_fns[key] = partial(
+                    CollateDefault._stack_tensors,
+                    pin_memory=self._pin_memory,
+                )
+            elif isinstance(value, np.ndarray) and value.dtype.kind in "biufc":
+                stack_fns[key] = partial(
+                    CollateDefault._stack_arrays,
+                    dtype=value.dtype,
+                    pin_memory=self._pin_memory,
+                )
+            elif type(value) in (int, float, bool):
+                stack_fns[key] = partial(
+                    CollateDefault._stack_scalars, scalar_type=type(value)
+                )
+            elif type(value) in (str, bytes):
+                stack_fns[key] = partial(
+                    CollateDefault._collect_same_type, value_type=type(value)
+                )
+            else:
+                stack_fns[key] = None
 
+        self._schema_keys = None if self._keep_keys else sample_keys
+        self._schema_stack_fns = stack_fns
+        # gets the values of all the keys of a sample in a single call
+        self._schema_getter = itemgetter(*stack_fns.keys()) if stack_fns else None
+
+    def _collate_with_schema(self, samples: List[Dict]) -> Optional[NDict]:
+        """
+        collate a batch using the schema - see lock_schema argument
+        :return: batch_dict or None if the samples do not match the schema
+        """
+        if len(samples) == 0:
+            return None
+        samples_stored = []
+        for sample in samples:
+            if not isinstance(sample, NDict):
+                return None
+            if self._schema_keys is not None and sample.keys() != self._schema_keys:
+                return None
+            samples_stored.append(sample.to_dict())
+
+        batch_dict = NDict()
+        if self._schema_getter is None:
+            return batch_dict
+        try:
+            rows = [self._schema_getter(stored) for stored in samples_stored]
+            if len(self._schema_stack_fns) == 1:
+                rows = [(row,) for row in rows]
+            columns = list(zip(*rows))
+        except KeyError:
+            # a key from keep_keys is missing in some of the samples
+            columns = None
+
+        batch_stored = batch_dict.to_dict()
+        schema_changed = False
+        for index, (key, stack_fn) in enumerate(self._schema_stack_fns.items()):
+            if columns is not None:
+                values = list(columns[index])
+            elif all(key in stored for stored in samples_stored):
+                values = [stored[key] for stored in samples_stored]
+            else:
+                # collect the key as the generic path does
+                try:
+                    (
+                        collected_values,
+                        has_error,
+                        has_missing_values,
+                    ) = self._collect_values_to_list(samples, key)
+                    self._batch_dispatch(
+                        batch_dict,
+                        samples,
+                        key,
+                        has_error or has_missing_values,
+                        collected_values,
+                    )
+                except:
+                    print(f"Error: Failed to collect key {key}")
+                    raise
+                continue
+            if stack_fn is not None:
+                try:
+                    batch_stored[key] = stack_fn(values)
+                    continue
+                except _SchemaMismatchError:
+                    schema_changed = True
+            try:
+                self._batch_dispatch(batch_dict, samples, key, False, values)
+            except:
+                print(f"Error: Failed to collect key {key}")
+                raise
+
+        if schema_changed:
+            # infer the schema again from the next batch
+            self._schema_keys = None
+            self._schema_stack_fns = None
         return batch_dict
 
+    @staticmethod
+    def _empty_batch_tensor(
+        elem: torch.Tensor, batch_size: int, pin_memory: bool
+    ) -> torch.Tensor:
+        """
+        preallocate a tensor for a batch of tensors like elem.
+        In a DataLoader worker process, allocate it in shared memory to avoid an extra copy (as in torch default_collate).
+        """
+        shape = (batch_size,) + tuple(elem.shape)
+        if torch.utils.data.get_worker_info() is not None:
+            storage = elem._typed_storage()._new_shared(
+                batch_size * elem.numel(), device=elem.device
+            )
+            return elem.new(storage).resize_(shape)
+        return torch.empty(shape, dtype=elem.dtype, pin_memory=pin_memory)
+
+    @staticmethod
+    def _stack_tensors(values: List[Any], pin_memory: bool) -> torch.Tensor:
+        # torch.stack() verifies the types and the shapes, and promotes the dtype as in torch default_collate
+        if not isinstance(values[0], torch.Tensor) or values[0].device.type != "cpu":
+            raise _SchemaMismatchError()
+        out = CollateDefault._empty_batch_tensor(values[0], len(values), pin_memory)
+        try:
+            return torch.stack(values, 0, out=out)
+        except (RuntimeError, TypeError):
+            raise _SchemaMismatchError()
+
+    @staticmethod
+    def _stack_arrays(
+        values: List[Any], dtype: np.dtype, pin_memory: bool
+    ) -> torch.Tensor:
+        # np.stack() verifies the shapes, casting="no" verifies the dtypes
+        if any(not isinstance(value, np.ndarray) for value in values):
+            raise _SchemaMismatchError()
+        if values[0].dtype != dtype:
+            raise _SchemaMismatchError()
+        out = CollateDefault._empty_batch_tensor(
+            torch.from_numpy(values[0]), len(values), pin_memory
+        )
+        try:
+            np.stack(values, 0, out=out.numpy(), casting="no")
+        except (ValueError, TypeError):
+            raise _SchemaMismatchError()
+        return out
+
+    @staticmethod
+    def _stack_scalars(values: List[Any], scalar_type: type) -> torch.Tensor:
+        if any(type(value) is not scalar_type for value in values):
+            raise _SchemaMismatchError()
+        if scalar_type is float:
+            # same as torch default_collate
+            return torch.tensor(values, dtype=torch.float64)
+        return torch.tensor(values)
+
+    @staticmethod
+    def _collect_same_type(values: List[Any], value_type: type) -> List[Any]:
+        if any(type(value) is not value_type for value in values):
+            raise _SchemaMismatchError()
+        return values
+
     def _batch_dispatch(
         self,
         batch_dict: dict,
@@ -274,3 +514,13 @@ class CollateDefault(CollateToBatchList):
         target_length = batch_dict[target_key].shape[1]
         for key in keys_to_match:
             batch_dict[key] = batch_dict[key][:, :target_length]
+
+
+class _SchemaMismatchError(Exception):
+    """
+    raised by the stacking functions of CollateDefault when the values do not match the locked schema
+    """
+
+
+# a key that doesn't exist in any of the samples of the batch that inferred the schema
+_MISSING = object()
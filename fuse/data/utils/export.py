@@ -16,7 +16,7 @@ limitations under the License.
 Created on June 30, 2021
 
 """
-from typing import Optional, Sequence
+from typing import Iterable, Iterator, List, Optional, Sequence
 import pandas as pds
 
 from fuse.data.datasets.dataset_base import DatasetBase
@@ -47,30 +47,104 @@ class ExportDataset:
                                 The file type will be inferred from filename, see fuse.utils.file_io.file_io.save_dataframe for more details
         :param dataset_get_kwargs: additional parameters to dataset.get(), might be used to optimize the running time
         """
-        # add sample_id to keys list
-        if keys is not None:
-            all_keys = []
-            all_keys += list(keys)
-            if sample_id_key not in keys:
-                all_keys.append(sample_id_key)
-        else:
-            all_keys = None
-
-        # read all the data
-        data = dataset.get_multi(keys=all_keys, desc="export", **dataset_get_kwargs)
+        all_keys = ExportDataset._get_keys(keys, sample_id_key)
 
-        # store in dataframe
-        df = pds.DataFrame()
+        # read the data - stream the samples to avoid keeping them all in memory
+        data = dataset.iter_multi(keys=all_keys, desc="export", **dataset_get_kwargs)
 
-        if all_keys is None:
-            for sample_dict in tqdm(data):
-                df = pds.concat([df, pds.DataFrame([sample_dict])])
-        else:
-            for key in all_keys:
-                values = [sample_dict[key] for sample_dict in data]
-                df[key] = values
+        # store in dataframe
+        df = ExportDataset._samples_to_dataframe(data, all_keys)
 
         if output_filename is not None:
             save_dataframe(df, output_filename)
 
         return df
+
+    @staticmethod
+    def export_to_parquet(
+        dataset: DatasetBase,
+        keys: Optional[Sequence[str]],
+        output_filename: str,
+        chunk_size: int = 10000,
+        sample_id_key: str = "data.sample_id",
+        **dataset_get_kwargs: dict
+    ) -> int:
+        """
+        extract from dataset the specified keys and write them to a parquet file, chunk by chunk (a row group per chunk),
+        so the memory is bounded by the chunk size. Requires pyarrow.
+        :param dataset: the dataset to extract the values from
+        :param keys: keys to extract from sample_dict, or None for all the keys
+        :param output_filename: path to the output parquet file
+        :param chunk_size: number of samples per chunk
+        :param dataset_get_kwargs: additional parameters to dataset.iter_multi(), e.g. workers and prefetch
+        :return: the number of exported samples
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception(
+                "Error: export_to_parquet() requires pyarrow, install it using: pip install pyarrow"
+            )
+
+        all_keys = ExportDataset._get_keys(keys, sample_id_key)
+        data = dataset.iter_multi(keys=all_keys, desc="export", **dataset_get_kwargs)
+
+        num_samples = 0
+        writer = None
+        try:
+            for chunk in ExportDataset._iter_chunks(data, chunk_size):
+                df = ExportDataset._samples_to_dataframe(chunk, all_keys)
+                if writer is None:
+                    table = pa.Table.from_pandas(df, preserve_index=False)
+                    writer = pq.ParquetWriter(output_filename, table.schema)
+                else:
+                    table = pa.Table.from_pandas(
+                        df, schema=writer.schema, preserve_index=False
+                    )
+                writer.write_table(table)
+                num_samples += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        return num_samples
+
+    @staticmethod
+    def _get_keys(
+        keys: Optional[Sequence[str]], sample_id_key: str
+    ) -> Optional[List[str]]:
+        """
+        add sample_id to keys list
+        """
+        if keys is None:
+            return None
+        all_keys = list(keys)
+        if sample_id_key not in keys:
+            all_keys.append(sample_id_key)
+        return all_keys
+
+    @staticmethod
+    def _samples_to_dataframe(
+        samples: Iterable[dict], all_keys: Optional[List[str]]
+    ) -> pds.DataFrame:
+        if all_keys is None:
+            frames = [pds.DataFrame([sample_dict]) for sample_dict in tqdm(samples)]
+            return pds.concat(frames) if frames else pds.DataFrame()
+
+        columns = {key: [] for key in all_keys}
+        for sample_dict in samples:
+            for key in all_keys:
+                columns[key].append(sample_dict[key])
+        return pds.DataFrame(columns)
+
+    @staticmethod
+    def _iter_chunks(samples: Iterable[dict], chunk_size: int) -> Iterator[List[dict]]:
+        chunk = []
+        for sample_dict in samples:
+            chunk.append(sample_dict)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
@@ -0,0 +1,175 @@
+"""
+(C) Copyright 2021 IBM Corp.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Lazy array - a handle to an array stored in a file, which is read (decoded) only when needed.
+See fuseimg OpLoadImage lazy argument.
+"""
+from typing import Any, Callable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+class LazyArray(np.lib.mixins.NDArrayOperatorsMixin):
+    """
+    A handle to an array that is read only when needed.
+    Basic indexing (ints and slices) and astype() are lazy - they are pushed into the read, so only the selected region is read and converted.
+    For example OpSelectSlice and OpCrop3D select the region, and OpToNumpy / OpToTensor read it in the requested dtype.
+    Any other use reads the selected region: value.numpy(), np.asarray(value), numpy functions and arithmetic operators.
+    When pickled (e.g. when cached by SamplesCacher or sent from a DataLoader worker) it's read and unpickled as a numpy array.
+    """
+
+    def __init__(
+        self,
+        reader: Callable[[Tuple[Union[int, slice], ...]], np.ndarray],
+        shape: Sequence[int],
+        dtype: Any,
+    ):
+        """
+        :param reader: reads a region of the array, gets a tuple with an int or a slice (with a positive step) per dimension
+        :param shape: the shape of the entire array
+        :param dtype: the dtype returned by reader
+        """
+        self._reader = reader
+        # per dimension of the entire array - the selected index (dimension removed) or range of indices
+        self._index: List[Union[int, range]] = [range(size) for size in shape]
+        self._read_dtype = np.dtype(dtype)
+        self._dtype: Optional[np.dtype] = None
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return tuple(len(r) for r in self._index if isinstance(r, range))
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def size(self) -> int:
+        return int(np.prod(self.shape))
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype if self._dtype is not None else self._read_dtype
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __repr__(self) -> str:
+        return f"LazyArray(shape={self.shape}, dtype={self.dtype})"
+
+    def __getitem__(self, index: Any) -> Union["LazyArray", np.ndarray]:
+        """
+        Basic indexing is lazy and returns a LazyArray, any other indexing reads the array
+        """
+        if not isinstance(index, tuple):
+            index = (index,)
+        if not all(
+            isinstance(key, (int, np.integer, slice)) or key is Ellipsis
+            for key in index
+        ):
+            return self.numpy()[index]
+
+        dims = [dim for dim, r in enumerate(self._index) if isinstance(r, range)]
+        if Ellipsis in index:
+            position = index.index(Ellipsis)
+            num_missing = len(dims) - len(index) + 1
+            index = (
+                index[:position] + (slice(None),) * num_missing + index[position + 1 :]
+            )
+        if len(index) > len(dims):
+            raise IndexError(
+                f"too many indices for array: array is {len(dims)}-dimensional, but {len(index)} were indexed"
+            )
+
+        new_index = list(self._index)
+        for dim, key in zip(dims, index):
+            r = new_index[dim]
+            if isinstance(key, slice):
+                new_index[dim] = r[key]
+            else:
+                if not -len(r) <= key < len(r):
+                    raise IndexError(
+                        f"index {key} is out of bounds for axis with size {len(r)}"
+                    )
+                new_index[dim] = r[key]
+        ans = self.__copy__()
+        ans._index = new_index
+        return ans
+
+    def astype(self, dtype: Any) -> "LazyArray":
+        """
+        Lazy - the region will be converted to dtype when read
+        """
+        ans = self.__copy__()
+        ans._dtype = np.dtype(dtype)
+        return ans
+
+    def numpy(self, dtype: Any = None) -> np.ndarray:
+        """
+        Read the selected region
+        :param dtype: optional, override the requested dtype (see astype())
+        """
+        read_index = []
+        flip_axes = []  # axes of the output array
+        axis = 0
+        for r in self._index:
+            if not isinstance(r, range):
+                read_index.append(r)
+                continue
+            if len(r) == 0:
+                read_index.append(slice(0, 0))
+            elif r.step > 0:
+                read_index.append(slice(r.start, r[-1] + 1, r.step))
+            else:
+                # read in increasing order and flip
+                read_index.append(slice(r[-1], r[0] + 1, -r.step))
+                flip_axes.append(axis)
+            axis += 1
+        value = np.asarray(self._reader(tuple(read_index)))
+        if len(flip_axes) > 0:
+            value = np.flip(value, axis=flip_axes)
+        if dtype is None:
+            dtype = self._dtype
+        if dtype is not None:
+            value = value.astype(dtype, copy=False)
+        return value
+
+    def __array__(self, dtype: Any = None, copy: Optional[bool] = None) -> np.ndarray:
+        return self.numpy(dtype)
+
+    def __array_ufunc__(
+        self, ufunc: np.ufunc, method: str, *inputs: Any, **kwargs: Any
+    ) -> Any:
+        inputs = tuple(materialize(value) for value in inputs)
+        if "out" in kwargs:
+            kwargs["out"] = tuple(materialize(value) for value in kwargs["out"])
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __copy__(self) -> "LazyArray":
+        ans = LazyArray.__new__(LazyArray)
+        ans.__dict__.update(self.__dict__)
+        return ans
+
+    def __reduce__(self) -> Tuple:
+        return (np.asarray, (self.numpy(),))
+
+
+def materialize(value: Any) -> Any:
+    """
+    :return: the array read from a LazyArray, other values are returned as is
+    """
+    if isinstance(value, LazyArray):
+        return value.numpy()
+    return value
@@ -0,0 +1,101 @@
+"""
+(C) Copyright 2021 IBM Corp.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Shared memory transport of numpy arrays from DataLoader worker processes to the main process.
+Torch sends tensors between processes as handles to shared memory, while numpy arrays are pickled and copied (twice).
+See CollateDefault and DatasetDefault shared_memory_transport argument.
+"""
+from typing import Any, Tuple
+
+import numpy as np
+import torch
+
+from fuse.utils.ndict import NDict
+
+
+class SharedMemoryArray(np.ndarray):
+    """
+    A numpy array whose memory is a torch tensor in shared memory.
+    When pickled by torch multiprocessing (e.g. sent from a DataLoader worker to the main process), only a handle to the shared memory is sent,
+    and it's unpickled as a regular numpy array that uses the same memory.
+    Views and results of operations on it are pickled as regular numpy arrays.
+    """
+
+    @staticmethod
+    def from_array(array: np.ndarray) -> "SharedMemoryArray":
+        """
+        Copy a numpy array to shared memory
+        """
+        elem = torch.from_numpy(np.empty(0, dtype=array.dtype))
+        storage = elem._typed_storage()._new_shared(array.size)
+        tensor = elem.new(storage).resize_(array.shape)
+        shared_array = tensor.numpy().view(SharedMemoryArray)
+        np.copyto(shared_array, array, casting="no")
+        shared_array._shared_tensor = tensor
+        return shared_array
+
+    def __reduce__(self) -> Tuple:
+        tensor = getattr(self, "_shared_tensor", None)
+        if tensor is None:
+            # a view or a result of an operation
+            return self.view(np.ndarray).__reduce__()
+        return (_tensor_to_numpy, (tensor,))
+
+    def __reduce_ex__(self, protocol: int) -> Tuple:
+        return self.__reduce__()
+
+
+def _tensor_to_numpy(tensor: torch.Tensor) -> np.ndarray:
+    return tensor.numpy()
+
+
+def to_shared_memory(value: Any, min_nbytes: int = 65536) -> Any:
+    """
+    Replace the numpy arrays in value with SharedMemoryArray instances, recursively in dicts, lists and tuples.
+    Dicts (including NDict) are modified in place.
+    :param value: typically a sample_dict or a batch_dict
+    :param min_nbytes: smaller arrays are left as is - pickling them is cheaper than allocating shared memory
+    :return: the modified value
+    """
+    if isinstance(value, np.ndarray):
+        if (
+            not isinstance(value, SharedMemoryArray)
+            and value.dtype.kind in "biufc"
+            and value.dtype.isnative
+            and value.nbytes >= min_nbytes
+        ):
+            return SharedMemoryArray.from_array(value)
+        return value
+    if isinstance(value, NDict):
+        stored = value.to_dict()
+        for key, sub_value in stored.items():
+            stored[key] = to_shared_memory(sub_value, min_nbytes)
+        return value
+    if isinstance(value, dict):
+        for key, sub_value in value.items():
+            value[key] = to_shared_memory(sub_value, min_nbytes)
+        return value
+    if isinstance(value, list):
+        return [to_shared_memory(element, min_nbytes) for element in value]
+    if isinstance(value, tuple):
+        return tuple(to_shared_memory(element, min_nbytes) for element in value)
+    return value
+
+
+def is_dataloader_worker() -> bool:
+    """
+    :return: True if running in a DataLoader worker process
+    """
+    return torch.utils.data.get_worker_info() is not None
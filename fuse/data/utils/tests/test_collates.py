@@ -17,7 +17,7 @@ Created on June 30, 2021
 
 """
 
-from typing import List, Optional, Union
+from typing import List, Optional, Sequence, Union
 import unittest
 
 import pandas as pds
@@ -31,6 +31,7 @@ from fuse.data.utils.collates import CollateDefault
 from fuse.data.pipelines.pipeline_default import PipelineDefault
 from fuse.data.ops.op_base import OpBase
 from fuse.data import get_sample_id
+from fuse.utils.ndict import NDict
 
 
 class OpCustomCollateDefTest(OpBase):
@@ -107,6 +108,89 @@ class TestCollate(unittest.TestCase):
         self.assertListEqual(batch["data.partial"], [1, None, None])
         self.assertFalse("data.not_important" in batch)
 
+    def test_collate_lock_schema(self) -> None:
+        def create_samples(batch_size: int, shape: tuple = (2, 3)) -> List[NDict]:
+            return [
+                NDict(
+                    {
+                        "data.sample_id": f"s{index}",
+                        "data.tensor": torch.full(shape, index, dtype=torch.float32),
+                        "data.array": np.full(shape, index, dtype=np.int16),
+                        "data.int": index,
+                        "data.float": index / 2,
+                        "data.bool": index % 2 == 0,
+                        "data.str": f"str{index}",
+                        "data.list": [index],
+                    }
+                )
+                for index in range(batch_size)
+            ]
+
+        def assert_batch_equal(batch: NDict, expected: NDict) -> None:
+            self.assertSetEqual(set(batch.keys()), set(expected.keys()))
+            for key in expected.keys():
+                if isinstance(expected[key], torch.Tensor):
+                    self.assertEqual(batch[key].dtype, expected[key].dtype)
+                    self.assertTrue(torch.equal(batch[key], expected[key]))
+                else:
+                    self.assertListEqual(batch[key], expected[key])
+
+        collate = CollateDefault()
+        collate_schema = CollateDefault(lock_schema=True, raise_error_key_missing=False)
+
+        # the first batch infers the schema, the second one uses it
+        for _ in range(2):
+            assert_batch_equal(
+                collate_schema(create_samples(4)), collate(create_samples(4))
+            )
+        self.assertIsNotNone(collate_schema._schema_stack_fns)
+
+        # schema changes - shapes and keys
+        assert_batch_equal(
+            collate_schema(create_samples(4, shape=(5,))),
+            collate(create_samples(4, shape=(5,))),
+        )
+        samples = create_samples(3)
+        samples[1]["data.extra"] = 1
+        batch = collate_schema(samples)
+        self.assertListEqual(batch["data.extra"], [None, 1, None])
+        assert_batch_equal(
+            collate_schema(create_samples(5)), collate(create_samples(5))
+        )
+
+    def test_collate_lock_schema_missing_keep_keys(self) -> None:
+        def create_samples(missing: Sequence[int]) -> List[NDict]:
+            samples = []
+            for index in range(3):
+                sample = NDict({"data.sample_id": f"s{index}", "data.value": index})
+                if index not in missing:
+                    sample["data.partial"] = torch.tensor([index])
+                samples.append(sample)
+            return samples
+
+        keep_keys = ["data.sample_id", "data.value", "data.partial", "data.none"]
+        collate = CollateDefault(keep_keys=keep_keys, raise_error_key_missing=False)
+        collate_schema = CollateDefault(
+            keep_keys=keep_keys, raise_error_key_missing=False, lock_schema=True
+        )
+        # the first sample of the first batch lacks a key, and a key is missing in all the samples
+        for missing in [(0,), (0, 1, 2), (), (1,)]:
+            batch = collate_schema(create_samples(missing))
+            expected = collate(create_samples(missing))
+            self.assertSetEqual(set(batch.keys()), set(expected.keys()))
+            self.assertListEqual(batch["data.none"], [None, None, None])
+            self.assertTrue(torch.equal(batch["data.value"], expected["data.value"]))
+            if isinstance(expected["data.partial"], torch.Tensor):
+                self.assertTrue(
+                    torch.equal(batch["data.partial"], expected["data.partial"])
+                )
+            else:
+                self.assertListEqual(
+                    [str(value) for value in batch["data.partial"]],
+                    [str(value) for value in expected["data.partial"]],
+                )
+        self.assertIsNotNone(collate_schema._schema_stack_fns)
+
     def test_pad_all_tensors_to_same_size(self) -> None:
         a = torch.zeros((1, 1, 3))
         b = torch.ones((1, 2, 1))
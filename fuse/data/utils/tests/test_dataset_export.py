@@ -17,6 +17,7 @@ Created on June 30, 2021
 
 """
 
+import importlib.util
 import unittest
 
 from tempfile import mkstemp
@@ -66,6 +67,28 @@ class TestDatasetExport(unittest.TestCase):
         for sid in data["sample_id"]:
             self.assertEqual(export_df.loc[sid]["values"], df.loc[sid]["values"])
 
+    @unittest.skipIf(
+        importlib.util.find_spec("pyarrow") is None, "pyarrow is not installed"
+    )
+    def test_export_to_parquet(self) -> None:
+        data = {
+            "sample_id": [f"s{index}" for index in range(25)],
+            "values": list(range(25)),
+        }
+        op = OpReadDataframe(pds.DataFrame(data))
+        pipeline = PipelineDefault("test", [(op, {})])
+        dataset = DatasetDefault(data["sample_id"], dynamic_pipeline=pipeline)
+        dataset.create()
+
+        _, filename = mkstemp(suffix=".parquet")
+        num_samples = ExportDataset.export_to_parquet(
+            dataset, ["values"], filename, chunk_size=10, workers=0
+        )
+        self.assertEqual(num_samples, 25)
+        export_df = pds.read_parquet(filename)
+        self.assertListEqual(list(export_df["data.sample_id"]), data["sample_id"])
+        self.assertListEqual(list(export_df["values"]), data["values"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,94 @@
+"""
+(C) Copyright 2021 IBM Corp.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import pickle
+import unittest
+from multiprocessing.reduction import ForkingPickler
+
+import numpy as np
+from torch.utils.data.dataloader import DataLoader
+
+from fuse.data.datasets.dataset_default import DatasetDefault
+from fuse.data.ops.ops_common import OpLambda
+from fuse.data.pipelines.pipeline_default import PipelineDefault
+from fuse.data.utils.collates import CollateDefault
+from fuse.data.utils.shared_memory_transport import (
+    SharedMemoryArray,
+    to_shared_memory,
+)
+from fuse.utils.ndict import NDict
+
+
+def create_image(sample_dict: NDict) -> NDict:
+    sample_id = sample_dict["data.sample_id"]
+    sample_dict["data.img"] = np.full((4, 64, 64), sample_id, dtype=np.float32)
+    return sample_dict
+
+
+class TestSharedMemoryTransport(unittest.TestCase):
+    def test_shared_memory_array(self) -> None:
+        array = np.arange(24, dtype=np.int32).reshape(2, 3, 4)
+        shared_array = SharedMemoryArray.from_array(array)
+        self.assertTrue(np.array_equal(shared_array, array))
+
+        # unpickled as a regular numpy array
+        for dumps in [ForkingPickler.dumps, pickle.dumps]:
+            value = pickle.loads(dumps(shared_array))
+            self.assertEqual(type(value), np.ndarray)
+            self.assertTrue(np.array_equal(value, array))
+
+            view = pickle.loads(dumps(shared_array[1]))
+            self.assertEqual(type(view), np.ndarray)
+            self.assertTrue(np.array_equal(view, array[1]))
+
+    def test_to_shared_memory(self) -> None:
+        sample = NDict(
+            {
+                "data.large": np.ones(1000, dtype=np.float64),
+                "data.small": np.ones(10, dtype=np.float64),
+                "data.list": [np.zeros(1000, dtype=np.uint8), "str"],
+                "data.str": np.array(["a" * 1000]),
+            }
+        )
+        sample = to_shared_memory(sample, min_nbytes=1000)
+        self.assertIsInstance(sample["data.large"], SharedMemoryArray)
+        self.assertNotIsInstance(sample["data.small"], SharedMemoryArray)
+        self.assertIsInstance(sample["data.list"][0], SharedMemoryArray)
+        self.assertEqual(sample["data.list"][1], "str")
+        self.assertNotIsInstance(sample["data.str"], SharedMemoryArray)
+
+    def test_dataloader(self) -> None:
+        pipeline = PipelineDefault("test", [(OpLambda(create_image), dict(key=None))])
+        for dataset_transport, collate_transport in [(True, False), (False, True)]:
+            dataset = DatasetDefault(
+                list(range(8)),
+                dynamic_pipeline=pipeline,
+                shared_memory_transport=dataset_transport,
+            )
+            dataset.create()
+            collate = CollateDefault(
+                special_handlers_keys={"data.img": CollateDefault.just_collect_to_list},
+                shared_memory_transport=collate_transport,
+            )
+            dl = DataLoader(dataset, batch_size=4, num_workers=1, collate_fn=collate)
+            for batch in dl:
+                for sample_id, img in zip(batch["data.sample_id"], batch["data.img"]):
+                    self.assertEqual(type(img), np.ndarray)
+                    self.assertTrue((img == sample_id).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,9 +17,11 @@ Created on June 30, 2021
 """
 
 from copy import deepcopy
+import json
 import os
 from typing import Optional, Dict, Union
 from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.data.pipelines.pipeline_profiler import PipelineProfiler
 
 import pytorch_lightning as pl
 from pytorch_lightning.callbacks import Checkpoint
@@ -62,12 +64,16 @@ class ModelEpochSummary(Checkpoint):
         filename: Optional[str] = None,
         monitor: Optional[str] = None,
         mode: str = "min",
+        data_profiler: Optional[PipelineProfiler] = None,
     ):
         """
         :param dirpath: location of log file
         :param filename: specify a filename. If not set, it will use f"epoch_summary_{monitor}.txt"
         :param monitor: the metric name to track. if not set, it will just save the last model.
         :param mode: either consider the "min" value to be best or the "max" value to be the best
+        :param data_profiler: optional PipelineProfiler (see DatasetDefault profiler argument).
+                              If set, the data pipelines hot spots of each epoch will be displayed as well,
+                              and saved in json format (a line per epoch) to data_profile.jsonl in dirpath.
         """
         super().__init__()
         self._monitor = monitor
@@ -81,6 +87,8 @@ class ModelEpochSummary(Checkpoint):
             )
         self._best_epoch_metrics = None
         self._best_epoch_index = None
+        self._data_profiler = data_profiler
+        self._prev_data_profiler_stats = None
 
     @rank_zero_only
     def print_epoch_summary_table(
@@ -144,6 +152,34 @@ class ModelEpochSummary(Checkpoint):
             )
             print(error)
 
+    @rank_zero_only
+    def print_data_profile_table(self, epoch_source_index: int) -> None:
+        """
+        Generate, print and log the data pipelines profile of the epoch.
+        Decorator makes sure it runs only once in a DDP strategy.
+        """
+        stats = self._data_profiler.get_stats()
+        epoch_stats = PipelineProfiler.subtract_stats(
+            stats, self._prev_data_profiler_stats
+        )
+        self._prev_data_profiler_stats = stats
+
+        profile_title = f"Data pipelines profile for epoch: {epoch_source_index}\n"
+        profile_as_str = self._data_profiler.summary(epoch_stats)
+        print(profile_title + profile_as_str)
+
+        try:
+            with open(os.path.join(self._dirpath, self._filename), "a") as sfile:
+                sfile.write(profile_title)
+                sfile.write(profile_as_str)
+            profile_as_json = json.loads(self._data_profiler.to_json(epoch_stats))
+            profile_as_json["epoch"] = epoch_source_index
+            with open(os.path.join(self._dirpath, "data_profile.jsonl"), "a") as jfile:
+                jfile.write(json.dumps(profile_as_json) + "\n")
+        except Exception as error:
+            print(f"Cannot write data profile to file in {self._dirpath}")
+            print(error)
+
     def on_train_epoch_end(
         self, trainer: "pl.Trainer", pl_module: "pl.LightningModule"
     ) -> None:
@@ -159,3 +195,5 @@ class ModelEpochSummary(Checkpoint):
                 self._best_epoch_metrics = current_epoch_metrics
                 self._best_epoch_index = trainer.current_epoch
         self.print_epoch_summary_table(current_epoch_metrics, trainer.current_epoch)
+        if self._data_profiler is not None:
+            self.print_data_profile_table(trainer.current_epoch)
@@ -23,6 +23,7 @@ import os
 
 from fuse.dl.lightning.pl_funcs import *  # noqa
 from fuse.utils.file_io.file_io import create_dir
+from fuse.utils.file_io.columnar import ColumnarReader, ColumnarWriter, is_columnar
 
 
 class LightningModuleDefault(pl.LightningModule):
@@ -165,6 +166,8 @@ class LightningModuleDefault(pl.LightningModule):
 
         # init state
         self._prediction_keys = None
+        self._predictions_filename = None
+        self._predictions_writer = None
         self._sep = tensorboard_sep
 
         self._training_step_outputs = []
@@ -256,7 +259,18 @@ class LightningModuleDefault(pl.LightningModule):
         if not isinstance(batch_dict, NDict):
             batch_dict = NDict(batch_dict)
         # extract the required keys - defined in self.set_predictions_keys()
-        return step_extract_predictions(self._prediction_keys, batch_dict)
+        predictions = step_extract_predictions(self._prediction_keys, batch_dict)
+        # append to the predictions file - defined in self.set_predictions_keys()
+        if self._predictions_filename is not None:
+            if self._predictions_writer is None:
+                self._predictions_writer = ColumnarWriter(self._predictions_filename)
+            self._predictions_writer.append(predictions)
+        return predictions
+
+    def on_predict_end(self) -> None:
+        if self._predictions_writer is not None:
+            self._predictions_writer.close()
+            self._predictions_writer = None
 
     ## Epoch end
     def on_train_epoch_end(self) -> None:
@@ -328,6 +342,27 @@ class LightningModuleDefault(pl.LightningModule):
         """See pl.LightningModule.configure_optimizers return value for all options"""
         return self._optimizers_and_lr_schs
 
-    def set_predictions_keys(self, keys: List[str]) -> None:
-        """Define which keys to extract from batch_dict on prediction mode"""
+    def set_predictions_keys(
+        self, keys: List[str], predictions_filename: Optional[str] = None
+    ) -> None:
+        """
+        Define which keys to extract from batch_dict on prediction mode
+        :param predictions_filename: optional, path to a columnar file (suffix ".columnar", see fuse.utils.file_io.columnar).
+                                     If specified, the predictions of each batch will be appended to this file (a part per process).
+                                     Use trainer.predict(..., return_predictions=False) to avoid from also keeping all the predictions in memory.
+                                     The file can be evaluated directly by EvaluatorDefault.
+        """
+        if predictions_filename is not None:
+            if not is_columnar(predictions_filename):
+                raise Exception(
+                    f"Error: expecting a columnar predictions file (suffix .columnar), got {predictions_filename}"
+                )
+            if (
+                os.path.isdir(predictions_filename)
+                and ColumnarReader(predictions_filename).num_rows > 0
+            ):
+                raise Exception(
+                    f"Error: predictions file {predictions_filename} already exists"
+                )
         self._prediction_keys = keys
+        self._predictions_filename = predictions_filename
@@ -0,0 +1,133 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - inference output files: a pickled dataframe with a numpy array per row ("gz" as in the templates, and "pkl")
+vs. a columnar file (fuse.utils.file_io.columnar) appended batch by batch, as in predict_step().
+Reports the time to write the file (the dataframe of the pickled files is created in advance - not included),
+the file size, and the time to read it with EvaluatorDefault.read_data() - all the samples, and a subset of the samples.
+
+Usage:
+    python fuse/eval/benchmarks/benchmark_predictions_file.py --num_samples 1000000 --num_classes 2 --subset_fraction 0.01
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from fuse.eval.evaluator import EvaluatorDefault
+from fuse.utils.file_io.columnar import ColumnarWriter
+from fuse.utils.file_io.file_io import save_dataframe
+from fuse.utils.misc.misc import get_pretty_dataframe
+
+
+def _get_size(filename: str) -> int:
+    if os.path.isdir(filename):
+        return sum(
+            os.path.getsize(os.path.join(filename, name))
+            for name in os.listdir(filename)
+        )
+    return os.path.getsize(filename)
+
+
+def run_benchmark(
+    num_samples: int,
+    num_classes: int,
+    batch_size: int,
+    subset_fraction: float,
+    formats: Sequence[str],
+    output_dir: Optional[str] = None,
+) -> pd.DataFrame:
+    if output_dir is None:
+        output_dir = tempfile.mkdtemp()
+    rng = np.random.default_rng(0)
+    ids = [f"sample_{i:07d}" for i in range(num_samples)]
+    preds = rng.dirichlet(np.ones(num_classes), size=num_samples).astype(np.float32)
+    targets = rng.integers(0, num_classes, size=num_samples)
+    subset = rng.choice(num_samples, int(num_samples * subset_fraction), replace=False)
+    subset_ids_df = pd.DataFrame({"id": [ids[i] for i in subset]}).set_index(
+        "id", drop=False
+    )
+
+    results = []
+    for file_format in formats:
+        filename = os.path.join(output_dir, f"infer.{file_format}")
+        if file_format == "columnar":
+            start = time.perf_counter()
+            with ColumnarWriter(filename) as writer:
+                for first in range(0, num_samples, batch_size):
+                    batch = slice(first, first + batch_size)
+                    writer.append(
+                        {
+                            "id": ids[batch],
+                            "model.output.classification": preds[batch],
+                            "data.label": targets[batch],
+                        }
+                    )
+            write_time = time.perf_counter() - start
+        else:
+            # as created by convert_predictions_to_dataframe()
+            df = pd.DataFrame(
+                {
+                    "id": ids,
+                    "model.output.classification": list(preds),
+                    "data.label": targets,
+                }
+            )
+            start = time.perf_counter()
+            save_dataframe(df, filename)
+            write_time = time.perf_counter() - start
+            del df
+
+        start = time.perf_counter()
+        EvaluatorDefault().read_data(filename, None, id_key="id")
+        read_all_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        EvaluatorDefault().read_data(filename, subset_ids_df, id_key="id")
+        read_subset_time = time.perf_counter() - start
+
+        results.append(
+            dict(
+                format=file_format,
+                write_s=write_time,
+                size_MB=_get_size(filename) / 1024**2,
+                read_all_s=read_all_time,
+                read_subset_s=read_subset_time,
+            )
+        )
+
+    return pd.DataFrame(results).round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_samples", type=int, default=1000000)
+    parser.add_argument("--num_classes", type=int, default=2)
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--subset_fraction", type=float, default=0.01)
+    parser.add_argument("--formats", nargs="+", default=["gz", "pkl", "columnar"])
+    parser.add_argument("--output_dir", type=str, default=None)
+    args = parser.parse_args()
+
+    df = run_benchmark(
+        args.num_samples,
+        args.num_classes,
+        args.batch_size,
+        args.subset_fraction,
+        args.formats,
+        args.output_dir,
+    )
+    print(get_pretty_dataframe(df))
@@ -33,6 +33,7 @@ import pandas as pd
 import numpy as np
 
 from fuse.utils import read_dataframe
+from fuse.utils.file_io.columnar import is_columnar, read_columnar
 from fuse.utils import NDict
 from fuse.utils import CollateToBatchList
 
@@ -72,7 +73,7 @@ class EvaluatorDefault:
         :param ids: list if sample_ids to consider
         :param data: data to evaluate
                      Supported formats:
-                        (1) str - path to a file -  csv, pickled dataframe or json. Assumes column called 'id' that holds unique identifier for a sample
+                        (1) str - path to a file -  csv, pickled dataframe, json or columnar file (read lazily, see fuse.utils.file_io.columnar). Assumes column called 'id' that holds unique identifier for a sample
                         (2) dataframe - assumes column called 'id'  that holds unique identifier for a sample
                         (3) Sequence of (1) or (2) - each element in the sequence considered to be a different fold.
                                                     ("evaluator_fold" will be added automatically to store the fold number)
@@ -206,7 +207,15 @@ class EvaluatorDefault:
             result_data = result_data.set_index(keys=id_key, drop=False)
 
         elif isinstance(data, str):  # data is path to a file
-            result_data = read_dataframe(data)
+            if is_columnar(data):
+                # read lazily - only the rows of the required ids
+                result_data = read_columnar(
+                    data,
+                    ids=None if ids_df is None else ids_df.index,
+                    id_column=id_key,
+                )
+            else:
+                result_data = read_dataframe(data)
             # make sure "id" column exist and set it as index
             if id_key not in result_data.keys():
                 raise Exception(
@@ -415,6 +415,8 @@ def example_8() -> NDict:
     """
     # path to prediction and target files
     dir_path = pathlib.Path(__file__).parent.resolve()
+    # the generated plot is written to a temporary directory
+    output_dir = mkdtemp(prefix="example_8")
     prediction_filename = os.path.join(dir_path, "inputs/example7_predictions.csv")
     targets_filename = os.path.join(
         dir_path, "inputs/example1_targets.csv"
@@ -497,7 +499,7 @@ def example_8() -> NDict:
                     pred="pred.output",
                     target="target.Task2-target",
                     class_names=class_names,
-                    output_filename="roc.png",
+                    output_filename=os.path.join(output_dir, "roc.png"),
                     pre_collect_process_func=pre_collect_process,
                 ),
             ),
@@ -698,6 +700,8 @@ def example_13() -> NDict:
     """
     # path to prediction and target files
     dir_path = pathlib.Path(__file__).parent.resolve()
+    # the generated plots are written to a temporary directory
+    output_dir = mkdtemp(prefix="example_13")
     prediction_filename = os.path.join(dir_path, "inputs/example7_predictions.csv")
     targets_filename = os.path.join(
         dir_path, "inputs/example1_targets.csv"
@@ -731,7 +735,7 @@ def example_13() -> NDict:
                     target="target.Task2-target",
                     num_bins=num_bins,
                     num_quantiles=num_quantiles,
-                    output_filename="reliability.png",
+                    output_filename=os.path.join(output_dir, "reliability.png"),
                     pre_collect_process_func=pre_collect_process,
                 ),
             ),
@@ -778,7 +782,9 @@ def example_13() -> NDict:
                     target="target.Task2-target",
                     num_bins=num_bins,
                     num_quantiles=num_quantiles,
-                    output_filename="reliability_calibrated.png",
+                    output_filename=os.path.join(
+                        output_dir, "reliability_calibrated.png"
+                    ),
                     pre_collect_process_func=pre_collect_process,
                 ),
             ),
@@ -807,7 +813,8 @@ def example_14() -> NDict:
         )
         for i in range(5)
     ]
-    output_file = "ensemble_output.gz"
+    # the ensemble predictions are written to a temporary directory
+    output_file = os.path.join(mkdtemp(prefix="example_14"), "ensemble_output.gz")
     # define data
     data = {str(k): model_dirs[k] for k in range(len(model_dirs))}
 
@@ -41,6 +41,7 @@ class MetricMultiClassDefault(MetricWithCollectorBase):
         metric_func: Callable,
         class_names: Optional[Sequence[str]] = None,
         class_weights: Optional[Sequence[float]] = None,
+        metric_resamples_func: Optional[Callable] = None,
         **kwargs: dict,
     ):
         """
@@ -50,12 +51,16 @@ class MetricMultiClassDefault(MetricWithCollectorBase):
                             the function should return a result or a dictionary of results
         :param class_names: class names for multi-class evaluation or None for binary evaluation
         :param class_weight: weight per class - the macro_average result will be a weighted sum rather than an average
+        :param metric_resamples_func: Optional, vectorized version of metric_func used to evaluate many resamples at once (see MetricBase.eval_resamples()).
+                            Gets the same arguments as metric_func plus 'resamples' and returns an array (or a dictionary of arrays) with a value per resample,
+                            or None if not supported for the given arguments.
         :param kwargs: additional kw arguments for MetricWithCollectorBase
         """
         super().__init__(pred=pred, target=target, **kwargs)
         self._metric_func = metric_func
         self._class_names = class_names
         self._class_weights = class_weights
+        self._metric_resamples_func = metric_resamples_func
 
     def eval(
         self, results: Dict[str, Any] = None, ids: Optional[Sequence[Hashable]] = None
@@ -129,6 +134,66 @@ class MetricMultiClassDefault(MetricWithCollectorBase):
 
         return metric_results
 
+    def eval_resamples(
+        self,
+        results: Dict[str, Any],
+        ids: Sequence[Hashable],
+        resamples: np.ndarray,
+    ) -> Union[None, Dict[str, np.ndarray], np.ndarray]:
+        """
+        See super class
+        """
+        if self._metric_resamples_func is None:
+            return None
+        kwargs = self._extract_arguments(results, ids)
+
+        if self._class_names is None:
+            return self._metric_resamples_func(resamples=resamples, **kwargs)
+
+        # one vs rest evaluation per class, including average
+        metric_results = {}
+        all_classes = []
+        for cls_index, cls_name in enumerate(self._class_names):
+            cls_res = self._metric_resamples_func(
+                resamples=resamples, pos_class_index=cls_index, **kwargs
+            )
+            if cls_res is None:
+                return None
+            if isinstance(cls_res, dict):
+                for sub_metric_name in cls_res:
+                    metric_results[f"{sub_metric_name}.{cls_name}"] = cls_res[
+                        sub_metric_name
+                    ]
+            else:
+                metric_results[f"{cls_name}"] = cls_res
+            all_classes.append(cls_res)
+
+        # compute macro average per resample, ignoring nan values
+        if isinstance(all_classes[0], dict):
+            for key in all_classes[0]:
+                metric_results[f"{key}.macro_avg"] = self._macro_avg_resamples(
+                    np.stack([d[key] for d in all_classes])
+                )
+        else:
+            metric_results["macro_avg"] = self._macro_avg_resamples(
+                np.stack(all_classes)
+            )
+
+        return metric_results
+
+    def _macro_avg_resamples(self, values: np.ndarray) -> np.ndarray:
+        """
+        :param values: array of shape [num_classes, num_resamples]
+        """
+        weights = (
+            np.ones(values.shape[0])
+            if self._class_weights is None
+            else np.asarray(self._class_weights, dtype=np.float64)
+        )
+        weights = np.where(np.isnan(values), 0.0, weights[:, None])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (np.nan_to_num(values) * weights).sum(axis=0) / weights.sum(axis=0)
+
 
 class MetricAUCROC(MetricMultiClassDefault):
     """
@@ -149,8 +214,14 @@ class MetricAUCROC(MetricMultiClassDefault):
                         If not ``None``, the standardized partial AUC over the range [0, max_fpr] is returned.
         """
         auc_roc = partial(MetricsLibClass.auc_roc, max_fpr=max_fpr)
+        auc_roc_resamples = partial(MetricsLibClass.auc_roc_resamples, max_fpr=max_fpr)
         super().__init__(
-            pred, target, metric_func=auc_roc, class_names=class_names, **kwargs
+            pred,
+            target,
+            metric_func=auc_roc,
+            class_names=class_names,
+            metric_resamples_func=auc_roc_resamples,
+            **kwargs,
         )
 
 
@@ -252,6 +323,7 @@ class MetricAccuracy(MetricDefault):
             target=target,
             sample_weight=sample_weight,
             metric_func=MetricsLibClass.accuracy,
+            metric_resamples_func=MetricsLibClass.accuracy_resamples,
             **kwargs,
         )
 
@@ -279,6 +351,7 @@ class MetricConfusion(MetricMultiClassDefault):
             pred=pred,
             target=target,
             metric_func=MetricsLibClass.confusion_metrics,
+            metric_resamples_func=MetricsLibClass.confusion_metrics_resamples,
             class_names=class_names,
             metrics=metrics,
             **kwargs,
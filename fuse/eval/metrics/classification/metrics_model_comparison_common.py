@@ -17,7 +17,7 @@ Created on June 30, 2021
 
 """
 
-from typing import Optional, Sequence
+from typing import Any, Dict, Optional, Sequence
 
 from .metrics_classification_common import MetricMultiClassDefault
 from fuse.eval.metrics.libs.model_comparison import ModelComparison
@@ -31,7 +31,7 @@ class MetricDelongsTest(MetricMultiClassDefault):
         pred2: str,
         target: str,
         class_names: Optional[Sequence[str]] = None,
-        **kwargs: dict
+        **kwargs: dict,
     ):
         # :param pred1: key name for the predictions of model 1
         # :param pred2: key name for the predictions of model 2
@@ -45,10 +45,42 @@ class MetricDelongsTest(MetricMultiClassDefault):
             class_names=class_names,
             pred1=pred1,
             pred2=pred2,
-            **kwargs
+            **kwargs,
         )
 
 
+class MetricDelongsTestMulti(MetricMultiClassDefault):
+    def __init__(
+        self,
+        preds: Dict[str, str],
+        target: str,
+        class_names: Optional[Sequence[str]] = None,
+        **kwargs: dict,
+    ):
+        """
+        DeLong's statistical test comparing the ROC AUCs of K models at once,
+        see ModelComparison.delong_auc_test_multi() for the returned values.
+        :param preds: model name -> key name for the predictions of the model
+        :param target: key name for the ground truth labels
+        :param class_names: class names. required for multi-class classifiers
+        """
+        self._model_names = list(preds.keys())
+        super().__init__(
+            pred=None,
+            target=target,
+            metric_func=self._delong_auc_test_multi,
+            class_names=class_names,
+            **{f"pred_{i}": key for i, key in enumerate(preds.values())},
+            **kwargs,
+        )
+
+    def _delong_auc_test_multi(self, target: Sequence, **kwargs: Any) -> Dict:
+        preds = {
+            name: kwargs.pop(f"pred_{i}") for i, name in enumerate(self._model_names)
+        }
+        return ModelComparison.delong_auc_test_multi(preds, target, **kwargs)
+
+
 class MetricContingencyTable(MetricDefault):
     def __init__(self, var1: str, var2: str, **kwargs: dict):
         """
@@ -62,7 +94,7 @@ class MetricContingencyTable(MetricDefault):
             metric_func=ModelComparison.contingency_table,
             var1=var1,
             var2=var2,
-            **kwargs
+            **kwargs,
         )
 
 
@@ -73,7 +105,7 @@ class MetricMcnemarsTest(MetricMultiClassDefault):
         pred2: str,
         target: Optional[str] = None,
         exact: Optional[bool] = True,
-        **kwargs: dict
+        **kwargs: dict,
     ):
         """
         McNemar's statistical test for comparing two model's predictions or accuracies
@@ -95,5 +127,5 @@ class MetricMcnemarsTest(MetricMultiClassDefault):
             target=target,
             exact=exact,
             metric_func=ModelComparison.mcnemars_test,
-            **kwargs
+            **kwargs,
         )
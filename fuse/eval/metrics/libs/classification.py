@@ -28,6 +28,8 @@ from sklearn.utils.multiclass import type_of_target
 
 import matplotlib.pyplot as plt
 
+from fuse.eval.metrics.utils import bootstrap_counts
+
 
 class MetricsLibClass:
     @staticmethod
@@ -88,6 +90,66 @@ class MetricsLibClass:
             max_fpr=max_fpr,
         )
 
+    @staticmethod
+    def auc_roc_resamples(
+        pred: Sequence[Union[np.ndarray, float]],
+        target: Sequence[Union[np.ndarray, int]],
+        resamples: np.ndarray,
+        sample_weight: Optional[Sequence[Union[np.ndarray, float]]] = None,
+        pos_class_index: int = -1,
+        ignore_index: Optional[int] = None,
+        max_fpr: Optional[float] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Vectorized version of auc_roc() - evaluates auc roc on many resamples (typically bootstrap) of the samples at once.
+        Computed as the (weighted) Mann-Whitney U statistic, after sorting the scores only once.
+        :param resamples: matrix of shape [num_resamples, num_samples], each row includes the positions of the selected samples
+        See auc_roc() for the other params
+        :return: auc per resample, or None if not supported (partial auc, multiple predictions per sample)
+        """
+        if max_fpr is not None:
+            return None
+        target = np.asarray(target)
+        single_pred = pred[0]
+        if (
+            not isinstance(single_pred, np.ndarray)
+            or (len(single_pred.shape) == 0)
+            or (single_pred.shape[0] == 1)
+        ):
+            pos_class_index = 1
+            y_score = np.asarray(pred, dtype=np.float64).reshape(-1)
+        else:
+            pred = np.asarray(pred)
+            if len(pred.shape) != 2:
+                return None
+            if pos_class_index < 0:
+                pos_class_index = pred.shape[1] - 1
+            y_score = pred[:, pos_class_index]
+        if len(target.shape) != 1 or y_score.shape[0] != target.shape[0]:
+            return None
+
+        weights = bootstrap_counts(resamples, len(target))
+        if sample_weight is not None:
+            weights *= np.asarray(sample_weight, dtype=np.float64)
+        if ignore_index is not None:
+            weights *= target != ignore_index
+
+        # group tied scores - a tied (positive, negative) pair contributes half
+        order = np.argsort(y_score, kind="stable")
+        sorted_score = y_score[order]
+        group_starts = np.flatnonzero(
+            np.concatenate(([True], sorted_score[1:] != sorted_score[:-1]))
+        )
+        is_pos = (target == pos_class_index)[order]
+        weights = weights[:, order]
+        pos = np.add.reduceat(weights * is_pos, group_starts, axis=1)
+        neg = np.add.reduceat(weights * ~is_pos, group_starts, axis=1)
+        neg_below = np.cumsum(neg, axis=1) - neg
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (pos * (neg_below + 0.5 * neg)).sum(axis=1) / (
+                pos.sum(axis=1) * neg.sum(axis=1)
+            )
+
     @staticmethod
     def auc_roc_mult_binary_label(
         pred: Sequence[Union[np.ndarray, float]],
@@ -219,6 +281,33 @@ class MetricsLibClass:
 
         return metrics.accuracy_score(target, pred, sample_weight=sample_weight)
 
+    @staticmethod
+    def accuracy_resamples(
+        pred: Sequence[Union[np.ndarray, int]],
+        target: Sequence[Union[np.ndarray, int]],
+        resamples: np.ndarray,
+        sample_weight: Optional[Sequence[Union[np.ndarray, float]]] = None,
+    ) -> np.ndarray:
+        """
+        Vectorized version of accuracy() - evaluates the accuracy on many resamples (typically bootstrap) of the samples at once
+        :param resamples: matrix of shape [num_resamples, num_samples], each row includes the positions of the selected samples
+        See accuracy() for the other params
+        :return: accuracy per resample
+        """
+        pred = np.array(pred)
+        target = np.array(target)
+
+        if type_of_target(pred) in ("continuous", "continuous-multioutput"):
+            pred = np.argmax(pred, -1)
+        if type_of_target(target) in ("multilabel-indicator", "multiclass-multioutput"):
+            target = np.argmax(target, -1)
+
+        if sample_weight is None:
+            sample_weight = np.ones(len(target))
+        sample_weight = np.asarray(sample_weight, dtype=np.float64)
+        counts = bootstrap_counts(resamples, len(target))
+        return (counts @ ((pred == target) * sample_weight)) / (counts @ sample_weight)
+
     @staticmethod
     def confusion_metrics(
         pred: Sequence[Union[np.ndarray, int]],
@@ -251,7 +340,6 @@ class MetricsLibClass:
         if sample_weight is None:
             sample_weight = np.ones_like(class_target_t)
 
-        res = {}
         tp = (np.logical_and(class_target_t, class_pred_t) * sample_weight).sum()
         fn = (
             np.logical_and(class_target_t, np.logical_not(class_pred_t)) * sample_weight
@@ -264,16 +352,70 @@ class MetricsLibClass:
             * sample_weight
         ).sum()
 
+        return MetricsLibClass._confusion_metrics_from_counts(tp, fn, fp, tn, metrics)
+
+    @staticmethod
+    def confusion_metrics_resamples(
+        pred: Sequence[Union[np.ndarray, int]],
+        target: Sequence[Union[np.ndarray, int]],
+        resamples: np.ndarray,
+        pos_class_index: int = 1,
+        metrics: Sequence[str] = tuple(),
+        sample_weight: Optional[Sequence[Union[np.ndarray, float]]] = None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Vectorized version of confusion_metrics() - evaluates the metrics on many resamples (typically bootstrap) of the samples at once
+        :param resamples: matrix of shape [num_resamples, num_samples], each row includes the positions of the selected samples
+        See confusion_metrics() for the other params
+        :return: dictionary, including an array with a value per resample for each of the required metrics
+        """
+        pred = np.array(pred)
+        target = np.array(target)
+
+        if type_of_target(pred) in ("continuous", "continuous-multioutput"):
+            pred = np.argmax(pred, -1)
+        if type_of_target(target) in ("multilabel-indicator", "multiclass-multioutput"):
+            target = np.argmax(target, -1)
+
+        class_target_t = target == pos_class_index
+        class_pred_t = pred == pos_class_index
+        if sample_weight is None:
+            sample_weight = np.ones(len(target))
+        sample_weight = np.asarray(sample_weight, dtype=np.float64)
+
+        counts = bootstrap_counts(resamples, len(target))
+        tp = counts @ ((class_target_t & class_pred_t) * sample_weight)
+        fn = counts @ ((class_target_t & ~class_pred_t) * sample_weight)
+        fp = counts @ ((~class_target_t & class_pred_t) * sample_weight)
+        tn = counts @ ((~class_target_t & ~class_pred_t) * sample_weight)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return MetricsLibClass._confusion_metrics_from_counts(
+                tp, fn, fp, tn, metrics
+            )
+
+    @staticmethod
+    def _confusion_metrics_from_counts(
+        tp: Union[float, np.ndarray],
+        fn: Union[float, np.ndarray],
+        fp: Union[float, np.ndarray],
+        tn: Union[float, np.ndarray],
+        metrics: Sequence[str],
+    ) -> Dict[str, Union[float, np.ndarray]]:
+        """
+        Compute the required metrics given the confusion matrix entries - either scalars or an array of values per resample
+        """
+        res = {}
         for metric in metrics:
             if metric in ["sensitivity", "recall", "tpr"]:
                 res[metric] = tp / (tp + fn)
             elif metric in ["specificity", "selectivity", "tnr"]:
                 res[metric] = tp / (tn + fp)
             elif metric in ["precision", "ppv"]:
-                if tp + fp != 0:
-                    res[metric] = tp / (tp + fp)
+                if np.isscalar(tp):
+                    res[metric] = tp / (tp + fp) if tp + fp != 0 else 0
                 else:
-                    res[metric] = 0
+                    res[metric] = np.where(tp + fp != 0, tp / (tp + fp), 0.0)
             elif metric in ["f1"]:
                 res[metric] = 2 * tp / (2 * tp + fp + fn)
             elif metric in ["matrix"]:
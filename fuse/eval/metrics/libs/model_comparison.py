@@ -16,7 +16,7 @@ limitations under the License.
 Created on June 30, 2021
 
 """
-from typing import Dict, Optional, Sequence, Union
+from typing import Dict, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import scipy
@@ -133,6 +133,7 @@ class ModelComparison:
     ) -> Dict:
         """
         Compute p-value resulting from DeLong's statistical test to compare two binary classifiers' ROC AUCs.
+        Uses the fast rank based algorithm, see delong_auc_test_multi() to compare more than two classifiers.
         The p-value represents likelihood for the (null) hypothesis that the two ROC AUCs are similar.
         A small p-value means the models are likely to be different.
         :param pred1: list of prediction arrays per sample for the first classifier. Each element shape is [num_classes].
@@ -152,76 +153,11 @@ class ModelComparison:
              cov12 is the 12 element of DeLong's covariance matrix (equal to the 21 element - symmetric matrix)
              cov22 is the 22 element of DeLong's covariance matrix (variance of the 2nd model's AUC)
         """
-        if isinstance(pred1[0], float):
-            predictions_1 = np.array(pred1)
-            predictions_2 = np.array(pred2)
-            ground_truth = np.array(target)
-        else:
-            if pos_class_index < 0:
-                pos_class_index = pred1[0].shape[0] - 1
-            predictions_1 = np.asarray(pred1)[:, pos_class_index]
-            predictions_2 = np.asarray(pred2)[:, pos_class_index]
-            ground_truth = (np.array(target) == pos_class_index) * 1
-
-        positive_labels = ground_truth == 1
-        negative_labels = ground_truth == 0
-        m = (positive_labels).sum()  # number of positives
-        n = (negative_labels).sum()  # number of negatives
-        x1 = predictions_1[positive_labels]
-        y1 = predictions_1[negative_labels]
-        x2 = predictions_2[positive_labels]
-        y2 = predictions_2[negative_labels]
-        # convert to matrix:
-        X1 = x1[:, np.newaxis].repeat(n, 1)
-        X2 = x2[:, np.newaxis].repeat(n, 1)
-        Y1 = y1[np.newaxis, :].repeat(m, 0)
-        Y2 = y2[np.newaxis, :].repeat(m, 0)
-
-        PSI1 = (Y1 < X1) * 1.0
-        PSI1[Y1 == X1] = 0.5
-
-        PSI2 = (Y2 < X2) * 1.0
-        PSI2[Y2 == X2] = 0.5
-
-        # empirical AUC:
-        emp_auc_1 = (1.0 / (m * n)) * PSI1.sum()
-        emp_auc_2 = (1.0 / (m * n)) * PSI2.sum()
-
-        # structural components (DeLong et al. 1988):
-        V10_1 = (1.0 / n) * PSI1.sum(1)
-        V10_2 = (1.0 / n) * PSI2.sum(1)
-
-        V01_1 = (1.0 / m) * PSI1.sum(0)
-        V01_2 = (1.0 / m) * PSI2.sum(0)
-
-        # covariance matrix
-        S10 = (1.0 / (m - 1)) * np.array(
-            [
-                [
-                    np.linalg.norm(V10_1 - emp_auc_1) ** 2,
-                    (V10_1 - emp_auc_1).dot(V10_2 - emp_auc_2),
-                ],
-                [
-                    (V10_2 - emp_auc_2).dot(V10_1 - emp_auc_1),
-                    np.linalg.norm(V10_2 - emp_auc_2) ** 2,
-                ],
-            ]
+        predictions, ground_truth = ModelComparison._delong_binary_inputs(
+            [pred1, pred2], target, pos_class_index
         )
-
-        S01 = (1.0 / (n - 1)) * np.array(
-            [
-                [
-                    np.linalg.norm(V01_1 - emp_auc_1) ** 2,
-                    (V01_1 - emp_auc_1).dot(V01_2 - emp_auc_2),
-                ],
-                [
-                    (V01_2 - emp_auc_2).dot(V01_1 - emp_auc_1),
-                    np.linalg.norm(V01_2 - emp_auc_2) ** 2,
-                ],
-            ]
-        )
-
-        S = (1.0 / m) * S10 + (1.0 / n) * S01
+        aucs, S = ModelComparison._fast_delong(predictions, ground_truth)
+        emp_auc_1, emp_auc_2 = aucs
 
         # z-score:
         z = (emp_auc_1 - emp_auc_2) / (
@@ -243,6 +179,109 @@ class ModelComparison:
 
         return results
 
+    @staticmethod
+    def delong_auc_test_multi(
+        preds: Dict[str, Sequence[np.ndarray]],
+        target: Sequence[np.ndarray],
+        pos_class_index: int = -1,
+    ) -> Dict:
+        """
+        DeLong's statistical test generalized to K models evaluated on the same samples:
+        computes the AUC of each model, the full DeLong covariance matrix and the pairwise p-values.
+        :param preds: model name -> list of prediction arrays per sample (see pred1 in delong_auc_test())
+        :param target: target per sample. Each element is an integer in range [0 - num_classes)
+        :param pos_class_index: index of the positive class (for one vs. rest), see delong_auc_test()
+        :return dictionary with the keys:
+            'auc.<model>' - the AUC of each model
+            'cov.<model_a>.<model_b>' - the elements of DeLong's covariance matrix
+            'z.<model_a>_vs_<model_b>', 'p_value.<model_a>_vs_<model_b>' - the Z-score and p-value per pair of models
+        """
+        model_names = list(preds.keys())
+        predictions, ground_truth = ModelComparison._delong_binary_inputs(
+            [preds[name] for name in model_names], target, pos_class_index
+        )
+        aucs, S = ModelComparison._fast_delong(predictions, ground_truth)
+
+        results = {}
+        for i, name in enumerate(model_names):
+            results[f"auc.{name}"] = aucs[i]
+        for i, name_i in enumerate(model_names):
+            for j, name_j in enumerate(model_names):
+                results[f"cov.{name_i}.{name_j}"] = S[i, j]
+        for i, name_i in enumerate(model_names):
+            for j in range(i + 1, len(model_names)):
+                name_j = model_names[j]
+                z = (aucs[i] - aucs[j]) / (
+                    (S[i, i] + S[j, j] - 2 * S[i, j]) ** 0.5 + np.finfo(float).eps
+                )
+                results[f"z.{name_i}_vs_{name_j}"] = z
+                results[f"p_value.{name_i}_vs_{name_j}"] = 2 * scipy.stats.norm.sf(
+                    abs(z), loc=0, scale=1
+                )
+
+        return results
+
+    @staticmethod
+    def _delong_binary_inputs(
+        preds: Sequence[Sequence[np.ndarray]],
+        target: Sequence[np.ndarray],
+        pos_class_index: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Convert predictions of K models to a binary problem (one vs. rest)
+        :return predictions matrix of shape [K, num_samples] and binary ground truth of shape [num_samples]
+        """
+        if isinstance(preds[0][0], float):
+            predictions = np.array([np.asarray(pred) for pred in preds], dtype=float)
+            ground_truth = np.array(target)
+        else:
+            if pos_class_index < 0:
+                pos_class_index = preds[0][0].shape[0] - 1
+            predictions = np.array(
+                [np.asarray(pred)[:, pos_class_index] for pred in preds], dtype=float
+            )
+            ground_truth = (np.array(target) == pos_class_index) * 1
+        return predictions, ground_truth
+
+    @staticmethod
+    def _fast_delong(
+        predictions: np.ndarray, ground_truth: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fast rank based computation of DeLong's AUCs and covariance matrix in O(K * N log N) time and O(K * N) memory
+        (Sun and Xu, "Fast Implementation of DeLong's Algorithm for Comparing the Areas Under Correlated Receiver Operating Characteristic Curves", 2014).
+        :param predictions: matrix of shape [K, num_samples]
+        :param ground_truth: binary ground truth of shape [num_samples]
+        :return the AUC per model (shape [K]) and DeLong's covariance matrix (shape [K, K])
+        """
+        positive_labels = ground_truth == 1
+        negative_labels = ground_truth == 0
+        m = positive_labels.sum()  # number of positives
+        n = negative_labels.sum()  # number of negatives
+        x = predictions[:, positive_labels]
+        y = predictions[:, negative_labels]
+
+        # midranks (ties get the average rank) within the positives, the negatives and all samples
+        tx = scipy.stats.rankdata(x, axis=1)
+        ty = scipy.stats.rankdata(y, axis=1)
+        tz = scipy.stats.rankdata(np.concatenate((x, y), axis=1), axis=1)
+
+        # empirical AUC:
+        aucs = tz[:, :m].sum(axis=1) / (m * n) - (m + 1.0) / (2.0 * n)
+
+        # structural components (DeLong et al. 1988):
+        # V10 - per positive, the fraction of negatives ranked below it (ties count as half)
+        # V01 - per negative, the fraction of positives ranked above it
+        V10 = (tz[:, :m] - tx) / n
+        V01 = 1.0 - (tz[:, m:] - ty) / m
+
+        # covariance matrix
+        S10 = np.atleast_2d(np.cov(V10))
+        S01 = np.atleast_2d(np.cov(V01))
+        S = (1.0 / m) * S10 + (1.0 / n) * S01
+
+        return aucs, S
+
     @staticmethod
     def contingency_table(var1: Sequence[bool], var2: Sequence[bool]) -> np.ndarray:
         """
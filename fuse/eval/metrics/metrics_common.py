@@ -20,7 +20,12 @@ Created on June 30, 2021
 from abc import ABC, abstractmethod
 from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple, Union, List
 import copy
+from collections import defaultdict
 from fuse.utils import uncollate
+from fuse.utils.multiprocessing.run_multiprocessed import (
+    get_from_global_storage,
+    run_multiprocessed,
+)
 import torch.distributed as dist
 import pandas as pd
 import torch
@@ -70,6 +75,22 @@ class MetricBase(ABC):
         """
         raise NotImplementedError
 
+    def eval_resamples(
+        self,
+        results: Dict[str, Any],
+        ids: Sequence[Hashable],
+        resamples: np.ndarray,
+    ) -> Union[None, Dict[str, np.ndarray], np.ndarray]:
+        """
+        Optional, vectorized evaluation of many resamples of the samples at once (used by CI to compute bootstrap statistics).
+        :param results: results aggregated by the previous metrics
+        :param ids: sequence of sample ids
+        :param resamples: matrix of shape [num_resamples, num_samples], each row includes the positions (in ids) of the selected samples
+        :return: the same format eval() returns, but with an array of values (one per resample) instead of each value.
+                 None if not supported - in which case eval() will be called per resample.
+        """
+        return None
+
 
 class MetricCollector(MetricBase):
     """
@@ -196,6 +217,7 @@ class MetricCollector(MetricBase):
 
             if ids is not None:
                 self._collected_ids.extend(ids)
+                self._collected_ids_pos = None
 
     @staticmethod
     def sync_tensor_data_and_concat(data: torch.Tensor) -> torch.Tensor:
@@ -384,6 +406,9 @@ class MetricCollector(MetricBase):
             self._collected_ids = None
 
         self._sampled_ids = None  # the required ids - set by sample() method
+        self._collected_ids_pos = (
+            None  # id -> position in collected ids, computed on demand
+        )
 
     def get_ids(self) -> Sequence[Hashable]:
         """
@@ -401,7 +426,11 @@ class MetricCollector(MetricBase):
         else:
             # convert required ids to permutation
             required_ids = ids
-            original_ids_pos = {s: i for (i, s) in enumerate(self._collected_ids)}
+            if self._collected_ids_pos is None:
+                self._collected_ids_pos = {
+                    s: i for (i, s) in enumerate(self._collected_ids)
+                }
+            original_ids_pos = self._collected_ids_pos
 
             permutation = [original_ids_pos[sample_id] for sample_id in required_ids]
 
@@ -556,6 +585,7 @@ class MetricDefault(MetricWithCollectorBase):
         metric_func: Callable,
         pred: Optional[str] = None,
         target: Optional[str] = None,
+        metric_resamples_func: Optional[Callable] = None,
         **kwargs: Any,
     ):
         """
@@ -563,6 +593,8 @@ class MetricDefault(MetricWithCollectorBase):
         :param target: target key to collect
         :param metric_func: function getting as a input list of predictions, targets and optionally more arguments specified in kwargs
                             the function should return a single result or a dictionary of results
+        :param metric_resamples_func: Optional, vectorized version of metric_func used to evaluate many resamples at once (see MetricBase.eval_resamples()).
+                            Gets the same arguments as metric_func plus 'resamples' and returns an array (or a dictionary of arrays) with a value per resample.
         :param kwargs: additional keyword arguments for MetricWithCollectorBase.
                        The keyword expected to be an argument name of metric_func and the value a string that is a key to value store in batch dict.
                        If instead a value should be extracted from results dict use "results:<key in results dict>
@@ -575,6 +607,7 @@ class MetricDefault(MetricWithCollectorBase):
         """
         super().__init__(pred=pred, target=target, **kwargs)
         self._metric_func = metric_func
+        self._metric_resamples_func = metric_resamples_func
 
     def eval(
         self, results: Dict[str, Any] = None, ids: Optional[Sequence[Hashable]] = None
@@ -589,6 +622,20 @@ class MetricDefault(MetricWithCollectorBase):
         # single evaluation method
         return self._metric_func(**kwargs)
 
+    def eval_resamples(
+        self,
+        results: Dict[str, Any],
+        ids: Sequence[Hashable],
+        resamples: np.ndarray,
+    ) -> Union[None, Dict[str, np.ndarray], np.ndarray]:
+        """
+        See super class
+        """
+        if self._metric_resamples_func is None:
+            return None
+        kwargs = self._extract_arguments(results, ids)
+        return self._metric_resamples_func(resamples=resamples, **kwargs)
+
 
 class MetricPerSampleDefault(MetricWithCollectorBase):
     """
@@ -602,6 +649,7 @@ class MetricPerSampleDefault(MetricWithCollectorBase):
         target: str,
         metric_per_sample_func: Callable,
         result_aggregate_func: Callable,
+        result_aggregate_resamples_func: Optional[Callable] = None,
         **kwargs: Any,
     ):
         """
@@ -610,6 +658,8 @@ class MetricPerSampleDefault(MetricWithCollectorBase):
         :param metric_per_sample_func: function that gets as input the values to collect specified in metric constructor, typically pred and target.
                                        A sequence of all the returned values from all samples will be passed to result_aggregate_func
         :param result_aggregate_func: function that get the output of metric_per_sample_func and aggregates it over multiple samples
+        :param result_aggregate_resamples_func: Optional, vectorized version of result_aggregate_func used to evaluate many resamples at once (see MetricBase.eval_resamples()).
+                                       Gets the same argument as result_aggregate_func plus 'resamples' and returns an array (or a dictionary of arrays) with a value per resample.
         :param kwargs: additional kw arguments for MetricWithCollectorBase
         """
 
@@ -620,6 +670,7 @@ class MetricPerSampleDefault(MetricWithCollectorBase):
             **kwargs,
         )
         self._result_aggregate_func = result_aggregate_func
+        self._result_aggregate_resamples_func = result_aggregate_resamples_func
 
     def eval(
         self, results: Dict[str, Any] = None, ids: Optional[Sequence[Hashable]] = None
@@ -637,6 +688,24 @@ class MetricPerSampleDefault(MetricWithCollectorBase):
         # single evaluation method
         return self._result_aggregate_func(kwargs)
 
+    def eval_resamples(
+        self,
+        results: Dict[str, Any],
+        ids: Sequence[Hashable],
+        resamples: np.ndarray,
+    ) -> Union[None, Dict[str, np.ndarray], np.ndarray]:
+        """
+        See super class
+        """
+        if self._result_aggregate_resamples_func is None:
+            return None
+        kwargs = self._extract_arguments(results, ids)
+
+        if self._collector._post_keys_to_collect is None:
+            kwargs = kwargs["post_args"]
+
+        return self._result_aggregate_resamples_func(kwargs, resamples=resamples)
+
 
 class MetricPerBatchDefault(MetricWithCollectorBase):
     """
@@ -847,6 +916,8 @@ class CI(MetricWithCollectorBase):
         rnd_seed: int = 1234,
         conf_interval: float = 95,
         ci_method: str = "PERCENTILE",
+        num_workers: int = 0,
+        max_resamples_elements: int = 10**7,
         **super_kwargs: Any,
     ) -> None:
         """
@@ -856,6 +927,9 @@ class CI(MetricWithCollectorBase):
         :param rnd_seed: seed for random number generator.
         :param conf_interval: Confidence interval. Default is 95.
         :param ci_method: specifies the method for computing the confidence intervals from bootstrap samples. Options: NORMAL (assuming normal distribution), PERCENTILE, PIVOTAL
+        :param num_workers: number of processes used to evaluate the bootstraps of metrics that do not support vectorized evaluation (see MetricBase.eval_resamples()).
+                            Set to 0 to evaluate them in the main process.
+        :param max_resamples_elements: the bootstraps are evaluated in chunks, each chunk includes at most this number of elements (num bootstraps in chunk x num samples)
         """
         super().__init__(stratum=stratum, **super_kwargs)
 
@@ -864,6 +938,8 @@ class CI(MetricWithCollectorBase):
         self._rnd_seed = rnd_seed
         self._conf_interval = conf_interval
         self._ci_method = ci_method
+        self._num_workers = num_workers
+        self._max_resamples_elements = max_resamples_elements
 
         # verify
         assert ci_method in [
@@ -906,28 +982,43 @@ class CI(MetricWithCollectorBase):
 
         rnd = np.random.RandomState(self._rnd_seed)
         original_sample_results = self._metric.eval(results, ids=ids)
-        boot_results = []
         ci_results = {}
 
         stratum_id = (
             np.array(data["stratum"]) if "stratum" in data else np.ones(len(ids))
         )
-        unique_strata = np.unique(stratum_id)
-
-        for _ in range(self._num_of_bootstraps):
-            sampled_ids = ids.copy()
-            for stratum in unique_strata:
-                stratum_filter = stratum_id == stratum
-                n_stratum = sum(stratum_filter)
-                random_sample = rnd.randint(0, n_stratum, size=n_stratum)
-                sampled_ids[stratum_filter] = ids[stratum_filter][random_sample]
-            boot_results.append(self._metric.eval(results, sampled_ids))
+        strata_positions = [
+            np.flatnonzero(stratum_id == stratum) for stratum in np.unique(stratum_id)
+        ]
+
+        # evaluate the bootstraps in chunks - each chunk is a matrix of positions of shape [num bootstraps in chunk, num samples]
+        chunk_size = max(1, self._max_resamples_elements // max(len(ids), 1))
+        is_dict = isinstance(original_sample_results, dict)
+        boot_results = defaultdict(list) if is_dict else []
+        for chunk_start in range(0, self._num_of_bootstraps, chunk_size):
+            num_resamples = min(chunk_size, self._num_of_bootstraps - chunk_start)
+            resamples = self._sample_resamples(
+                rnd, strata_positions, len(ids), num_resamples
+            )
+            chunk_results = self._metric.eval_resamples(results, ids, resamples)
+            if chunk_results is None:
+                chunk_results = self._eval_resamples_one_by_one(
+                    results,
+                    ids,
+                    resamples,
+                    list(original_sample_results.keys()) if is_dict else None,
+                )
+            if is_dict:
+                for key, values in chunk_results.items():
+                    boot_results[key].extend(np.atleast_1d(values))
+            else:
+                boot_results.extend(np.atleast_1d(chunk_results))
 
         # results can be either a list of floats or a list of dictionaries
         if isinstance(original_sample_results, dict):
             for key, orig_val in original_sample_results.items():
-                sampled_vals = [sample[key] for sample in boot_results]
                 try:
+                    sampled_vals = boot_results[key]
                     ci_results[key] = self._compute_stats(
                         self._ci_method, orig_val, sampled_vals, self._conf_interval
                     )
@@ -943,6 +1034,73 @@ class CI(MetricWithCollectorBase):
 
         return ci_results
 
+    @staticmethod
+    def _sample_resamples(
+        rnd: np.random.RandomState,
+        strata_positions: List[np.ndarray],
+        num_samples: int,
+        num_resamples: int,
+    ) -> np.ndarray:
+        """
+        Bootstrap sampling (with replacement) within each stratum
+        :return: matrix of shape [num_resamples, num_samples] of sample positions
+        """
+        resamples = np.empty((num_resamples, num_samples), dtype=np.int64)
+        for resample in resamples:
+            for positions in strata_positions:
+                resample[positions] = positions[
+                    rnd.randint(0, len(positions), size=len(positions))
+                ]
+        return resamples
+
+    def _eval_resamples_one_by_one(
+        self,
+        results: Dict[str, Any],
+        ids: np.ndarray,
+        resamples: np.ndarray,
+        keys: Optional[List[str]],
+    ) -> Union[Dict[str, list], list]:
+        """
+        Fallback for metrics that do not support vectorized evaluation - evaluate the metric per resample, optionally using a process pool
+        :param keys: the keys of the results in case the metric returns a dictionary, otherwise None
+        """
+        if self._num_workers > 0:
+            for_global_storage = {
+                "ci_metric": self._metric,
+                "ci_results": results,
+                "ci_ids": ids,
+            }
+            chunks = np.array_split(
+                resamples, min(len(resamples), self._num_workers * 4)
+            )
+            boot_results = run_multiprocessed(
+                CI._eval_resamples_worker,
+                chunks,
+                workers=self._num_workers,
+                copy_to_global_storage=for_global_storage,
+            )
+            boot_results = [res for chunk in boot_results for res in chunk]
+        else:
+            boot_results = [self._metric.eval(results, ids[row]) for row in resamples]
+
+        if keys is None:
+            return boot_results
+        ans = {}
+        for key in keys:
+            try:
+                ans[key] = [sample[key] for sample in boot_results]
+            except (KeyError, TypeError):
+                # failed to evaluate some of the resamples - ignore this key
+                pass
+        return ans
+
+    @staticmethod
+    def _eval_resamples_worker(resamples: np.ndarray) -> list:
+        metric = get_from_global_storage("ci_metric")
+        results = get_from_global_storage("ci_results")
+        ids = get_from_global_storage("ci_ids")
+        return [metric.eval(results, ids[row]) for row in resamples]
+
     @staticmethod
     def _compute_stats(
         ci_method: str,
@@ -0,0 +1,464 @@
+"""
+(C) Copyright 2021 IBM Corp.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+from functools import reduce
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.distributed as dist
+
+from fuse.eval.metrics.libs.classification import MetricsLibClass
+from fuse.eval.metrics.metrics_common import MetricBase
+from fuse.utils.ndict import NDict
+
+
+class MetricStreamingBase(MetricBase):
+    """
+    Base class for streaming (online) metrics.
+    Rather than collecting the predictions and targets of all the samples until eval() is called,
+    a streaming metric keeps a fixed size state which is updated per batch.
+    The memory therefore does not grow with the number of samples - useful for dense outputs (e.g., segmentation) and large validation sets.
+    Can be used as any other metric - in EvaluatorDefault.eval() (including iterators, see batch_size) and in the lightning module epoch loop.
+    Note that since the samples are not kept, it cannot be evaluated on a subset or a permutation of the samples (e.g., wrapped by CI).
+
+    To implement a streaming metric, implement:
+        init_state() - returns the initial state, a dictionary of numpy arrays
+        update_state() - updates the state in place given the values of a batch
+        finalize() - computes the results given the state
+    By default, states are merged by summation - override merge_states() otherwise.
+    """
+
+    def __init__(self, collect_distributed: bool = True, **keys_to_collect: str):
+        """
+        :param collect_distributed: if True, in multi gpu training, eval() will merge the states of all the gpus - otherwise only the local state will be reported.
+        :param keys_to_collect: argument name of update_state() -> key to extract from the batch dict
+        """
+        super().__init__()
+        self._keys_to_collect = keys_to_collect
+        self._collect_distributed = collect_distributed
+        self.reset()
+
+    def init_state(self) -> Dict[str, np.ndarray]:
+        """
+        :return: the initial (empty) state
+        """
+        raise NotImplementedError
+
+    def update_state(self, state: Dict[str, np.ndarray], **values: np.ndarray) -> None:
+        """
+        Update the state in place
+        :param state: the state to update
+        :param values: argument name -> numpy array with the values of the batch (first dim is the batch dim)
+        """
+        raise NotImplementedError
+
+    def finalize(self, state: Dict[str, np.ndarray]) -> Union[Dict[str, Any], Any]:
+        """
+        :return: the metric results given the state
+        """
+        raise NotImplementedError
+
+    def merge_states(
+        self, state_a: Dict[str, np.ndarray], state_b: Dict[str, np.ndarray]
+    ) -> Dict[str, np.ndarray]:
+        """
+        :return: a state equivalent to updating a single state with the batches of both states
+        """
+        return {name: state_a[name] + state_b[name] for name in state_a}
+
+    def update(self, batch: Dict) -> None:
+        """
+        Update the state given a batch dict
+        """
+        if not isinstance(batch, NDict):
+            batch = NDict(batch)
+        values = {
+            name: self._to_numpy(batch[key])
+            for name, key in self._keys_to_collect.items()
+        }
+        self.update_state(self._state, **values)
+
+    def merge(self, other: "MetricStreamingBase") -> None:
+        """
+        Merge the state of another instance of the same metric (e.g. evaluated on a different shard of the data) into this one
+        """
+        self._state = self.merge_states(self._state, other.get_state())
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        return self._state
+
+    def collect(self, batch: Dict) -> None:
+        """
+        See super class
+        """
+        self.update(batch)
+
+    def set(self, data: pd.DataFrame) -> None:
+        """
+        See super class - replaces the current state
+        """
+        self.reset()
+        values = {
+            name: self._to_numpy(list(data[key]))
+            for name, key in self._keys_to_collect.items()
+        }
+        self.update_state(self._state, **values)
+
+    def reset(self) -> None:
+        """
+        See super class
+        """
+        self._state = self.init_state()
+
+    def eval(
+        self, results: Dict[str, Any] = None, ids: Optional[Sequence[Hashable]] = None
+    ) -> Union[Dict[str, Any], Any]:
+        """
+        See super class. ids are ignored - the metric is always evaluated on all the samples passed to update()
+        """
+        state = self._state
+        if dist.is_initialized() and self._collect_distributed:
+            states = [None for _ in range(dist.get_world_size())]
+            dist.all_gather_object(states, state)
+            state = reduce(self.merge_states, states)
+        return self.finalize(state)
+
+    @staticmethod
+    def _to_numpy(value: Any) -> np.ndarray:
+        if isinstance(value, torch.Tensor):
+            value = value.detach()
+            if value.dtype == torch.bfloat16:
+                value = value.to(torch.float)
+            return value.cpu().numpy()
+        if isinstance(value, (list, tuple)):
+            return np.stack([MetricStreamingBase._to_numpy(v) for v in value])
+        return np.asarray(value)
+
+
+class MetricStreamingAUCROC(MetricStreamingBase):
+    """
+    Streaming AUC-ROC (one vs rest). The scores of the positive and negative samples are accumulated into histograms,
+    and the AUC is computed from the histograms - scores that fall in the same bin are considered as ties.
+    With the default 10000 bins the result typically differs from the exact AUC only in the 4th decimal place.
+    Returns the same format as MetricAUCROC.
+    """
+
+    def __init__(
+        self,
+        pred: str,
+        target: str,
+        class_names: Optional[Sequence[str]] = None,
+        num_bins: int = 10000,
+        score_range: Tuple[float, float] = (0.0, 1.0),
+        **kwargs: Any,
+    ):
+        """
+        :param pred: prediction key - either a score per sample or an array of shape [num_classes] per sample
+        :param target: target key - integer in range [0 - num_classes) per sample
+        :param class_names: class names for multi-class evaluation or None for binary evaluation
+        :param num_bins: number of histogram bins
+        :param score_range: the range of the scores, scores out of this range are clipped
+        :param kwargs: additional arguments for MetricStreamingBase
+        """
+        self._class_names = class_names
+        self._num_bins = num_bins
+        self._score_range = score_range
+        super().__init__(pred=pred, target=target, **kwargs)
+
+    def init_state(self) -> Dict[str, np.ndarray]:
+        num_classes = 1 if self._class_names is None else len(self._class_names)
+        return {
+            "pos_hist": np.zeros((num_classes, self._num_bins), dtype=np.int64),
+            "neg_hist": np.zeros((num_classes, self._num_bins), dtype=np.int64),
+        }
+
+    def update_state(
+        self, state: Dict[str, np.ndarray], pred: np.ndarray, target: np.ndarray
+    ) -> None:
+        target = target.reshape(-1)
+        if self._class_names is None:
+            # binary - use the score of the last class (as MetricAUCROC does)
+            scores = pred.reshape(len(target), -1)[:, -1:]
+            pos_class_indices = [1]
+        else:
+            scores = pred.reshape(len(target), -1)
+            pos_class_indices = range(len(self._class_names))
+
+        low, high = self._score_range
+        bins = np.floor((scores - low) / (high - low) * self._num_bins).astype(np.int64)
+        bins = np.clip(bins, 0, self._num_bins - 1)
+        for i, pos_class_index in enumerate(pos_class_indices):
+            is_pos = target == pos_class_index
+            state["pos_hist"][i] += np.bincount(
+                bins[is_pos, i], minlength=self._num_bins
+            )
+            state["neg_hist"][i] += np.bincount(
+                bins[~is_pos, i], minlength=self._num_bins
+            )
+
+    def finalize(self, state: Dict[str, np.ndarray]) -> Union[Dict[str, float], float]:
+        pos_hist = state["pos_hist"].astype(np.float64)
+        neg_hist = state["neg_hist"].astype(np.float64)
+        # per positive, the number of negatives with a lower score (ties count as half)
+        neg_below = np.cumsum(neg_hist, axis=1) - 0.5 * neg_hist
+        with np.errstate(divide="ignore", invalid="ignore"):
+            aucs = (pos_hist * neg_below).sum(axis=1) / (
+                pos_hist.sum(axis=1) * neg_hist.sum(axis=1)
+            )
+
+        if self._class_names is None:
+            return float(aucs[0])
+        results = {
+            cls_name: float(auc) for cls_name, auc in zip(self._class_names, aucs)
+        }
+        results["macro_avg"] = float(np.nanmean(aucs))
+        return results
+
+
+class MetricStreamingConfusion(MetricStreamingBase):
+    """
+    Streaming confusion matrix based metrics (one vs rest): 'sensitivity', 'recall', 'tpr', 'specificity',  'selectivity', 'npr', 'precision', 'ppv', 'f1'.
+    Returns the same format as MetricConfusion.
+    """
+
+    def __init__(
+        self,
+        pred: str,
+        target: str,
+        class_names: Optional[Sequence[str]] = None,
+        metrics: Sequence[str] = ("sensitivity", "specificity", "precision", "f1"),
+        **kwargs: Any,
+    ):
+        """
+        :param pred: class prediction key - integer in range [0 - num_classes) per sample, or scores per class in which case argmax will be applied
+        :param target: target key - integer in range [0 - num_classes) per sample
+        :param class_names: class names for multi-class evaluation or None for binary evaluation (positive class is 1)
+        :param metrics: required metrics names, see MetricsLibClass.confusion_metrics()
+        :param kwargs: additional arguments for MetricStreamingBase
+        """
+        self._class_names = class_names
+        self._metrics = metrics
+        super().__init__(pred=pred, target=target, **kwargs)
+
+    def _num_classes(self) -> int:
+        return 2 if self._class_names is None else len(self._class_names)
+
+    def init_state(self) -> Dict[str, np.ndarray]:
+        num_classes = self._num_classes()
+        return {"matrix": np.zeros((num_classes, num_classes), dtype=np.int64)}
+
+    def update_state(
+        self, state: Dict[str, np.ndarray], pred: np.ndarray, target: np.ndarray
+    ) -> None:
+        num_classes = self._num_classes()
+        target = target.reshape(-1).astype(np.int64)
+        if pred.size != target.size:
+            # scores per class - apply argmax
+            pred = pred.reshape(target.size, -1).argmax(axis=1)
+        pred = pred.reshape(-1).astype(np.int64)
+        state["matrix"] += np.bincount(
+            target * num_classes + pred, minlength=num_classes**2
+        ).reshape(num_classes, num_classes)
+
+    def finalize(self, state: Dict[str, np.ndarray]) -> Dict[str, float]:
+        matrix = state["matrix"].astype(np.float64)
+        tp = np.diag(matrix)
+        fn = matrix.sum(axis=1) - tp
+        fp = matrix.sum(axis=0) - tp
+        tn = matrix.sum() - tp - fn - fp
+        with np.errstate(divide="ignore", invalid="ignore"):
+            per_class = MetricsLibClass._confusion_metrics_from_counts(
+                tp, fn, fp, tn, self._metrics
+            )
+
+        if self._class_names is None:
+            return {name: float(values[1]) for name, values in per_class.items()}
+        results = {}
+        for name, values in per_class.items():
+            for cls_name, value in zip(self._class_names, values):
+                results[f"{name}.{cls_name}"] = float(value)
+            results[f"{name}.macro_avg"] = float(np.nanmean(values))
+        return results
+
+
+class MetricStreamingSegmentationBase(MetricStreamingBase):
+    """
+    Base class for streaming segmentation metrics that average a per sample score per label.
+    Returns the same format as the non streaming versions (e.g., MetricDice):
+    the average score per label (over the samples in which the label appears in the target) and their average.
+    """
+
+    def __init__(
+        self,
+        pred: str,
+        target: str,
+        labels: Sequence[int],
+        class_weights: Optional[Dict[str, float]] = None,
+        **kwargs: Any,
+    ):
+        """
+        :param pred: key to a predicted label map per sample
+        :param target: key to a target label map per sample
+        :param labels: the labels to evaluate (0 is the background and should not be included)
+        :param class_weights: weight per label (str(label) -> weight), we assume sum of total weights is 1 and each element is in 0-1 range
+        :param kwargs: additional arguments for MetricStreamingBase
+        """
+        self._labels = list(labels)
+        self._class_weights = class_weights
+        super().__init__(pred=pred, target=target, **kwargs)
+
+    def init_state(self) -> Dict[str, np.ndarray]:
+        return {
+            "score_sum": np.zeros(len(self._labels), dtype=np.float64),
+            "count": np.zeros(len(self._labels), dtype=np.int64),
+        }
+
+    def score(
+        self,
+        intersection: np.ndarray,
+        pred_size: np.ndarray,
+        target_size: np.ndarray,
+    ) -> np.ndarray:
+        """
+        :return: per sample score given the number of pixels in the intersection, the prediction and the target
+        """
+        raise NotImplementedError
+
+    def update_state(
+        self, state: Dict[str, np.ndarray], pred: np.ndarray, target: np.ndarray
+    ) -> None:
+        batch_size = target.shape[0]
+        pred = pred.reshape(batch_size, -1)
+        target = target.reshape(batch_size, -1)
+        for i, label in enumerate(self._labels):
+            mask_pred = pred == label
+            mask_gt = target == label
+            target_size = mask_gt.sum(axis=1)
+            # the label is evaluated only in samples in which it appears in the target
+            present = target_size > 0
+            if not np.any(present):
+                continue
+            scores = self.score(
+                np.logical_and(mask_pred, mask_gt).sum(axis=1)[present],
+                mask_pred.sum(axis=1)[present],
+                target_size[present],
+            )
+            state["score_sum"][i] += scores.sum()
+            state["count"][i] += present.sum()
+
+    def finalize(self, state: Dict[str, np.ndarray]) -> Dict[str, float]:
+        results = {}
+        total_average = 0.0
+        for i, label in enumerate(self._labels):
+            if state["count"][i] == 0:
+                continue
+            key = str(int(label))
+            results[key] = state["score_sum"][i] / state["count"][i]
+            weight = 1.0 if self._class_weights is None else self._class_weights[key]
+            total_average += weight * results[key]
+        results["average"] = total_average / len(results) if results else np.nan
+        return results
+
+
+class MetricStreamingDice(MetricStreamingSegmentationBase):
+    """
+    Streaming dice score (2*|X&Y| / (|X|+|Y|)) for every label
+    """
+
+    def score(
+        self,
+        intersection: np.ndarray,
+        pred_size: np.ndarray,
+        target_size: np.ndarray,
+    ) -> np.ndarray:
+        return 2.0 * intersection / (pred_size + target_size)
+
+
+class MetricStreamingIouJaccard(MetricStreamingSegmentationBase):
+    """
+    Streaming IOU Jaccard score (|X&Y| / |XUY|) for every label
+    """
+
+    def score(
+        self,
+        intersection: np.ndarray,
+        pred_size: np.ndarray,
+        target_size: np.ndarray,
+    ) -> np.ndarray:
+        return intersection / (pred_size + target_size - intersection)
+
+
+class MetricStreamingECE(MetricStreamingBase):
+    """
+    Streaming Expected Calibration Error (and Maximum Calibration Error), using equal width bins.
+    Returns the same format as MetricECE.
+    """
+
+    def __init__(self, pred: str, target: str, num_bins: int = 10, **kwargs: Any):
+        """
+        :param pred: prediction key - array of shape [num_classes] per sample, or a score per sample for binary classifiers
+        :param target: target key - integer in range [0 - num_classes) per sample
+        :param num_bins: number of equal width bins
+        :param kwargs: additional arguments for MetricStreamingBase
+        """
+        self._conf_vec = np.linspace(0, 1, num_bins + 1)
+        super().__init__(pred=pred, target=target, **kwargs)
+
+    def init_state(self) -> Dict[str, np.ndarray]:
+        num_bins = len(self._conf_vec) - 1
+        return {
+            "num_samples": np.zeros(num_bins, dtype=np.int64),
+            "num_correct": np.zeros(num_bins, dtype=np.int64),
+            "total_samples": np.zeros((), dtype=np.int64),
+        }
+
+    def update_state(
+        self, state: Dict[str, np.ndarray], pred: np.ndarray, target: np.ndarray
+    ) -> None:
+        target = target.reshape(-1)
+        pred = pred.reshape(len(target), -1)
+        if pred.shape[1] == 1:  # binary case
+            pred = np.concatenate((1 - pred, pred), axis=1)
+        max_pred = pred.max(axis=1)
+        correct = pred.argmax(axis=1) == target
+
+        num_bins = len(self._conf_vec) - 1
+        bins = np.digitize(max_pred, self._conf_vec) - 1
+        in_range = (bins >= 0) & (bins < num_bins)
+        state["num_samples"] += np.bincount(bins[in_range], minlength=num_bins)
+        state["num_correct"] += np.bincount(
+            bins[in_range], weights=correct[in_range], minlength=num_bins
+        ).astype(np.int64)
+        state["total_samples"] += len(target)
+
+    def finalize(self, state: Dict[str, np.ndarray]) -> Dict[str, float]:
+        num_samples = state["num_samples"]
+        accuracy_vec = state["num_correct"] / np.maximum(
+            num_samples, np.finfo(float).eps
+        )
+        conf_vec = self._conf_vec[1:]
+        existing_bins = num_samples > 0
+        results = {}
+        results["ece"] = float(
+            np.sum(num_samples * np.abs(accuracy_vec - conf_vec))
+            / state["total_samples"]
+        )
+        results["mce"] = float(
+            np.max(np.abs(accuracy_vec[existing_bins] - conf_vec[existing_bins]))
+        )
+        return results
@@ -1,7 +1,8 @@
 from functools import partial
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 from collections import defaultdict
 from fuse.eval.metrics.libs.segmentation import MetricsSegmentation
+from fuse.eval.metrics.utils import bootstrap_counts
 
 import numpy as np
 
@@ -37,6 +38,40 @@ def average_sample_results(
     return average_results
 
 
+def average_sample_results_resamples(
+    metric_result: List[Dict[str, float]],
+    resamples: np.ndarray,
+    class_weights: Optional[Dict[int, float]] = None,
+) -> Union[None, Dict[str, np.ndarray]]:
+    """
+    Vectorized version of average_sample_results() that evaluates many resamples at once (see MetricBase.eval_resamples())
+    :param metric_result: list of per image metric results ,each element is a dictionary where the key is class id and value is the metric score
+    :param resamples: matrix of shape [num_resamples, num_samples], each row includes the positions of the selected samples
+    :param class_weights: weight per segmentation class , we assume sum of total weights is 1 and each element is in 0-1 range
+    :return: dictionary of arrays of average result per class and average result over classes - a value per resample.
+             None if a class is missing in one of the resamples.
+    """
+    counts = bootstrap_counts(resamples, len(metric_result))
+    classes = list(dict.fromkeys(key for sample in metric_result for key in sample))
+    average_results = {}
+    total_avarage = 0
+    for key in classes:
+        scores = np.array(
+            [sample.get(key, 0.0) for sample in metric_result], dtype=np.float64
+        )
+        present = np.array(
+            [key in sample for sample in metric_result], dtype=np.float64
+        )
+        num_present = counts @ present
+        if np.any(num_present == 0):
+            return None
+        average_results[key] = (counts @ (scores * present)) / num_present
+        weight = 1.0 if class_weights is None else class_weights[key]
+        total_avarage = total_avarage + weight * average_results[key]
+    average_results["average"] = total_avarage / len(classes)
+    return average_results
+
+
 class MetricDice(MetricPerSampleDefault):
     """
     Compute similarity dice score (2*|X&Y| / (|X|+|Y|)) for every label
@@ -57,12 +92,16 @@ class MetricDice(MetricPerSampleDefault):
         :param pixel_weight: Optional dictionary key to collect
         """
         average = partial(average_sample_results, class_weights=class_weights)
+        average_resamples = partial(
+            average_sample_results_resamples, class_weights=class_weights
+        )
         super().__init__(
             pred=pred,
             target=target,
             pixel_weight=pixel_weight,
             metric_per_sample_func=MetricsSegmentation.dice,
             result_aggregate_func=average,
+            result_aggregate_resamples_func=average_resamples,
             **kwargs
         )
 
@@ -87,12 +126,16 @@ class MetricIouJaccard(MetricPerSampleDefault):
         :param pixel_weight: Optional dictionary key to collect
         """
         average = partial(average_sample_results, class_weights=class_weights)
+        average_resamples = partial(
+            average_sample_results_resamples, class_weights=class_weights
+        )
         super().__init__(
             pred,
             target,
             pixel_weight=pixel_weight,
             metric_per_sample_func=MetricsSegmentation.iou_jaccard,
             result_aggregate_func=average,
+            result_aggregate_resamples_func=average_resamples,
             **kwargs
         )
 
@@ -117,12 +160,16 @@ class MetricOverlap(MetricPerSampleDefault):
         :param pixel_weight: Optional dictionary key to collect
         """
         average = partial(average_sample_results, class_weights=class_weights)
+        average_resamples = partial(
+            average_sample_results_resamples, class_weights=class_weights
+        )
         super().__init__(
             pred,
             target,
             pixel_weight=pixel_weight,
             metric_per_sample_func=MetricsSegmentation.overlap,
             result_aggregate_func=average,
+            result_aggregate_resamples_func=average_resamples,
             **kwargs
         )
 
@@ -145,11 +192,15 @@ class Metric2DHausdorff(MetricPerSampleDefault):
         :param class_weights: weight per segmentation class , we assume sum of total weights is 1 and each element is in 0-1 range
         """
         average = partial(average_sample_results, class_weights=class_weights)
+        average_resamples = partial(
+            average_sample_results_resamples, class_weights=class_weights
+        )
         super().__init__(
             pred,
             target,
             metric_per_sample_func=MetricsSegmentation.hausdorff_2d_distance,
             result_aggregate_func=average,
+            result_aggregate_resamples_func=average_resamples,
             **kwargs
         )
 
@@ -174,11 +225,15 @@ class MetricPixelAccuracy(MetricPerSampleDefault):
         :param pixel_weight: Optional dictionary key to collect
         """
         average = partial(average_sample_results, class_weights=class_weights)
+        average_resamples = partial(
+            average_sample_results_resamples, class_weights=class_weights
+        )
         super().__init__(
             pred,
             target,
             pixel_weight=pixel_weight,
             metric_per_sample_func=MetricsSegmentation.pixel_accuracy,
             result_aggregate_func=average,
+            result_aggregate_resamples_func=average_resamples,
             **kwargs
         )
@@ -29,3 +29,20 @@ class PerSampleData:
             permutation = [original_ids_pos[sample_id] for sample_id in required_ids]
 
             return [self._data[i] for i in permutation]
+
+
+def bootstrap_counts(resamples: np.ndarray, num_samples: int) -> np.ndarray:
+    """
+    Converts resamples to the number of times each sample was selected in each resample.
+    Used by vectorized implementations of metrics evaluated on many resamples (see MetricBase.eval_resamples()).
+    :param resamples: matrix of shape [num_resamples, num_samples_in_resample], each row includes the positions of the selected samples
+    :param num_samples: total number of samples
+    :return: float matrix of shape [num_resamples, num_samples]
+    """
+    resamples = np.asarray(resamples)
+    num_resamples = resamples.shape[0]
+    offsets = (np.arange(num_resamples, dtype=np.int64) * num_samples)[:, None]
+    counts = np.bincount(
+        (resamples + offsets).ravel(), minlength=num_resamples * num_samples
+    )
+    return counts.reshape(num_resamples, num_samples).astype(np.float64)
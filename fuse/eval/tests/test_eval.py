@@ -16,9 +16,14 @@ limitations under the License.
 Created on June 30, 2021
 
 """
+import os
+import tempfile
 import pandas as pd
 from distutils.log import warn
 import unittest
+import numpy as np
+import torch
+from typing import Iterator
 
 
 from fuse.eval.examples.examples import (
@@ -55,6 +60,35 @@ from fuse.eval.examples.examples_seq_gen import (
 )
 
 from fuse.eval.examples.examples_stats import example_pearson_correlation
+from fuse.eval.evaluator import EvaluatorDefault
+from fuse.utils.file_io.columnar import ColumnarWriter
+from fuse.eval.metrics.metrics_common import CI
+from fuse.eval.metrics.classification.metrics_classification_common import (
+    MetricAUCROC,
+    MetricAccuracy,
+    MetricConfusion,
+)
+from fuse.eval.metrics.classification.metrics_thresholding_common import (
+    MetricApplyThresholds,
+)
+from fuse.eval.metrics.classification.metrics_model_comparison_common import (
+    MetricDelongsTest,
+    MetricDelongsTestMulti,
+)
+from fuse.eval.metrics.classification.metrics_calibration_common import MetricECE
+from fuse.eval.metrics.metrics_streaming import (
+    MetricStreamingAUCROC,
+    MetricStreamingConfusion,
+    MetricStreamingDice,
+    MetricStreamingECE,
+    MetricStreamingIouJaccard,
+)
+from fuse.eval.metrics.segmentation.metrics_segmentation_common import (
+    MetricDice,
+    average_sample_results,
+    average_sample_results_resamples,
+)
+from collections import OrderedDict
 
 
 class TestEval(unittest.TestCase):
@@ -84,7 +118,7 @@ class TestEval(unittest.TestCase):
         results = example_4()
         self.assertEqual(results["metrics.auc.org"], 0.845)
         self.assertAlmostEqual(results["metrics.auc.mean"], 0.8456, places=3)
-        self.assertAlmostEqual(results["metrics.auc.conf_lower"], 0.712, places=3)
+        self.assertAlmostEqual(results["metrics.auc.conf_lower"], 0.7125, places=3)
         self.assertAlmostEqual(results["metrics.auc.conf_upper"], 0.954, places=3)
         self.assertAlmostEqual(results["metrics.auc.std"], 0.0622, places=3)
 
@@ -243,6 +277,280 @@ class TestEval(unittest.TestCase):
         self.assertAlmostEqual(results["metrics.count.seq_num"], 10)
         self.assertAlmostEqual(results["metrics.count.token_num"], 4999)
 
+    def test_ci_vectorized(self) -> None:
+        """
+        Compare the vectorized bootstrap evaluation to the evaluation per resample
+        """
+        rng = np.random.default_rng(0)
+        num_samples = 60
+        pred = rng.dirichlet(np.ones(3), size=num_samples)
+        target = rng.integers(0, 3, size=num_samples)
+        data = pd.DataFrame(
+            {
+                "id": list(range(num_samples)),
+                "pred": list(pred),
+                "target": target,
+            }
+        )
+        class_names = ["a", "b", "c"]
+
+        cls_pred = "results:metrics.apply_thresh.cls_pred"
+        results = {}
+        for vectorized in [True, False]:
+            metrics = [
+                MetricAUCROC(pred="pred", target="target", class_names=class_names),
+                MetricAccuracy(pred=cls_pred, target="target"),
+                MetricConfusion(
+                    pred=cls_pred,
+                    target="target",
+                    class_names=class_names,
+                    metrics=("sensitivity", "specificity", "precision"),
+                ),
+            ]
+            if not vectorized:
+                # fallback to evaluation per resample
+                for metric in metrics:
+                    metric.eval_resamples = lambda *args: None
+            metrics = OrderedDict(
+                [("apply_thresh", MetricApplyThresholds(pred="pred"))]
+                + [
+                    (
+                        name,
+                        CI(metric, stratum="target", num_of_bootstraps=50),
+                    )
+                    for name, metric in zip(["auc", "acc", "confusion"], metrics)
+                ]
+            )
+            results[vectorized] = EvaluatorDefault().eval(
+                ids=None, data=data, metrics=metrics
+            )
+
+        keys = [key for key in results[False].keypaths() if "apply_thresh" not in key]
+        self.assertGreater(len(keys), 20)
+        for key in keys:
+            self.assertAlmostEqual(
+                results[True][key], results[False][key], places=8, msg=key
+            )
+
+    def test_average_sample_results_resamples(self) -> None:
+        rng = np.random.default_rng(0)
+        metric_result = [
+            {"1": rng.random(), "2": rng.random()} if i % 3 else {"1": rng.random()}
+            for i in range(30)
+        ]
+        resamples = rng.integers(0, 30, size=(20, 30))
+        class_weights = {"1": 0.3, "2": 0.7}
+        vectorized = average_sample_results_resamples(
+            metric_result, resamples, class_weights=class_weights
+        )
+        for index, resample in enumerate(resamples):
+            expected = average_sample_results(
+                [metric_result[i] for i in resample], class_weights=class_weights
+            )
+            for key, value in expected.items():
+                self.assertAlmostEqual(vectorized[key][index], value, places=10)
+
+    def test_delongs_test_multi(self) -> None:
+        rng = np.random.default_rng(0)
+        target = rng.integers(0, 3, size=200)
+        preds = {
+            name: list(rng.dirichlet(np.ones(3), size=200) + np.eye(3)[target] * shift)
+            for name, shift in [("a", 0.5), ("b", 0.3), ("c", 0.0)]
+        }
+        data = pd.DataFrame({"id": list(range(200)), "target": target, **preds})
+        class_names = ["x", "y", "z"]
+        metrics = OrderedDict(
+            [
+                (
+                    "multi",
+                    MetricDelongsTestMulti(
+                        preds={name: name for name in preds},
+                        target="target",
+                        class_names=class_names,
+                    ),
+                ),
+                (
+                    "a_vs_c",
+                    MetricDelongsTest(
+                        pred1="a", pred2="c", target="target", class_names=class_names
+                    ),
+                ),
+            ]
+        )
+        results = EvaluatorDefault().eval(ids=None, data=data, metrics=metrics)
+        for cls_name in class_names + ["macro_avg"]:
+            self.assertAlmostEqual(
+                results[f"metrics.multi.p_value.a_vs_c.{cls_name}"],
+                results[f"metrics.a_vs_c.p_value.{cls_name}"],
+            )
+            self.assertAlmostEqual(
+                results[f"metrics.multi.cov.a.c.{cls_name}"],
+                results[f"metrics.a_vs_c.cov12.{cls_name}"],
+            )
+            self.assertAlmostEqual(
+                results[f"metrics.multi.auc.c.{cls_name}"],
+                results[f"metrics.a_vs_c.auc2.{cls_name}"],
+            )
+        self.assertLess(results["metrics.multi.p_value.a_vs_c.macro_avg"], 0.01)
+
+    def test_streaming_metrics(self) -> None:
+        rng = np.random.default_rng(0)
+        num_samples = 300
+        target = rng.integers(0, 3, size=num_samples)
+        # scores in multiples of 0.001, so the histogram based AUC is exact
+        pred = rng.dirichlet(np.ones(3), size=num_samples) + np.eye(3)[target] * 0.3
+        pred = np.round(pred / pred.sum(axis=1, keepdims=True) * 1000).astype(int)
+        pred[:, 2] = 1000 - pred[:, 0] - pred[:, 1]
+        pred = pred / 1000
+        seg_target = rng.integers(0, 3, size=(num_samples, 8, 8))
+        seg_pred = np.where(
+            rng.random((num_samples, 8, 8)) < 0.7,
+            seg_target,
+            rng.integers(0, 3, size=(num_samples, 8, 8)),
+        )
+        class_names = ["a", "b", "c"]
+
+        def data_iter() -> Iterator[dict]:
+            for start in range(0, num_samples, 32):
+                yield {
+                    "id": list(range(start, min(start + 32, num_samples))),
+                    "pred": torch.tensor(pred[start : start + 32]),
+                    "target": torch.tensor(target[start : start + 32]),
+                    "seg_pred": torch.tensor(seg_pred[start : start + 32]),
+                    "seg_target": torch.tensor(seg_target[start : start + 32]),
+                }
+
+        metrics = OrderedDict(
+            [
+                (
+                    "auc",
+                    MetricAUCROC(pred="pred", target="target", class_names=class_names),
+                ),
+                (
+                    "streaming_auc",
+                    MetricStreamingAUCROC(
+                        pred="pred", target="target", class_names=class_names
+                    ),
+                ),
+                (
+                    "confusion",
+                    MetricConfusion(
+                        pred="pred", target="target", class_names=class_names
+                    ),
+                ),
+                (
+                    "streaming_confusion",
+                    MetricStreamingConfusion(
+                        pred="pred", target="target", class_names=class_names
+                    ),
+                ),
+                ("ece", MetricECE(pred="pred", target="target")),
+                ("streaming_ece", MetricStreamingECE(pred="pred", target="target")),
+                ("dice", MetricDice(pred="seg_pred", target="seg_target")),
+                (
+                    "streaming_dice",
+                    MetricStreamingDice(
+                        pred="seg_pred", target="seg_target", labels=[1, 2]
+                    ),
+                ),
+            ]
+        )
+        results = EvaluatorDefault().eval(
+            ids=None, data=data_iter(), metrics=metrics, batch_size=0
+        )
+        for name in ["auc", "confusion", "ece", "dice"]:
+            expected = results[f"metrics.{name}"]
+            for key in expected.keypaths():
+                self.assertAlmostEqual(
+                    results[f"metrics.streaming_{name}.{key}"],
+                    expected[key],
+                    places=6,
+                    msg=f"{name}.{key}",
+                )
+
+        # merge states of metrics evaluated on two shards of the data
+        metric_a = MetricStreamingIouJaccard(
+            pred="seg_pred", target="seg_target", labels=[1, 2]
+        )
+        metric_b = MetricStreamingIouJaccard(
+            pred="seg_pred", target="seg_target", labels=[1, 2]
+        )
+        metric_all = MetricStreamingIouJaccard(
+            pred="seg_pred", target="seg_target", labels=[1, 2]
+        )
+        for i, batch in enumerate(data_iter()):
+            (metric_a if i % 2 else metric_b).collect(batch)
+            metric_all.collect(batch)
+        metric_a.merge(metric_b)
+        merged_results, expected = metric_a.eval(), metric_all.eval()
+        self.assertEqual(merged_results.keys(), expected.keys())
+        for key in expected:
+            self.assertAlmostEqual(merged_results[key], expected[key], places=10)
+
+        # evaluating again with the same metric instances ignores the data of the previous evaluation
+        data = pd.DataFrame(
+            {"id": list(range(num_samples)), "pred": list(pred), "target": target}
+        )
+
+        def streaming_metrics() -> OrderedDict:
+            return OrderedDict(
+                [
+                    (
+                        "streaming_confusion",
+                        MetricStreamingConfusion(
+                            pred="pred", target="target", class_names=class_names
+                        ),
+                    ),
+                    ("streaming_ece", MetricStreamingECE(pred="pred", target="target")),
+                ]
+            )
+
+        metrics = streaming_metrics()
+        EvaluatorDefault().eval(ids=None, data=data, metrics=metrics)
+        second = EvaluatorDefault().eval(ids=None, data=data[:50], metrics=metrics)
+        expected = EvaluatorDefault().eval(
+            ids=None, data=data[:50], metrics=streaming_metrics()
+        )
+        for key in expected.keypaths():
+            self.assertEqual(second[key], expected[key], msg=key)
+
+    def test_eval_columnar(self) -> None:
+        rng = np.random.default_rng(0)
+        num_samples = 200
+        data = pd.DataFrame(
+            {
+                "id": [f"sample_{i}" for i in range(num_samples)],
+                "pred": list(rng.dirichlet([1.0, 1.0], size=num_samples)),
+                "target": rng.integers(0, 2, size=num_samples),
+            }
+        )
+        filename = os.path.join(tempfile.mkdtemp(), "infer.columnar")
+        with ColumnarWriter(filename) as writer:
+            for start in range(0, num_samples, 32):
+                batch = data.iloc[start : start + 32]
+                writer.append(
+                    {
+                        "id": batch.id.tolist(),
+                        "pred": np.stack(batch.pred),
+                        "target": batch.target.values,
+                    }
+                )
+
+        for ids in [None, [f"sample_{i}" for i in range(0, num_samples, 3)]]:
+            results = {}
+            for name, input_data in [("dataframe", data), ("columnar", filename)]:
+                metrics = OrderedDict(
+                    [("auc", MetricAUCROC(pred="pred", target="target"))]
+                )
+                results[name] = EvaluatorDefault().eval(
+                    ids=ids, data=input_data, metrics=metrics
+                )
+            self.assertAlmostEqual(
+                results["columnar"]["metrics.auc"],
+                results["dataframe"]["metrics.auc"],
+                places=10,
+            )
+
     def test_pearson_correlation(self) -> None:
         res = example_pearson_correlation()
         self.assertAlmostEqual(res["metrics.pearsonr.statistic"], 1.0, places=2)
@@ -0,0 +1,105 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Micro benchmarks - NDict operations used on the collate and metrics paths
+(building a sample, leaf and sub-dict access, containment, deletion of a sub-tree and collating a batch).
+
+Usage:
+    python fuse/utils/benchmarks/benchmark_ndict.py --num_keys 200 --batch_size 32
+"""
+import argparse
+import timeit
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+
+from fuse.data.utils.collates import CollateDefault
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.ndict import NDict
+
+
+def get_keys(num_keys: int) -> List[str]:
+    """
+    :return: keys in a typical sample / batch_dict structure, e.g. model.output.head_3.key_12
+    """
+    groups = ["data.input", "data.gt", "model.output", "model.logits", "losses"]
+    return [
+        f"{groups[index % len(groups)]}.head_{index % 7}.key_{index}"
+        for index in range(num_keys)
+    ]
+
+
+def create_ndict(keys: List[str]) -> NDict:
+    ndict = NDict()
+    for key in keys:
+        ndict[key] = 0
+    return ndict
+
+
+def time_op(func: Callable, number: int) -> float:
+    """
+    :return: microseconds per call (best of 3 repeats)
+    """
+    return 1e6 * min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def run_benchmark(num_keys: int, batch_size: int, number: int) -> pd.DataFrame:
+    keys = get_keys(num_keys)
+    ndict = create_ndict(keys)
+    ndict["model"]  # build the prefix index once, as in a metric computation
+
+    def delete_sub_tree() -> None:
+        tmp_ndict = NDict(dict(ndict.to_dict()), already_flat=True)
+        del tmp_ndict["model.output"]
+
+    samples = [
+        NDict(
+            {
+                "data.sample_id": index,
+                "data.input.img": np.zeros((1, 4, 4), dtype=np.float32),
+                "data.gt.label": index % 2,
+                "data.meta.name": f"sample_{index}",
+            }
+        )
+        for index in range(batch_size)
+    ]
+    for sample in samples:
+        for key in keys[:20]:
+            sample[f"extra.{key}"] = 0
+    collate = CollateDefault()
+
+    benchmarks = [
+        ("set (new keys)", lambda: create_ndict(keys), number // 10),
+        ("get leaf", lambda: ndict[keys[-1]], number),
+        ("get sub-dict (model.output)", lambda: ndict["model.output"], number // 10),
+        ("contains prefix (model.logits)", lambda: "model.logits" in ndict, number),
+        ("contains missing", lambda: "model.missing" in ndict, number),
+        ("delete sub-tree (incl. copy)", delete_sub_tree, number // 10),
+        ("keypaths", lambda: ndict.keypaths(), number),
+        ("collate batch", lambda: collate(samples), max(number // 1000, 1)),
+    ]
+    results = []
+    for name, func, op_number in benchmarks:
+        results.append(dict(op=name, us_per_call=time_op(func, op_number)))
+    return pd.DataFrame(results).round(3)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_keys", type=int, default=200)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--number", type=int, default=10000)
+    args = parser.parse_args()
+
+    df = run_benchmark(args.num_keys, args.batch_size, args.number)
+    print(get_pretty_dataframe(df))
@@ -79,7 +79,7 @@ class CollateToBatchList(Callable):
         for sample in samples:
             if not isinstance(sample, NDict):
                 sample = NDict(sample)
-            keys |= set(sample.keypaths())
+            keys.update(sample.keys())
         return list(keys)
 
     def _collect_values_to_list(
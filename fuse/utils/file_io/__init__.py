@@ -12,9 +12,20 @@ from .file_io import (
     create_simple_timestamp_file,
     save_hdf5_safe,
     load_hdf5,
+    load_hdf5_lazy,
+    set_hdf5_max_open_files,
+    close_hdf5_files,
     delete_directory_tree,
 )
 
+from .columnar import (
+    ColumnarWriter,
+    ColumnarReader,
+    save_columnar,
+    read_columnar,
+    is_columnar,
+)
+
 from .compressed import extract_zip_file
 
 from .path import change_extension, get_extension, remove_extension
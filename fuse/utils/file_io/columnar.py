@@ -0,0 +1,335 @@
+"""
+(C) Copyright 2021 IBM Corp.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Columnar, chunked file format for per-sample values such as inference outputs (see LightningModuleDefault.set_predictions_keys()).
+A columnar file is a directory (suffix ".columnar") that stores one or more parts - a part per writer (e.g. per DDP rank).
+Each part stores:
+    <part>.schema.pkl - the columns: name, kind, dtype and the shape of a single row
+    <part>.<column index>.bin - "tensor" columns (numeric values with a fixed shape per row), raw row-major data, memory mapped when reading
+    <part>.<column index>.pkl - "object" columns (e.g. string ids or values with a varying shape), a pickled list per chunk
+    <part>.chunks - the number of rows per chunk (int64), appended after the chunk data is written - rows of a partially written chunk are ignored.
+Rows are appended in chunks (e.g. a batch), and can be read lazily - a subset of the columns, and only the rows of the required ids.
+"""
+import os
+import pickle
+import socket
+import time
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+COLUMNAR_SUFFIX = "columnar"
+
+_SCHEMA_SUFFIX = ".schema.pkl"
+_CHUNKS_SUFFIX = ".chunks"
+
+
+def is_columnar(filename: str) -> bool:
+    """
+    :return: True if filename is a columnar file (by suffix)
+    """
+    return filename.rstrip("/").split(".")[-1] == COLUMNAR_SUFFIX
+
+
+class ColumnarWriter:
+    """
+    Appends rows to a columnar file, chunk by chunk. Each writer adds a new part to the file, so several processes can write to the same file.
+
+    Example:
+        with ColumnarWriter("infer.columnar") as writer:
+            for batch in batches:
+                writer.append({"id": batch_ids, "model.output": batch_outputs})
+    """
+
+    def __init__(self, filename: str, object_columns: Sequence[str] = tuple()):
+        """
+        :param filename: path to the columnar file (directory), created if not exist
+        :param object_columns: columns to store as pickled values even if numeric (e.g. values with a varying shape).
+                               Other columns are stored as "tensor" columns if the values of the first chunk are numeric with the same shape.
+        """
+        os.makedirs(filename, exist_ok=True)
+        self._filename = filename
+        # the parts are sorted by creation time when reading
+        self._part = os.path.join(
+            filename, f"{time.time_ns():020d}@{socket.gethostname()}@{os.getpid()}"
+        )
+        self._object_columns = set(object_columns)
+        self._schema = None
+        self._files = None
+        self._chunks_file = None
+
+    def append(self, chunk: Dict[str, Any]) -> None:
+        """
+        Append a chunk of rows
+        :param chunk: column name to values - numpy array with the rows along the first axis, or a sequence of row values. All the chunks must have the same columns.
+                      The dtype of a tensor column is set by the first chunk, the values of the next chunks must be safely castable to it (see np.can_cast()).
+        """
+        columns = {}
+        for name, values in chunk.items():
+            columns[name] = (
+                None if name in self._object_columns else _as_tensor_column(values)
+            )
+            if columns[name] is None:
+                columns[name] = list(values)
+        num_rows = {len(values) for values in columns.values()}
+        if len(num_rows) != 1:
+            raise Exception(
+                f"Error: expecting the same number of rows in all the columns, got {[(name, len(values)) for name, values in columns.items()]}"
+            )
+
+        if self._schema is None:
+            self._open(columns)
+        if list(columns.keys()) != list(self._schema.keys()):
+            raise Exception(
+                f"Error: expecting columns {list(self._schema.keys())}, got {list(columns.keys())}"
+            )
+
+        for (name, values), column_file in zip(columns.items(), self._files):
+            column = self._schema[name]
+            if column["kind"] == "object":
+                pickle.dump(values, column_file, protocol=pickle.HIGHEST_PROTOCOL)
+            else:
+                if isinstance(values, list) or values.shape[1:] != column["shape"]:
+                    raise Exception(
+                        f"Error: column {name} expects numeric rows with shape {column['shape']}. Use object_columns for values with a varying shape"
+                    )
+                if not np.can_cast(values.dtype, column["dtype"], casting="safe"):
+                    raise Exception(
+                        f"Error: column {name} was created with dtype {column['dtype']}, got values with dtype {values.dtype} which can't be safely cast to it"
+                    )
+                column_file.write(
+                    np.ascontiguousarray(values, dtype=column["dtype"]).tobytes()
+                )
+            column_file.flush()
+
+        # commit the chunk
+        self._chunks_file.write(np.array([num_rows.pop()], dtype="<i8").tobytes())
+        self._chunks_file.flush()
+
+    def close(self) -> None:
+        if self._files is not None:
+            for column_file in self._files + [self._chunks_file]:
+                column_file.close()
+            self._files = None
+            self._chunks_file = None
+
+    def __enter__(self) -> "ColumnarWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _open(self, columns: Dict[str, Union[np.ndarray, list]]) -> None:
+        """
+        Write the schema (inferred from the first chunk) and open the column files
+        """
+        self._schema = {}
+        for name, values in columns.items():
+            if isinstance(values, list):
+                self._schema[name] = dict(kind="object", dtype=None, shape=None)
+            else:
+                self._schema[name] = dict(
+                    kind="tensor",
+                    dtype=values.dtype.newbyteorder("<"),
+                    shape=values.shape[1:],
+                )
+        with open(self._part + _SCHEMA_SUFFIX, "wb") as schema_file:
+            pickle.dump(self._schema, schema_file)
+        self._files = [
+            open(_column_filename(self._part, index, column["kind"]), "ab")
+            for index, column in enumerate(self._schema.values())
+        ]
+        self._chunks_file = open(self._part + _CHUNKS_SUFFIX, "ab")
+
+
+class ColumnarReader:
+    """
+    Reads a columnar file. Tensor columns are memory mapped - reading a subset of the rows reads only the pages of these rows.
+    """
+
+    def __init__(self, filename: str):
+        """
+        :param filename: path to the columnar file (directory)
+        """
+        if not os.path.isdir(filename):
+            raise Exception(f"Error: columnar file {filename} was not found")
+        self._filename = filename
+        self._parts = []
+        self._schema = None
+        for schema_filename in sorted(os.listdir(filename)):
+            if not schema_filename.endswith(_SCHEMA_SUFFIX):
+                continue
+            part = os.path.join(filename, schema_filename[: -len(_SCHEMA_SUFFIX)])
+            with open(part + _SCHEMA_SUFFIX, "rb") as schema_file:
+                schema = pickle.load(schema_file)
+            if self._schema is None:
+                self._schema = schema
+            elif schema != self._schema:
+                raise Exception(
+                    f"Error: the parts of columnar file {filename} have different columns: {self._schema} and {schema}"
+                )
+            chunks_filename = part + _CHUNKS_SUFFIX
+            chunks = (
+                np.fromfile(chunks_filename, dtype="<i8")
+                if os.path.exists(chunks_filename)
+                else np.zeros(0, dtype="<i8")
+            )
+            self._parts.append((part, chunks))
+        if self._schema is None:
+            self._schema = {}
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._schema.keys())
+
+    @property
+    def num_rows(self) -> int:
+        return int(sum(chunks.sum() for _, chunks in self._parts))
+
+    def read_column(
+        self, name: str, rows: Optional[np.ndarray] = None
+    ) -> Union[np.ndarray, list]:
+        """
+        :param name: the column name
+        :param rows: optional, sorted indices of the rows to read. Default is all the rows.
+        :return: numpy array (rows along the first axis) for tensor columns, or a list of values for object columns.
+                 When reading all the rows of a single part tensor column, returns a read-only memory mapped array.
+        """
+        if name not in self._schema:
+            raise Exception(
+                f"Error: column {name} wasn't found in columnar file {self._filename}, available columns are {self.columns}"
+            )
+        index = list(self._schema.keys()).index(name)
+        column = self._schema[name]
+        part_values = []
+        first_row = 0
+        for part, chunks in self._parts:
+            num_rows = int(chunks.sum())
+            part_rows = None
+            if rows is not None:
+                part_rows = rows[
+                    np.searchsorted(rows, first_row) : np.searchsorted(
+                        rows, first_row + num_rows
+                    )
+                ]
+                part_rows = part_rows - first_row
+            first_row += num_rows
+            if num_rows == 0:
+                continue
+            column_filename = _column_filename(part, index, column["kind"])
+
+            if column["kind"] == "tensor":
+                values = np.memmap(
+                    column_filename,
+                    dtype=column["dtype"],
+                    mode="r",
+                    shape=(num_rows,) + column["shape"],
+                )
+                if part_rows is not None:
+                    values = np.asarray(values[part_rows])
+                part_values.append(values)
+            else:
+                values = []
+                with open(column_filename, "rb") as column_file:
+                    for _ in range(len(chunks)):
+                        values += pickle.load(column_file)
+                if part_rows is not None:
+                    values = [values[row] for row in part_rows]
+                part_values.append(values)
+
+        if column["kind"] == "object":
+            return sum(part_values, [])
+        if len(part_values) == 0:
+            return np.zeros((0,) + column["shape"], dtype=column["dtype"])
+        if len(part_values) == 1:
+            return part_values[0]
+        return np.concatenate(part_values)
+
+    def to_dataframe(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        ids: Optional[Sequence] = None,
+        id_column: str = "id",
+    ) -> pd.DataFrame:
+        """
+        :param columns: the columns to read, default is all the columns
+        :param ids: optional, read only the rows of these ids. The id column is read first, and the other columns are read only for the matching rows.
+        :param id_column: the column that stores the ids
+        :return: dataframe with a row per sample. Tensor columns with a scalar per row are numeric columns, others are object columns with a numpy array per row (as in convert_predictions_to_dataframe())
+        """
+        if columns is None:
+            columns = self.columns
+        rows = None
+        if ids is not None:
+            id_values = self.read_column(id_column)
+            rows = np.flatnonzero(pd.Index(id_values).isin(ids))
+
+        data = {}
+        for name in columns:
+            values = self.read_column(name, rows)
+            if isinstance(values, np.ndarray):
+                # copy - the dataframe should not keep the files open
+                values = np.array(values)
+                if values.ndim > 1:
+                    values = list(values)
+            data[name] = values
+        return pd.DataFrame(data)
+
+
+def save_columnar(df: pd.DataFrame, filename: str, **kwargs: dict) -> None:
+    """
+    Save a dataframe into a columnar file (as a single chunk). Object columns with equal shape numpy arrays are stored as tensor columns.
+    :param filename: path to the columnar file (directory), must not include previously written rows
+    :param kwargs: see ColumnarWriter
+    """
+    if os.path.isdir(filename) and ColumnarReader(filename).num_rows > 0:
+        raise Exception(f"Error: columnar file {filename} already exists")
+    with ColumnarWriter(filename, **kwargs) as writer:
+        writer.append({name: df[name].tolist() for name in df.columns})
+
+
+def read_columnar(
+    filename: str,
+    columns: Optional[Sequence[str]] = None,
+    ids: Optional[Sequence] = None,
+    id_column: str = "id",
+) -> pd.DataFrame:
+    """
+    Read a columnar file into a dataframe, see ColumnarReader.to_dataframe()
+    :param filename: path to the columnar file (directory)
+    """
+    return ColumnarReader(filename).to_dataframe(
+        columns=columns, ids=ids, id_column=id_column
+    )
+
+
+def _as_tensor_column(values: Any) -> Optional[np.ndarray]:
+    """
+    :return: the values as a numpy array if numeric with the same shape per row, otherwise None (stored as an object column)
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in "biufc":
+        return values
+    try:
+        values = np.asarray(list(values))
+    except ValueError:  # varying shape
+        return None
+    if values.dtype.kind not in "biufc" or values.ndim == 0:
+        return None
+    return values
+
+
+def _column_filename(part: str, index: int, kind: str) -> str:
+    return f"{part}.{index}.{'bin' if kind == 'tensor' else 'pkl'}"
@@ -1,4 +1,5 @@
 import errno
+from collections import OrderedDict
 from typing import Iterable, List, Dict, Optional, Tuple, Union, Any
 import pickle
 import bz2
@@ -8,6 +9,7 @@ import os
 import numpy as np
 import time
 import datetime
+import threading
 
 import pandas as pd
 import shutil
@@ -16,6 +18,7 @@ import hdf5plugin
 from scipy.io import arff
 
 from fuse.utils.misc.misc import Misc
+from fuse.utils.file_io.columnar import read_columnar, save_columnar
 
 ###note - it is required that hdf5 support will be installed in a way that blosc is supported as well
 # the recommended way is to install it in the following way:
@@ -182,11 +185,19 @@ def create_simple_timestamp_file(file_path: str) -> None:
         f.close()
 
 
-def save_hdf5_safe(filename: str, use_blosc: bool = True, **kwarrays: dict) -> str:
+def save_hdf5_safe(
+    filename: str,
+    use_blosc: bool = True,
+    chunk_bytes: Optional[int] = 512 * 1024,
+    **kwarrays: dict,
+) -> str:
     """
     multi-threading and multi-processing safe saving content to hdf5 file
     args:
         use_blosc: uses the blosc compression algorithm
+        chunk_bytes: the approximate size of a compressed chunk (before compression), see get_hdf5_chunk_shape().
+            Reading a region of an array (see load_hdf5_lazy()) decompresses only the chunks it touches.
+            Set to None to use h5py automatic chunking.
     """
     # first validate the request
     for k, d in kwarrays.items():
@@ -195,12 +206,15 @@ def save_hdf5_safe(filename: str, use_blosc: bool = True, **kwarrays: dict) -> s
         if not isinstance(d, np.ndarray):
             raise Exception(f"only np.ndarray data is supported, instead got {type(d)}")
     scrambed_filename = get_randomized_postfix_name(filename)
-    # import ipdb;ipdb.set_trace()
     with h5py.File(scrambed_filename, "w") as h5f:
         for k, d in kwarrays.items():
             _use_kwargs = {}
             if use_blosc:
-                _use_kwargs = hdf5plugin.Blosc()
+                _use_kwargs = dict(hdf5plugin.Blosc())
+                if chunk_bytes is not None and d.size > 0:
+                    _use_kwargs["chunks"] = get_hdf5_chunk_shape(
+                        d.shape, d.itemsize, chunk_bytes
+                    )
             h5f.create_dataset(k, data=d, **_use_kwargs)
 
     os.rename(scrambed_filename, filename)  # '.' + saved_tensors_format)
@@ -208,8 +222,168 @@ def save_hdf5_safe(filename: str, use_blosc: bool = True, **kwarrays: dict) -> s
     return filename
 
 
-# TODO: CONSIDER supporting slicing more "organically" - for example, changing this into a class instance,
-#      which supports something like: x = load_hdf5('blah'); x['a.b'][:2,10:20:3,...]
+def get_hdf5_chunk_shape(
+    shape: Tuple[int, ...], itemsize: int, chunk_bytes: int = 512 * 1024
+) -> Tuple[int, ...]:
+    """
+    Chunk shape tuned for reading patches (crops, slices) of the array - the largest axis is halved until the chunk is smaller than chunk_bytes,
+    so the chunks are as close to cubes as the array shape allows. For example a [128, 512, 512] int16 volume is stored in [64, 64, 64] chunks.
+    :param shape: the shape of the array
+    :param itemsize: number of bytes per element
+    :param chunk_bytes: the maximal size of a chunk
+    :return: the chunk shape
+    """
+    chunk = list(shape)
+    while int(np.prod(chunk)) * itemsize > chunk_bytes and max(chunk) > 1:
+        axis = int(np.argmax(chunk))
+        chunk[axis] = (chunk[axis] + 1) // 2
+    return tuple(max(size, 1) for size in chunk)
+
+
+class _HDF5HandlesPool:
+    """
+    LRU pool of files opened for reading, per process.
+    A file that was replaced or modified since it was opened (e.g. a rebuilt cache) is opened again.
+    """
+
+    def __init__(self, max_open_files: int = 64):
+        self._max_open_files = max_open_files
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+        # filename -> (h5py.File, os.stat signature)
+        self._handles: "OrderedDict[str, Tuple[h5py.File, Tuple]]" = OrderedDict()
+
+    def get(self, filename: str) -> h5py.File:
+        stat = os.stat(filename)
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if self._pid != os.getpid():
+                # handles must not be shared with a forked process
+                self._handles = OrderedDict()
+                self._pid = os.getpid()
+            if filename in self._handles:
+                h5f, curr_signature = self._handles[filename]
+                if curr_signature == signature and h5f.id.valid:
+                    self._handles.move_to_end(filename)
+                    return h5f
+                self._close(filename)
+            h5f = h5py.File(filename, "r")
+            self._handles[filename] = (h5f, signature)
+            while len(self._handles) > self._max_open_files:
+                self._close(next(iter(self._handles)))
+            return h5f
+
+    def set_max_open_files(self, max_open_files: int) -> None:
+        with self._lock:
+            self._max_open_files = max_open_files
+            while len(self._handles) > self._max_open_files:
+                self._close(next(iter(self._handles)))
+
+    def close_all(self) -> None:
+        with self._lock:
+            for filename in list(self._handles):
+                self._close(filename)
+
+    def _close(self, filename: str) -> None:
+        h5f, _ = self._handles.pop(filename)
+        if self._pid == os.getpid():
+            h5f.close()
+
+
+_hdf5_handles_pool = _HDF5HandlesPool()
+
+
+def set_hdf5_max_open_files(max_open_files: int) -> None:
+    """
+    Set the maximal number of HDF5 files kept open (per process) by load_hdf5() and load_hdf5_lazy(). The least recently used files are closed first.
+    """
+    _hdf5_handles_pool.set_max_open_files(max_open_files)
+
+
+def close_hdf5_files() -> None:
+    """
+    Close all the HDF5 files kept open (in the current process) by load_hdf5() and load_hdf5_lazy()
+    """
+    _hdf5_handles_pool.close_all()
+
+
+class LazyHDF5Dataset:
+    """
+    A handle to an array stored in an HDF5 file, see load_hdf5_lazy().
+    Indexing reads only the selected region (and decompresses only the chunks it touches), using h5py indexing rules
+    (ints, slices with a positive step, Ellipsis and an increasing list of indices in a single axis).
+    np.asarray() reads the entire array.
+    """
+
+    def __init__(self, filename: str, key: str):
+        self._filename = filename
+        self._key = key
+        dset = _hdf5_handles_pool.get(filename)[key]
+        self.shape: Tuple[int, ...] = dset.shape
+        self.dtype: np.dtype = dset.dtype
+        self.chunks: Optional[Tuple[int, ...]] = dset.chunks
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __repr__(self) -> str:
+        return f"LazyHDF5Dataset(filename={self._filename}, key={self._key}, shape={self.shape}, dtype={self.dtype})"
+
+    def __getitem__(self, index: Any) -> np.ndarray:
+        return _hdf5_handles_pool.get(self._filename)[self._key][index]
+
+    def __array__(self, dtype: Any = None, copy: Optional[bool] = None) -> np.ndarray:
+        ans = self[...]
+        if dtype is not None:
+            ans = ans.astype(dtype, copy=False)
+        return ans
+
+
+class LazyHDF5File:
+    """
+    A read only, dict like, handle to an HDF5 file, see load_hdf5_lazy()
+    """
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self._keys = list(_hdf5_handles_pool.get(filename).keys())
+
+    def keys(self) -> List[str]:
+        return list(self._keys)
+
+    def items(self) -> Iterable[Tuple[str, LazyHDF5Dataset]]:
+        return ((key, self[key]) for key in self._keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self) -> Iterable[str]:
+        return iter(self._keys)
+
+    def __getitem__(self, key: str) -> LazyHDF5Dataset:
+        if key not in self._keys:
+            raise KeyError(f"{key} not found in {self._filename}")
+        return LazyHDF5Dataset(self._filename, key)
+
+
+def load_hdf5_lazy(filename: str) -> LazyHDF5File:
+    """
+    Lazy alternative to load_hdf5() - nothing is read until an array is indexed, and then only the selected region is read.
+    The file is kept open in a per process pool of recently used files (see set_hdf5_max_open_files()), so repeated reads do not re-open it.
+
+    Usage example:
+        x = load_hdf5_lazy('some_file.hdf5')
+        x['a.b'].shape
+        x['a.b'][:2, 10:20:3, ...]  # reads only the touched chunks
+    """
+    return LazyHDF5File(filename)
 
 
 def load_hdf5(
@@ -248,12 +422,12 @@ def load_hdf5(
         Note: if custom_extraction is provided (not None), then only data from keys found in it will be returned
         In the example above, let's say that there was also a dataset named 'z.z.banana' in the file, it will *not* be returned.
         )
+        See also load_hdf5_lazy() for reading regions of the arrays on demand.
     :return:
     """
-    # import ipdb;ipdb.set_trace()
-
     ans = {}
-    h5f = h5py.File(filename, "r")
+    # the file is kept open in a per process pool, see load_hdf5_lazy()
+    h5f = _hdf5_handles_pool.get(filename)
     for k in h5f.keys():
         if custom_extract is not None:
             if k not in custom_extract:
@@ -284,7 +458,7 @@ def load_hdf5(
 def save_dataframe(df: pd.DataFrame, filename: str, **kwargs: dict) -> None:
     """
     Save dataframe into a file. The file format inferred from filename suffix
-    Supported types: "csv", "hd5", "hdf5", "pickle", "pkl", "gz", "xslx", "md"
+    Supported types: "csv", "hd5", "hdf5", "pickle", "pkl", "gz", "xslx", "md", "columnar" (see fuse.utils.file_io.columnar)
     :param filename: path to the output file
     """
     file_type = filename.split(".")[-1]
@@ -300,9 +474,12 @@ def save_dataframe(df: pd.DataFrame, filename: str, **kwargs: dict) -> None:
         "gz",
         "xslx",
         "md",
+        "columnar",
     ], f"file type {file_type} not supported"
     if file_type in ["pickle", "pkl", "gz"]:
         df.to_pickle(filename, **kwargs)
+    elif file_type == "columnar":
+        save_columnar(df, filename, **kwargs)
     elif file_type == "csv":
         df.to_csv(filename, **kwargs)
     elif file_type == "tsv":
@@ -318,7 +495,7 @@ def save_dataframe(df: pd.DataFrame, filename: str, **kwargs: dict) -> None:
 def read_dataframe(filename: str) -> pd.DataFrame:
     """
     Read dataframe from a file. The file format inferred from filename suffix
-    Supported types: "csv", "hd5", "hdf5", "pickle", "pkl", "gz", "xslx"
+    Supported types: "csv", "hd5", "hdf5", "pickle", "pkl", "gz", "xslx", "columnar" (see fuse.utils.file_io.columnar)
     :param filename: path to the output file
     """
     file_type = filename.split(".")[-1]
@@ -333,9 +510,12 @@ def read_dataframe(filename: str) -> pd.DataFrame:
         "pkl",
         "gz",
         "xslx",
+        "columnar",
     ], f"file type {file_type} not supported"
     if file_type in ["pickle", "pkl", "gz"]:
         df = pd.read_pickle(filename)
+    elif file_type == "columnar":
+        df = read_columnar(filename)
     elif file_type == "csv":
         df = pd.read_csv(filename)
     elif file_type == "tsv":
@@ -0,0 +1,120 @@
+"""
+(C) Copyright 2021 IBM Corp.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from fuse.utils.file_io.columnar import (
+    ColumnarReader,
+    ColumnarWriter,
+    read_columnar,
+)
+from fuse.utils.file_io.file_io import read_dataframe, save_dataframe
+
+
+class TestColumnar(unittest.TestCase):
+    def test_write_read(self) -> None:
+        rng = np.random.default_rng(0)
+        ids = [f"case_{i:04d}" for i in range(50)]
+        preds = rng.random((50, 3)).astype(np.float32)
+        labels = rng.integers(0, 3, size=50)
+        masks = [np.zeros(rng.integers(1, 5)) for _ in range(50)]
+
+        filename = os.path.join(tempfile.mkdtemp(), "infer.columnar")
+        # two writers (e.g. two DDP ranks), each appends batches of 10 samples
+        for first, last in [(0, 30), (30, 50)]:
+            with ColumnarWriter(filename, object_columns=["mask"]) as writer:
+                for start in range(first, last, 10):
+                    batch = slice(start, start + 10)
+                    writer.append(
+                        {
+                            "id": ids[batch],
+                            "pred": preds[batch],
+                            "label": list(labels[batch]),
+                            "mask": masks[batch],
+                        }
+                    )
+
+        reader = ColumnarReader(filename)
+        self.assertEqual(reader.columns, ["id", "pred", "label", "mask"])
+        self.assertEqual(reader.num_rows, 50)
+        self.assertIsInstance(reader.read_column("pred"), np.ndarray)
+        np.testing.assert_array_equal(reader.read_column("pred"), preds)
+        self.assertEqual(reader.read_column("id"), ids)
+
+        df = read_columnar(filename)
+        self.assertEqual(list(df.id), ids)
+        np.testing.assert_array_equal(np.stack(df.pred), preds)
+        np.testing.assert_array_equal(df.label.values, labels)
+        for value, mask in zip(df["mask"], masks):
+            np.testing.assert_array_equal(value, mask)
+        pd.testing.assert_frame_equal(read_dataframe(filename), df)
+
+        # read only the rows of the required ids
+        subset = [ids[i] for i in [3, 29, 30, 47]] + ["missing"]
+        df = read_columnar(filename, columns=["id", "pred"], ids=subset)
+        self.assertEqual(list(df.id), subset[:-1])
+        np.testing.assert_array_equal(np.stack(df.pred), preds[[3, 29, 30, 47]])
+
+        # unexpected shape
+        with ColumnarWriter(filename) as writer:
+            writer.append({"x": np.zeros((2, 3))})
+            with self.assertRaises(Exception):
+                writer.append({"x": np.zeros((2, 4))})
+        # a lossy cast
+        with ColumnarWriter(filename) as writer:
+            writer.append({"x": np.zeros((2, 3), dtype=np.float32)})
+            writer.append({"x": np.ones((2, 3), dtype=np.float16)})
+            with self.assertRaisesRegex(Exception, "column x"):
+                writer.append({"x": np.zeros((2, 3), dtype=np.float64)})
+        # the parts have different columns
+        with self.assertRaises(Exception):
+            ColumnarReader(filename)
+
+    def test_save_dataframe(self) -> None:
+        df = pd.DataFrame(
+            {
+                "id": [10, 11, 12],
+                "pred": [
+                    np.array([0.1, 0.9]),
+                    np.array([0.7, 0.3]),
+                    np.array([0.5, 0.5]),
+                ],
+                "name": ["a", "b", "c"],
+            }
+        )
+        filename = os.path.join(tempfile.mkdtemp(), "infer.columnar")
+        save_dataframe(df, filename)
+        self.assertEqual(
+            [column["kind"] for column in ColumnarReader(filename)._schema.values()],
+            ["tensor", "tensor", "object"],
+        )
+        result = read_dataframe(filename)
+        self.assertEqual(list(result.id), [10, 11, 12])
+        self.assertEqual(list(result.name), ["a", "b", "c"])
+        np.testing.assert_array_equal(np.stack(result.pred), np.stack(df.pred))
+        # not appending to existing file
+        with self.assertRaises(Exception):
+            save_dataframe(df, filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
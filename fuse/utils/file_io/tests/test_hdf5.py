@@ -18,7 +18,13 @@ limitations under the License.
 import unittest
 
 from fuse.utils.rand.seed import Seed
-from fuse.utils.file_io.file_io import save_hdf5_safe, load_hdf5
+from fuse.utils.file_io.file_io import (
+    close_hdf5_files,
+    save_hdf5_safe,
+    load_hdf5,
+    load_hdf5_lazy,
+    set_hdf5_max_open_files,
+)
 import numpy as np
 import tempfile
 import os
@@ -77,6 +83,32 @@ class TestHDF5IO(unittest.TestCase):
             loaded_hdf5_partial["data.clinical_info_input"].sum(), 507.3055890687598
         )
 
+    def test_load_hdf5_lazy(self) -> None:
+        data = self._generate_test_data_1()
+        tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(tmpdir, "test_hdf5_lazy.hdf5")
+        save_hdf5_safe(filename, chunk_bytes=64 * 1024, **data)
+
+        loaded = load_hdf5_lazy(filename)
+        self.assertEqual(sorted(loaded.keys()), sorted(data.keys()))
+        img = loaded["data.cc.img"]
+        self.assertEqual(img.shape, (30, 200, 200))
+        self.assertEqual(img.dtype, np.float64)
+        # chunks are close to cubes
+        self.assertEqual(img.chunks, (15, 13, 25))
+        np.testing.assert_array_equal(
+            img[:2, 10:20:3, ...], data["data.cc.img"][:2, 10:20:3, ...]
+        )
+        np.testing.assert_array_equal(np.asarray(img), data["data.cc.img"])
+
+        # the file is kept open, and opened again once replaced
+        save_hdf5_safe(filename, **{"data.cc.img": data["data.cc.img"][:3]})
+        self.assertEqual(load_hdf5(filename)["data.cc.img"].shape, (3, 200, 200))
+        set_hdf5_max_open_files(1)
+        self.assertEqual(load_hdf5_lazy(filename)["data.cc.img"].shape, (3, 200, 200))
+        close_hdf5_files()
+        set_hdf5_max_open_files(64)
+
     def tearDown(self) -> None:
         pass
 
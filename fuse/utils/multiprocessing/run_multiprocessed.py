@@ -1,11 +1,14 @@
+import collections
+import concurrent.futures
 import functools
-from typing import Any, List, Optional, Union, Tuple, Callable
+from typing import Any, Iterable, Iterator, List, Optional, Union, Tuple, Callable
 from fuse.utils.utils_debug import FuseDebug
 import torch
 from tqdm import tqdm
 import multiprocessing as mp
 from termcolor import cprint
 import os
+import threading
 import traceback
 
 """
@@ -29,6 +32,7 @@ def run_multiprocessed(
     mp_context: Optional[str] = None,
     desc: Optional[str] = None,
     maxtasksperchild: Optional[int] = None,
+    prefetch: Optional[int] = None,
 ) -> List[Any]:
     """
     Args:
@@ -52,6 +56,8 @@ def run_multiprocessed(
          if False, the answers will be accumulated to a list and returned.
         :param mp_context: "fork", "spawn", "thread" or None for multiprocessing default
         :param maxtasksperchild: the maximum number of tasks that a worker process/thread is allowed to do before it is destroyed (and a new one is created instead of it)
+        :param prefetch: Optional, relevant with as_iterator - the maximal number of results computed ahead of the consumer (pending or ready).
+            Bounds the memory when the consumer is slower than the workers. If None, all the tasks are submitted at once.
 
     Returns:
         if as_iterator is set to True, returns an iterator.
@@ -68,6 +74,7 @@ def run_multiprocessed(
         mp_context=mp_context,
         desc=desc,
         maxtasksperchild=maxtasksperchild,
+        prefetch=prefetch,
     )
 
     if as_iterator:
@@ -87,6 +94,7 @@ def _run_multiprocessed_as_iterator_impl(
     mp_context: Optional[str] = None,
     desc: Optional[str] = None,
     maxtasksperchild: Optional[int] = None,
+    prefetch: Optional[int] = None,
 ) -> List[Any]:
     """
     an iterator version of run_multiprocessed - useful when the accumulated answer is too large to fit in memory
@@ -109,6 +117,7 @@ def _run_multiprocessed_as_iterator_impl(
             if strict_answers_order is set to True, the answers will be provided at the same order as defined in the args_list
         :param mp_context: "fork", "spawn", "thread" or None for multiprocessing default
         :param maxtasksperchild: the maximum number of tasks that a worker process/thread is allowed to do before it is destroyed (and a new one is created instead of it)
+        :param prefetch: Optional, the maximal number of results computed ahead of the consumer (pending or ready). If None, all the tasks are submitted at once.
     """
     if "DEBUG_SINGLE_PROCESS" in os.environ and os.environ["DEBUG_SINGLE_PROCESS"] in [
         "T",
@@ -167,29 +176,101 @@ def _run_multiprocessed_as_iterator_impl(
         if mp_context == "thread":
             from multiprocessing.pool import ThreadPool
 
-            pool = ThreadPool
-        elif mp_context is None:  # os default
-            pool = mp.Pool
+            # threads share the global storage and are not recycled (maxtasksperchild is not supported)
+            _store_in_global_storage(copy_to_global_storage)
+            pool = ThreadPool(processes=workers)
         else:
-            pool = mp.get_context(mp_context).Pool
+            pool_type = (
+                mp.Pool if mp_context is None else mp.get_context(mp_context).Pool
+            )
+            pool = pool_type(
+                processes=workers,
+                initializer=_store_in_global_storage,
+                initargs=(copy_to_global_storage,),
+                maxtasksperchild=maxtasksperchild,
+            )
 
         worker_func = functools.partial(worker_func_wrapper, worker_func=worker_func)
-        with pool(
-            processes=workers,
-            initializer=_store_in_global_storage,
-            initargs=(copy_to_global_storage,),
-            maxtasksperchild=maxtasksperchild,
-        ) as pool:
+        with pool:
             if verbose > 0:
                 cprint(f"multiprocess pool created with {workers} workers.", "cyan")
             map_func = pool.imap if keep_results_order else pool.imap_unordered
-            for curr_ans in tqdm_func(
-                map_func(worker_func, args_list),
-                total=args_num,
-                smoothing=0.1,
-                disable=verbose < 1,
-            ):
-                yield curr_ans
+            if prefetch is not None:
+                # the pool submits the tasks from a separate thread - block it until a result is consumed
+                slots = threading.Semaphore(prefetch)
+                stop = threading.Event()
+                args_list = _throttled_iterator(args_list, slots, stop)
+            try:
+                for curr_ans in tqdm_func(
+                    map_func(worker_func, args_list),
+                    total=args_num,
+                    smoothing=0.1,
+                    disable=verbose < 1,
+                ):
+                    if prefetch is not None:
+                        slots.release()
+                    yield curr_ans
+            finally:
+                if prefetch is not None:
+                    # release the task submitting thread if the consumer stopped early
+                    stop.set()
+                if mp_context == "thread":
+                    _remove_from_global_storage(list(copy_to_global_storage.keys()))
+
+
+def _throttled_iterator(
+    args_list: Iterable, slots: threading.Semaphore, stop: threading.Event
+) -> Iterator:
+    """
+    yields the elements of args_list, each one after acquiring a slot - see prefetch argument of run_multiprocessed()
+    """
+    for args in args_list:
+        while not slots.acquire(timeout=0.1):
+            if stop.is_set():
+                return
+        yield args
+
+
+def run_thread_prefetched(
+    worker_func: Callable,
+    args_list: Iterable,
+    threads: int,
+    prefetch: Optional[int] = None,
+) -> Iterator[Tuple[Any, Any]]:
+    """
+    Applies worker_func on the elements of args_list in a pool of threads, running ahead of the consumer.
+    Useful to overlap I/O bound work (e.g. reading files from a network storage) with the processing of the results.
+    :param worker_func: a function that gets a single element of args_list
+    :param args_list: the arguments, consumed lazily
+    :param threads: number of threads. Set to 0 to run worker_func in the calling thread, just before the result is consumed.
+    :param prefetch: the maximal number of elements that are submitted but not yet consumed. Default: 2 * threads
+    :return: iterator over tuples (args, worker_func(args)), in the order of args_list.
+             An exception raised by worker_func is raised when its result is consumed.
+    """
+    if threads < 1:
+        for args in args_list:
+            yield args, worker_func(args)
+        return
+
+    if prefetch is None:
+        prefetch = 2 * threads
+    prefetch = max(prefetch, 1)
+
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        try:
+            for args in args_list:
+                pending.append((args, executor.submit(worker_func, args)))
+                if len(pending) >= prefetch:
+                    args, future = pending.popleft()
+                    yield args, future.result()
+            while len(pending) > 0:
+                args, future = pending.popleft()
+                yield args, future.result()
+        finally:
+            # the consumer stopped early or an exception was raised
+            for _, future in pending:
+                future.cancel()
 
 
 def worker_func_wrapper(*args: list, worker_func: Callable, **kwargs: dict) -> Any:
@@ -27,6 +27,7 @@ from torch import Tensor
 from typing import (
     Any,
     Callable,
+    Dict,
     Iterator,
     Optional,
     Sequence,
@@ -44,6 +45,11 @@ class NDict(dict):
         1. strings
         2. do not contain '.' within a single key, as '.' is used as a special symbol for accessing deeper level nested dict.
 
+    The values are stored in a single flat dict. Sub-dict access, containment and deletion of a prefix use a prefix index,
+    built on first use and maintained by __setitem__ and __delitem__ (see _PrefixIndex).
+    Modifying the dict returned by to_dict() directly is supported - the flat dict counts the changes of its keys (see _TrackedDict),
+    and the index is rebuilt if it's out of date.
+
     For example:
 
         nx = NDict(x)
@@ -66,19 +72,28 @@ class NDict(dict):
         :param dict_like: the data with which to populate the nested dictionary, in case of NDict it acts as view constructor,
             otherwise we just set all the keys and values using the setitem function
         :param already_flat: optimization option. set to True only if you are sure that the input "dict_like" is a dict without nested dictionaries.
+                             The flat dict is shared if it was returned by to_dict() of another NDict, otherwise it's (shallow) copied.
         """
 
         if dict_like is None:
-            self._stored = dict()
+            self._stored = _TrackedDict()
+            self._index = _PrefixIndex()
 
         elif isinstance(dict_like, NDict):
             self._stored = dict_like._stored
+            self._index = dict_like._index
 
         elif isinstance(dict_like, dict) and already_flat:
-            self._stored = dict_like
+            self._stored = (
+                dict_like
+                if isinstance(dict_like, _TrackedDict)
+                else _TrackedDict(dict_like)
+            )
+            self._index = _PrefixIndex()
 
         elif dict_like is not None:
-            self._stored = dict()
+            self._stored = _TrackedDict()
+            self._index = _PrefixIndex()
             if not isinstance(dict_like, MutableMapping):
                 dict_like = dict(dict_like)
             for k, d in dict_like.items():
@@ -101,7 +116,7 @@ class NDict(dict):
         :param deepcopy: if true, does deep copy, otherwise does a shallow copy
         """
         if not deepcopy:
-            return NDict(copy.copy(self._stored), already_flat=True)
+            return NDict(_TrackedDict(self._stored), already_flat=True)
         else:
             return NDict(copy.deepcopy(self._stored), already_flat=True)
 
@@ -187,18 +202,16 @@ class NDict(dict):
             >>> ndict.get_sub_dict("a.b")
             {'c': 'x', 'd': 'y', 'e': 'z'}
         """
-        res = NDict()
-        prefix_key = key + "."
-        suffix_key = None
-        for kk in self.keys():
-            if kk.startswith(prefix_key):
-                suffix_key = kk[len(prefix_key) :]
-                res[suffix_key] = self[kk]
-
-        if suffix_key is None:
+        sub_keys = self._index.get(self._stored).get(key, None)
+        if sub_keys is None:
             return None
 
-        return res
+        prefix_len = len(key) + 1
+        stored = self._stored
+        return NDict(
+            _TrackedDict({kk[prefix_len:]: stored[kk] for kk in sub_keys}),
+            already_flat=True,
+        )
 
     def __setitem__(self, key: str, value: Any) -> None:
         """
@@ -219,7 +232,15 @@ class NDict(dict):
             for sub_key in value:
                 self[f"{key}.{sub_key}"] = value[sub_key]
             return
-        self._stored[key] = value
+        stored = self._stored
+        if key in stored:
+            stored[key] = value
+            return
+        index = self._index
+        in_sync = index.is_synced(stored)
+        stored[key] = value
+        if in_sync:
+            index.add(key, stored)
 
     def __delitem__(self, key: str) -> None:
         """
@@ -227,22 +248,24 @@ class NDict(dict):
         if key is a prefix to a sub-dict, deletes the entire sub-dict.
         if key is a key for a value AND a sub-dict, deletes BOTH
         """
-        deleted = False
+        # entire branch
+        sub_keys = list(self._index.get(self._stored).get(key, ()))
 
-        # delete specific (key, value)
+        # specific (key, value)
         if key in self._stored:
-            del self._stored[key]
-            deleted = True
+            sub_keys.append(key)
 
-        # delete entire branch
-        for kk in list(self.keys()):
-            if kk.startswith(f"{key}."):
-                del self[kk]
-                deleted = True
-
-        if not deleted:
+        if len(sub_keys) == 0:
             raise NestedKeyError(key, self)
 
+        stored = self._stored
+        index = self._index
+        in_sync = index.is_synced(stored)
+        for kk in sub_keys:
+            del stored[kk]
+            if in_sync:
+                index.remove(kk, stored)
+
     def get_closest_keys(self, key: str, n: int = 1) -> List[str]:
         """
         For a given keypath, returns the closest key(s) in the current nested dict.
@@ -253,12 +276,8 @@ class NDict(dict):
         if key in self._stored:
             return [key]
 
-        total_sub_keys = []
-
-        for kk in self.keys():
-            splitted_key = kk.split(".")
-            for i in range(len(splitted_key)):
-                total_sub_keys.append(".".join(splitted_key[: i + 1]))
+        total_sub_keys = list(self._index.get(self._stored).keys())
+        total_sub_keys.extend(self.keys())
 
         closest_keys = difflib.get_close_matches(key, total_sub_keys, n=n, cutoff=0)
         return closest_keys
@@ -282,10 +301,8 @@ class NDict(dict):
         :return: NDict with only the required indices
         """
         new_dict = {}
-        all_keys = self.keys()
-        for key in all_keys:
+        for key, value in self.items():
             try:
-                value = self[key]
                 if isinstance(value, (ndarray, Tensor)):
                     new_value = value[indices]
                 elif isinstance(value, Sequence):
@@ -305,14 +322,25 @@ class NDict(dict):
         :param apply_func: function to apply
         :param args: custom arguments for the 'apply_func' function
         """
-        all_keys = self.keys()
-        for key in all_keys:
-            new_value = apply_func(self[key], *args)
-            self[key] = new_value
+        stored = self._stored
+        for key, value in stored.items():
+            stored[key] = apply_func(value, *args)
 
     def __reduce__(self) -> Union[str, tuple]:
         return super().__reduce__()
 
+    def __getstate__(self) -> dict:
+        # the prefix index is not pickled - it will be rebuilt on demand
+        return {"_stored": dict(self._stored)}
+
+    def __setstate__(self, state: dict) -> None:
+        self._stored = _TrackedDict(state["_stored"])
+        self._index = _PrefixIndex()
+
+    def __copy__(self) -> NDict:
+        # a view - shares the storage (as python's default shallow copy of the object) and the index
+        return NDict(self)
+
     def __iter__(self) -> Iterator:
         return iter(self._stored)
 
@@ -329,14 +357,8 @@ class NDict(dict):
         if key in self._stored:
             return True
 
-        key_dot = key + "."
-        # iterate over all keys and looking for a match
-        for kk in self.keys():
-            if kk.startswith(key_dot):
-                return True
-
-        # a match wasn't found
-        return False
+        # a prefix of other key(s)
+        return key in self._index.get(self._stored)
 
     def get(self, key: str, default_value: Any = None) -> Any:
         if key not in self:
@@ -461,6 +483,131 @@ class NDict(dict):
                 print(f"\tshape={val.shape}")
 
 
+class _TrackedDict(dict):
+    """
+    NDict flat storage - a dict that counts the changes of its keys (version), so the prefix index can tell whether it's up to date.
+    Replacing the value of an existing key doesn't change the version.
+    Pickled and copied as a plain dict.
+    """
+
+    __slots__ = ("version",)
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        if key not in self:
+            self.version += 1
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key: Any) -> None:
+        dict.__delitem__(self, key)
+        self.version += 1
+
+    def pop(self, *args: Any) -> Any:
+        self.version += 1
+        return dict.pop(self, *args)
+
+    def popitem(self) -> tuple:
+        self.version += 1
+        return dict.popitem(self)
+
+    def clear(self) -> None:
+        self.version += 1
+        dict.clear(self)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        self.version += 1
+        dict.update(self, *args, **kwargs)
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            self.version += 1
+        return dict.setdefault(self, key, default)
+
+    def __ior__(self, other: Any) -> _TrackedDict:
+        self.version += 1
+        return dict.__ior__(self, other)
+
+    def __reduce__(self) -> tuple:
+        return (dict, (dict(self),))
+
+
+class _PrefixIndex:
+    """
+    NDict prefix index - maps each proper prefix of the stored keys (e.g. "a" and "a.b" for the key "a.b.c")
+    to the keys that start with it, in insertion order.
+    Built on first use. Once built, it's maintained by add() and remove() at O(depth) per key.
+    Shared between NDict instances that share the same storage (see NDict constructor).
+    The index keeps the version of the storage it reflects (see _TrackedDict), and is rebuilt if the keys were modified
+    without add() and remove() (e.g. via NDict.to_dict() or another NDict that shares the storage with a different index).
+    """
+
+    __slots__ = ("prefixes", "version")
+
+    def __init__(self) -> None:
+        self.prefixes: Optional[Dict[str, Dict[str, None]]] = None
+        self.version = -1
+
+    def is_synced(self, stored: _TrackedDict) -> bool:
+        """
+        :return: True if the index is built and reflects the current keys of stored
+        """
+        return self.prefixes is not None and self.version == stored.version
+
+    def get(self, stored: _TrackedDict) -> Dict[str, Dict[str, None]]:
+        """
+        :param stored: the flat dict
+        :return: the prefixes index, rebuilt if out of date
+        """
+        if not self.is_synced(stored):
+            self.prefixes = {}
+            for key in stored:
+                self._add(key)
+            self.version = stored.version
+        return self.prefixes
+
+    def add(self, key: str, stored: _TrackedDict) -> None:
+        """
+        Add a key that was just added to stored. Expects the index to be in sync before the key was added.
+        """
+        self._add(key)
+        self.version = stored.version
+
+    def remove(self, key: str, stored: _TrackedDict) -> None:
+        """
+        Remove a key that was just deleted from stored. Expects the index to be in sync before the key was deleted.
+        """
+        self._remove(key)
+        self.version = stored.version
+
+    def _add(self, key: str) -> None:
+        if not isinstance(key, str):
+            return
+        pos = key.find(".")
+        while pos != -1:
+            prefix = key[:pos]
+            sub_keys = self.prefixes.get(prefix, None)
+            if sub_keys is None:
+                sub_keys = self.prefixes[prefix] = {}
+            sub_keys[key] = None
+            pos = key.find(".", pos + 1)
+
+    def _remove(self, key: str) -> None:
+        if not isinstance(key, str):
+            return
+        pos = key.find(".")
+        while pos != -1:
+            prefix = key[:pos]
+            sub_keys = self.prefixes.get(prefix, None)
+            if sub_keys is not None:
+                sub_keys.pop(key, None)
+                if len(sub_keys) == 0:
+                    del self.prefixes[prefix]
+            pos = key.find(".", pos + 1)
+
+
 class NestedKeyError(KeyError):
     def __init__(self, key: str, d: NDict) -> None:
         closest_keys = d.get_closest_keys(key, n=3)
@@ -188,3 +188,17 @@ def draw_samples_recursively(data: Any) -> Any:
 
     # otherwise return the original data
     return data
+
+
+def contains_param_sampler(data: Any) -> bool:
+    """
+    :param data: data structure, recursively looking for ParamSamplerBase in a dictionary and a sequence (see draw_samples_recursively())
+    :return: True if data includes at least one ParamSamplerBase
+    """
+    if isinstance(data, dict):
+        return any(contains_param_sampler(value) for value in data.values())
+
+    if isinstance(data, (list, tuple)):
+        return any(contains_param_sampler(element) for element in data)
+
+    return isinstance(data, ParamSamplerBase)
@@ -30,6 +30,7 @@ from fuse.utils import (
     draw_samples_recursively,
     Seed,
 )
+from fuse.utils.rand.param_sampler import contains_param_sampler
 
 
 class TestParamSampler(unittest.TestCase):
@@ -159,6 +160,13 @@ class TestParamSampler(unittest.TestCase):
         self.assertIn(b["c"]["f"][3]["h"], [10, 11, 12, 13, 14, 15])
         self.assertIn(b["e"]["g"], [6, 7, 8])
 
+    def test_contains_param_sampler(self) -> None:
+        self.assertTrue(
+            contains_param_sampler({"a": 5, "c": {"f": [1, 2, (3, RandBool(0.5))]}})
+        )
+        self.assertFalse(contains_param_sampler({"a": 5, "c": {"f": [1, 2, (3, 4)]}}))
+        self.assertFalse(contains_param_sampler(None))
+
 
 if __name__ == "__main__":
     unittest.main()
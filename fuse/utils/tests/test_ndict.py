@@ -17,6 +17,8 @@ Created on June 30, 2021
 
 """
 
+import copy
+import pickle
 import unittest
 
 
@@ -264,6 +266,76 @@ class TestNDict(unittest.TestCase):
         self.assertDictEqual(ndict.unflatten()["a"]["b"], {"c": 42, "d": 23})
         self.assertDictEqual(ndict["a"].unflatten()["b"], {"c": 42, "d": 23})
 
+    def test_prefix_index(self) -> None:
+        ndict = NDict()
+        ndict["a.b.c"] = 1
+        ndict["a.b.d"] = 2
+        ndict["a.e"] = 3
+
+        # build the index, then keep it up to date
+        self.assertTrue("a.b" in ndict)
+        ndict["a.b.f.g"] = 4
+        self.assertDictEqual(ndict["a.b"].to_dict(), {"c": 1, "d": 2, "f.g": 4})
+        del ndict["a.b.c"]
+        self.assertDictEqual(ndict["a.b"].to_dict(), {"d": 2, "f.g": 4})
+        del ndict["a.b"]
+        self.assertFalse("a.b" in ndict)
+        self.assertFalse("a.b.f" in ndict)
+        self.assertDictEqual(ndict["a"].to_dict(), {"e": 3})
+
+        # views share the storage and the index
+        view = NDict(ndict)
+        view["a.h.i"] = 5
+        self.assertTrue("a.h" in ndict)
+
+        # modifications of the flat dict are detected
+        ndict.to_dict()["x.y"] = 6
+        self.assertEqual(ndict["x"]["y"], 6)
+
+        # the index is not pickled
+        ndict_copy = pickle.loads(pickle.dumps(ndict))
+        self.assertDictEqual(ndict_copy.to_dict(), ndict.to_dict())
+        self.assertIsNone(ndict_copy._index.prefixes)
+        self.assertTrue("a.h" in ndict_copy)
+
+    def test_prefix_index_modified_storage(self) -> None:
+        ndict = NDict({"x.y": 1, "r.s": 1})
+        self.assertTrue("x" in ndict)  # build the index
+
+        # a shallow copy shares the storage - and the index
+        ndict_copy = copy.copy(ndict)
+        del ndict_copy["x.y"]
+        ndict_copy["z.w"] = 2
+        self.assertTrue("z" in ndict)
+        self.assertFalse("x" in ndict)
+        self.assertDictEqual(ndict["r"].to_dict(), {"s": 1})
+
+        # replace a key via the flat dict, without changing the number of keys
+        flat = ndict.to_dict()
+        del flat["r.s"]
+        flat["q.t"] = 3
+        self.assertFalse("r" in ndict)
+        self.assertDictEqual(ndict["q"].to_dict(), {"t": 3})
+        self.assertTrue("q" in ndict_copy)
+        flat.pop("q.t")
+        flat.update({"r.s": 4})
+        self.assertFalse("q" in ndict)
+        self.assertDictEqual(ndict["r"].to_dict(), {"s": 4})
+
+        # a new NDict over the same flat dict, with a different index
+        other = NDict(flat, already_flat=True)
+        self.assertTrue("r" in other)
+        other["v.u"] = 5
+        del other["r.s"]
+        self.assertTrue("v" in ndict)
+        self.assertFalse("r" in ndict)
+
+        # deep copy and pickle - independent storage, pickled as a plain dict
+        ndict_deepcopy = copy.deepcopy(ndict)
+        ndict_deepcopy["n.m"] = 6
+        self.assertFalse("n" in ndict)
+        self.assertIs(type(pickle.loads(pickle.dumps(flat))), dict)
+
     def tearDown(self) -> None:
         delattr(self, "nested_dict")
 
@@ -77,6 +77,12 @@ class OpAddBMI(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpConvertVisitToSentence(OpBase):
     """
@@ -101,6 +107,12 @@ class OpConvertVisitToSentence(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpGenerateFinalTrajectoryOfVisits(OpBase):
     """
@@ -224,6 +236,12 @@ class OpMapToCategorical(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class PhysioNetCinC:
     @staticmethod
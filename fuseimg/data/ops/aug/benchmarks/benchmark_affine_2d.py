@@ -0,0 +1,98 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - OpAugAffine2D backends: a single tensor resample of all the channels vs. the legacy per channel PIL round trip.
+Uses ISIC shaped inputs (3 x 300 x 300 image) and KiTS shaped inputs (110 x 256 x 256 volume squeezed to 2D slices),
+with the augmentation parameters used by the ISIC and KiTS dynamic pipelines.
+
+Usage:
+    python fuseimg/data/ops/aug/benchmarks/benchmark_affine_2d.py --num_samples 10
+"""
+import argparse
+import time
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+import torch
+
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.ndict import NDict
+from fuseimg.data.ops.aug.geometry import OpAugAffine2D
+
+INPUT_SHAPES = {"isic": (3, 300, 300), "kits": (110, 256, 256)}
+
+
+def run_benchmark(
+    num_samples: int, inputs: Sequence[str], backends: Sequence[str]
+) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    ops = {
+        "pil": OpAugAffine2D(backend="pil"),
+        "tensor": OpAugAffine2D(backend="tensor"),
+    }
+    if torch.cuda.is_available():
+        ops["tensor_fp16_cuda"] = OpAugAffine2D(
+            backend="tensor", compute_dtype=torch.float16
+        )
+
+    results = []
+    for input_name in inputs:
+        images = [
+            torch.rand(INPUT_SHAPES[input_name], dtype=torch.float32)
+            for _ in range(num_samples)
+        ]
+        aug_args = [
+            dict(
+                rotate=float(rng.uniform(-180.0, 180.0)),
+                scale=float(rng.uniform(0.8, 1.2)),
+                flip=(bool(rng.random() < 0.5), bool(rng.random() < 0.5)),
+                translate=(int(rng.integers(-15, 16)), int(rng.integers(-15, 16))),
+            )
+            for _ in range(num_samples)
+        ]
+        for backend, op in ops.items():
+            if backend.split("_")[0] not in backends:
+                continue
+            device = "cuda" if backend.endswith("cuda") else "cpu"
+            start = time.perf_counter()
+            for image, args in zip(images, aug_args):
+                sample = NDict({"data.input.img": image.clone().to(device)})
+                op(sample, "data.input.img", **args)
+            if device == "cuda":
+                torch.cuda.synchronize()
+            elapsed = time.perf_counter() - start
+            results.append(
+                dict(
+                    input=f"{input_name} {INPUT_SHAPES[input_name]}",
+                    backend=backend,
+                    ms_per_sample=1000.0 * elapsed / num_samples,
+                )
+            )
+
+    df = pd.DataFrame(results)
+    pil_time = df[df.backend == "pil"].set_index("input")["ms_per_sample"]
+    df["speedup_vs_pil"] = df.apply(
+        lambda row: pil_time.get(row["input"], np.nan) / row["ms_per_sample"], axis=1
+    )
+    return df.round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_samples", type=int, default=10)
+    parser.add_argument("--inputs", nargs="+", default=list(INPUT_SHAPES.keys()))
+    parser.add_argument("--backends", nargs="+", default=["pil", "tensor"])
+    args = parser.parse_args()
+
+    df = run_benchmark(args.num_samples, args.inputs, args.backends)
+    print(get_pretty_dataframe(df))
@@ -0,0 +1,183 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - 3D augmentation of a volume and its segmentation mask:
+the existing chain, per key (OpRotation3D, as in the knight pipeline, followed by OpAugSqueeze3Dto2D -> OpAugAffine2D -> OpAugUnsqueeze3DFrom2D, as in the picai pipeline)
+vs. a single OpAugAffineElastic3D for both keys - in-plane transformations, 3D transformations and 3D transformations with elastic deformation.
+
+Usage:
+    python fuseimg/data/ops/aug/benchmarks/benchmark_affine_3d.py --volume_shape 64 128 128 --num_samples 10
+"""
+import argparse
+import time
+from functools import partial
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+import torchvision.transforms as transforms
+
+from fuse.data.ops.op_base import OpBase
+from fuse.data.ops.ops_aug_common import OpSample
+from fuse.data.ops.ops_common import OpLambda
+from fuse.data.pipelines.pipeline_default import PipelineDefault
+from fuse.data.utils.sample import set_sample_id
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.ndict import NDict
+from fuse.utils.rand.param_sampler import RandBool, RandInt, Uniform
+from fuse.utils.rand.seed import Seed
+from fuseimg.data.ops.aug.geometry import (
+    OpAugAffine2D,
+    OpAugAffineElastic3D,
+    OpAugSqueeze3Dto2D,
+    OpAugUnsqueeze3DFrom2D,
+    OpRotation3D,
+)
+
+KEYS = ("data.input.img", "data.gt.seg")
+
+
+def get_chain_ops(rotation_3d: bool) -> List[Tuple[OpBase, dict]]:
+    ops = []
+    for key in KEYS:
+        interpolation = (
+            transforms.InterpolationMode.NEAREST
+            if key == "data.gt.seg"
+            else transforms.InterpolationMode.BILINEAR
+        )
+        if rotation_3d:
+            ops += [
+                (
+                    OpSample(OpRotation3D()),
+                    dict(key=key, y_rot=Uniform(-5.0, 5.0), x_rot=Uniform(-5.0, 5.0)),
+                ),
+            ]
+        ops += [
+            (OpLambda(partial(torch.unsqueeze, dim=0)), dict(key=key)),
+            (OpAugSqueeze3Dto2D(), dict(key=key, axis_squeeze=1)),
+            (
+                OpSample(OpAugAffine2D()),
+                dict(
+                    key=key,
+                    rotate=Uniform(-10.0, 10.0),
+                    scale=Uniform(0.9, 1.1),
+                    translate=(RandInt(-5, 5), RandInt(-5, 5)),
+                    flip=(False, RandBool(0.5)),
+                    interpolation=interpolation,
+                ),
+            ),
+            (OpAugUnsqueeze3DFrom2D(), dict(key=key, axis_squeeze=1, channels=1)),
+            (OpLambda(partial(torch.squeeze, dim=0)), dict(key=key)),
+        ]
+    return ops
+
+
+def get_single_pass_ops(
+    rotation_3d: bool, elastic_alpha: float
+) -> List[Tuple[OpBase, dict]]:
+    if rotation_3d:
+        rotate = (Uniform(-10.0, 10.0), Uniform(-5.0, 5.0), Uniform(-5.0, 5.0))
+        scale = Uniform(0.9, 1.1)
+    else:
+        rotate = (Uniform(-10.0, 10.0), 0.0, 0.0)
+        scale = (1.0, Uniform(0.9, 1.1), Uniform(0.9, 1.1))
+    return [
+        (
+            OpSample(OpAugAffineElastic3D()),
+            dict(
+                keys=list(KEYS),
+                interpolation=["bilinear", "nearest"],
+                rotate=rotate,
+                scale=scale,
+                translate=(0.0, RandInt(-5, 5), RandInt(-5, 5)),
+                flip=(False, False, RandBool(0.5)),
+                elastic_alpha=elastic_alpha,
+            ),
+        )
+    ]
+
+
+def run_benchmark(volume_shape: Sequence[int], num_samples: int) -> pd.DataFrame:
+    Seed.set_seed(0)
+    rng = np.random.default_rng(0)
+    img = torch.from_numpy(rng.normal(size=volume_shape).astype(np.float32))
+    seg = (img > 1.0).float()
+
+    # transformation, pipeline name, is the baseline, ops
+    cases = [
+        (
+            "in-plane",
+            "squeeze->affine2d->unsqueeze",
+            True,
+            get_chain_ops(rotation_3d=False),
+        ),
+        (
+            "in-plane",
+            "OpAugAffineElastic3D",
+            False,
+            get_single_pass_ops(rotation_3d=False, elastic_alpha=0.0),
+        ),
+        (
+            "3d",
+            "rotation3d->squeeze->affine2d->unsqueeze",
+            True,
+            get_chain_ops(rotation_3d=True),
+        ),
+        (
+            "3d",
+            "OpAugAffineElastic3D",
+            False,
+            get_single_pass_ops(rotation_3d=True, elastic_alpha=0.0),
+        ),
+        (
+            "3d + elastic",
+            "OpAugAffineElastic3D",
+            False,
+            get_single_pass_ops(rotation_3d=True, elastic_alpha=2.0),
+        ),
+    ]
+    results = []
+    for transformation, name, is_baseline, ops in cases:
+        pipeline = PipelineDefault(name, ops)
+        elapsed = []
+        for _ in range(num_samples):
+            sample = NDict({KEYS[0]: img.clone(), KEYS[1]: seg.clone()})
+            set_sample_id(sample, 0)
+            start = time.perf_counter()
+            pipeline(sample)
+            elapsed.append(time.perf_counter() - start)
+        results.append(
+            dict(
+                transformation=transformation,
+                pipeline=name,
+                baseline=is_baseline,
+                ms_per_sample=1000.0 * np.mean(elapsed),
+            )
+        )
+    df = pd.DataFrame(results)
+    baseline = df[df.baseline].set_index("transformation").ms_per_sample
+    # elastic deformation is not supported by the existing ops, compared to the 3d chain
+    df["speedup"] = (
+        df.transformation.str.split(" ").str[0].map(baseline) / df.ms_per_sample
+    )
+    return df.drop(columns="baseline").round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--volume_shape", type=int, nargs=3, default=[64, 128, 128])
+    parser.add_argument("--num_samples", type=int, default=10)
+    args = parser.parse_args()
+
+    df = run_benchmark(args.volume_shape, args.num_samples)
+    print(get_pretty_dataframe(df))
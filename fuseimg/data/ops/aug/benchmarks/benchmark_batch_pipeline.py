@@ -0,0 +1,128 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - ISIC like augmentations (affine, color, gaussian noise) applied per sample in the dynamic pipeline
+vs. applied on the collated batch by a pipeline in batch mode (see CollateDefault batch_pipeline argument).
+If available, also applies the batch pipeline on the gpu, after moving the collated batch.
+
+Usage:
+    python fuseimg/data/ops/aug/benchmarks/benchmark_batch_pipeline.py --batch_size 32 --num_batches 5
+"""
+import argparse
+import time
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+
+from fuse.data.ops.op_base import OpBase
+from fuse.data.ops.ops_aug_common import OpRandApply, OpSample
+from fuse.data.pipelines.pipeline_default import PipelineDefault
+from fuse.data.utils.collates import CollateDefault
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.rand.param_sampler import RandBool, RandInt, Uniform
+from fuse.utils.rand.seed import Seed
+from fuseimg.data.ops.aug.color import OpAugColor, OpAugGaussian
+from fuseimg.data.ops.aug.geometry import OpAugAffine2D
+from fuseimg.data.ops.color import OpClip
+
+
+def get_ops_and_kwargs() -> List[Tuple[OpBase, dict]]:
+    key = "data.input.img"
+    return [
+        (
+            OpRandApply(OpSample(OpAugAffine2D(backend="tensor")), 0.8),
+            dict(
+                key=key,
+                rotate=Uniform(-180.0, 180.0),
+                scale=Uniform(0.9, 1.1),
+                flip=(RandBool(0.3), RandBool(0.3)),
+                translate=(RandInt(-50, 50), RandInt(-50, 50)),
+            ),
+        ),
+        (
+            OpRandApply(OpSample(OpAugColor()), 0.7),
+            dict(
+                key=key,
+                add=Uniform(-0.06, 0.06),
+                mul=Uniform(0.95, 1.05),
+                gamma=Uniform(0.9, 1.1),
+                contrast=Uniform(0.85, 1.15),
+            ),
+        ),
+        (
+            OpRandApply(OpSample(OpAugGaussian()), 0.3),
+            dict(key=key, std=0.03),
+        ),
+        (OpClip(), dict(key=key, clip=(0.0, 1.0))),
+    ]
+
+
+def run_benchmark(batch_size: int, num_batches: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    images = [
+        torch.from_numpy(rng.random((3, 300, 300), dtype=np.float32))
+        for _ in range(batch_size * num_batches)
+    ]
+    per_sample_pipeline = PipelineDefault("aug", get_ops_and_kwargs())
+    collate = CollateDefault()
+    batch_pipeline = PipelineDefault("aug", get_ops_and_kwargs(), batch_mode=True)
+    batch_collate = CollateDefault(batch_pipeline=batch_pipeline)
+    modes = ["per_sample", "batch"]
+    if torch.cuda.is_available():
+        # collate on cpu, apply the batch pipeline on the gpu
+        modes.append("batch_cuda")
+
+    results = []
+    for mode in modes:
+        Seed.set_seed(0)
+        start = time.perf_counter()
+        for batch_index in range(num_batches):
+            samples = [
+                {"data.sample_id": index, "data.input.img": images[index].clone()}
+                for index in range(
+                    batch_index * batch_size, (batch_index + 1) * batch_size
+                )
+            ]
+            if mode == "per_sample":
+                samples = [per_sample_pipeline(sample) for sample in samples]
+                collate(samples)
+            elif mode == "batch":
+                batch_collate(samples)
+            else:
+                batch_dict = collate(samples)
+                batch_dict["data.input.img"] = batch_dict["data.input.img"].cuda()
+                batch_pipeline(batch_dict)
+                torch.cuda.synchronize()
+        elapsed = time.perf_counter() - start
+        results.append(
+            dict(
+                mode=mode,
+                ms_per_batch=1000.0 * elapsed / num_batches,
+                ms_per_sample=1000.0 * elapsed / (num_batches * batch_size),
+            )
+        )
+
+    df = pd.DataFrame(results)
+    df["speedup"] = df.ms_per_batch.iloc[0] / df.ms_per_batch
+    return df.round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--num_batches", type=int, default=5)
+    args = parser.parse_args()
+
+    df = run_benchmark(args.batch_size, args.num_batches)
+    print(get_pretty_dataframe(df))
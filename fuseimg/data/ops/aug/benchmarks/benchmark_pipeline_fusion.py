@@ -0,0 +1,139 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - op fusion (see PipelineDefault.compile()): running time of each op in an ISIC like dynamic pipeline
+(affine, flip, color, clip and range ops on a 3 x 300 x 300 image) vs. the running time of the fused op.
+
+Usage:
+    python fuseimg/data/ops/aug/benchmarks/benchmark_pipeline_fusion.py --num_samples 50
+"""
+import argparse
+import time
+from collections import defaultdict
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from fuse.data.ops.op_base import OpBase, op_call
+from fuse.data.ops.ops_aug_common import OpRandApply, OpSample
+from fuse.data.ops.ops_cast import OpToTensor
+from fuse.data.ops.ops_fusion import fuse_ops
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.ndict import NDict
+from fuse.utils.rand.param_sampler import RandBool, RandInt, Uniform
+from fuse.utils.rand.seed import Seed
+from fuseimg.data.ops.aug.color import OpAugColor
+from fuseimg.data.ops.aug.geometry import OpAugAffine2D
+from fuseimg.data.ops.color import OpClip, OpToRange
+
+
+def get_ops_and_kwargs() -> List[Tuple[OpBase, dict]]:
+    key = "data.input.img"
+    return [
+        (OpToTensor(), dict(key=key)),
+        (
+            OpSample(OpAugAffine2D(backend="tensor")),
+            dict(
+                key=key,
+                rotate=Uniform(-180.0, 180.0),
+                scale=Uniform(0.9, 1.1),
+                translate=(RandInt(-50, 50), RandInt(-50, 50)),
+            ),
+        ),
+        (
+            OpRandApply(OpSample(OpAugAffine2D(backend="tensor")), 0.8),
+            dict(key=key, flip=(RandBool(0.3), RandBool(0.3))),
+        ),
+        (
+            OpRandApply(OpSample(OpAugColor()), 0.7),
+            dict(
+                key=key,
+                add=Uniform(-0.06, 0.06),
+                mul=Uniform(0.95, 1.05),
+                gamma=Uniform(0.9, 1.1),
+                contrast=Uniform(0.85, 1.15),
+            ),
+        ),
+        (OpClip(), dict(key=key, clip=(0.0, 1.0))),
+        (OpToRange(), dict(key=key, from_range=(0.0, 1.0), to_range=(-1.0, 1.0))),
+    ]
+
+
+def time_ops(
+    ops_and_kwargs: List[Tuple[OpBase, dict]],
+    op_ids: List[str],
+    images: List[np.ndarray],
+) -> dict:
+    """
+    :return: total running time in seconds per op id
+    """
+    elapsed = defaultdict(float)
+    Seed.set_seed(0)
+    for image in images:
+        sample = NDict({"data.input.img": image.copy()})
+        for op_id, (op, kwargs) in zip(op_ids, ops_and_kwargs):
+            start = time.perf_counter()
+            sample = op_call(op, sample, f"benchmark.{op_id}", **kwargs)
+            elapsed[op_id] += time.perf_counter() - start
+    return elapsed
+
+
+def run_benchmark(num_samples: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    images = [rng.random((3, 300, 300), dtype=np.float32) for _ in range(num_samples)]
+
+    ops_and_kwargs = get_ops_and_kwargs()
+    op_ids = [str(index) for index in range(len(ops_and_kwargs))]
+    fused_ops_and_kwargs, fused_op_ids = fuse_ops(ops_and_kwargs, op_ids)
+
+    results = []
+    per_op = time_ops(ops_and_kwargs, op_ids, images)
+    for op_id, (op, _) in zip(op_ids, ops_and_kwargs):
+        results.append(
+            dict(
+                pipeline="original",
+                op_id=op_id,
+                op=type(op).__name__,
+                ms_per_sample=1000.0 * per_op[op_id] / num_samples,
+            )
+        )
+    fused = time_ops(fused_ops_and_kwargs, fused_op_ids, images)
+    for op_id, (op, _) in zip(fused_op_ids, fused_ops_and_kwargs):
+        results.append(
+            dict(
+                pipeline="compiled",
+                op_id=op_id,
+                op=type(op).__name__,
+                ms_per_sample=1000.0 * fused[op_id] / num_samples,
+            )
+        )
+    for name, elapsed in [("original", per_op), ("compiled", fused)]:
+        results.append(
+            dict(
+                pipeline=name,
+                op_id="total",
+                op="",
+                ms_per_sample=1000.0 * sum(elapsed.values()) / num_samples,
+            )
+        )
+
+    return pd.DataFrame(results).round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_samples", type=int, default=50)
+    args = parser.parse_args()
+
+    df = run_benchmark(args.num_samples)
+    print(get_pretty_dataframe(df))
@@ -1,5 +1,10 @@
-from typing import List, Optional
-from fuse.data.ops.op_base import OpBase
+from typing import Callable, List, Optional
+from fuse.data.ops.ops_batch import OpBatchBase, get_batch_param, get_common_kwarg
+from fuse.data.ops.ops_fusion import (
+    FusionStepBase,
+    FusionStepElementwise,
+    OpFusibleBase,
+)
 from fuse.utils.ndict import NDict
 from fuse.utils.rand.param_sampler import Gaussian
 from fuse.data.ops.ops_cast import Cast
@@ -8,9 +13,11 @@ from torch import Tensor
 import torch
 
 
-class OpAugColor(OpBase):
+class OpAugColor(OpFusibleBase, OpBatchBase):
     """
     Color augmentation for gray scale images of any dimensions, including addition, multiplication, gamma and contrast adjusting
+    In a compiled pipeline (see PipelineDefault.compile()) floating point images are augmented in place,
+    and in batch mode (see PipelineDefault batch_mode argument) all the samples are augmented at once.
     """
 
     def __init__(self, verify_arguments: bool = True):
@@ -38,8 +45,155 @@ class OpAugColor(OpBase):
         :param contrast: contrast factor
         :param channels: Apply clipping just over the specified channels. If set to None will apply on all channels.
         """
-        aug_input = sample_dict[key]
+        sample_dict[key] = self._aug(
+            sample_dict[key], add, mul, gamma, contrast, channels, in_place=False
+        )
+        return sample_dict
+
+    def get_fusion_step(
+        self,
+        key: str,
+        add: Optional[float] = None,
+        mul: Optional[float] = None,
+        gamma: Optional[float] = None,
+        contrast: Optional[float] = None,
+        channels: Optional[List[int]] = None,
+    ) -> Optional[FusionStepBase]:
+        """
+        See OpFusibleBase
+        """
+        return FusionStepElementwise(
+            [
+                lambda aug_input: self._aug(
+                    aug_input, add, mul, gamma, contrast, channels, in_place=True
+                )
+            ]
+        )
+
+    def call_batch(
+        self,
+        batch_dict: NDict,
+        op_id: Optional[str],
+        kwargs_per_sample: List[Optional[dict]],
+    ) -> NDict:
+        """
+        See OpBatchBase. Augments a floating point batch at once and in place, each sample with its own parameters.
+        Expects the same key and channels for all the samples.
+        The result might differ from augmenting each sample separately by floating point rounding.
+        """
+        indices = [
+            index
+            for index, kwargs in enumerate(kwargs_per_sample)
+            if kwargs is not None
+        ]
+        if not indices:
+            return batch_dict
+        key = get_common_kwarg(kwargs_per_sample, "key")
+        channels = get_common_kwarg(kwargs_per_sample, "channels")
+
+        batch = batch_dict[key]
+        if not isinstance(batch, torch.Tensor) or not torch.is_floating_point(batch):
+            return super().call_batch(batch_dict, op_id, kwargs_per_sample)
+
+        all_samples = len(indices) == batch.shape[0]
+        selected = batch if all_samples else batch[indices]
+        kwargs_per_sample = [kwargs_per_sample[index] for index in indices]
+
+        # verify
+        if self._verify_arguments:
+            assert (
+                selected.min() >= 0.0 and selected.max() <= 1.0
+            ), f"Error: OpAugColor expects tensor in range [0.0-1.0]. got [{selected.min()}-{selected.max()}]"
+
+        aug_tensor = selected if channels is None else selected[:, channels]
+        aug_tensor = self._aug_batch_param(
+            aug_tensor,
+            kwargs_per_sample,
+            "add",
+            lambda aug_input, add: aug_input.add_(add).clamp_(0.0, 1.0),
+        )
+        aug_tensor = self._aug_batch_param(
+            aug_tensor,
+            kwargs_per_sample,
+            "mul",
+            lambda aug_input, mul: aug_input.mul_(mul).clamp_(0.0, 1.0),
+        )
+        aug_tensor = self._aug_batch_param(
+            aug_tensor,
+            kwargs_per_sample,
+            "gamma",
+            lambda aug_input, gamma: aug_input.pow_(gamma).clamp_(0.0, 1.0),
+        )
+        aug_tensor = self._aug_batch_param(
+            aug_tensor, kwargs_per_sample, "contrast", self._aug_contrast_batch
+        )
+
+        if channels is not None:
+            selected[:, channels] = aug_tensor
+            aug_tensor = selected
+        if all_samples:
+            batch_dict[key] = aug_tensor
+        else:
+            batch[indices] = aug_tensor
+        return batch_dict
+
+    @staticmethod
+    def _aug_batch_param(
+        aug_tensor: Tensor,
+        kwargs_per_sample: List[dict],
+        name: str,
+        func: Callable[[Tensor, Tensor], Tensor],
+    ) -> Tensor:
+        """
+        Apply func(aug_input, param) on the samples that set the argument name, param shape is [num_samples, 1, 1, ...]
+        func may modify aug_input in place
+        """
+        indices = [
+            index
+            for index, kwargs in enumerate(kwargs_per_sample)
+            if kwargs.get(name, None) is not None
+        ]
+        if not indices:
+            return aug_tensor
+        if len(indices) == len(kwargs_per_sample):
+            return func(
+                aug_tensor, get_batch_param(kwargs_per_sample, name, None, aug_tensor)
+            )
+        selected_kwargs = [kwargs_per_sample[index] for index in indices]
+        aug_tensor[indices] = func(
+            aug_tensor[indices],
+            get_batch_param(selected_kwargs, name, None, aug_tensor),
+        )
+        return aug_tensor
+
+    @staticmethod
+    def _aug_contrast_batch(aug_input: Tensor, factor: Tensor) -> Tensor:
+        """
+        Batched, in place, aug_op_contrast - the mean is calculated per sample
+        """
+        calculated_mean = aug_input.mean(
+            dim=tuple(range(1, aug_input.dim())), keepdim=True
+        )
+        return (
+            aug_input.sub_(calculated_mean)
+            .mul_(factor)
+            .add_(calculated_mean)
+            .clamp_(0.0, 1.0)
+        )
 
+    def _aug(
+        self,
+        aug_input: Tensor,
+        add: Optional[float],
+        mul: Optional[float],
+        gamma: Optional[float],
+        contrast: Optional[float],
+        channels: Optional[List[int]],
+        in_place: bool,
+    ) -> Tensor:
+        """
+        :param in_place: allow to modify aug_input in place - used when fused, the result is identical
+        """
         # verify
         if self._verify_arguments:
             assert isinstance(
@@ -49,6 +203,9 @@ class OpAugColor(OpBase):
                 aug_input.min() >= 0.0 and aug_input.max() <= 1.0
             ), f"Error: OpAugColor expects tensor in range [0.0-1.0]. got [{aug_input.min()}-{aug_input.max()}]"
 
+        if in_place and channels is None and torch.is_floating_point(aug_input):
+            return self.aug_in_place(aug_input, add, mul, gamma, contrast)
+
         aug_tensor = aug_input
         if channels is None:
             if add is not None:
@@ -73,8 +230,33 @@ class OpAugColor(OpBase):
                     aug_tensor[channels], contrast
                 )
 
-        sample_dict[key] = aug_tensor
-        return sample_dict
+        return aug_tensor
+
+    @staticmethod
+    def aug_in_place(
+        aug_tensor: Tensor,
+        add: Optional[float] = None,
+        mul: Optional[float] = None,
+        gamma: Optional[float] = None,
+        contrast: Optional[float] = None,
+    ) -> Tensor:
+        """
+        Same as applying aug_op_add_col, aug_op_mul_col, aug_op_gamma (gain 1.0) and aug_op_contrast, without allocating new tensors
+        :param aug_tensor: floating point tensor to augment in place
+        :return: the augmented tensor
+        """
+        if add is not None:
+            aug_tensor.add_(add).clamp_(0.0, 1.0)
+        if mul is not None:
+            aug_tensor.mul_(mul).clamp_(0.0, 1.0)
+        if gamma is not None:
+            aug_tensor.pow_(gamma).clamp_(0.0, 1.0)
+        if contrast is not None:
+            calculated_mean = aug_tensor.mean()
+            aug_tensor.sub_(calculated_mean).mul_(contrast).add_(
+                calculated_mean
+            ).clamp_(0.0, 1.0)
+        return aug_tensor
 
     @staticmethod
     def aug_op_add_col(aug_input: Tensor, add: float) -> Tensor:
@@ -126,8 +308,14 @@ class OpAugColor(OpBase):
         input_tensor = OpClip.clip(input_tensor, clip=(0.0, 1.0))
         return input_tensor
 
+    def is_random(self) -> bool:
+        """
+        See OpBase - the random arguments are drawn by the caller, given the arguments the op is deterministic
+        """
+        return False
+
 
-class OpAugGaussian(OpBase):
+class OpAugGaussian(OpBatchBase):
     """
     Add gaussian noise to numpy array or torch tensor of any dimensions
     """
@@ -161,3 +349,55 @@ class OpAugGaussian(OpBase):
 
         sample_dict[key] = aug_tensor
         return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return True
+
+    def call_batch(
+        self,
+        batch_dict: NDict,
+        op_id: Optional[str],
+        kwargs_per_sample: List[Optional[dict]],
+    ) -> NDict:
+        """
+        See OpBatchBase. The noise of all the samples is drawn at once by torch, on the device of the batch,
+        each sample with its own mean and std, and added in place. Expects the same key and channels for all the samples.
+        """
+        indices = [
+            index
+            for index, kwargs in enumerate(kwargs_per_sample)
+            if kwargs is not None
+        ]
+        if not indices:
+            return batch_dict
+        key = get_common_kwarg(kwargs_per_sample, "key")
+        channels = get_common_kwarg(kwargs_per_sample, "channels")
+
+        batch = batch_dict[key]
+        if not isinstance(batch, torch.Tensor):
+            return super().call_batch(batch_dict, op_id, kwargs_per_sample)
+
+        all_samples = len(indices) == batch.shape[0]
+        selected = batch if all_samples else batch[indices]
+        kwargs_per_sample = [kwargs_per_sample[index] for index in indices]
+
+        aug_tensor = selected if channels is None else selected[:, channels]
+        mean = get_batch_param(kwargs_per_sample, "mean", 0.0, aug_tensor)
+        std = get_batch_param(kwargs_per_sample, "std", 0.03, aug_tensor)
+        rand_patch = (
+            torch.randn(aug_tensor.shape, dtype=mean.dtype, device=mean.device) * std
+            + mean
+        )
+        aug_tensor = aug_tensor.add_(rand_patch.to(aug_tensor.dtype))
+
+        if channels is not None:
+            selected[:, channels] = aug_tensor
+            aug_tensor = selected
+        if all_samples:
+            batch_dict[key] = aug_tensor
+        else:
+            batch[indices] = aug_tensor
+        return batch_dict
@@ -1,4 +1,5 @@
-from typing import List, Optional, Tuple, Union, Dict, Any
+from typing import List, Optional, Sequence, Tuple, Union, Dict, Any
+import random
 
 from PIL import Image
 
@@ -12,19 +13,48 @@ import skimage.transform
 from fuse.utils.ndict import NDict
 
 from fuse.data import OpBase
+from fuse.data.ops.op_base import OpReversibleBase
+from fuse.data.ops.ops_batch import OpBatchBase, get_common_kwarg
+from fuse.data.ops.ops_fusion import FusionStepBase, OpFusibleBase
+from fuse.data.utils.lazy_array import LazyArray
 
 
-class OpAugAffine2D(OpBase):
+class OpAugAffine2D(OpFusibleBase, OpBatchBase):
     """
     2D affine transformation
+    Two backends:
+        "pil" (default) - per channel PIL round trip, followed by flips.
+        "tensor" - rotation, scale, shear, translation and flip are composed into a single affine matrix
+                   and all the channels are resampled at once using torch grid_sample.
+                   Consecutive affine transformations are resampled once in a compiled pipeline (see PipelineDefault.compile()),
+                   and in batch mode all the samples are resampled at once (see PipelineDefault batch_mode argument).
+    The backends give the same values, except for pixels near the image border (sampled partially outside of the image),
+    and rounding of integer images (up to 1).
+    The default backend will change to "tensor" in a future release - set backend explicitly to keep the current behavior.
     """
 
-    def __init__(self, verify_arguments: bool = True):
+    BACKENDS = ("tensor", "pil")
+
+    def __init__(
+        self,
+        verify_arguments: bool = True,
+        backend: str = "pil",
+        compute_dtype: torch.dtype = torch.float32,
+    ):
         """
         :param verify_arguments: this op expects torch tensor with either 2 or 3 dimensions. Set to False to disable verification
+        :param backend: "pil" - per channel using PIL, or "tensor" - a single resample of all the channels using torch
+        :param compute_dtype: the floating point type used to resample (tensor backend only), e.g. torch.float16 to save memory.
+                              The output has the same dtype as the input.
         """
         super().__init__()
+        if backend not in self.BACKENDS:
+            raise Exception(
+                f"Error: unsupported backend {backend}, supported backends are {self.BACKENDS}"
+            )
         self._verify_arguments = verify_arguments
+        self._backend = backend
+        self._compute_dtype = compute_dtype
 
     def __call__(
         self,
@@ -46,7 +76,7 @@ class OpAugAffine2D(OpBase):
         :param flip: flip per spatial axis flip[0] for vertical flip and flip[1] for horizontal flip
         :param shear: shear factor
         :param channels: apply the augmentation on the specified channels. Set to None to apply to all channels.
-        :param interpolation: used PIL interpolation method see TTF.affine for details.
+        :param interpolation: interpolation method see TTF.affine for details. The tensor backend supports NEAREST, BILINEAR and BICUBIC.
         :return: the augmented image
         """
         aug_input = sample_dict[key]
@@ -68,9 +98,185 @@ class OpAugAffine2D(OpBase):
         else:
             remember_to_squeeze = False
 
-        # convert to PIL (required by affine augmentation function)
         if channels is None:
             channels = list(range(aug_input.shape[0]))
+
+        if self._backend == "tensor":
+            aug_tensor = aug_input
+            aug_tensor[channels] = self._affine_tensor(
+                aug_input[channels],
+                rotate=rotate,
+                translate=translate,
+                scale=scale,
+                flip=flip,
+                shear=shear,
+                interpolation=interpolation,
+            )
+        else:
+            aug_tensor = self._affine_pil(
+                aug_input,
+                rotate=rotate,
+                translate=translate,
+                scale=scale,
+                flip=flip,
+                shear=shear,
+                channels=channels,
+                interpolation=interpolation,
+            )
+
+        # squeeze back to 2-dim if needed
+        if remember_to_squeeze:
+            aug_tensor = aug_tensor.squeeze(dim=0)
+
+        sample_dict[key] = aug_tensor
+        return sample_dict
+
+    def get_fusion_step(
+        self,
+        key: str,
+        rotate: float = 0.0,
+        translate: Tuple[float, float] = (0.0, 0.0),
+        scale: Tuple[float, float] = 1.0,
+        flip: Tuple[bool, bool] = (False, False),
+        shear: float = 0.0,
+        channels: Optional[List[int]] = None,
+        interpolation: int = transforms.InterpolationMode.BILINEAR,
+    ) -> Optional[FusionStepBase]:
+        """
+        See OpFusibleBase. Supported by the tensor backend only.
+        """
+        if self._backend != "tensor":
+            return None
+        matrix = self._get_matrix(
+            rotate=rotate, translate=translate, scale=scale, flip=flip, shear=shear
+        )
+        return FusionStepAffine2D(
+            matrix,
+            channels=channels,
+            interpolation=interpolation,
+            compute_dtype=self._compute_dtype,
+            verify_arguments=self._verify_arguments,
+        )
+
+    def call_batch(
+        self,
+        batch_dict: NDict,
+        op_id: Optional[str],
+        kwargs_per_sample: List[Optional[dict]],
+    ) -> NDict:
+        """
+        See OpBatchBase. With the tensor backend, all the samples are resampled in a single grid_sample call, with a matrix per sample.
+        Expects the same key, channels and interpolation for all the samples.
+        """
+        if self._backend != "tensor":
+            return super().call_batch(batch_dict, op_id, kwargs_per_sample)
+        indices = [
+            index
+            for index, kwargs in enumerate(kwargs_per_sample)
+            if kwargs is not None
+        ]
+        if not indices:
+            return batch_dict
+        key = get_common_kwarg(kwargs_per_sample, "key")
+        channels = get_common_kwarg(kwargs_per_sample, "channels")
+        interpolation = get_common_kwarg(
+            kwargs_per_sample, "interpolation", transforms.InterpolationMode.BILINEAR
+        )
+
+        batch = batch_dict[key]
+        if self._verify_arguments:
+            assert isinstance(
+                batch, torch.Tensor
+            ), f"Error: OpAugAffine2D expects torch Tensor, got {type(batch)}"
+            assert len(batch.shape) in [
+                3,
+                4,
+            ], f"Error: OpAugAffine2D expects a batch of tensors with 2 or 3 dimensions. got {batch.shape}"
+
+        # Support for 2D inputs - implicit single channel
+        images = batch.unsqueeze(dim=1) if len(batch.shape) == 3 else batch
+
+        matrices = np.stack(
+            [
+                self._get_matrix(
+                    **{
+                        name: value
+                        for name, value in kwargs_per_sample[index].items()
+                        if name not in ("key", "channels", "interpolation")
+                    }
+                )
+                for index in indices
+            ]
+        )
+        all_samples = len(indices) == images.shape[0]
+        selected = images if all_samples else images[indices]
+        if channels is None:
+            output = affine_resample_2d_batch(
+                selected, matrices, interpolation, self._compute_dtype
+            )
+        else:
+            output = selected
+            output[:, channels] = affine_resample_2d_batch(
+                selected[:, channels], matrices, interpolation, self._compute_dtype
+            )
+        if all_samples:
+            images = output
+        else:
+            images[indices] = output
+
+        # squeeze back to 2-dim if needed
+        batch_dict[key] = images.squeeze(dim=1) if len(batch.shape) == 3 else images
+        return batch_dict
+
+    @staticmethod
+    def _get_matrix(
+        rotate: float = 0.0,
+        translate: Tuple[float, float] = (0.0, 0.0),
+        scale: float = 1.0,
+        flip: Tuple[bool, bool] = (False, False),
+        shear: float = 0.0,
+    ) -> np.ndarray:
+        # inverse matrix in pixel coordinates relative to the image center (same convention as TTF.affine for tensors)
+        matrix = affine_matrix_2d(
+            rotate=rotate, translate=translate, scale=scale, shear=shear
+        )
+        # flip the output image - compose with a reflection of the output coordinates
+        return matrix @ np.diag(
+            [-1.0 if flip[1] else 1.0, -1.0 if flip[0] else 1.0, 1.0]
+        )
+
+    def _affine_tensor(
+        self,
+        aug_input: torch.Tensor,
+        rotate: float,
+        translate: Tuple[float, float],
+        scale: float,
+        flip: Tuple[bool, bool],
+        shear: float,
+        interpolation: transforms.InterpolationMode,
+    ) -> torch.Tensor:
+        """
+        Resample all the channels at once, shape [num_channels, height, width]
+        """
+        matrix = self._get_matrix(
+            rotate=rotate, translate=translate, scale=scale, flip=flip, shear=shear
+        )
+        return affine_resample_2d(
+            aug_input, matrix, interpolation, compute_dtype=self._compute_dtype
+        )
+
+    @staticmethod
+    def _affine_pil(
+        aug_input: torch.Tensor,
+        rotate: float,
+        translate: Tuple[float, float],
+        scale: float,
+        flip: Tuple[bool, bool],
+        shear: float,
+        channels: List[int],
+        interpolation: transforms.InterpolationMode,
+    ) -> torch.Tensor:
+        # convert to PIL (required by affine augmentation function)
         aug_tensor = aug_input
         for channel in channels:
             aug_channel_tensor = aug_input[channel].numpy()
@@ -94,13 +300,176 @@ class OpAugAffine2D(OpBase):
 
             # set the augmented channel
             aug_tensor[channel] = aug_channel_tensor
+        return aug_tensor
 
-        # squeeze back to 2-dim if needed
-        if remember_to_squeeze:
-            aug_tensor = aug_tensor.squeeze(dim=0)
+    def is_random(self) -> bool:
+        """
+        See OpBase - the random arguments are drawn by the caller, given the arguments the op is deterministic
+        """
+        return False
 
-        sample_dict[key] = aug_tensor
-        return sample_dict
+
+def affine_matrix_2d(
+    rotate: float = 0.0,
+    translate: Tuple[float, float] = (0.0, 0.0),
+    scale: float = 1.0,
+    shear: Union[float, Tuple[float, float]] = 0.0,
+) -> np.ndarray:
+    """
+    Inverse affine matrix (output pixel -> input pixel), in pixel coordinates relative to the image center.
+    Rotation, scale and shear are around the image center, followed by translation - same parameters as TTF.affine.
+    :return: 3x3 matrix
+    """
+    if isinstance(shear, (int, float)):
+        shear = (shear, 0.0)
+    rot = np.radians(rotate)
+    sx = np.radians(shear[0])
+    sy = np.radians(shear[1])
+    tx, ty = translate
+
+    # rotation, scale and shear matrix (see TTF._get_inverse_affine_matrix)
+    a = np.cos(rot - sy) / np.cos(sy)
+    b = -np.cos(rot - sy) * np.tan(sx) / np.cos(sy) - np.sin(rot)
+    c = np.sin(rot - sy) / np.cos(sy)
+    d = -np.sin(rot - sy) * np.tan(sx) / np.cos(sy) + np.cos(rot)
+
+    # inverse of rotation, scale and shear, followed by inverse of the translation
+    inv_rss = np.array([[d, -b], [-c, a]]) / scale
+    matrix = np.eye(3)
+    matrix[:2, :2] = inv_rss
+    matrix[:2, 2] = inv_rss @ np.array([-tx, -ty])
+    return matrix
+
+
+def affine_resample_2d(
+    image: torch.Tensor,
+    matrix: np.ndarray,
+    interpolation: transforms.InterpolationMode = transforms.InterpolationMode.BILINEAR,
+    compute_dtype: torch.dtype = torch.float32,
+) -> torch.Tensor:
+    """
+    Resample all the channels at once using torch grid_sample
+    :param image: tensor of shape [num_channels, height, width]
+    :param matrix: inverse affine matrix (output pixel -> input pixel) relative to the image center, see affine_matrix_2d()
+    :param interpolation: NEAREST, BILINEAR or BICUBIC
+    :param compute_dtype: the floating point type used to resample. float16 is replaced by float32 on cpu.
+    :return: the resampled image, same shape and dtype as the input
+    """
+    return affine_resample_2d_batch(
+        image.unsqueeze(0), matrix[np.newaxis], interpolation, compute_dtype
+    )[0]
+
+
+def affine_resample_2d_batch(
+    images: torch.Tensor,
+    matrices: np.ndarray,
+    interpolation: transforms.InterpolationMode = transforms.InterpolationMode.BILINEAR,
+    compute_dtype: torch.dtype = torch.float32,
+) -> torch.Tensor:
+    """
+    Batched version of affine_resample_2d() - a different matrix per image, a single grid_sample call
+    :param images: tensor of shape [batch_size, num_channels, height, width]
+    :param matrices: inverse affine matrices, shape [batch_size, 3, 3]
+    :return: the resampled images, same shape and dtype as the input
+    """
+    height, width = images.shape[-2:]
+    # convert to normalized coordinates in range [-1, 1]
+    norm = np.diag([width / 2.0, height / 2.0, 1.0])
+    theta = np.linalg.inv(norm) @ matrices @ norm
+
+    if images.device.type == "cpu" and compute_dtype == torch.float16:
+        # half precision resampling is not supported on cpu
+        compute_dtype = torch.float32
+    batch = images.to(compute_dtype)
+    theta = torch.tensor(theta[:, :2], dtype=compute_dtype, device=images.device)
+    grid = torch.nn.functional.affine_grid(
+        theta, list(batch.shape), align_corners=False
+    )
+    output = torch.nn.functional.grid_sample(
+        batch,
+        grid,
+        mode=transforms.InterpolationMode(interpolation).value,
+        padding_mode="zeros",
+        align_corners=False,
+    )
+
+    if not torch.is_floating_point(images):
+        output = output.round()
+        if images.dtype == torch.uint8:
+            output = output.clamp(0, 255)
+    return output.to(images.dtype)
+
+
+class FusionStepAffine2D(FusionStepBase):
+    """
+    The fusible part of OpAugAffine2D (see OpFusibleBase).
+    Consecutive affine transformations with the same channels and interpolation are composed into a single matrix and resampled once.
+    Note that the result is close to, but not bitwise identical to, resampling after each transformation
+    (a single interpolation, and integer images are not rounded in between).
+    """
+
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        channels: Optional[List[int]],
+        interpolation: transforms.InterpolationMode,
+        compute_dtype: torch.dtype,
+        verify_arguments: bool,
+    ):
+        """
+        :param matrix: inverse affine matrix, see affine_matrix_2d()
+        See OpAugAffine2D for the other arguments
+        """
+        self._matrix = matrix
+        self._channels = channels
+        self._interpolation = interpolation
+        self._compute_dtype = compute_dtype
+        self._verify_arguments = verify_arguments
+
+    def merge(self, other: FusionStepBase) -> Optional[FusionStepBase]:
+        if (
+            not isinstance(other, FusionStepAffine2D)
+            or self._channels != other._channels
+            or self._interpolation != other._interpolation
+            or self._compute_dtype != other._compute_dtype
+        ):
+            return None
+        # other is applied on the output of self: output pixel -> self output pixel -> input pixel
+        return FusionStepAffine2D(
+            self._matrix @ other._matrix,
+            channels=self._channels,
+            interpolation=self._interpolation,
+            compute_dtype=self._compute_dtype,
+            verify_arguments=self._verify_arguments or other._verify_arguments,
+        )
+
+    def apply(self, value: Any, owned: bool) -> Tuple[Any, bool]:
+        if self._verify_arguments:
+            assert isinstance(
+                value, torch.Tensor
+            ), f"Error: OpAugAffine2D expects torch Tensor, got {type(value)}"
+            assert len(value.shape) in [
+                2,
+                3,
+            ], f"Error: OpAugAffine2D expects tensor with 2 or 3 dimensions. got {value.shape}"
+
+        # Support for 2D inputs - implicit single channel
+        image = value.unsqueeze(dim=0) if len(value.shape) == 2 else value
+        if self._channels is None:
+            output = affine_resample_2d(
+                image, self._matrix, self._interpolation, self._compute_dtype
+            )
+        else:
+            output = image if owned else image.clone()
+            output[self._channels] = affine_resample_2d(
+                image[self._channels],
+                self._matrix,
+                self._interpolation,
+                self._compute_dtype,
+            )
+        if len(value.shape) == 2:
+            output = output.squeeze(dim=0)
+        return output, True
 
 
 class OpAugCropAndResize2D(OpBase):
@@ -186,6 +555,12 @@ class OpAugCropAndResize2D(OpBase):
         sample_dict[key] = aug_tensor
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase - the random arguments are drawn by the caller, given the arguments the op is deterministic
+        """
+        return False
+
 
 class OpAugSqueeze3Dto2D(OpBase):
     """
@@ -236,6 +611,12 @@ class OpAugSqueeze3Dto2D(OpBase):
         sample_dict[key] = aug_output
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase - the random arguments are drawn by the caller, given the arguments the op is deterministic
+        """
+        return False
+
 
 class OpAugUnsqueeze3DFrom2D(OpBase):
     """
@@ -290,10 +671,17 @@ class OpAugUnsqueeze3DFrom2D(OpBase):
         sample_dict[key] = aug_output
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase - the random arguments are drawn by the caller, given the arguments the op is deterministic
+        """
+        return False
+
 
 class OpCrop3D(OpBase):
     """
     crop to certain size. if the image is smaller than the size then its padded.
+    Given a LazyArray (see OpLoadImage lazy argument), only the cropped region will be read.
     """
 
     def __call__(
@@ -332,11 +720,22 @@ class OpCrop3D(OpBase):
             crop_start = round(x_move * (width - output_shape[2]))
             aug_input = aug_input[:, :, crop_start : crop_start + output_shape[2]]
 
+        if isinstance(aug_input, LazyArray):
+            # only the cropped region is read
+            aug_input = aug_input.numpy(np.float32)
+        if isinstance(aug_input, np.ndarray):
+            aug_input = torch.from_numpy(np.ascontiguousarray(aug_input))
         aug_tensor[:depth, :height, :width] = aug_input
         sample_dict[key] = aug_tensor
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpResizeTo(OpBase):
     """
@@ -413,6 +812,12 @@ class OpResizeTo(OpBase):
         perm = tuple(perm)
         return perm
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpRotation3D(OpBase):
     def __call__(
@@ -449,3 +854,390 @@ class OpRotation3D(OpBase):
 
         sample_dict[key] = aug_input
         return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
+
+class OpAugAffineElastic3D(OpReversibleBase):
+    """
+    Single pass 3D augmentation: rotation (about any of the 3 axes), scale, translation, flip and elastic deformation
+    are composed into a single sampling grid, and all the given volumes (e.g. an image and its segmentation mask) are resampled once
+    using torch grid_sample (multithreaded on cpu, see torch.set_num_threads()).
+    An alternative to OpAugSqueeze3Dto2D -> OpAugAffine2D -> OpAugUnsqueeze3DFrom2D and OpRotation3D, which permute, reshape and resample the volume a few times.
+    The elastic deformation is determined by elastic_seed (drawn if not specified). The applied arguments are stored in sample_dict[op_id],
+    such that the same augmentation can be replayed: op(other_sample_dict, op_id, keys=keys, **sample_dict[op_id])
+    reverse() applies the inverse of the affine part (rotation, scale, translation and flip), the elastic deformation is not reversed.
+
+    Example:
+        (OpSample(OpAugAffineElastic3D()), dict(
+            keys=["data.input.img", "data.gt.seg"],
+            interpolation=["bilinear", "nearest"],
+            rotate=(Uniform(-10.0, 10.0), Uniform(-10.0, 10.0), Uniform(-10.0, 10.0)),
+            scale=Uniform(0.9, 1.1),
+            flip=(False, False, RandBool(0.5)),
+            elastic_alpha=Uniform(0.0, 2.0),
+        )),
+    """
+
+    INTERPOLATIONS = (
+        transforms.InterpolationMode.NEAREST,
+        transforms.InterpolationMode.BILINEAR,
+    )
+
+    def __call__(
+        self,
+        sample_dict: NDict,
+        op_id: Optional[str],
+        keys: Union[str, Sequence[str]],
+        rotate: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+        scale: Union[float, Tuple[float, float, float]] = 1.0,
+        translate: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+        flip: Tuple[bool, bool, bool] = (False, False, False),
+        elastic_alpha: float = 0.0,
+        elastic_control_points: Union[int, Tuple[int, int, int]] = 4,
+        elastic_seed: Optional[int] = None,
+        interpolation: Union[
+            transforms.InterpolationMode, Sequence[transforms.InterpolationMode]
+        ] = transforms.InterpolationMode.BILINEAR,
+        padding_mode: str = "zeros",
+    ) -> NDict:
+        """
+        :param keys: key or keys to numpy arrays or tensors stored in sample_dict, all with the same spatial shape [depth, height, width].
+                     Either shape [depth, height, width] or [num_channels, depth, height, width].
+        :param rotate: rotation angles in degrees about the depth (z), height (y) and width (x) axes, e.g. rotate[0] rotates the y-x plane
+        :param scale: scale factor, or scale factor per spatial axis
+        :param translate: translation per spatial axis (number of voxels)
+        :param flip: flip per spatial axis
+        :param elastic_alpha: the standard deviation of the elastic displacement (number of voxels) at each control point. Set to 0.0 to disable.
+        :param elastic_control_points: the number of control points per spatial axis, the displacement is linearly interpolated in between
+        :param elastic_seed: the seed of the random elastic displacement. Drawn if not specified.
+        :param interpolation: NEAREST (use for segmentation masks) or BILINEAR (trilinear), or interpolation per key
+        :param padding_mode: see torch grid_sample, "zeros", "border" or "reflection"
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+        if isinstance(interpolation, (str, transforms.InterpolationMode)):
+            interpolation = [interpolation] * len(keys)
+        if len(interpolation) != len(keys):
+            raise Exception(
+                f"Error: expecting interpolation per key, got keys {keys} and interpolation {interpolation}"
+            )
+        interpolation = [transforms.InterpolationMode(mode) for mode in interpolation]
+        for mode in interpolation:
+            if mode not in self.INTERPOLATIONS:
+                raise Exception(
+                    f"Error: unsupported interpolation {mode}, supported interpolations are {self.INTERPOLATIONS}"
+                )
+        if elastic_alpha > 0.0 and elastic_seed is None:
+            elastic_seed = random.randint(0, 2**31 - 1)
+
+        volumes = [_as_volume_tensor(sample_dict[key]) for key in keys]
+        spatial_shape = tuple(volumes[0].shape[-3:])
+        for key, volume in zip(keys, volumes):
+            if tuple(volume.shape[-3:]) != spatial_shape:
+                raise Exception(
+                    f"Error: OpAugAffineElastic3D expects volumes with the same spatial shape, got {spatial_shape} and {tuple(volume.shape[-3:])} ({key})"
+                )
+
+        grid = affine_elastic_grid_3d(
+            spatial_shape,
+            rotate=rotate,
+            scale=scale,
+            translate=translate,
+            flip=flip,
+            elastic_alpha=elastic_alpha,
+            elastic_control_points=elastic_control_points,
+            elastic_seed=elastic_seed,
+            device=volumes[0].device,
+        )
+
+        # all the volumes with the same interpolation are resampled in a single call
+        for mode in set(interpolation):
+            indices = [
+                index for index, other in enumerate(interpolation) if other == mode
+            ]
+            outputs = _grid_sample_volumes(
+                [volumes[index] for index in indices], grid, mode, padding_mode
+            )
+            for index, volume_output in zip(indices, outputs):
+                key = keys[index]
+                if isinstance(sample_dict[key], np.ndarray):
+                    volume_output = volume_output.numpy()
+                sample_dict[key] = volume_output
+
+        if op_id is not None:
+            sample_dict[op_id] = dict(
+                rotate=tuple(rotate),
+                scale=scale,
+                translate=tuple(translate),
+                flip=tuple(flip),
+                elastic_alpha=elastic_alpha,
+                elastic_control_points=elastic_control_points,
+                elastic_seed=elastic_seed,
+                interpolation=[mode.value for mode in interpolation],
+                padding_mode=padding_mode,
+            )
+        return sample_dict
+
+    def reverse(
+        self,
+        sample_dict: NDict,
+        key_to_reverse: str,
+        key_to_follow: str,
+        op_id: Optional[str],
+    ) -> dict:
+        """
+        Applies the inverse of the affine transformation (rotation, scale, translation and flip) stored in sample_dict[op_id].
+        The elastic deformation is not reversed (treated as identity), so the result is exact (up to interpolation and the voxels that were
+        moved outside of the volume) only if elastic_alpha is 0.0.
+        Values with an integer dtype (e.g. segmentation masks) are resampled with NEAREST interpolation, other values with BILINEAR.
+        See super class for the arguments
+        """
+        args = sample_dict[op_id]
+        value = sample_dict[key_to_reverse]
+        volume = _as_volume_tensor(value)
+        grid = affine_inverse_grid_3d(
+            tuple(volume.shape[-3:]),
+            rotate=args["rotate"],
+            scale=args["scale"],
+            translate=args["translate"],
+            flip=args["flip"],
+            device=volume.device,
+        )
+        mode = (
+            transforms.InterpolationMode.BILINEAR
+            if torch.is_floating_point(volume)
+            else transforms.InterpolationMode.NEAREST
+        )
+        (volume_output,) = _grid_sample_volumes(
+            [volume], grid, mode, args["padding_mode"]
+        )
+        if isinstance(value, np.ndarray):
+            volume_output = volume_output.numpy()
+        sample_dict[key_to_reverse] = volume_output
+        return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase - draws the elastic seed if not specified
+        """
+        return True
+
+
+def _grid_sample_volumes(
+    volumes: List[torch.Tensor],
+    grid: torch.Tensor,
+    mode: transforms.InterpolationMode,
+    padding_mode: str,
+) -> List[torch.Tensor]:
+    """
+    Resamples the volumes (with the same spatial shape) in a single grid_sample call
+    :param volumes: tensors of shape [depth, height, width] or [num_channels, depth, height, width]
+    :param grid: see affine_elastic_grid_3d()
+    :return: the resampled volumes, with the shape and the dtype of the input volumes
+    """
+    spatial_shape = tuple(volumes[0].shape[-3:])
+    channels = [volume if volume.dim() == 4 else volume[None] for volume in volumes]
+    batch = torch.cat([channel.to(grid.dtype) for channel in channels])
+    if grid.dim() == 3:
+        # in-plane transformation, the slices are resampled as channels
+        batch = batch.reshape((1, -1) + spatial_shape[1:])
+    else:
+        batch = batch[None]
+    output = torch.nn.functional.grid_sample(
+        batch,
+        grid[None],
+        mode=mode.value,
+        padding_mode=padding_mode,
+        align_corners=False,
+    ).reshape((-1,) + spatial_shape)
+    outputs = []
+    for volume, volume_output in zip(
+        volumes, torch.split(output, [channel.shape[0] for channel in channels])
+    ):
+        if volume.dim() == 3:
+            volume_output = volume_output[0]
+        if not torch.is_floating_point(volume):
+            volume_output = volume_output.round()
+            if volume.dtype == torch.uint8:
+                volume_output = volume_output.clamp(0, 255)
+        outputs.append(volume_output.to(volume.dtype))
+    return outputs
+
+
+def _as_volume_tensor(value: Any) -> torch.Tensor:
+    """
+    :return: a tensor sharing the memory with value (numpy array or tensor) when possible
+    """
+    if isinstance(value, torch.Tensor):
+        return value
+    return torch.from_numpy(np.ascontiguousarray(value))
+
+
+def affine_matrix_3d(
+    rotate: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+    scale: Union[float, Tuple[float, float, float]] = 1.0,
+) -> np.ndarray:
+    """
+    Forward rotation and scale matrix in (z, y, x) voxel coordinates
+    :param rotate: rotation angles in degrees about the z, y and x axes
+    :param scale: scale factor, or scale factor per axis
+    :return: 3x3 matrix
+    """
+    if isinstance(scale, (int, float)):
+        scale = (scale, scale, scale)
+    z_rot, y_rot, x_rot = np.radians(rotate)
+    # rotation about the z axis rotates the y-x plane, etc.
+    rot_z = np.array(
+        [
+            [1.0, 0.0, 0.0],
+            [0.0, np.cos(z_rot), -np.sin(z_rot)],
+            [0.0, np.sin(z_rot), np.cos(z_rot)],
+        ]
+    )
+    rot_y = np.array(
+        [
+            [np.cos(y_rot), 0.0, np.sin(y_rot)],
+            [0.0, 1.0, 0.0],
+            [-np.sin(y_rot), 0.0, np.cos(y_rot)],
+        ]
+    )
+    rot_x = np.array(
+        [
+            [np.cos(x_rot), -np.sin(x_rot), 0.0],
+            [np.sin(x_rot), np.cos(x_rot), 0.0],
+            [0.0, 0.0, 1.0],
+        ]
+    )
+    return rot_z @ rot_y @ rot_x @ np.diag(np.asarray(scale, dtype=np.float64))
+
+
+def affine_elastic_grid_3d(
+    shape: Tuple[int, int, int],
+    rotate: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+    scale: Union[float, Tuple[float, float, float]] = 1.0,
+    translate: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+    flip: Tuple[bool, bool, bool] = (False, False, False),
+    elastic_alpha: float = 0.0,
+    elastic_control_points: Union[int, Tuple[int, int, int]] = 4,
+    elastic_seed: Optional[int] = None,
+    device: Union[str, torch.device] = "cpu",
+) -> torch.Tensor:
+    """
+    The sampling grid of torch grid_sample (align_corners=False) for OpAugAffineElastic3D.
+    Output voxel p (relative to the volume center) samples input voxel A^-1 (flip(p) + elastic(p) - translate), where A is the rotation and scale matrix.
+    :param shape: the spatial shape [depth, height, width]
+    See OpAugAffineElastic3D for the other arguments
+    :return: float32 tensor of shape [depth, height, width, 3] (x, y, z normalized coordinates).
+             If the depth axis is kept as is (an in-plane transformation without elastic deformation), a 2D grid of shape [height, width, 2] (x, y),
+             to resample each slice (2D grid_sample is significantly faster than 3D grid_sample).
+    """
+    inv_matrix = np.linalg.inv(affine_matrix_3d(rotate=rotate, scale=scale))
+    matrix = inv_matrix @ np.diag([-1.0 if axis_flip else 1.0 for axis_flip in flip])
+    offset = -inv_matrix @ np.asarray(translate, dtype=np.float64)
+
+    if elastic_alpha <= 0.0 and _is_in_plane(matrix, offset):
+        return _affine_grid(shape[1:], matrix[1:, 1:], offset[1:], device)
+
+    grid = _affine_grid(shape, matrix, offset, device)
+    if elastic_alpha > 0.0:
+        if isinstance(elastic_control_points, int):
+            elastic_control_points = (elastic_control_points,) * 3
+        # the displacement at the control points, transformed to the normalized input coordinates in grid order
+        control = np.random.default_rng(elastic_seed).standard_normal(
+            tuple(elastic_control_points) + (3,)
+        )
+        control = (control * elastic_alpha) @ inv_matrix.T
+        control = (control * (2.0 / np.asarray(shape, dtype=np.float64)))[..., ::-1]
+        control = torch.tensor(control.copy(), dtype=torch.float32, device=device)
+
+        # separable linear interpolation of the control points to the full grid
+        interp = [
+            _linear_interpolation_matrix(num_points, size, device)
+            for num_points, size in zip(elastic_control_points, shape)
+        ]
+        control = torch.einsum("xc,abcd->abxd", interp[2], control)
+        control = torch.einsum("yb,abxd->ayxd", interp[1], control)
+        grid_2d = grid.view(shape[0], -1)
+        grid_2d.addmm_(interp[0], control.reshape(control.shape[0], -1))
+    return grid
+
+
+def affine_inverse_grid_3d(
+    shape: Tuple[int, int, int],
+    rotate: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+    scale: Union[float, Tuple[float, float, float]] = 1.0,
+    translate: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+    flip: Tuple[bool, bool, bool] = (False, False, False),
+    device: Union[str, torch.device] = "cpu",
+) -> torch.Tensor:
+    """
+    The sampling grid of torch grid_sample (align_corners=False) which reverses the affine part of affine_elastic_grid_3d():
+    voxel q (relative to the volume center) samples voxel flip(A q + translate), where A is the rotation and scale matrix.
+    :param shape: the spatial shape [depth, height, width]
+    See OpAugAffineElastic3D for the other arguments
+    :return: see affine_elastic_grid_3d()
+    """
+    flip_matrix = np.diag([-1.0 if axis_flip else 1.0 for axis_flip in flip])
+    matrix = flip_matrix @ affine_matrix_3d(rotate=rotate, scale=scale)
+    offset = flip_matrix @ np.asarray(translate, dtype=np.float64)
+    if _is_in_plane(matrix, offset):
+        return _affine_grid(shape[1:], matrix[1:, 1:], offset[1:], device)
+    return _affine_grid(shape, matrix, offset, device)
+
+
+def _is_in_plane(matrix: np.ndarray, offset: np.ndarray) -> bool:
+    """
+    :return: True if the transformation keeps the depth axis as is
+    """
+    return (
+        np.allclose(matrix[0], (1.0, 0.0, 0.0))
+        and np.allclose(matrix[:, 0], (1.0, 0.0, 0.0))
+        and np.isclose(offset[0], 0.0)
+    )
+
+
+def _affine_grid(
+    shape: Sequence[int],
+    matrix: np.ndarray,
+    offset: np.ndarray,
+    device: Union[str, torch.device],
+) -> torch.Tensor:
+    """
+    :param shape: the spatial shape
+    :param matrix: output voxel -> input voxel, relative to the volume center, axes in the order of shape
+    :return: the sampling grid of torch grid_sample (align_corners=False), normalized coordinates in reversed order
+    """
+    ndim = len(shape)
+    coords = [
+        torch.arange(size, dtype=torch.float32, device=device) - (size - 1) / 2.0
+        for size in shape
+    ]
+    grid = torch.empty(tuple(shape) + (ndim,), dtype=torch.float32, device=device)
+    for axis in range(ndim):
+        component = grid[..., ndim - 1 - axis]
+        component.fill_(offset[axis])
+        for other in range(ndim):
+            view_shape = [1] * ndim
+            view_shape[other] = -1
+            component.add_(coords[other].view(view_shape), alpha=matrix[axis, other])
+        # normalize to [-1, 1] relative to the input volume
+        component.mul_(2.0 / shape[axis])
+    return grid
+
+
+def _linear_interpolation_matrix(
+    num_points: int, size: int, device: Union[str, torch.device]
+) -> torch.Tensor:
+    """
+    :return: matrix of shape [size, num_points], linear interpolation of num_points control points spread over size voxels (first and last at the edges)
+    """
+    positions = np.linspace(0.0, num_points - 1.0, size)
+    ans = np.maximum(
+        0.0, 1.0 - np.abs(positions[:, None] - np.arange(num_points)[None, :])
+    )
+    return torch.tensor(ans, dtype=torch.float32, device=device)
@@ -0,0 +1,103 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - OpLoadImage eager vs. lazy loading (see OpLoadImage lazy argument) of a CT like int16 NIfTI volume,
+followed by a single slice selection (OpSelectSlice) or a crop (OpCrop3D).
+Reports the running time and the peak memory allocated by numpy per sample.
+
+Usage:
+    python fuseimg/data/ops/benchmarks/benchmark_load_image_lazy.py --volume_shape 128 512 512 --num_repeats 5
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Sequence
+
+import nibabel as nib
+import numpy as np
+import pandas as pd
+
+from fuse.data.pipelines.pipeline_default import PipelineDefault
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.ndict import NDict
+from fuseimg.data.ops.aug.geometry import OpCrop3D
+from fuseimg.data.ops.image_loader import OpLoadImage
+from fuseimg.data.ops.shape_ops import OpSelectSlice
+
+
+def run_benchmark(volume_shape: Sequence[int], num_repeats: int) -> pd.DataFrame:
+    tmpdir = tempfile.mkdtemp()
+    rng = np.random.default_rng(0)
+    volume = rng.integers(-1000, 2000, size=volume_shape, dtype=np.int16)
+    nib.save(nib.Nifti1Image(volume, np.eye(4)), os.path.join(tmpdir, "img.nii"))
+    del volume
+
+    region_ops = {
+        "select_slice": (
+            OpSelectSlice(),
+            dict(key="data.input.img", slice_idx=volume_shape[0] // 2),
+        ),
+        "crop_64": (
+            OpCrop3D(),
+            dict(key="data.input.img", output_shape=(64, 64, 64)),
+        ),
+    }
+    results = []
+    for region_name, region_op in region_ops.items():
+        for lazy in [False, True]:
+            pipeline = PipelineDefault(
+                "benchmark",
+                [
+                    (
+                        OpLoadImage(tmpdir),
+                        dict(
+                            key_in="data.input.img_path",
+                            key_out="data.input.img",
+                            format="nii",
+                            lazy=lazy,
+                        ),
+                    ),
+                    region_op,
+                ],
+            )
+            elapsed = []
+            peaks = []
+            for _ in range(num_repeats):
+                tracemalloc.start()
+                start = time.perf_counter()
+                sample = pipeline(NDict({"data.input.img_path": "img.nii"}))
+                elapsed.append(time.perf_counter() - start)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+                del sample
+            results.append(
+                dict(
+                    region=region_name,
+                    lazy=lazy,
+                    ms_per_sample=1000.0 * np.mean(elapsed),
+                    peak_MB=np.mean(peaks) / 1024**2,
+                )
+            )
+
+    return pd.DataFrame(results).round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--volume_shape", type=int, nargs=3, default=[128, 512, 512])
+    parser.add_argument("--num_repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    df = run_benchmark(args.volume_shape, args.num_repeats)
+    print(get_pretty_dataframe(df))
@@ -0,0 +1,164 @@
+"""
+(C) Copyright 2021 IBM Corp.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+   http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark - resizing a KiTS21 sized CT scan (int16) and its segmentation mask (uint8):
+OpResizeToShape (fuseimg.utils.resample) vs. the existing skimage based functions -
+kits21.my_resize, OpResizeTo, image_processing.preserve_range_resize and image_processing.block_reduce_resize (2D only, applied per slice).
+Reports the running time per volume and the speedup compared to the fastest existing function for the same input.
+
+Usage:
+    python fuseimg/data/ops/benchmarks/benchmark_resample.py --volume_shape 128 512 512 --output_shape 110 256 256 --num_threads 4
+"""
+import argparse
+import time
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from fuse.utils.misc.misc import get_pretty_dataframe
+from fuse.utils.ndict import NDict
+from fuseimg.data.ops.aug.geometry import OpResizeTo
+from fuseimg.data.ops.resample import OpResizeToShape
+from fuseimg.datasets.kits21 import my_resize
+from fuseimg.utils.image_processing import block_reduce_resize, preserve_range_resize
+
+
+def _time(func: Callable, num_repeats: int) -> float:
+    elapsed = []
+    for _ in range(num_repeats):
+        start = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - start)
+    return 1000.0 * float(np.mean(elapsed))
+
+
+def _op(op: Callable, value: np.ndarray, **kwargs: dict) -> Callable:
+    return lambda: op(NDict({"data.value": value}), key="data.value", **kwargs)
+
+
+def run_benchmark(
+    volume_shape: Sequence[int],
+    output_shape: Sequence[int],
+    num_threads: Optional[int],
+    num_repeats: int,
+) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    img = rng.integers(-1000, 2000, size=volume_shape, dtype=np.int16)
+    # a few blobs - background, kidney, tumor and cyst labels
+    seg = np.zeros(volume_shape, dtype=np.uint8)
+    grid = np.ogrid[tuple(slice(0, size) for size in volume_shape)]
+    for label in [1, 1, 2, 3]:
+        center = [rng.integers(size // 4, 3 * size // 4) for size in volume_shape]
+        radius = [size / 8 for size in volume_shape]
+        dist = sum(((g - c) / r) ** 2 for g, c, r in zip(grid, center, radius))
+        seg[dist <= 1] = label
+
+    # kits21.my_resize expects H x W x D
+    resize_to_hwd = (output_shape[1], output_shape[2], output_shape[0])
+    new_op = OpResizeToShape(num_threads=num_threads)
+    cases = [
+        # input, function, mode, is the new op, note
+        (
+            "img",
+            "kits21.my_resize",
+            "linear+aa",
+            False,
+            lambda: my_resize(img.transpose(1, 2, 0), resize_to_hwd),
+        ),
+        (
+            "img",
+            "OpResizeTo",
+            "linear+aa",
+            False,
+            _op(OpResizeTo(channels_first=False), img, output_shape=output_shape),
+        ),
+        (
+            "img",
+            "OpResizeToShape",
+            "linear+aa",
+            True,
+            _op(new_op, img, output_shape=output_shape),
+        ),
+        (
+            "img",
+            "OpResizeToShape",
+            "linear",
+            True,
+            _op(new_op, img, output_shape=output_shape, anti_aliasing=False),
+        ),
+        (
+            "seg",
+            "preserve_range_resize",
+            "nearest",
+            False,
+            lambda: preserve_range_resize(seg, output_shape),
+        ),
+        (
+            "seg",
+            "block_reduce_resize (in-plane, per slice)",
+            "max",
+            False,
+            lambda: [
+                block_reduce_resize(seg_slice, output_shape[1:]) for seg_slice in seg
+            ],
+        ),
+        (
+            "seg",
+            "OpResizeToShape",
+            "nearest",
+            True,
+            _op(new_op, seg, output_shape=output_shape, mode="nearest"),
+        ),
+        (
+            "seg",
+            "OpResizeToShape",
+            "majority",
+            True,
+            _op(new_op, seg, output_shape=output_shape, mode="majority"),
+        ),
+    ]
+
+    results = []
+    for input_name, func_name, mode, is_new, func in cases:
+        results.append(
+            dict(
+                input=input_name,
+                function=func_name,
+                mode=mode,
+                new=is_new,
+                ms_per_volume=_time(func, num_repeats),
+            )
+        )
+    df = pd.DataFrame(results)
+    baseline = df[~df.new].groupby("input").ms_per_volume.min()
+    df["speedup"] = df.input.map(baseline) / df.ms_per_volume
+    return df.drop(columns="new").round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--volume_shape", type=int, nargs=3, default=[128, 512, 512])
+    parser.add_argument("--output_shape", type=int, nargs=3, default=[110, 256, 256])
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=None,
+        help="default is torch.get_num_threads()",
+    )
+    parser.add_argument("--num_repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    df = run_benchmark(
+        args.volume_shape, args.output_shape, args.num_threads, args.num_repeats
+    )
+    print(get_pretty_dataframe(df))
@@ -1,15 +1,20 @@
-from typing import Tuple, Union, Dict, Any
+from typing import Optional, Tuple, Union, Dict, Any
 import numpy as np
 import torch
 from fuse.utils.ndict import NDict
 
 from fuse.data.ops.op_base import OpBase
+from fuse.data.ops.ops_fusion import (
+    FusionStepBase,
+    FusionStepElementwise,
+    OpFusibleBase,
+)
 
 from fuseimg.utils.typing.key_types_imaging import DataTypeImaging
 from fuseimg.data.ops.ops_common_imaging import OpApplyTypesImaging
 
 
-class OpClip(OpBase):
+class OpClip(OpFusibleBase):
     """
     Clip values - support both torch tensor and numpy array
     """
@@ -36,6 +41,14 @@ class OpClip(OpBase):
         sample_dict[key] = processed_img
         return sample_dict
 
+    def get_fusion_step(
+        self, key: str, clip: Tuple[float, float] = (0.0, 1.0)
+    ) -> Optional[FusionStepBase]:
+        """
+        See OpFusibleBase
+        """
+        return FusionStepElementwise([lambda img: self.clip(img, clip)])
+
     @staticmethod
     def clip(
         img: Union[np.ndarray, torch.Tensor], clip: Tuple[float, float] = (0.0, 1.0)
@@ -48,6 +61,12 @@ class OpClip(OpBase):
             raise Exception(f"Error: unexpected type {type(img)}")
         return processed_img
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 op_clip_img = OpApplyTypesImaging({DataTypeImaging.IMAGE: (OpClip(), {})})
 
@@ -68,6 +87,12 @@ class OpNormalizeAgainstSelf(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 op_normalize_against_self_img = OpApplyTypesImaging(
     {DataTypeImaging.IMAGE: (OpNormalizeAgainstSelf(), {})}
@@ -96,13 +121,19 @@ class OpToIntImageSpace(OpBase):
         sample_dict[key] = img
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 op_to_int_image_space_img = OpApplyTypesImaging(
     {DataTypeImaging.IMAGE: (OpToIntImageSpace(), {})}
 )
 
 
-class OpToRange(OpBase):
+class OpToRange(OpFusibleBase):
     """
     linearly project from a range to a different range
     """
@@ -114,13 +145,38 @@ class OpToRange(OpBase):
         from_range: Tuple[float, float],
         to_range: Tuple[float, float],
     ) -> NDict:
+        img = sample_dict[key]
+
+        img = self.to_range(img, from_range, to_range)
+
+        sample_dict[key] = img
+
+        return sample_dict
+
+    def get_fusion_step(
+        self, key: str, from_range: Tuple[float, float], to_range: Tuple[float, float]
+    ) -> Optional[FusionStepBase]:
+        """
+        See OpFusibleBase
+        """
+        return FusionStepElementwise(
+            [lambda img: self.to_range(img, from_range, to_range)]
+        )
+
+    @staticmethod
+    def to_range(
+        img: Union[np.ndarray, torch.Tensor],
+        from_range: Tuple[float, float],
+        to_range: Tuple[float, float],
+    ) -> Union[np.ndarray, torch.Tensor]:
+        """
+        In place linear projection
+        """
         from_range_start = from_range[0]
         from_range_end = from_range[1]
         to_range_start = to_range[0]
         to_range_end = to_range[1]
 
-        img = sample_dict[key]
-
         # shift to start at 0
         img -= from_range_start
 
@@ -129,9 +185,13 @@ class OpToRange(OpBase):
         # shift to start in desired start val
         img += to_range_start
 
-        sample_dict[key] = img
+        return img
 
-        return sample_dict
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
 
 
 op_to_range_img = OpApplyTypesImaging({DataTypeImaging.IMAGE: (OpToRange(), {})})
@@ -95,5 +95,11 @@ class OpDrawGrid(OpBase):
         sample_dict[key] = img
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 op_draw_grid_img = OpApplyTypesImaging({DataTypeImaging.IMAGE: (OpDrawGrid(), {})})
@@ -4,6 +4,7 @@ from typing import Optional
 import numpy as np
 import nibabel as nib
 from fuse.utils.ndict import NDict
+from fuse.data.utils.lazy_array import LazyArray
 
 from torchvision.io import read_image
 from medpy.io import load
@@ -28,11 +29,16 @@ class OpLoadImage(OpReversibleBase):
         key_out: str,
         key_metadata_out: Optional[str] = None,
         format: str = "infer",
+        lazy: bool = False,
     ) -> NDict:
         """
         :param key_in: the key name in sample_dict that holds the filename
         :param key_out: the key name in sample_dict that holds the image
         :param key_metadata_out : the key to hold metadata dictionary
+        :param lazy: supported for 'nii' and 'dcm' - store a LazyArray in key_out instead of reading the image.
+                     Only the region selected later by ops such as OpSelectSlice and OpCrop3D will be read (decoded), in the stored dtype
+                     (unless requested otherwise, e.g. by OpToNumpy dtype argument) instead of float64.
+                     Multi-frame DICOM frames are decoded one by one (requires pydicom>=3), otherwise the entire pixel data is decoded.
         """
         img_filename = os.path.join(self._dir_path, sample_dict[key_in])
         img_filename_suffix = img_filename.split(".")[-1]
@@ -40,8 +46,11 @@ class OpLoadImage(OpReversibleBase):
             format in ["nii", "nib"]
         ):
             img = nib.load(img_filename)
-            img_np = img.get_fdata()
-            sample_dict[key_out] = img_np
+            if lazy:
+                sample_dict[key_out] = _lazy_nifti(img)
+            else:
+                img_np = img.get_fdata()
+                sample_dict[key_out] = img_np
 
         elif img_filename_suffix in ["jpg", "jpeg", "png"]:
             img = read_image(img_filename)
@@ -62,11 +71,16 @@ class OpLoadImage(OpReversibleBase):
         elif (format == "infer" and img_filename_suffix in ["dcm"]) or (
             format in ["dcm"]
         ):
-            dcm = pydicom.dcmread(img_filename)
-            inner_image = dcm.pixel_array
-            # convert to numpy
-            img_np = np.asarray(inner_image)
-            sample_dict[key_out] = img_np
+            if lazy:
+                # the pixel data is read only when accessed
+                dcm = pydicom.dcmread(img_filename, defer_size="1 KB")
+                sample_dict[key_out] = _lazy_dicom(dcm)
+            else:
+                dcm = pydicom.dcmread(img_filename)
+                inner_image = dcm.pixel_array
+                # convert to numpy
+                img_np = np.asarray(inner_image)
+                sample_dict[key_out] = img_np
             if key_metadata_out is not None:
                 metadata = NDict()
                 for key, field in key_metadata_out:
@@ -87,3 +101,61 @@ class OpLoadImage(OpReversibleBase):
         op_id: Optional[str],
     ) -> dict:
         return sample_dict
+
+    def get_execution_hint(self) -> str:
+        """
+        See OpBase
+        """
+        return "io"
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
+
+def _lazy_nifti(img: nib.Nifti1Image) -> LazyArray:
+    """
+    Reads the requested region through the nibabel array proxy - in the stored dtype (or float if the header defines scaling)
+    """
+    proxy = img.dataobj
+    # the dtype depends on the scaling - determined by reading a single voxel
+    dtype = np.asarray(proxy[(slice(0, 1),) * len(img.shape)]).dtype
+    return LazyArray(lambda index: proxy[index], img.shape, dtype)
+
+
+def _lazy_dicom(dcm: pydicom.Dataset) -> LazyArray:
+    """
+    Decodes just the requested frames of a multi-frame DICOM (pydicom>=3), otherwise the entire pixel data
+    """
+    num_frames = int(dcm.get("NumberOfFrames", 1) or 1)
+    shape = (dcm.Rows, dcm.Columns)
+    if dcm.get("SamplesPerPixel", 1) > 1:
+        shape = shape + (dcm.SamplesPerPixel,)
+    if num_frames > 1:
+        shape = (num_frames,) + shape
+    if dcm.BitsAllocated in [8, 16, 32, 64]:
+        dtype = np.dtype(
+            f"{'i' if dcm.PixelRepresentation else 'u'}{dcm.BitsAllocated // 8}"
+        )
+    else:
+        dtype = np.dtype(np.uint8)
+
+    decode_frame = getattr(getattr(pydicom, "pixels", None), "pixel_array", None)
+
+    def reader(index: tuple) -> np.ndarray:
+        frames = index[0]
+        if num_frames > 1 and decode_frame is not None and frames != slice(0, 0):
+            if isinstance(frames, int):
+                value = decode_frame(dcm, index=frames)[index[1:]]
+            else:
+                frames = range(num_frames)[frames]
+                value = np.stack(
+                    [decode_frame(dcm, index=frame)[index[1:]] for frame in frames]
+                )
+        else:
+            value = dcm.pixel_array[index]
+        return value.astype(dtype, copy=False)
+
+    return LazyArray(reader, shape, dtype)
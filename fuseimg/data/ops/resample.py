@@ -0,0 +1,153 @@
+"""
+(C) Copyright 2021 IBM Corp.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import torch
+
+from fuse.data.ops.op_base import OpBase
+from fuse.utils.ndict import NDict
+from fuseimg.utils.resample import get_output_shape_for_spacing, resample_volume
+
+
+class OpResizeToShape(OpBase):
+    """
+    Resizes a volume (or an image) of any number of dimensions to a given shape, using fast separable float32 kernels (see resample_volume()).
+    Supports numpy arrays and torch tensors (returns the same type).
+
+    Example - resize a CT scan and its segmentation mask:
+        (OpResizeToShape(), dict(key="data.input.img", output_shape=(110, 256, 256))),
+        (OpResizeToShape(), dict(key="data.gt.seg", output_shape=(110, 256, 256), mode="majority")),
+    """
+
+    def __init__(self, num_threads: Optional[int] = None):
+        """
+        :param num_threads: the number of threads. Default is torch.get_num_threads(), which is 1 in DataLoader worker processes
+        """
+        super().__init__()
+        self._num_threads = num_threads
+
+    def __call__(
+        self,
+        sample_dict: NDict,
+        key: str,
+        output_shape: Sequence[Optional[int]],
+        mode: str = "linear",
+        anti_aliasing: bool = True,
+    ) -> NDict:
+        """
+        :param key: key to a numpy array or a tensor stored in sample_dict
+        :param output_shape: the required size per axis, None to keep an axis as is (e.g. the channels axis)
+        :param mode: "linear" (float32 output), or for segmentation masks "nearest" or "majority" (the most common label in the footprint of each output voxel). See resample_volume()
+        :param anti_aliasing: used in "linear" mode when downsampling, see resample_volume()
+        """
+        sample_dict[key] = _resample(
+            sample_dict[key], output_shape, mode, anti_aliasing, self._num_threads
+        )
+        return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
+
+class OpResampleToSpacing(OpBase):
+    """
+    Resamples a volume to a given voxel size (spacing), using fast separable float32 kernels (see resample_volume()).
+    Supports numpy arrays and torch tensors (returns the same type).
+    The current spacing is either given or read from sample_dict (and updated to the actual spacing after resampling).
+
+    Example - resample a CT scan and its segmentation mask to 1mm x 1mm x 1mm voxels:
+        (OpResampleToSpacing(), dict(key="data.input.img", key_spacing="data.input.spacing", target_spacing=(1.0, 1.0, 1.0))),
+        (OpResampleToSpacing(), dict(key="data.gt.seg", key_spacing="data.gt.spacing", target_spacing=(1.0, 1.0, 1.0), mode="majority")),
+    """
+
+    def __init__(self, num_threads: Optional[int] = None):
+        """
+        :param num_threads: the number of threads. Default is torch.get_num_threads(), which is 1 in DataLoader worker processes
+        """
+        super().__init__()
+        self._num_threads = num_threads
+
+    def __call__(
+        self,
+        sample_dict: NDict,
+        key: str,
+        target_spacing: Sequence[Optional[float]],
+        spacing: Optional[Sequence[float]] = None,
+        key_spacing: Optional[str] = None,
+        mode: str = "linear",
+        anti_aliasing: bool = True,
+    ) -> NDict:
+        """
+        :param key: key to a numpy array or a tensor stored in sample_dict
+        :param target_spacing: the required voxel size per axis, None to keep an axis as is (e.g. the channels axis)
+        :param spacing: the current voxel size per axis. Specify either spacing or key_spacing.
+        :param key_spacing: key to the current voxel size per axis stored in sample_dict, will be set to the voxel size after resampling.
+        :param mode: "linear" (float32 output), or for segmentation masks "nearest" or "majority" (the most common label in the footprint of each output voxel). See resample_volume()
+        :param anti_aliasing: used in "linear" mode when downsampling, see resample_volume()
+        """
+        if (spacing is None) == (key_spacing is None):
+            raise Exception(
+                "Error: OpResampleToSpacing expects either spacing or key_spacing"
+            )
+        if key_spacing is not None:
+            spacing = sample_dict[key_spacing]
+
+        value = sample_dict[key]
+        output_shape = get_output_shape_for_spacing(
+            value.shape, spacing, target_spacing
+        )
+        sample_dict[key] = _resample(
+            value, output_shape, mode, anti_aliasing, self._num_threads
+        )
+        if key_spacing is not None:
+            sample_dict[key_spacing] = tuple(
+                float(current) * in_size / out_size
+                for current, in_size, out_size in zip(
+                    spacing, value.shape, output_shape
+                )
+            )
+        return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
+
+def _resample(
+    value: Any,
+    output_shape: Sequence[Optional[int]],
+    mode: str,
+    anti_aliasing: bool,
+    num_threads: Optional[int],
+) -> Any:
+    """
+    resample_volume() for numpy arrays and torch tensors
+    """
+    if isinstance(value, torch.Tensor):
+        ans = resample_volume(
+            value.detach().cpu().numpy(), output_shape, mode, anti_aliasing, num_threads
+        )
+        return torch.from_numpy(ans).to(value.device)
+    return resample_volume(
+        np.asarray(value), output_shape, mode, anti_aliasing, num_threads
+    )
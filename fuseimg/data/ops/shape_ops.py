@@ -45,6 +45,12 @@ class OpHWCToCHW(OpBase):
         sample_dict[key] = input_tensor
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpCHWToHWC(OpBase):
     """
@@ -64,11 +70,18 @@ class OpCHWToHWC(OpBase):
         sample_dict[key] = input_tensor
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpSelectSlice(OpBase):
     """
     select one slice from the input tensor,
-    from the first dimension of a >2 dimensional input
+    from the first dimension of a >2 dimensional input.
+    Given a LazyArray (see OpLoadImage lazy argument), only the selected slice will be read.
     """
 
     def __init__(self, **kwargs: Dict[str, Any]):
@@ -87,6 +100,12 @@ class OpSelectSlice(OpBase):
         sample_dict[key] = img
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpResizeAndPad2D(OpBase):
     """
@@ -214,6 +233,12 @@ class OpResizeAndPad2D(OpBase):
         sample_dict[key] = img
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpFindBiggestNonEmptyBbox2D(OpBase):
     """
@@ -292,6 +317,12 @@ class OpFindBiggestNonEmptyBbox2D(OpBase):
         sample_dict[key] = img
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpFlipBrightSideOnLeft2D(OpBase):
     """
@@ -336,6 +367,12 @@ class OpFlipBrightSideOnLeft2D(OpBase):
             sample_dict[key] = image
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 op_select_slice_img_and_seg = OpApplyTypesImaging(
     {
@@ -386,3 +423,9 @@ class OpPad(OpBase):
 
         sample_dict[key] = processed_img
         return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
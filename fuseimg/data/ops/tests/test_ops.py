@@ -1,13 +1,36 @@
+import os
+import pickle
+import tempfile
 import unittest
 
 from fuse.data.pipelines.pipeline_default import PipelineDefault
 from fuseimg.data.ops.color import OpClip, OpToRange
-from fuseimg.data.ops.shape_ops import OpPad
+from fuseimg.data.ops.shape_ops import OpPad, OpSelectSlice
+from fuseimg.data.ops.aug.geometry import (
+    OpAugAffine2D,
+    OpAugAffineElastic3D,
+    OpCrop3D,
+)
+from fuseimg.data.ops.image_loader import OpLoadImage
+from fuseimg.data.ops.resample import OpResampleToSpacing, OpResizeToShape
+from fuseimg.data.ops.aug.color import OpAugColor, OpAugGaussian
+from fuse.data.ops.ops_aug_common import OpRandApply, OpSample
+from fuse.data.ops.ops_cast import OpToNumpy, OpToTensor
+from fuse.data.utils.lazy_array import LazyArray
+from fuse.data.ops.ops_fusion import OpFused
+from fuse.data.utils.collates import CollateDefault
+from fuse.utils.rand.param_sampler import Choice, RandBool, Uniform
 
 from fuse.utils.ndict import NDict
+from fuse.utils.rand.seed import Seed
 
+import nibabel as nib
 import numpy as np
+import pydicom
+import skimage.transform
 import torch
+import torchvision.transforms as transforms
+import torchvision.transforms.functional as TTF
 
 
 class TestOps(unittest.TestCase):
@@ -100,6 +123,535 @@ class TestOps(unittest.TestCase):
         self.assertTrue(np.array_equal(sample["data.input.tensor_img_2"], res_2))
         self.assertTrue(np.array_equal(sample["data.input.numpy_img_2"], res_2))
 
+    def test_op_aug_affine_2d(self) -> None:
+        """
+        Test that the tensor backend of OpAugAffine2D (single resample) matches torchvision's affine followed by flips
+        """
+        torch.manual_seed(0)
+        img = torch.rand(4, 37, 50)
+        kwargs = dict(rotate=30.0, translate=(3.0, -2.0), scale=1.2, shear=10.0)
+        for flip in [(False, False), (True, False), (False, True), (True, True)]:
+            expected = TTF.affine(
+                img.clone(),
+                angle=kwargs["rotate"],
+                translate=list(kwargs["translate"]),
+                scale=kwargs["scale"],
+                shear=kwargs["shear"],
+                interpolation=transforms.InterpolationMode.BILINEAR,
+            )
+            if flip[0]:
+                expected = TTF.vflip(expected)
+            if flip[1]:
+                expected = TTF.hflip(expected)
+
+            sample = NDict({"data.input.img": img.clone()})
+            sample = OpAugAffine2D(backend="tensor")(
+                sample, "data.input.img", flip=flip, **kwargs
+            )
+            self.assertTrue(
+                torch.allclose(sample["data.input.img"], expected, atol=1e-4)
+            )
+
+            # legacy implementation
+            sample = NDict({"data.input.img": img.clone()})
+            sample = OpAugAffine2D(backend="pil")(
+                sample, "data.input.img", flip=flip, **kwargs
+            )
+            self.assertLess(
+                (sample["data.input.img"] - expected).abs().mean().item(), 0.01
+            )
+
+        # integer image, subset of channels
+        img = (torch.rand(3, 40, 40) * 255).to(torch.uint8)
+        sample = NDict({"data.input.img": img.clone()})
+        sample = OpAugAffine2D(backend="tensor")(
+            sample,
+            "data.input.img",
+            rotate=90.0,
+            channels=[1],
+            interpolation=transforms.InterpolationMode.NEAREST,
+        )
+        self.assertEqual(sample["data.input.img"].dtype, torch.uint8)
+        self.assertTrue(torch.equal(sample["data.input.img"][0], img[0]))
+        self.assertTrue(
+            torch.equal(sample["data.input.img"][1], torch.rot90(img[1], -1, [0, 1]))
+        )
+
+    def test_op_aug_affine_2d_backends_parity(self) -> None:
+        """
+        Test that the tensor backend of OpAugAffine2D matches the pil backend (the default).
+        The backends differ only near the image border (pixels sampled partially outside of the image) and in rounding of integer images.
+        """
+        height, width = 48, 64
+        grid_y, grid_x = np.mgrid[0:height, 0:width]
+        smooth = 0.5 + 0.25 * np.sin(grid_x / 7.0) + 0.25 * np.cos(grid_y / 5.0)
+        img = torch.from_numpy(np.stack([smooth, smooth[::-1]]).astype(np.float32))
+        img_uint8 = (img * 255).to(torch.uint8)
+
+        def _affine(backend: str, image: torch.Tensor, **kwargs: dict) -> torch.Tensor:
+            sample = NDict({"data.input.img": image.clone()})
+            sample = OpAugAffine2D(backend=backend)(sample, "data.input.img", **kwargs)
+            return sample["data.input.img"]
+
+        cases = [
+            dict(rotate=30.0),
+            dict(scale=1.2),
+            dict(scale=0.8),
+            dict(flip=(True, False)),
+            dict(flip=(False, True)),
+            dict(rotate=-20.0, scale=1.1, translate=(3, 2), flip=(True, True)),
+        ]
+        for kwargs in cases:
+            # pixels sampled from within the image in both backends
+            interior = (_affine("tensor", torch.ones_like(img), **kwargs) > 0.999) & (
+                _affine("pil", torch.ones_like(img), **kwargs) > 0.999
+            )
+            self.assertGreater(interior.float().mean().item(), 0.5)
+
+            diff = (
+                _affine("tensor", img, **kwargs) - _affine("pil", img, **kwargs)
+            ).abs()
+            self.assertLess(diff[interior].max().item(), 1e-3, msg=str(kwargs))
+            self.assertLess(diff.mean().item(), 0.01, msg=str(kwargs))
+
+            output = _affine("tensor", img_uint8, **kwargs)
+            self.assertEqual(output.dtype, torch.uint8)
+            diff = (output.int() - _affine("pil", img_uint8, **kwargs).int()).abs()
+            self.assertLessEqual(diff[interior].max().item(), 1, msg=str(kwargs))
+
+    def test_pipeline_compile(self) -> None:
+        """
+        Test that a compiled pipeline (fused ops) gives the same results as the original pipeline
+        """
+        nearest = transforms.InterpolationMode.NEAREST
+        pipeline = PipelineDefault(
+            "test_pipeline",
+            [
+                (OpToTensor(), dict(key="data.input.img")),
+                (
+                    OpSample(OpAugAffine2D(backend="tensor")),
+                    dict(
+                        key="data.input.img",
+                        rotate=Choice([0.0, 90.0, 180.0, 270.0]),
+                        interpolation=nearest,
+                    ),
+                ),
+                (
+                    OpRandApply(OpSample(OpAugAffine2D(backend="tensor")), 0.5),
+                    dict(
+                        key="data.input.img",
+                        flip=(RandBool(0.5), RandBool(0.5)),
+                        interpolation=nearest,
+                    ),
+                ),
+                (
+                    OpSample(OpAugColor()),
+                    dict(
+                        key="data.input.img",
+                        add=Uniform(-0.1, 0.1),
+                        mul=Uniform(0.8, 1.2),
+                        gamma=Uniform(0.8, 1.2),
+                        contrast=Uniform(0.8, 1.2),
+                    ),
+                ),
+                (OpClip(), dict(key="data.input.img", clip=(0.0, 1.0))),
+                (
+                    OpToRange(),
+                    dict(key="data.input.img", from_range=(0, 1), to_range=(-1, 1)),
+                ),
+                (
+                    OpToRange(),
+                    dict(key="data.input.other", from_range=(0, 1), to_range=(-1, 1)),
+                ),
+            ],
+        )
+        compiled_pipeline = pipeline.compile()
+        self.assertEqual(len(compiled_pipeline), 3)
+        self.assertIsInstance(compiled_pipeline.ops[1], OpFused)
+        self.assertEqual(compiled_pipeline.get_op_ids()[1], "1+2+3+4+5")
+
+        img = np.random.rand(32, 32).astype(np.float32)
+        for seed in range(10):
+            Seed.set_seed(seed)
+            sample = pipeline(
+                NDict({"data.input.img": img.copy(), "data.input.other": img.copy()})
+            )
+            Seed.set_seed(seed)
+            fused_sample = compiled_pipeline(
+                NDict({"data.input.img": img.copy(), "data.input.other": img.copy()})
+            )
+            self.assertEqual(set(sample.keypaths()), set(fused_sample.keypaths()))
+            self.assertEqual(
+                sample["internal.test_pipeline.2"],
+                fused_sample["internal.test_pipeline.2"],
+            )
+            self.assertTrue(
+                torch.equal(sample["data.input.img"], fused_sample["data.input.img"])
+            )
+            self.assertTrue(
+                np.array_equal(
+                    sample["data.input.other"], fused_sample["data.input.other"]
+                )
+            )
+
+        # the pil backend can't be fused - fallback to a regular call
+        pipeline = PipelineDefault(
+            "test_pipeline",
+            [
+                (
+                    OpAugAffine2D(backend="tensor"),
+                    dict(key="data.input.img", rotate=90.0, interpolation=nearest),
+                ),
+                (
+                    OpAugAffine2D(backend="pil"),
+                    dict(key="data.input.img", rotate=90.0, interpolation=nearest),
+                ),
+                (
+                    OpAugAffine2D(backend="tensor"),
+                    dict(key="data.input.img", rotate=90.0, interpolation=nearest),
+                ),
+            ],
+        )
+        img = torch.rand(3, 20, 20)
+        fused_sample = pipeline.compile()(NDict({"data.input.img": img.clone()}))
+        self.assertTrue(
+            torch.equal(fused_sample["data.input.img"], torch.rot90(img, -3, [1, 2]))
+        )
+
+    def test_batch_ops(self) -> None:
+        """
+        Test that the batch implementations (single batched op with per sample arguments) match the per sample results
+        """
+        Seed.set_seed(0)
+        batch = torch.rand(6, 3, 24, 32)
+        key = "data.input.img"
+        cases = [
+            (
+                OpAugColor(),
+                [
+                    dict(key=key, add=0.05, mul=1.1, gamma=0.9, contrast=1.2),
+                    None,
+                    dict(key=key, add=-0.05, contrast=0.8),
+                    dict(key=key, mul=0.9, gamma=1.1),
+                    dict(key=key, add=0.1, mul=0.95, gamma=1.0, contrast=1.0),
+                    None,
+                ],
+            ),
+            (
+                OpAugAffine2D(backend="tensor"),
+                [
+                    dict(key=key, rotate=30.0, scale=1.1, flip=(True, False)),
+                    dict(key=key, translate=(3.0, -2.0), shear=10.0),
+                    None,
+                    dict(key=key, rotate=-90.0, flip=(False, True)),
+                    None,
+                    dict(key=key),
+                ],
+            ),
+            (
+                OpAugColor(),
+                [dict(key=key, add=0.05, mul=1.1, channels=[0, 2])] * 6,
+            ),
+        ]
+        for op, kwargs_per_sample in cases:
+            batch_dict = NDict({key: batch.clone()})
+            batch_dict = op.call_batch(batch_dict, "test", kwargs_per_sample)
+            for index, kwargs in enumerate(kwargs_per_sample):
+                expected = batch[index].clone()
+                if kwargs is not None:
+                    expected = op(NDict({key: expected}), **kwargs)[key]
+                self.assertTrue(
+                    torch.allclose(batch_dict[key][index], expected, atol=1e-5)
+                )
+
+        # end to end - a batch pipeline applied by the collate function
+        batch_pipeline = PipelineDefault(
+            "batch_aug",
+            [
+                (
+                    OpRandApply(OpSample(OpAugAffine2D(backend="tensor")), 0.5),
+                    dict(key=key, rotate=Uniform(-180.0, 180.0)),
+                ),
+                (OpSample(OpAugColor()), dict(key=key, mul=Uniform(0.8, 1.2))),
+                (OpSample(OpAugGaussian()), dict(key=key, std=Uniform(0.0, 0.03))),
+                (OpClip(), dict(key=key, clip=(0.0, 1.0))),
+            ],
+            batch_mode=True,
+        )
+        collate = CollateDefault(batch_pipeline=batch_pipeline)
+        samples = [
+            {"data.sample_id": index, key: batch[index].clone()} for index in range(6)
+        ]
+        batch_dict = collate(samples)
+        self.assertEqual(batch_dict[key].shape, batch.shape)
+        self.assertEqual(len(batch_dict["internal.batch_aug.0"]), 6)
+        self.assertTrue(batch_dict[key].min() >= 0.0 and batch_dict[key].max() <= 1.0)
+        for index, apply in enumerate(batch_dict["internal.batch_aug.0"]):
+            mean_diff = (batch_dict[key][index] - batch[index]).abs().mean().item()
+            self.assertEqual(mean_diff > 0.15, apply)
+
+    def test_op_aug_affine_elastic_3d(self) -> None:
+        """
+        Test OpAugAffineElastic3D
+        """
+        rng = np.random.default_rng(0)
+        volume = rng.normal(size=(6, 8, 8)).astype(np.float32)
+        op = OpAugAffineElastic3D()
+
+        def _aug(**kwargs: dict) -> np.ndarray:
+            return op(
+                NDict({"data.input.img": volume.copy()}),
+                None,
+                keys="data.input.img",
+                **kwargs,
+            )["data.input.img"]
+
+        self.assertTrue(np.allclose(_aug(), volume, atol=1e-5))
+        self.assertTrue(
+            np.allclose(
+                _aug(flip=(True, False, True)), volume[::-1, :, ::-1], atol=1e-5
+            )
+        )
+        self.assertTrue(
+            np.allclose(
+                _aug(rotate=(90.0, 0.0, 0.0)),
+                np.rot90(volume, k=1, axes=(1, 2)),
+                atol=1e-5,
+            )
+        )
+        translated = _aug(translate=(0.0, 0.0, 2.0))
+        self.assertTrue(np.allclose(translated[:, :, 2:], volume[:, :, :-2], atol=1e-5))
+        self.assertTrue(np.all(translated[:, :, :2] == 0.0))
+
+        # image and mask together, replayed using the stored arguments
+        def _sample() -> NDict:
+            return NDict(
+                {
+                    "data.input.img": torch.from_numpy(volume[None].copy()),
+                    "data.gt.seg": (volume > 0.5).astype(np.uint8),
+                }
+            )
+
+        sample = op(
+            _sample(),
+            "aug",
+            keys=["data.input.img", "data.gt.seg"],
+            interpolation=["bilinear", "nearest"],
+            rotate=(10.0, 20.0, 5.0),
+            scale=1.1,
+            elastic_alpha=1.5,
+        )
+        self.assertEqual(tuple(sample["data.input.img"].shape), (1, 6, 8, 8))
+        self.assertEqual(sample["data.gt.seg"].dtype, np.uint8)
+        self.assertTrue(set(np.unique(sample["data.gt.seg"])) <= {0, 1})
+        self.assertIsNotNone(sample["aug.elastic_seed"])
+
+        replayed = op(
+            _sample(), None, keys=["data.input.img", "data.gt.seg"], **sample["aug"]
+        )
+        self.assertTrue(
+            torch.equal(sample["data.input.img"], replayed["data.input.img"])
+        )
+        self.assertTrue(np.array_equal(sample["data.gt.seg"], replayed["data.gt.seg"]))
+
+    def test_op_aug_affine_elastic_3d_reverse(self) -> None:
+        """
+        Test OpAugAffineElastic3D reverse - the inverse affine transformation
+        """
+        z, y, x = np.meshgrid(
+            *[np.linspace(-1.0, 1.0, size) for size in (16, 24, 24)], indexing="ij"
+        )
+        volume = np.exp(-(z**2 + y**2 + x**2) / 0.3).astype(np.float32)
+        seg = (volume > 0.5).astype(np.uint8)
+        center = (slice(4, 12), slice(6, 18), slice(6, 18))
+        op = OpAugAffineElastic3D()
+        keys = ["data.input.img", "data.gt.seg"]
+        for kwargs in [
+            dict(
+                rotate=(10.0, 5.0, 20.0),
+                scale=1.1,
+                translate=(1.0, 2.0, -1.0),
+                flip=(False, True, False),
+            ),
+            # in-plane transformation
+            dict(
+                rotate=(30.0, 0.0, 0.0),
+                translate=(0.0, 1.5, 0.0),
+                flip=(False, False, True),
+            ),
+        ]:
+            sample = op(
+                NDict({"data.input.img": volume.copy(), "data.gt.seg": seg.copy()}),
+                "aug",
+                keys=keys,
+                interpolation=["bilinear", "nearest"],
+                **kwargs,
+            )
+            self.assertGreater(np.abs(sample["data.input.img"] - volume).max(), 0.1)
+            for key in keys:
+                sample = op.reverse(sample, key, key, "aug")
+            self.assertLess(
+                np.abs(sample["data.input.img"] - volume)[center].max(), 0.05
+            )
+            self.assertEqual(sample["data.gt.seg"].dtype, np.uint8)
+            self.assertGreater((sample["data.gt.seg"] == seg)[center].mean(), 0.98)
+
+    def test_op_load_image_lazy(self) -> None:
+        """
+        Test OpLoadImage lazy mode followed by ops that select a region
+        """
+        tmpdir = tempfile.mkdtemp()
+        volume = np.arange(5 * 6 * 7, dtype=np.int16).reshape(5, 6, 7)
+        nib.save(nib.Nifti1Image(volume, np.eye(4)), os.path.join(tmpdir, "img.nii"))
+
+        # multi-frame dicom
+        file_meta = pydicom.dataset.FileMetaDataset()
+        file_meta.TransferSyntaxUID = pydicom.uid.ExplicitVRLittleEndian
+        file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.7"
+        file_meta.MediaStorageSOPInstanceUID = pydicom.uid.generate_uid()
+        dcm = pydicom.dataset.FileDataset(
+            "img.dcm", {}, file_meta=file_meta, preamble=b"\0" * 128
+        )
+        dcm.SOPClassUID = file_meta.MediaStorageSOPClassUID
+        dcm.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+        dcm.Rows, dcm.Columns, dcm.NumberOfFrames = 6, 7, 5
+        dcm.SamplesPerPixel = 1
+        dcm.PhotometricInterpretation = "MONOCHROME2"
+        dcm.BitsAllocated, dcm.BitsStored, dcm.HighBit = 16, 16, 15
+        dcm.PixelRepresentation = 1
+        dcm.PixelData = volume.tobytes()
+        dcm.save_as(os.path.join(tmpdir, "img.dcm"))
+
+        for filename in ["img.nii", "img.dcm"]:
+            sample = NDict({"data.input.img_path": filename})
+            sample = OpLoadImage(tmpdir)(
+                sample,
+                None,
+                key_in="data.input.img_path",
+                key_out="data.input.img",
+                lazy=True,
+            )
+            img = sample["data.input.img"]
+            self.assertIsInstance(img, LazyArray)
+            self.assertEqual(img.shape, volume.shape)
+            self.assertEqual(img.dtype, np.int16)
+            self.assertTrue(np.array_equal(img[1:4, ::-2, 3], volume[1:4, ::-2, 3]))
+
+            # push a slice selection and a dtype request into the read
+            pipeline = PipelineDefault(
+                "test_pipeline",
+                [
+                    (OpSelectSlice(), dict(key="data.input.img", slice_idx=2)),
+                    (OpToNumpy(), dict(key="data.input.img", dtype=np.float32)),
+                ],
+            )
+            img = pipeline(NDict({"data.input.img": sample["data.input.img"]}))[
+                "data.input.img"
+            ]
+            self.assertEqual(img.dtype, np.float32)
+            self.assertTrue(np.array_equal(img, volume[2]))
+
+            # crop
+            output_shape = (3, 4, 4)
+            lazy_crop = OpCrop3D()(
+                NDict({"data.input.img": sample["data.input.img"]}),
+                key="data.input.img",
+                output_shape=output_shape,
+            )["data.input.img"]
+            crop = OpCrop3D()(
+                NDict({"data.input.img": torch.from_numpy(volume).float()}),
+                key="data.input.img",
+                output_shape=output_shape,
+            )["data.input.img"]
+            self.assertTrue(torch.equal(lazy_crop, crop))
+
+            # cached or sent to another process as a numpy array
+            img = pickle.loads(pickle.dumps(sample["data.input.img"][0]))
+            self.assertEqual(type(img), np.ndarray)
+            self.assertTrue(np.array_equal(img, volume[0]))
+
+    def test_resample(self) -> None:
+        """
+        Test OpResizeToShape and OpResampleToSpacing
+        """
+        rng = np.random.default_rng(0)
+        volume = rng.normal(size=(12, 20, 16)).astype(np.float32)
+
+        # linear, compared to skimage
+        for output_shape in [(6, 31, 16), (12, 7, 40)]:
+            img = OpResizeToShape()(
+                NDict({"data.input.img": volume}),
+                key="data.input.img",
+                output_shape=output_shape,
+                anti_aliasing=False,
+            )["data.input.img"]
+            expected = skimage.transform.resize(
+                volume, output_shape, order=1, mode="edge", anti_aliasing=False
+            )
+            self.assertEqual(img.dtype, np.float32)
+            self.assertTrue(np.allclose(img, expected, atol=1e-5))
+
+        # anti aliasing preserves constant volumes
+        img = OpResizeToShape()(
+            NDict({"data.input.img": torch.full((12, 20, 16), 3.0)}),
+            key="data.input.img",
+            output_shape=(5, 7, None),
+        )["data.input.img"]
+        self.assertIsInstance(img, torch.Tensor)
+        self.assertEqual(tuple(img.shape), (5, 7, 16))
+        self.assertTrue(torch.allclose(img, torch.tensor(3.0)))
+
+        # label safe modes, each block of 2x2x2 voxels has a single label
+        labels = np.kron(
+            rng.integers(0, 4, size=(6, 10, 8)), np.ones((2, 2, 2), dtype=np.int64)
+        ).astype(np.uint8)
+        for mode in ["nearest", "majority"]:
+            seg = OpResizeToShape()(
+                NDict({"data.gt.seg": labels}),
+                key="data.gt.seg",
+                output_shape=(6, 10, 8),
+                mode=mode,
+            )["data.gt.seg"]
+            self.assertEqual(seg.dtype, np.uint8)
+            self.assertTrue(np.array_equal(seg, labels[::2, ::2, ::2]))
+
+            seg = OpResizeToShape()(
+                NDict({"data.gt.seg": labels}),
+                key="data.gt.seg",
+                output_shape=(17, 9, 30),
+                mode=mode,
+            )["data.gt.seg"]
+            self.assertTrue(set(np.unique(seg)) <= set(np.unique(labels)))
+
+        # resample to spacing
+        sample = OpResampleToSpacing()(
+            NDict({"data.input.img": volume, "data.input.spacing": (2.5, 0.8, 0.8)}),
+            key="data.input.img",
+            key_spacing="data.input.spacing",
+            target_spacing=(1.25, 1.6, None),
+        )
+        self.assertEqual(sample["data.input.img"].shape, (24, 10, 16))
+        self.assertTrue(np.allclose(sample["data.input.spacing"], (1.25, 1.6, 0.8)))
+        with self.assertRaises(Exception):
+            OpResampleToSpacing()(
+                NDict({"data.input.img": volume}),
+                key="data.input.img",
+                target_spacing=(1.0, 1.0, 1.0),
+            )
+
+        # multithreaded
+        single = OpResizeToShape(num_threads=1)(
+            NDict({"data.input.img": volume}),
+            key="data.input.img",
+            output_shape=(5, 9, 33),
+        )["data.input.img"]
+        multi = OpResizeToShape(num_threads=3)(
+            NDict({"data.input.img": volume}),
+            key="data.input.img",
+            output_shape=(5, 9, 33),
+        )["data.input.img"]
+        self.assertTrue(np.array_equal(single, multi))
+
 
 if __name__ == "__main__":
     unittest.main()
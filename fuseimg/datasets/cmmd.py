@@ -43,6 +43,12 @@ class OpCMMDSampleIDDecode(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class CMMD:
     """
@@ -41,6 +41,12 @@ class OpISICSampleIDDecode(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 def derive_label(sample_dict: NDict) -> NDict:
     """
@@ -621,3 +627,9 @@ class OpEncodeMetaData(OpBase):
             sample_dict[f"{out_prefix}.age"] = age_one_hot
 
         return sample_dict
+
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
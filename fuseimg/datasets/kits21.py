@@ -71,6 +71,12 @@ class OpKits21SampleIDDecode(OpReversibleBase):
     ) -> dict:
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 def my_resize(
     input_tensor: torch.Tensor, resize_to: Tuple[int, int, int]
@@ -252,7 +258,10 @@ class KITS21:
                     ),
                 ),
                 # add channel dimension -> [C=1, D, H, W]
-                (OpLambda(partial(torch.unsqueeze, dim=0)), dict(key="data.input.img")),
+                (
+                    OpLambda(partial(torch.unsqueeze, dim=0), deterministic=True),
+                    dict(key="data.input.img"),
+                ),
             ],
         )
         return dynamic_pipeline
@@ -264,6 +273,7 @@ class KITS21:
         reset_cache: bool = False,
         num_workers: int = 10,
         sample_ids: Optional[Sequence[Hashable]] = None,
+        hoist_deterministic_ops: bool = False,
     ) -> DatasetDefault:
         """
         Get cached dataset
@@ -272,6 +282,7 @@ class KITS21:
         :param reset_cache: set to True tp reset the cache
         :param num_workers: number of processes used for caching
         :param sample_ids: dataset including the specified sample_ids or None for all the samples. sample_id is case_{id:05d} (for example case_00001 or case_00100).
+        :param hoist_deterministic_ops: set to True to cache also the output of the deterministic ops at the beginning of the dynamic pipeline, see DatasetDefault hoist_deterministic_ops argument
         """
 
         if sample_ids is None:
@@ -293,6 +304,7 @@ class KITS21:
             static_pipeline=static_pipeline,
             dynamic_pipeline=dynamic_pipeline,
             cacher=cacher,
+            hoist_deterministic_ops=hoist_deterministic_ops,
         )
         my_dataset.create()
         return my_dataset
@@ -45,6 +45,12 @@ class OpKnightSampleIDDecode(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpClinicalLoad(OpBase):
     def __init__(self, json_path: str):
@@ -115,6 +121,12 @@ class OpClinicalLoad(OpBase):
         sample_dict["data.input.clinical"] = row
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpPrepareClinical(OpBase):
     def __call__(
@@ -179,6 +191,12 @@ class OpPrepareClinical(OpBase):
         sample_dict["data.input.clinical.all"] = clinical_encoding
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class KNIGHT:
     """
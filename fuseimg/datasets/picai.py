@@ -43,6 +43,12 @@ class OpPICAISampleIDDecode(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpLoadPICAIImage(OpBase):
     """
@@ -89,6 +95,12 @@ class OpLoadPICAIImage(OpBase):
             )
             return None
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 # loads cancer segmentation - not in use for now
 class OpLoadPICAISegmentation(OpBase):
@@ -145,6 +157,12 @@ class OpLoadPICAISegmentation(OpBase):
         sample_dict[key_out] = nii_data
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class OpLoadPICAISegmentationWholeGland(OpBase):
     """
@@ -179,6 +197,12 @@ class OpLoadPICAISegmentationWholeGland(OpBase):
         sample_dict[key_out] = nii_data
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class PICAI:
     """ """
@@ -314,7 +338,7 @@ class PICAI:
             (OpToTensor(), dict(key="data.gt.seg", dtype=torch.int32)),
             (
                 OpRepeat(
-                    (OpLambda(partial(torch.unsqueeze, dim=0))),
+                    (OpLambda(partial(torch.unsqueeze, dim=0), deterministic=True)),
                     kwargs_per_step_to_add=repeat_images_with_seg,
                 ),
                 {},
@@ -367,6 +391,7 @@ class PICAI:
         sample_ids: Optional[Sequence[Hashable]] = None,
         train: bool = False,
         run_sample: int = 0,
+        hoist_deterministic_ops: bool = False,
     ) -> DatasetDefault:
         """
         Creates Fuse Dataset single object (either for training, validation and test or user defined set)
@@ -376,6 +401,7 @@ class PICAI:
         :param sample_ids:                  dataset including the specified sample_ids or None for all the samples.
         :param train:                       True if used for training  - adds augmentation operations to the pipeline
         :param run_sample:                  if > 0 it samples from all the samples #run_sample examples ( used for testing), if =0 then it takes all samples
+        :param hoist_deterministic_ops:     set to True to cache also the output of the deterministic ops at the beginning of the dynamic pipeline, see DatasetDefault hoist_deterministic_ops argument
         :return: DatasetDefault object
         """
 
@@ -425,6 +451,7 @@ class PICAI:
             static_pipeline=static_pipeline,
             dynamic_pipeline=dynamic_pipeline,
             cacher=cacher,
+            hoist_deterministic_ops=hoist_deterministic_ops,
         )
 
         my_dataset.create()
@@ -60,6 +60,12 @@ class OpSTOIC21SampleIDDecode(OpBase):
 
         return sample_dict
 
+    def is_random(self) -> bool:
+        """
+        See OpBase
+        """
+        return False
+
 
 class STOIC21:
     """
@@ -216,7 +222,10 @@ class STOIC21:
                 (OpToTensor(), dict(key="data.input.img", dtype=torch.float32)),
                 (OpToTensor(), dict(key="data.input.clinical", dtype=torch.float32)),
                 # add channel dimension -> [C=1, D, H, W]
-                (OpLambda(partial(torch.unsqueeze, dim=0)), dict(key="data.input.img")),
+                (
+                    OpLambda(partial(torch.unsqueeze, dim=0), deterministic=True),
+                    dict(key="data.input.img"),
+                ),
             ],
         )
 
@@ -225,7 +234,7 @@ class STOIC21:
             dynamic_pipeline.extend(
                 [
                     (
-                        OpLambda(partial(torch.squeeze, dim=0)),
+                        OpLambda(partial(torch.squeeze, dim=0), deterministic=True),
                         dict(key="data.input.img"),
                     ),
                     # affine augmentation - will apply the same affine transformation on each slice
@@ -248,7 +257,7 @@ class STOIC21:
                     # )),
                     # add channel dimension -> [C=1, D, H, W]
                     (
-                        OpLambda(partial(torch.unsqueeze, dim=0)),
+                        OpLambda(partial(torch.unsqueeze, dim=0), deterministic=True),
                         dict(key="data.input.img"),
                     ),
                 ]
@@ -266,6 +275,7 @@ class STOIC21:
         train: bool = False,
         output_shape: Tuple[int, int, int] = (32, 256, 256),
         clip_range: Tuple[float, float] = (-200, 800),
+        hoist_deterministic_ops: bool = False,
     ) -> DatasetDefault:
         """
         Get cached dataset
@@ -277,6 +287,7 @@ class STOIC21:
         :param train: True if used for training  - adds augmentation operations to the pipeline
         :param output_shape: fixed shape to resize the image to
         :param clip_range: clip the original voxels values to fit this range
+        :param hoist_deterministic_ops: set to True to cache also the output of the deterministic ops at the beginning of the dynamic pipeline, see DatasetDefault hoist_deterministic_ops argument
         """
 
         if sample_ids is None:
@@ -298,6 +309,7 @@ class STOIC21:
             static_pipeline=static_pipeline,
             dynamic_pipeline=dynamic_pipeline,
             cacher=cacher,
+            hoist_deterministic_ops=hoist_deterministic_ops,
         )
         my_dataset.create()
         return my_dataset
@@ -0,0 +1,263 @@
+"""
+(C) Copyright 2021 IBM Corp.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Fast resampling of n-dimensional volumes (e.g. CT / MRI scans and their segmentation masks).
+The resampling is separable - applied axis by axis, each output voxel is a weighted sum of a few input voxels along the axis.
+The kernels run in float32, and each axis is split into chunks processed by multiple threads.
+See OpResizeToShape and OpResampleToSpacing.
+"""
+import concurrent.futures
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+# supported modes
+RESAMPLE_MODES = ("linear", "nearest", "majority")
+
+
+def get_output_shape_for_spacing(
+    shape: Sequence[int],
+    spacing: Sequence[float],
+    target_spacing: Sequence[Optional[float]],
+) -> Tuple[int, ...]:
+    """
+    :param shape: the shape of the volume
+    :param spacing: the voxel size per axis
+    :param target_spacing: the required voxel size per axis, None to keep an axis as is
+    :return: the shape of the volume resampled to target_spacing
+    """
+    if not len(shape) == len(spacing) == len(target_spacing):
+        raise Exception(
+            f"Error: expecting spacing and target spacing per axis, got shape {shape}, spacing {spacing} and target spacing {target_spacing}"
+        )
+    return tuple(
+        size
+        if target is None
+        else max(int(round(size * float(current) / float(target))), 1)
+        for size, current, target in zip(shape, spacing, target_spacing)
+    )
+
+
+def resample_volume(
+    volume: np.ndarray,
+    output_shape: Sequence[Optional[int]],
+    mode: str = "linear",
+    anti_aliasing: bool = True,
+    num_threads: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Resizes a volume of any number of dimensions to output_shape. The voxel centers are mapped as in skimage.transform.resize.
+    :param volume: numpy array
+    :param output_shape: the required size per axis, None to keep an axis as is (e.g. the channels axis)
+    :param mode: one of:
+                 "linear" - linear interpolation, float32 output.
+                 "nearest" - the nearest voxel, keeps the dtype. Label safe.
+                 "majority" - for segmentation masks. Each label is resampled as a one-hot mask (with the linear kernel)
+                              and the label with the highest weight is selected, so when downsampling, each output voxel gets the most common label in its footprint.
+                              Keeps the dtype. Label safe. The running time is proportional to the number of labels.
+    :param anti_aliasing: used by "linear" mode. When downsampling, the linear kernel is stretched to cover the footprint of the output voxel (a triangle filter, as in PIL)
+                 instead of sampling 2 input voxels. Recommended for images, avoids aliasing artifacts.
+    :param num_threads: the number of threads. Default is torch.get_num_threads(), which is 1 in DataLoader worker processes
+    :return: the resampled volume
+    """
+    if mode not in RESAMPLE_MODES:
+        raise Exception(
+            f"Error: unsupported mode {mode}, expecting one of {RESAMPLE_MODES}"
+        )
+    volume = np.asarray(volume)
+    if len(output_shape) != volume.ndim:
+        raise Exception(
+            f"Error: expecting output shape with {volume.ndim} dimensions, got {output_shape}"
+        )
+    output_shape = tuple(
+        in_size if out_size is None else int(out_size)
+        for in_size, out_size in zip(volume.shape, output_shape)
+    )
+    if num_threads is None:
+        num_threads = torch.get_num_threads()
+
+    if mode == "majority":
+        return _resample_labels(volume, output_shape, num_threads)
+
+    if mode == "linear":
+        volume = volume.astype(np.float32, copy=False)
+    ans = volume
+    for axis in _get_axes_order(volume.shape, output_shape):
+        indices, weights = _get_axis_weights(
+            ans.shape[axis], output_shape[axis], mode, anti_aliasing
+        )
+        ans = _resample_axis(ans, axis, indices, weights, num_threads)
+    if ans is volume:
+        ans = volume.copy()
+    return ans
+
+
+def _get_axes_order(
+    input_shape: Sequence[int], output_shape: Sequence[int]
+) -> List[int]:
+    """
+    :return: the axes to resample, the most reduced axes first - so the next axes will process less voxels
+    """
+    axes = [
+        axis
+        for axis in range(len(input_shape))
+        if input_shape[axis] != output_shape[axis]
+    ]
+    return sorted(axes, key=lambda axis: output_shape[axis] / input_shape[axis])
+
+
+def _get_axis_weights(
+    in_size: int, out_size: int, mode: str, anti_aliasing: bool
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: the input indices and the weights, both with shape [out_size, taps] - output voxel i is sum_t(weights[i, t] * input[indices[i, t]])
+    """
+    scale = in_size / out_size
+    if mode == "nearest":
+        indices = np.minimum(
+            np.floor((np.arange(out_size) + 0.5) * scale).astype(np.int64),
+            in_size - 1,
+        )
+        return indices[:, None], np.ones((out_size, 1), dtype=np.float32)
+
+    # linear kernel, stretched when downsampling with anti aliasing
+    support = max(scale, 1.0) if anti_aliasing else 1.0
+    centers = (np.arange(out_size) + 0.5) * scale - 0.5
+    taps = int(np.ceil(2 * support)) + 1
+    first = np.floor(centers - support).astype(np.int64) + 1
+    indices = first[:, None] + np.arange(taps)[None, :]
+    weights = np.maximum(0.0, 1.0 - np.abs(indices - centers[:, None]) / support)
+    # out of range voxels are ignored (edge mode)
+    weights[(indices < 0) | (indices >= in_size)] = 0.0
+    weights /= weights.sum(axis=1, keepdims=True)
+    indices = np.clip(indices, 0, in_size - 1)
+    # drop the taps which are not used by any output voxel
+    used = weights.any(axis=0)
+    return indices[:, used], weights[:, used].astype(np.float32)
+
+
+def _resample_axis(
+    volume: np.ndarray,
+    axis: int,
+    indices: np.ndarray,
+    weights: np.ndarray,
+    num_threads: int,
+) -> np.ndarray:
+    """
+    Resamples a single axis. The volume is split into chunks along the largest other axis, processed in parallel (numpy releases the GIL)
+    """
+    out_shape = list(volume.shape)
+    out_shape[axis] = indices.shape[0]
+    nearest = indices.shape[1] == 1 and np.all(weights == 1.0)
+    ans = np.empty(out_shape, dtype=volume.dtype if nearest else np.float32)
+
+    weights_shape = [1] * volume.ndim
+    weights_shape[axis] = -1
+    tap_weights = [
+        weights[:, tap].reshape(weights_shape) for tap in range(weights.shape[1])
+    ]
+
+    def _run(chunk: Tuple[slice, ...]) -> None:
+        src = volume[chunk]
+        dst = ans[chunk]
+        if nearest:
+            np.take(src, indices[:, 0], axis=axis, out=dst)
+            return
+        np.multiply(np.take(src, indices[:, 0], axis=axis), tap_weights[0], out=dst)
+        for tap in range(1, len(tap_weights)):
+            dst += np.take(src, indices[:, tap], axis=axis) * tap_weights[tap]
+
+    other_axes = [other for other in range(volume.ndim) if other != axis]
+    if num_threads <= 1 or len(other_axes) == 0:
+        _run((slice(None),) * volume.ndim)
+        return ans
+
+    split_axis = max(other_axes, key=lambda other: volume.shape[other])
+    bounds = np.linspace(
+        0, volume.shape[split_axis], min(num_threads, volume.shape[split_axis]) + 1
+    ).astype(int)
+    chunks = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        chunk = [slice(None)] * volume.ndim
+        chunk[split_axis] = slice(start, stop)
+        chunks.append(tuple(chunk))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        list(executor.map(_run, chunks))
+    return ans
+
+
+def _resample_labels(
+    labels: np.ndarray, output_shape: Tuple[int, ...], num_threads: int
+) -> np.ndarray:
+    """
+    See "majority" mode of resample_volume()
+    Each label is resampled only within its bounding box (labels such as organs and tumors typically cover a small part of the volume).
+    """
+    if tuple(labels.shape) == output_shape:
+        return labels.copy()
+    values, counts = np.unique(labels, return_counts=True)
+    # the weights of the most common label (typically the background) are the complement of the others
+    background = values[np.argmax(counts)]
+    ans = np.full(output_shape, background, dtype=labels.dtype)
+    if len(values) == 1:
+        return ans
+    axes_weights = [
+        _get_axis_weights(in_size, out_size, "linear", anti_aliasing=True)
+        for in_size, out_size in zip(labels.shape, output_shape)
+    ]
+    axes_order = _get_axes_order(labels.shape, output_shape)
+    best_weight = np.zeros(output_shape, dtype=np.float32)
+    others_weight = np.zeros(output_shape, dtype=np.float32)
+    for value in values:
+        if value == background:
+            continue
+        mask = labels == value
+        in_region = []
+        out_region = []
+        region_weights = []
+        for axis, (indices, weights) in enumerate(axes_weights):
+            # the output voxels affected by the bounding box of the label along the axis
+            present = np.flatnonzero(
+                mask.any(
+                    axis=tuple(other for other in range(mask.ndim) if other != axis)
+                )
+            )
+            affected = np.flatnonzero(
+                (
+                    (indices >= present[0]) & (indices <= present[-1]) & (weights > 0)
+                ).any(axis=1)
+            )
+            out_start, out_stop = affected[0], affected[-1] + 1
+            in_start = indices[out_start:out_stop].min()
+            in_stop = indices[out_start:out_stop].max() + 1
+            in_region.append(slice(in_start, in_stop))
+            out_region.append(slice(out_start, out_stop))
+            region_weights.append(
+                (indices[out_start:out_stop] - in_start, weights[out_start:out_stop])
+            )
+        in_region = tuple(in_region)
+        out_region = tuple(out_region)
+
+        weight = mask[in_region].astype(np.float32)
+        for axis in axes_order:
+            indices, weights = region_weights[axis]
+            weight = _resample_axis(weight, axis, indices, weights, num_threads)
+        others_weight[out_region] += weight
+        selected = weight > best_weight[out_region]
+        ans[out_region][selected] = value
+        np.maximum(best_weight[out_region], weight, out=best_weight[out_region])
+    ans[(1.0 - others_weight) >= best_weight] = background
+    return ans